@@ -3,19 +3,24 @@
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+HTTP is served by Django (async views are registered when ASGI_MODE=true) and
+WebSockets by Channels. Run with e.g. ``ASGI_MODE=true gunicorn chidmano.asgi:application
+-k uvicorn.workers.UvicornWorker`` (main.py does this when ASGI_MODE is set).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from store_analysis import consumers
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chidmano.settings')
 
-# Import URL patterns for WebSocket routing
+# get_asgi_application باید پیش از import مدل‌ها/consumerها اجرا شود (django.setup)
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 from store_analysis.consumers import AnalysisConsumer, NotificationConsumer
 
@@ -25,10 +30,10 @@
 ]
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-}) 
\ No newline at end of file
+})
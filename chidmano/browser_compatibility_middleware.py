@@ -112,7 +112,8 @@ def process_response(self, request, response):
                 response['Cache-Control'] = 'public, max-age=3600'  # 1 hour
             
             # تنظیم ETag برای caching
-            if not response.get('ETag'):
+            # پاسخ‌های stream (FileResponse دانلود PDF) بدنه content ندارند
+            if not response.get('ETag') and not response.streaming:
                 import hashlib
                 content_hash = hashlib.md5(response.content).hexdigest()
                 response['ETag'] = f'"{content_hash}"'
@@ -186,13 +187,15 @@ def process_request(self, request):
                     self.active_requests[user_id] += 1
             else:
                 self.active_requests[user_id] = 1
-        
+            # کلید شمارش‌شده؛ login/logout وسط درخواست کلید را عوض می‌کند و درخواست ردشده شمرده نشده
+            request._concurrency_key = user_id
+
         return None
-    
+
     def process_response(self, request, response):
         """کاهش تعداد درخواست‌های فعال"""
-        user_id = request.user.id if request.user.is_authenticated else request.META.get('REMOTE_ADDR')
-        
+        user_id = getattr(request, '_concurrency_key', None)
+
         if user_id and user_id in self.active_requests:
             self.active_requests[user_id] -= 1
             if self.active_requests[user_id] <= 0:
@@ -221,7 +224,8 @@ def process_response(self, request, response):
                 response['Cache-Control'] = 'public, max-age=3600'  # 1 hour
             
             # تنظیم ETag برای caching
-            if not response.get('ETag'):
+            # پاسخ‌های stream (FileResponse دانلود PDF) بدنه content ندارند
+            if not response.get('ETag') and not response.streaming:
                 import hashlib
                 content_hash = hashlib.md5(response.content).hexdigest()
                 response['ETag'] = f'"{content_hash}"'
@@ -323,7 +327,8 @@ def process_response(self, request, response):
                 response['Cache-Control'] = 'public, max-age=3600'  # 1 hour
             
             # تنظیم ETag برای caching
-            if not response.get('ETag'):
+            # پاسخ‌های stream (FileResponse دانلود PDF) بدنه content ندارند
+            if not response.get('ETag') and not response.streaming:
                 import hashlib
                 content_hash = hashlib.md5(response.content).hexdigest()
                 response['ETag'] = f'"{content_hash}"'
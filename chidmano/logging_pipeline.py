@@ -0,0 +1,253 @@
+"""
+خط لوله لاگ غیرمسدودکننده: QueueHandler + QueueListener با رکوردهای JSON
+
+StreamHandler معمولی هر رکورد را در thread درخواست فرمت و روی stdout می‌نویسد؛ زیر بار،
+نوشتن مسدودکننده و فرمت payloadهای بزرگ (بدنه callback پرداخت، پاسخ‌های AI) به تأخیر
+درخواست اضافه می‌شود. AsyncQueueHandler در thread درخواست فقط:
+    - فیلترهای نمونه‌برداری/محدودیت نرخ را اجرا می‌کند (رکورد حذف‌شده هیچ‌وقت فرمت نمی‌شود)
+    - پیام و فیلدهای extra را با سقف طول می‌سازد (args بزرگ پیش از تبدیل به رشته کوتاه می‌شوند)
+    - رکورد را در صف محدود می‌گذارد؛ اگر صف پر باشد رکورد دور ریخته و شمرده می‌شود
+سریال‌سازی JSON و نوشتن در thread پس‌زمینه QueueListener انجام می‌شود.
+
+listener در هر پروسس جدا (و پس از fork در workerهای gunicorn با preload_app) به‌صورت تنبل
+ساخته می‌شود و logging.shutdown هنگام خروج با close() صف را تخلیه می‌کند.
+
+این ماژول هنگام dictConfig (پیش از آماده شدن Django) import می‌شود و نباید به Django وابسته باشد.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import reprlib
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# attributeهای استاندارد LogRecord؛ بقیه از extra آمده‌اند و فیلد ساخت‌یافته حساب می‌شوند
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_SCALARS = (int, float, bool, type(None))
+
+
+def cap_text(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}…[+{len(text) - limit} chars]"
+    return text
+
+
+class _CappedRepr(reprlib.Repr):
+    """repr با سقف طول که ساختارهای بزرگ را بدون ساخت repr کامل کوتاه می‌کند"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.maxlevel = 4
+        self.maxdict = self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdeque = 50
+        self.maxstring = self.maxother = max(limit, 20)
+
+
+def cap_value(value: Any, limit: int) -> Any:
+    """نسخه کوتاه‌شده و غیرقابل‌تغییر یک آرگومان/فیلد برای رفتن به صف"""
+    if isinstance(value, _SCALARS):
+        return value
+    if isinstance(value, str):
+        return cap_text(value, limit)
+    if isinstance(value, bytes):
+        return cap_text(value.decode('utf-8', 'replace'), limit)
+    if isinstance(value, (dict, list, tuple, set, frozenset)):
+        return cap_text(_CappedRepr(limit).repr(value), limit)
+    return cap_text(str(value), limit)
+
+
+class SamplingFilter(logging.Filter):
+    """نمونه‌برداری و محدودیت نرخ برای loggerهای پرتکرار
+
+    rules: {'نام logger': {'sample': 0.1, 'per_second': 20}}؛ قاعده نزدیک‌ترین logger والد
+    اعمال می‌شود. sample نسبت رکوردهای نگه‌داشته (قطعی: یکی از هر 1/sample) و per_second
+    سقف token bucket است. رکوردهای WARNING و بالاتر همیشه عبور می‌کنند. تعداد رکوردهای
+    حذف‌شده هر قاعده روی اولین رکورد عبوری بعدی با فیلد sampled_out ثبت می‌شود.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, float]]] = None, name: str = ''):
+        super().__init__(name)
+        self.rules = {key: dict(value) for key, value in (rules or {}).items()}
+        self._state: Dict[str, Dict[str, float]] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def _rule_for(self, logger_name: str) -> Optional[str]:
+        try:
+            return self._resolved[logger_name]
+        except KeyError:
+            pass
+        name = logger_name
+        while name and name not in self.rules:
+            name = name.rpartition('.')[0]
+        key = name if name in self.rules else ('' if '' in self.rules else None)
+        self._resolved[logger_name] = key
+        return key
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = self._rule_for(record.name)
+        if key is None:
+            return True
+        rule = self.rules[key]
+        with self._lock:
+            state = self._state.setdefault(key, {'credit': 1.0, 'tokens': None, 'at': 0.0, 'dropped': 0})
+            keep = True
+            sample = rule.get('sample')
+            if sample is not None:
+                keep = state['credit'] >= 1.0
+                state['credit'] += float(sample) - (1.0 if keep else 0.0)
+            per_second = rule.get('per_second')
+            if keep and per_second:
+                now = time.monotonic()
+                tokens = per_second if state['tokens'] is None else state['tokens']
+                tokens = min(float(per_second), tokens + (now - state['at']) * per_second)
+                state['at'] = now
+                if tokens >= 1.0:
+                    state['tokens'] = tokens - 1.0
+                else:
+                    state['tokens'] = tokens
+                    keep = False
+            if not keep:
+                state['dropped'] += 1
+                return False
+            if state['dropped']:
+                record.sampled_out = int(state['dropped'])
+                state['dropped'] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """یک خط JSON برای هر رکورد؛ فیلدهای extra هم به‌صورت کلید جدا نوشته می‌شوند"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler با listener تنبل در هر پروسس و سقف طول پیام و فیلدها
+
+    در dictConfig (با '()'؛ از Python 3.12 'class' زیرکلاس QueueHandler کلید handlers لازم دارد):
+        '()': 'chidmano.logging_pipeline.AsyncQueueHandler',
+        'stream': 'ext://sys.stdout', 'formatter': 'json', 'queue_size': 10000,
+        'max_message_chars': 4000, 'max_field_chars': 1000
+    formatter روی handler نهایی (stream) اعمال می‌شود و در thread پس‌زمینه اجرا می‌شود.
+    """
+
+    def __init__(self, stream=None, queue_size: int = 10000, max_message_chars: int = 4000,
+                 max_field_chars: int = 1000, target: Optional[logging.Handler] = None):
+        self.queue_size = max(int(queue_size), 1)
+        super().__init__(queue.Queue(self.queue_size))
+        self.target = target or logging.StreamHandler(stream or sys.stdout)
+        self.max_message_chars = int(max_message_chars)
+        self.max_field_chars = int(max_field_chars)
+        self.dropped = 0
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.target.setLevel(level)
+
+    def _ensure_listener(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # پس از fork، صف و قفل‌های پروسس والد قابل اعتماد نیستند و thread آن وجود ندارد
+            self.queue = queue.Queue(self.queue_size)
+            self.dropped = 0
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ساخت پیام با args کوتاه‌شده در thread فراخواننده؛ سریال‌سازی به listener سپرده می‌شود"""
+        prepared = logging.makeLogRecord(record.__dict__)
+        msg = str(record.msg)
+        if record.args:
+            args = record.args
+            if isinstance(args, dict):
+                args = {key: cap_value(value, self.max_field_chars) for key, value in args.items()}
+            else:
+                args = tuple(cap_value(arg, self.max_field_chars) for arg in args)
+            try:
+                msg = msg % args
+            except (TypeError, ValueError, KeyError):
+                msg = f"{msg} {args!r}"
+        prepared.msg = cap_text(msg, self.max_message_chars)
+        prepared.args = None
+        prepared.message = prepared.msg
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                setattr(prepared, key, cap_value(value, self.max_field_chars))
+        if record.exc_info:
+            # traceback فقط تا پایان همین فراخوانی معتبر است
+            prepared.exc_text = logging.Formatter().formatException(record.exc_info)
+            prepared.exc_info = None
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.dropped:
+            record.queue_dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._ensure_listener()
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """انتظار (با سقف زمانی) تا نوشته شدن رکوردهای صف؛ برای تست و benchmark"""
+        if self._pid == os.getpid():
+            deadline = time.monotonic() + timeout
+            with self.queue.all_tasks_done:
+                while self.queue.unfinished_tasks and time.monotonic() < deadline:
+                    self.queue.all_tasks_done.wait(max(deadline - time.monotonic(), 0))
+        self.target.flush()
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.target.close()
+        super().close()
@@ -18,7 +18,9 @@ class GoogleSearchConsoleSubmitter:
     """ارسال URL ها به Google Search Console"""
     
     def __init__(self):
-        self.api_endpoint = "https://indexing.googleapis.com/v3/urlNotifications:publish"
+        self.api_endpoint = getattr(
+            settings, 'GOOGLE_INDEXING_API_URL', "https://indexing.googleapis.com/v3/urlNotifications:publish"
+        )
         self.site_url = getattr(settings, 'SITE_URL', 'https://chidmano.ir')
         
         # Google Search Console API credentials (از environment variables)
@@ -218,14 +218,14 @@ class SEOLoggingMiddleware(MiddlewareMixin):
     def process_request(self, request):
         """لاگ کردن درخواست‌های مهم"""
         if self._should_log_request(request):
-            logger.info(f"SEO Request: {request.method} {request.path} - User-Agent: {request.META.get('HTTP_USER_AGENT', 'Unknown')}")
+            logger.info("SEO Request: %s %s - User-Agent: %s", request.method, request.path, request.META.get('HTTP_USER_AGENT', 'Unknown'))
         
         return None
     
     def process_response(self, request, response):
         """لاگ کردن پاسخ‌های مهم"""
         if self._should_log_response(request, response):
-            logger.info(f"SEO Response: {response.status_code} {request.path} - Content-Type: {response.get('Content-Type', 'Unknown')}")
+            logger.info("SEO Response: %s %s - Content-Type: %s", response.status_code, request.path, response.get('Content-Type', 'Unknown'))
         
         return response
 
@@ -4,6 +4,7 @@
 
 from pathlib import Path
 import os
+import json
 import logging
 from dotenv import load_dotenv
 
@@ -125,6 +126,7 @@
 
 MIDDLEWARE = [
     'chidmano.middleware.UltraLightHealthMiddleware',
+    'store_analysis.middleware.QueryInstrumentationMiddleware',  # شمارش کوئری و بودجه هر view (QUERY_INSTRUMENTATION_ENABLED)
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # برای static files در production
@@ -318,6 +320,9 @@
 
 # Google Search Console
 GOOGLE_SEARCH_CONSOLE_VERIFICATION = os.getenv('GOOGLE_SEARCH_CONSOLE_VERIFICATION', '')
+GOOGLE_INDEXING_API_URL = os.getenv(
+    'GOOGLE_INDEXING_API_URL', 'https://indexing.googleapis.com/v3/urlNotifications:publish'
+)
 
 # Facebook Pixel
 FACEBOOK_PIXEL_ID = os.getenv('FACEBOOK_PIXEL_ID', '')
@@ -328,17 +333,6 @@
 # Yandex Verification
 YANDEX_VERIFICATION = os.getenv('YANDEX_VERIFICATION', '')
 
-# تنظیمات آپلود فایل برای Liara (read-only filesystem)
-if os.getenv('LIARA') == 'true':
-    # Use hybrid handlers: keep small files in memory, large files spill to temp dir
-    FILE_UPLOAD_HANDLERS = [
-        'django.core.files.uploadhandler.MemoryFileUploadHandler',
-        'django.core.files.uploadhandler.TemporaryFileUploadHandler',
-    ]
-    # افزایش سقف آپلود برای فرم‌های چندفایلی
-    FILE_UPLOAD_MAX_MEMORY_SIZE = 32 * 1024 * 1024  # 32MB
-    DATA_UPLOAD_MAX_MEMORY_SIZE = 64 * 1024 * 1024  # 64MB
-
 # Media files configuration for production
 if not DEBUG:
     # In production, serve media files through WhiteNoise
@@ -357,6 +351,10 @@
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 
+# Bulk email dispatch (review reminders and notification fan-out)
+EMAIL_BULK_CHUNK_SIZE = int(os.getenv('EMAIL_BULK_CHUNK_SIZE', '50'))  # پیام در هر دسته/تراکنش
+EMAIL_BULK_THROTTLE_SECONDS = float(os.getenv('EMAIL_BULK_THROTTLE_SECONDS', '1.0'))  # مکث بین دسته‌ها
+
 # Security settings - optimized for Liara
 PRODUCTION = os.getenv('PRODUCTION', 'False').lower() == 'true'
 
@@ -428,6 +426,8 @@
 # Payment Gateway Settings
 ZARINPAL_MERCHANT_ID = os.getenv('ZARINPAL_MERCHANT_ID', 'test-merchant-id')
 ZARINPAL_SANDBOX = os.getenv('ZARINPAL_SANDBOX', 'True').lower() == 'true'
+# آدرس جایگزین API زرین‌پال (خالی = آدرس رسمی)؛ برای سرورهای ساختگی load test
+ZARINPAL_API_BASE_URL = os.getenv('ZARINPAL_API_BASE_URL', '')
 
 # Liara AI Settings
 # ⚠️ مهم: در production، API key باید از environment variable خوانده شود
@@ -458,6 +458,8 @@
 # Base URL برای سرویس AI لیارا - بر اساس پاسخ پشتیبانی
 # سرویس AI از طریق دامنه ai.liara.ir ارائه می‌شود
 LIARA_AI_BASE_URL = os.getenv('LIARA_AI_BASE_URL', 'https://ai.liara.ir/api')
+# endpoint سازگار با OpenAI برای موتور premium (GPT-4)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
 # 🔧 strip کردن فاصله‌های اضافی برای جلوگیری از خطای 403
 LIARA_AI_PROJECT_ID = (os.getenv('LIARA_AI_PROJECT_ID', '690f9dd94e6dbd1c22243c26') or '690f9dd94e6dbd1c22243c26').strip()  # Workspace ID از پنل لیارا
 LIARA_AI_MODEL = os.getenv('LIARA_AI_MODEL', 'openai/gpt-4o-mini')  # مدل پیش‌فرض
@@ -465,6 +467,61 @@
 USE_LIARA_AI = os.getenv('USE_LIARA_AI', 'True').lower() == 'true'
 FALLBACK_TO_OLLAMA = os.getenv('FALLBACK_TO_OLLAMA', 'True').lower() == 'true'
 
+# Pipeline مرحله‌ای تحلیل (چک‌پوینت + اجرای هم‌زمان مراحل مستقل)
+ANALYSIS_PIPELINE_MAX_WORKERS = int(os.getenv('ANALYSIS_PIPELINE_MAX_WORKERS', '4'))
+ANALYSIS_CHECKPOINT_MAX_AGE_DAYS = int(os.getenv('ANALYSIS_CHECKPOINT_MAX_AGE_DAYS', '7'))
+# سقف درخواست هم‌زمان هر provider در هر پروسس برای مراحل pipeline (0 = بدون محدودیت)
+AI_PROVIDER_CONCURRENCY = {
+    'openai': int(os.getenv('OPENAI_MAX_CONCURRENCY', '6')),
+}
+# بسته‌بندی چند بخش گزارش در یک درخواست LLM با خروجی JSON (ai_services/prompt_packing.py)؛
+# تعداد درخواست را کم می‌کند ولی خروجی بخش‌های یک گروه پشت سر هم تولید می‌شود (زمان کل بیشتر)
+PROMPT_PACKING_ENABLED = os.getenv('PROMPT_PACKING_ENABLED', 'False').lower() == 'true'
+PROMPT_PACK_MAX_SECTIONS = int(os.getenv('PROMPT_PACK_MAX_SECTIONS', '3'))
+PROMPT_PACK_MAX_TOKENS = int(os.getenv('PROMPT_PACK_MAX_TOKENS', '8000'))
+
+# بازیابی تحلیل‌های stuck (fix_stuck_analyses --retry)
+STUCK_RECOVERY_CONCURRENCY = int(os.getenv('STUCK_RECOVERY_CONCURRENCY', '4'))
+# سقف درخواست در دقیقه به Liara AI برای هر پروسس (0 = بدون محدودیت)
+LIARA_AI_REQUESTS_PER_MINUTE = float(os.getenv('LIARA_AI_REQUESTS_PER_MINUTE', '60'))
+
+# سرویس‌هایی از ServiceRegistry که پیش از fork در master gunicorn ساخته می‌شوند (با کاما جدا)
+AI_SERVICE_WARMUP = [name.strip() for name in os.getenv('AI_SERVICE_WARMUP', 'liara,consultant').split(',') if name.strip()]
+
+# اندازه هر chunk (ردیف) در jobهای همگام‌سازی پرداخت/سفارش (manage.py reconcile_payments)
+RECONCILIATION_CHUNK_SIZE = int(os.getenv('RECONCILIATION_CHUNK_SIZE', '2000'))
+
+# تاریخچه پرداخت: اندازه صفحه cursor و TTL خلاصه cache‌شده هر کاربر (ثانیه)
+PAYMENT_HISTORY_PAGE_SIZE = int(os.getenv('PAYMENT_HISTORY_PAGE_SIZE', '20'))
+PAYMENT_SUMMARY_CACHE_TTL = int(os.getenv('PAYMENT_SUMMARY_CACHE_TTL', '60'))
+
+# حالت ASGI: اجرای chidmano.asgi با worker uvicorn و ثبت viewهای async برای مسیرهای I/O-bound
+ASGI_MODE = os.getenv('ASGI_MODE', 'False').lower() == 'true'
+# حداکثر thread (و اتصال دیتابیس) هر worker برای ORM در viewهای async
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', '8'))
+# سقف اتصال‌های هم‌زمان httpx به سرویس LLM در مسیر async
+ASYNC_LLM_MAX_CONNECTIONS = int(os.getenv('ASYNC_LLM_MAX_CONNECTIONS', '50'))
+
+# تولید PDF گزارش‌ها در process pool جدا (تعداد پروسس برای هر worker وب، سقف حافظه و مهلت هر job)
+PDF_POOL_WORKERS = int(os.getenv('PDF_POOL_WORKERS', '2'))
+PDF_POOL_MAX_TASKS_PER_CHILD = int(os.getenv('PDF_POOL_MAX_TASKS_PER_CHILD', '50'))
+PDF_JOB_MEMORY_MB = int(os.getenv('PDF_JOB_MEMORY_MB', '1024'))
+PDF_JOB_TIMEOUT = int(os.getenv('PDF_JOB_TIMEOUT', '120'))
+# انتظار view برای آماده شدن PDF؛ پس از آن پاسخ 202 با وضعیت job برمی‌گردد
+PDF_SYNC_WAIT_SECONDS = float(os.getenv('PDF_SYNC_WAIT_SECONDS', '15'))
+PDF_ARTIFACT_MAX_AGE_HOURS = float(os.getenv('PDF_ARTIFACT_MAX_AGE_HOURS', '24'))
+# cache شکل‌دهی متن فارسی (arabic_reshaper/bidi): اندازه LRU، بلندترین متن قابل cache و فایل JSON اختیاری
+# رشته‌های ثابت که هنگام بوت شکل‌دهی می‌شوند
+PERSIAN_SHAPING_CACHE_SIZE = int(os.getenv('PERSIAN_SHAPING_CACHE_SIZE', '4096'))
+PERSIAN_SHAPING_CACHE_MAX_CHARS = int(os.getenv('PERSIAN_SHAPING_CACHE_MAX_CHARS', '400'))
+PERSIAN_SHAPING_WARM_FILE = os.getenv('PERSIAN_SHAPING_WARM_FILE', '')
+
+# کلیدهای API: مدت اعتبار کلید بررسی‌شده در cache هر worker (ثانیه)، اندازه cache و کلید HMAC
+# (خالی = SECRET_KEY؛ تغییر آن همه کلیدهای صادرشده را باطل می‌کند)
+API_KEY_CACHE_TTL = int(os.getenv('API_KEY_CACHE_TTL', '30'))
+API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', '1024'))
+API_KEY_HMAC_SECRET = os.getenv('API_KEY_HMAC_SECRET', '')
+
 # فقط در runtime warning/info بده، نه در build time
 if not _is_build_time:
     if not LIARA_AI_API_KEY:
@@ -503,6 +560,8 @@
 # Mock mode for testing when PayPing token has restrictions
 # در production باید False باشد تا به پی‌پینگ واقعی برود
 PAYPING_MOCK_MODE = os.getenv('PAYPING_MOCK_MODE', 'False').lower() == 'true'
+# آدرس جایگزین API پی‌پینگ (خالی = آدرس رسمی)؛ برای سرورهای ساختگی load test
+PAYPING_API_BASE_URL = os.getenv('PAYPING_API_BASE_URL', '')
 
 # AI Analysis Settings
 AI_ANALYSIS_CACHE_TIMEOUT = 3600  # 1 hour
@@ -592,9 +651,38 @@
 
 # Logging configuration - optimized for Liara (read-only filesystem)
 # در Liara، فقط از console handler استفاده می‌کنیم
+# LOG_ASYNC: نوشتن از thread پس‌زمینه (chidmano.logging_pipeline)؛ LOG_FORMAT=json رکورد ساخت‌یافته
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'True') == 'True'
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # رکوردهای بیشتر از این در صف دور ریخته می‌شوند
+LOG_MAX_MESSAGE_CHARS = int(os.getenv('LOG_MAX_MESSAGE_CHARS', '4000'))
+LOG_MAX_FIELD_CHARS = int(os.getenv('LOG_MAX_FIELD_CHARS', '1000'))  # سقف هر آرگومان/فیلد extra (بدنه callback، پاسخ AI)
+# نمونه‌برداری و محدودیت نرخ رکوردهای زیر WARNING برای loggerهای پرتکرار؛ با JSON در env قابل جایگزینی
+LOG_SAMPLING_RULES = json.loads(os.getenv('LOG_SAMPLING_RULES', '') or 'null') or {
+    'store_analysis.activity': {'sample': float(os.getenv('LOG_ACTIVITY_SAMPLE_RATE', '0.1')), 'per_second': 50},
+    'chidmano.seo_middleware': {'per_second': 20},
+}
+
 if os.getenv('LIARA') == 'true' or not DEBUG:
     # Production/Liara: فقط console logging (Liara logs را capture می‌کند)
     import logging.config
+    _console_handler = {
+        'level': 'INFO',
+        'class': 'logging.StreamHandler',
+        'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
+        'filters': ['sampling'],
+        'stream': 'ext://sys.stdout',
+    }
+    if LOG_ASYNC:
+        # ساخت با '()' (factory) نه 'class': از Python 3.12 dictConfig برای زیرکلاس‌های QueueHandler
+        # کلیدهای queue/listener/handlers را انتظار دارد و با 'class' خطا می‌دهد
+        del _console_handler['class']
+        _console_handler.update({
+            '()': 'chidmano.logging_pipeline.AsyncQueueHandler',
+            'queue_size': LOG_QUEUE_SIZE,
+            'max_message_chars': LOG_MAX_MESSAGE_CHARS,
+            'max_field_chars': LOG_MAX_FIELD_CHARS,
+        })
     LOGGING = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -607,15 +695,19 @@
                 'format': '{asctime} {levelname} {module} {process:d} {thread:d} {message}',
                 'style': '{',
             },
+            'json': {
+                '()': 'chidmano.logging_pipeline.JsonFormatter',
+            },
         },
-        'handlers': {
-            'console': {
-                'level': 'INFO',
-                'class': 'logging.StreamHandler',
-                'formatter': 'verbose',
-                'stream': 'ext://sys.stdout',
+        'filters': {
+            'sampling': {
+                '()': 'chidmano.logging_pipeline.SamplingFilter',
+                'rules': LOG_SAMPLING_RULES,
             },
         },
+        'handlers': {
+            'console': _console_handler,
+        },
         'root': {
             'handlers': ['console'],
             'level': 'INFO',
@@ -694,9 +786,26 @@
     'memory_usage_threshold': 0.9,  # 90%
 }
 
-# File upload optimization (defaults; Liara overrides above)
-FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 32 * 1024 * 1024))
-DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('DATA_UPLOAD_MAX_MEMORY_SIZE', 64 * 1024 * 1024))
+# File upload: هر فایل chunk به chunk روی FILE_UPLOAD_TEMP_DIR نوشته و در حین دریافت اعتبارسنجی می‌شود
+# (store_analysis.utils.streaming_upload)؛ حافظه هر درخواست به یک chunk محدود است
+FILE_UPLOAD_HANDLERS = [
+    'store_analysis.utils.streaming_upload.StreamingUploadHandler',
+]
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))
+UPLOAD_MAX_REQUEST_MB = int(os.getenv('UPLOAD_MAX_REQUEST_MB', '300'))  # سقف مجموع فایل‌های یک درخواست
+UPLOAD_MAX_FILE_MB = {
+    'image': int(os.getenv('UPLOAD_MAX_IMAGE_MB', '20')),
+    'video': int(os.getenv('UPLOAD_MAX_VIDEO_MB', '200')),
+    'document': int(os.getenv('UPLOAD_MAX_DOCUMENT_MB', '25')),
+}
+# فقط برای handlerهای حافظه‌ای Django (در صورت جایگزینی FILE_UPLOAD_HANDLERS)
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 2 * 1024 * 1024))
+# سقف فیلدهای متنی فرم (فایل‌ها شامل نمی‌شوند)
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('DATA_UPLOAD_MAX_MEMORY_SIZE', 5 * 1024 * 1024))
+
+# Content-addressed upload store cleanup (store_analysis.tasks.cleanup_old_files)
+UPLOAD_BLOB_MAX_AGE_DAYS = int(os.getenv('UPLOAD_BLOB_MAX_AGE_DAYS', '30'))  # حذف فایل‌های بدون ارجاع قدیمی‌تر از این
+UPLOAD_BLOB_MAX_TOTAL_MB = int(os.getenv('UPLOAD_BLOB_MAX_TOTAL_MB', '2048'))  # سقف حجم کل فایل‌ها
 
 # تشخیص Liara و استفاده از /tmp برای فایل‌های موقت
 is_liara = (
@@ -772,11 +881,14 @@
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # به جای BasicAuthentication (PBKDF2 در هر درخواست): کلید API با HMAC و cache داخل پروسس
+        # (اول فهرست تا پاسخ کلید نامعتبر 401 با WWW-Authenticate باشد)
+        'store_analysis.api.authentication.ApiKeyAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+        'store_analysis.api.permissions.ApiKeyScopePermission',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -867,15 +979,59 @@
 # Django Channels Configuration
 ASGI_APPLICATION = 'chidmano.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        # برای production از Redis استفاده کنید:
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     "hosts": [('127.0.0.1', 6379)],
-        # },
-    },
+# رویدادهای پیشرفت تحلیل از پروسس‌های دیگر (Celery، thread پس‌زمینه worker دیگر)
+# منتشر می‌شوند، پس layer باید بین پروسس‌ها مشترک باشد:
+# با CHANNEL_REDIS_URL از Redis و در غیر این صورت از فایل SQLite مشترک استفاده می‌شود
+CHANNEL_REDIS_URL = os.getenv('CHANNEL_REDIS_URL', '')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'store_analysis.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': os.getenv('CHANNEL_LAYER_DB', '/tmp/chidmano_channels.sqlite3'),
+            },
+        },
+    }
+
+# مدت نگهداری آخرین وضعیت پیشرفت هر تحلیل در cache (ثانیه)
+ANALYSIS_PROGRESS_TTL = int(os.getenv('ANALYSIS_PROGRESS_TTL', '3600'))
+# long-poll endpoint وضعیت async در ASGI_MODE (?wait=N): سقف انتظار و فاصله بررسی تغییرات (ثانیه)
+ANALYSIS_STATUS_LONG_POLL_MAX = float(os.getenv('ANALYSIS_STATUS_LONG_POLL_MAX', '25'))
+ANALYSIS_STATUS_POLL_INTERVAL = float(os.getenv('ANALYSIS_STATUS_POLL_INTERVAL', '0.5'))
+# اسناد JSON بزرگ‌تر از این (بایت) در results/store_images/analysis_files با zlib ذخیره می‌شوند؛ 0 = غیرفعال
+ANALYSIS_JSON_COMPRESS_MIN_BYTES = int(os.getenv('ANALYSIS_JSON_COMPRESS_MIN_BYTES', str(256 * 1024)))
+ANALYSIS_JSON_COMPRESS_LEVEL = int(os.getenv('ANALYSIS_JSON_COMPRESS_LEVEL', '6'))
+
+# شمارش کوئری هر view/task (store_analysis.services.query_budget) و گزارش «کوئری‌ها» در admin_reports
+# پیش‌فرض فقط در DEBUG: ثبت گزارش روی هر درخواست یک get/set روی cache است و با LocMem فقط یک پروسس را می‌بیند
+QUERY_INSTRUMENTATION_ENABLED = os.getenv('QUERY_INSTRUMENTATION_ENABLED', str(DEBUG)).lower() == 'true'
+# هدرهای X-DB-* خارج از DEBUG هم اضافه شوند
+QUERY_INSTRUMENTATION_HEADERS = os.getenv('QUERY_INSTRUMENTATION_HEADERS', 'False').lower() == 'true'
+# عبور از بودجه به‌جای هشدار در لاگ خطا شود (برای اجرای محلی/CI)
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False').lower() == 'true'
+# سقف تکرار یک کوئری در یک درخواست/task (نشانه N+1) برای برچسب‌های بدون بودجه صریح
+QUERY_REPEAT_LIMIT = int(os.getenv('QUERY_REPEAT_LIMIT', '10'))
+QUERY_REPORT_WINDOW = int(os.getenv('QUERY_REPORT_WINDOW', '200'))
+QUERY_REPORT_TTL = int(os.getenv('QUERY_REPORT_TTL', '86400'))
+# بودجه برچسب‌های پرترافیک (نام view با namespace یا task:<نام task>)؛ مقادیر مستقل از تعداد ردیف‌اند
+# و از درخواست سرد اندازه‌گیری شده‌اند (کار middlewareها: سشن، PageView و ساخت SiteStats اولین درخواست روز)
+QUERY_BUDGETS = {
+    'store_analysis:user_dashboard': {'queries': 25, 'repeats': 3},
+    'store_analysis:analysis_list': {'queries': 20, 'repeats': 3},
+    'store_analysis:admin_dashboard': {'queries': 30, 'repeats': 3},
+    'store_analysis:payment_history': {'queries': 20, 'repeats': 3},
+    'admin:store_analysis_storeanalysis_changelist': {'queries': 15, 'repeats': 3},
+    'admin:store_analysis_payment_changelist': {'queries': 12, 'repeats': 3},
+    'task:store_analysis.send_review_reminders': {'queries': 40, 'repeats': 10},
 }
 
 # HTTPS Settings - handled above in security section
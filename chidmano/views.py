@@ -28,7 +28,7 @@ def signup_view(request):
             form = CustomUserCreationForm(request.POST)
             
             # لاگ کردن داده‌های دریافتی برای دیباگ
-            logger.info(f"📥 Signup POST data: {request.POST}")
+            logger.info("📥 Signup POST data: %s", request.POST)
             
             if form.is_valid():
                 try:
@@ -254,7 +254,6 @@ def dashboard_view(request):
 def simple_home(request):
     """صفحه اصلی فوق‌العاده جذاب و حرفه‌ای"""
     import time
-    from django.core.cache import cache
     from datetime import datetime
     
     # تخفیف افتتاحیه - 2 هفته از تاریخ شروع (2025-11-27)
@@ -302,8 +301,9 @@ def simple_home(request):
             'time_remaining_seconds': 0
         }
     
-    # دریافت تنظیمات سیستم از cache
-    saved_settings = cache.get('admin_settings', {})
+    # دریافت تنظیمات سیستم (مشترک بین همه workerها)
+    from store_analysis.utils.config_store import ConfigStore
+    saved_settings = ConfigStore.get_admin_settings()
     
     # مقادیر واقعی - اطلاعات تماس چیدمانو
     site_name = saved_settings.get('site_name', 'چیدمانو')
@@ -0,0 +1,175 @@
+"""
+مدیریت workerهای gunicorn: تعیین تعداد worker/thread از حافظه و CPU در دسترس (با
+احترام به محدودیت cgroup کانتینر) و بازنشستگی worker بر اساس رشد RSS به‌جای تعداد
+درخواست. این ماژول پیش از بارگذاری Django در gunicorn.conf.py import می‌شود و نباید
+به Django وابسته باشد.
+"""
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """تعداد CPU قابل استفاده: quota cgroup (v2/v1)، سپس affinity و cpu_count"""
+    quota = _read('/sys/fs/cgroup/cpu.max')
+    if quota:
+        limit, _, period = quota.partition(' ')
+        if limit != 'max' and period:
+            return max(float(limit) / float(period), 0.1)
+    limit, period = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if limit and period and int(limit) > 0:
+        return max(int(limit) / int(period), 0.1)
+    try:
+        return float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return float(os.cpu_count() or 1)
+
+
+def memory_limit_bytes() -> int:
+    """حافظه در دسترس کانتینر: memory.max cgroup (v2/v1) یا کل حافظه سیستم"""
+    total = psutil.virtual_memory().total if PSUTIL_AVAILABLE else 0
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        if value and value.isdigit():
+            limit = int(value)
+            # cgroup v1 بدون محدودیت عدد بسیار بزرگی برمی‌گرداند
+            if not total or limit < total:
+                return limit
+    if total:
+        return total
+    pages, page_size = os.sysconf('SC_PHYS_PAGES'), os.sysconf('SC_PAGE_SIZE')
+    return pages * page_size
+
+
+def process_rss_bytes(pid: Optional[int] = None) -> int:
+    if PSUTIL_AVAILABLE:
+        return psutil.Process(pid).memory_info().rss
+    statm = _read(f"/proc/{pid or 'self'}/statm")
+    return int(statm.split()[1]) * os.sysconf('SC_PAGE_SIZE') if statm else 0
+
+
+@dataclass
+class WorkerPlan:
+    workers: int
+    threads: int
+    cpus: float
+    memory_mb: int
+    reason: str
+
+    @property
+    def worker_class(self) -> str:
+        return 'gthread' if self.threads > 1 else 'sync'
+
+
+def plan_workers(
+    cpus: float,
+    memory_mb: int,
+    worker_mb: int,
+    reserve_mb: int = 256,
+    max_workers: int = 8,
+    threads: int = 4,
+) -> WorkerPlan:
+    """
+    تعداد worker = کمینه (2×CPU+1، حافظه قابل تخصیص ÷ حافظه هر worker، max_workers).
+    درخواست‌ها عمدتاً منتظر LLM/دیتابیس‌اند، پس هم‌زمانی اضافه با thread (ارزان) تأمین
+    می‌شود نه با worker (هر worker چند صد مگابایت کتابخانه ML دارد).
+    """
+    by_cpu = int(2 * cpus) + 1
+    by_memory = int(max(memory_mb - reserve_mb, 0) // max(worker_mb, 1))
+    workers = max(1, min(by_cpu, by_memory, max_workers))
+    if workers == max_workers:
+        reason = 'max_workers'
+    elif workers == by_memory or by_memory < 1:
+        reason = 'memory'
+    else:
+        reason = 'cpu'
+    return WorkerPlan(workers=workers, threads=max(1, threads), cpus=cpus, memory_mb=memory_mb, reason=reason)
+
+
+def plan_from_environ(environ=os.environ) -> WorkerPlan:
+    """
+    GUNICORN_WORKERS عددی تعداد ثابت است و auto یعنی تعیین خودکار؛ بدون آن WEB_CONCURRENCY
+    عددی استفاده می‌شود. WEB_CONCURRENCY باید عددی بماند چون gunicorn هنگام import
+    gunicorn.config آن را با int() می‌خواند (پیش از اجرای gunicorn.conf.py).
+    """
+    threads = int(environ.get('GUNICORN_THREADS', '4'))
+    cpus = cpu_limit()
+    memory_mb = memory_limit_bytes() // MB
+    for name in ('GUNICORN_WORKERS', 'WEB_CONCURRENCY'):
+        fixed = (environ.get(name) or '').strip().lower()
+        if fixed:
+            break
+    if fixed and fixed != 'auto':
+        return WorkerPlan(workers=max(1, int(fixed)), threads=max(1, threads), cpus=cpus,
+                          memory_mb=memory_mb, reason=name)
+    return plan_workers(
+        cpus=cpus,
+        memory_mb=memory_mb,
+        worker_mb=int(environ.get('WORKER_MEMORY_MB', '450')),
+        reserve_mb=int(environ.get('MEMORY_RESERVE_MB', '256')),
+        max_workers=int(environ.get('MAX_WORKERS', '8')),
+        threads=threads,
+    )
+
+
+class RssRecycler:
+    """
+    تصمیم بازنشستگی worker: هر check_every درخواست RSS خوانده و با RSS پس از fork
+    مقایسه می‌شود؛ با عبور رشد از max_growth_mb (یا RSS از max_rss_mb) worker پس از
+    درخواست‌های جاری به‌صورت graceful خارج می‌شود.
+    """
+
+    def __init__(self, max_growth_mb: int = 512, max_rss_mb: int = 0, check_every: int = 10):
+        self.max_growth = max_growth_mb * MB
+        self.max_rss = max_rss_mb * MB
+        self.check_every = max(1, check_every)
+        self.baseline = None
+        self.requests = 0
+
+    @classmethod
+    def from_environ(cls, environ=os.environ) -> 'RssRecycler':
+        return cls(
+            max_growth_mb=int(environ.get('WORKER_MAX_RSS_GROWTH_MB', '512')),
+            max_rss_mb=int(environ.get('WORKER_MAX_RSS_MB', '0')),
+            check_every=int(environ.get('WORKER_RSS_CHECK_EVERY', '10')),
+        )
+
+    def start(self, rss: Optional[int] = None) -> None:
+        self.baseline = process_rss_bytes() if rss is None else rss
+        self.requests = 0
+
+    def should_recycle(self, rss: Optional[int] = None) -> Optional[str]:
+        """دلیل بازنشستگی یا None؛ RSS فقط هر check_every درخواست خوانده می‌شود"""
+        self.requests += 1
+        if self.requests % self.check_every:
+            return None
+        rss = process_rss_bytes() if rss is None else rss
+        if self.baseline is None:
+            self.baseline = rss
+            return None
+        growth = rss - self.baseline
+        if self.max_growth and growth > self.max_growth:
+            return f"RSS grew {growth // MB}MB since fork ({rss // MB}MB now)"
+        if self.max_rss and rss > self.max_rss:
+            return f"RSS {rss // MB}MB over limit {self.max_rss // MB}MB"
+        return None
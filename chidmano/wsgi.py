@@ -42,12 +42,16 @@
     logging.getLogger(__name__).warning(f"⚠️ Auto-migration setup error: {e}")
     pass
 
+# یک بار ساخته می‌شود (با preload_app در master)؛ ساخت handler در هر درخواست middleware را هر بار بارگذاری می‌کرد
+_django_application = get_wsgi_application()
+
+
 # Create a simple health check wrapper
 def health_check_wrapper(environ, start_response):
     """Ultra-light health check that bypasses Django completely"""
     if environ.get('PATH_INFO') in ['/health', '/health/']:
         start_response('200 OK', [('Content-Type', 'text/plain')])
         return [b'OK']
-    return get_wsgi_application()(environ, start_response)
+    return _django_application(environ, start_response)
 
 application = health_check_wrapper 
\ No newline at end of file
@@ -1,22 +1,32 @@
 # Gunicorn configuration for Chidmano Store Analysis
 import multiprocessing
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chidmano.worker_tuning import RssRecycler, plan_from_environ
 
 # Server socket
 port = os.environ.get('PORT', '8000')
 bind = f"0.0.0.0:{port}"
 backlog = 2048
 
-# Worker processes - use 1 for Liara to avoid memory issues
-workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
-worker_class = "sync"
+# Worker processes - GUNICORN_WORKERS (یا WEB_CONCURRENCY) عددی ثابت است؛ GUNICORN_WORKERS=auto یعنی تعیین از CPU و حافظه کانتینر
+_plan = plan_from_environ()
+workers = _plan.workers
+# درخواست‌ها عمدتاً منتظر LLM/دیتابیس‌اند؛ threadها هم‌زمانی را بدون حافظه worker اضافه تأمین می‌کنند
+threads = _plan.threads
+# ASGI_MODE=true: chidmano.asgi با worker uvicorn (viewهای async؛ انتظار LLM worker را block نمی‌کند)
+asgi_mode = os.environ.get('ASGI_MODE', 'False').lower() == 'true'
+worker_class = "uvicorn.workers.UvicornWorker" if asgi_mode else _plan.worker_class
 worker_connections = 1000
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', os.environ.get('TIMEOUT', '300')))  # 5 minutes for AI processing
 keepalive = 2
 
-# Restart workers after this many requests, to prevent memory leaks
-max_requests = 1000
-max_requests_jitter = 50
+# بازنشستگی worker بر اساس رشد RSS (post_request)؛ تعداد درخواست فقط در صورت تنظیم صریح
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = 50 if max_requests else 0
 
 # Logging
 accesslog = "-"
@@ -43,4 +53,58 @@
 
 # Worker timeout for AI processing
 worker_timeout = 300  # 5 minutes
-graceful_timeout = 120  # 2 minutes for graceful shutdown
\ No newline at end of file
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '120'))  # 2 minutes for graceful shutdown
+
+
+def post_fork(server, worker):
+    worker._rss_recycler = RssRecycler.from_environ()
+    worker._rss_recycler.start()
+
+
+def post_request(worker, req, environ, resp):
+    """worker با رشد RSS پس از پایان درخواست‌های جاری به‌صورت graceful بازنشسته می‌شود"""
+    recycler = getattr(worker, '_rss_recycler', None)
+    if recycler is None or not worker.alive:
+        return
+    reason = recycler.should_recycle()
+    if reason:
+        worker.log.info(f"Recycling worker {worker.pid}: {reason}")
+        worker.alive = False
+
+
+def worker_exit(server, worker):
+    """انتظار برای تحلیل‌های پس‌زمینه در حال اجرا پیش از خروج worker"""
+    try:
+        from store_analysis.utils.inflight import InflightTracker
+    except Exception:
+        return
+    if InflightTracker.active():
+        worker.log.info(f"Worker {worker.pid} draining {InflightTracker.active()} background analyses")
+        InflightTracker.wait_idle(max(graceful_timeout - 5, 0), tick=worker.notify)
+
+
+def when_ready(server):
+    """ساخت سرویس‌های AI در master پیش از fork تا workerها نمونه‌های آماده را به ارث ببرند"""
+    if not preload_app:
+        return
+    server.log.info(
+        f"Workers: {workers} x {threads} threads ({worker_class}); "
+        f"cpus={_plan.cpus:g} memory={_plan.memory_mb}MB limited by {_plan.reason}"
+    )
+    try:
+        import django
+        django.setup()
+        from store_analysis.ai_services.registry import ServiceRegistry
+        stats = ServiceRegistry.warm_up()
+        for name, info in stats.items():
+            if info.get('loaded'):
+                server.log.info(f"AI service {name} warmed up in {info['total_seconds']:.3f}s")
+            elif info.get('error'):
+                server.log.warning(f"AI service {name} warm-up failed: {info['error']}")
+    except Exception as e:
+        server.log.warning(f"AI service warm-up skipped: {e}")
+    try:
+        from store_analysis.utils.preload import preload_shared_resources
+        server.log.info(f"Shared resources preloaded: {preload_shared_resources()}")
+    except Exception as e:
+        server.log.warning(f"Shared resource preload skipped: {e}")
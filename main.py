@@ -51,17 +51,26 @@
         port = os.environ.get('PORT', '8000')
         # Respect WEB_CONCURRENCY if provided; default to 1 to reduce memory usage
         workers = os.environ.get('WEB_CONCURRENCY', '1')
+        if not workers.isdigit():
+            # تعیین خودکار (GUNICORN_WORKERS=auto) فقط در gunicorn.conf.py انجام می‌شود
+            workers = '1'
         timeout = os.environ.get('GUNICORN_TIMEOUT', os.environ.get('TIMEOUT', '300'))
         if not timeout or timeout == '':
             timeout = '300'
 
         # Use gunicorn.conf.py if it exists, otherwise use command line arguments
+        # ASGI_MODE=true: اجرای chidmano.asgi با worker uvicorn (viewهای async)
+        asgi_mode = os.environ.get('ASGI_MODE', 'False').lower() == 'true'
+        app = "chidmano.asgi:application" if asgi_mode else "chidmano.wsgi:application"
+        print(f"🔌 Application: {app}")
+
         config_file = os.path.join(os.path.dirname(__file__), 'gunicorn.conf.py')
         if os.path.exists(config_file):
-            cmd = f"gunicorn chidmano.wsgi:application --config gunicorn.conf.py --bind 0.0.0.0:{port}"
+            cmd = f"gunicorn {app} --config gunicorn.conf.py --bind 0.0.0.0:{port}"
             print(f"✅ Using gunicorn.conf.py configuration")
         else:
-            cmd = f"gunicorn chidmano.wsgi:application --bind 0.0.0.0:{port} --workers {workers} --timeout {timeout} --access-logfile - --error-logfile -"
+            worker_class = "uvicorn.workers.UvicornWorker" if asgi_mode else "sync"
+            cmd = f"gunicorn {app} --bind 0.0.0.0:{port} --workers {workers} --worker-class {worker_class} --timeout {timeout} --access-logfile - --error-logfile -"
             print(f"⚠️ Using command line arguments (gunicorn.conf.py not found)")
 
         subprocess.run(shlex.split(cmd))
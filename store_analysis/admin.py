@@ -10,6 +10,7 @@
 from django.contrib.admin import SimpleListFilter
 from django.http import HttpResponse
 import csv
+from functools import lru_cache
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.urls import path
@@ -17,9 +18,19 @@
 from .models import (
     Payment, PaymentLog, ServicePackage, UserSubscription,
     ChatSession, ChatMessage, FreeUsageTracking, StoreAnalysis,
-    SupportTicket
+    SupportTicket, ApiKey
 )
 
+@lru_cache(maxsize=1)
+def _geoip():
+    """GeoIP2 یک بار برای هر پروسس باز می‌شود (نه برای هر ردیف changelist)؛ None اگر در دسترس نباشد"""
+    try:
+        from django.contrib.gis.geoip2 import GeoIP2
+        return GeoIP2()
+    except Exception:
+        return None
+
+
 # --- Custom Filters ---
 class PaymentStatusFilter(SimpleListFilter):
     """فیلتر بر اساس وضعیت پرداخت"""
@@ -116,6 +127,9 @@ class PaymentAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at', 'updated_at', 'completed_at']
     ordering = ['-created_at']
     list_per_page = 25
+    list_select_related = ['user']
+    # در جدول‌های بزرگ COUNT(*) کامل برای هر صفحه changelist اجرا نمی‌شود
+    show_full_result_count = False
     
     fieldsets = (
         ('اطلاعات پرداخت', {
@@ -228,9 +242,8 @@ def client_location(self, obj):
 
             # اگر GeoIP2 نصب و پیکربندی شده باشد آن را استفاده کن
             try:
-                from django.contrib.gis.geoip2 import GeoIP2
-                g = GeoIP2()
-                info = g.city(ip)
+                g = _geoip()
+                info = g.city(ip) if g else {}
                 city = info.get('city')
                 country = info.get('country_name')
                 if city or country:
@@ -264,7 +277,9 @@ def recent_payments_locations_view(self, request):
             from django.core.exceptions import PermissionDenied
             raise PermissionDenied()
 
-        payments = Payment.objects.order_by('-created_at')[:200]
+        payments = Payment.objects.select_related('user').only(
+            'order_id', 'amount', 'currency', 'status', 'client_ip', 'created_at', 'user__username'
+        ).order_by('-created_at')[:200]
 
         rows = []
         for p in payments:
@@ -460,6 +475,8 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
     list_per_page = 25
+    list_select_related = ['user', 'package']
+    show_full_result_count = False
     
     fieldsets = (
         ('اطلاعات اشتراک', {
@@ -566,6 +583,7 @@ class StoreAnalysisAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at', 'completed_at')
     ordering = ['-created_at']
     list_per_page = 25
+    list_select_related = ('user',)
 
     fieldsets = (
         ('اطلاعات فروشگاه', {
@@ -580,15 +598,33 @@ class StoreAnalysisAdmin(admin.ModelAdmin):
         }),
     )
 
+    LOCATION_KEYS = ('city', 'area', 'region', 'province', 'location')
+
+    def get_queryset(self, request):
+        # فقط کلیدهای موقعیت از analysis_data خوانده می‌شوند، نه کل سند JSON هر ردیف
+        from django.db.models.fields.json import KT
+
+        return super().get_queryset(request).annotate(
+            **{f'location_{key}': KT(f'analysis_data__{key}') for key in self.LOCATION_KEYS}
+        )
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        # فرم ویرایش ستون‌های JSON را نمایش می‌دهد؛ همه با یک کوئری بارگذاری می‌شوند
+        return obj.load_payload() if obj is not None else obj
+
     def get_location(self, obj):
         """سعی می‌کنیم موقعیت (شهر/منطقه/آدرس) را از فیلدهای مختلف استخراج کنیم."""
         try:
             if obj.store_address:
                 return obj.store_address
             # نگاه به داده‌های فرم (analysis_data) برای فیلدهای رایج
-            data = obj.analysis_data or {}
-            for key in ('city', 'area', 'region', 'province', 'location'):
-                val = data.get(key)
+            if hasattr(obj, 'location_city'):
+                values = [getattr(obj, f'location_{key}') for key in self.LOCATION_KEYS]
+            else:
+                data = obj.analysis_data or {}
+                values = [data.get(key) for key in self.LOCATION_KEYS]
+            for val in values:
                 if val:
                     return val
             return '-'
@@ -620,6 +656,31 @@ class SupportTicketAdmin(admin.ModelAdmin):
         }),
     )
 
+# --- API Key Admin ---
+@admin.register(ApiKey)
+class ApiKeyAdmin(admin.ModelAdmin):
+    """مدیریت کلیدهای API (صدور با manage.py api_keys create)"""
+    list_display = ('name', 'user', 'prefix', 'scopes', 'expires_at', 'revoked_at', 'last_used_at', 'created_at')
+    list_filter = ('revoked_at', 'created_at')
+    search_fields = ('name', 'prefix', 'user__username')
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'prefix', 'key_hash', 'last_used_at', 'created_at', 'revoked_at')
+    actions = ['revoke_keys']
+
+    def has_add_permission(self, request):
+        # کلید خام فقط هنگام صدور نمایش داده می‌شود؛ صدور از طریق management command
+        return False
+
+    def revoke_keys(self, request, queryset):
+        """ابطال کلیدهای انتخاب‌شده در همه workerها"""
+        from .services.api_keys import ApiKeyService
+        keys = list(queryset.filter(revoked_at__isnull=True))
+        for api_key in keys:
+            ApiKeyService.revoke(api_key)
+        self.message_user(request, f'{len(keys)} کلید API باطل شد.')
+    revoke_keys.short_description = 'ابطال کلیدهای انتخاب‌شده'
+
+
 # --- Admin Site Configuration ---
 admin.site.site_header = "مدیریت چیدمانو"
 admin.site.site_title = "چیدمانو"
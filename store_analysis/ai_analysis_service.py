@@ -58,8 +58,8 @@ def analyze_store(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
     def _fallback_analysis(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
         """تحلیل ساده در صورت خطا در OpenAI"""
         try:
-            from .ai_analysis_service_simple import SimpleAIAnalysisService
-            simple_service = SimpleAIAnalysisService()
+            from .ai_services.registry import ServiceRegistry
+            simple_service = ServiceRegistry.get('simple_ai')
             return simple_service.analyze_store(store_data)
         except:
             return {
@@ -413,9 +413,9 @@ def process_persian_text_for_pdf(text):
                     return text
                 
                 try:
-                    import arabic_reshaper
-                    # اعمال Character Shaping برای اتصال کاراکترها
-                    processed_text = arabic_reshaper.reshape(text)
+                    from .utils.persian_shaping import PersianShaper
+                    # اعمال Character Shaping برای اتصال کاراکترها (cache‌شده)
+                    processed_text = PersianShaper.reshape(text)
                     return processed_text
                 except Exception as e:
                     logger.warning(f"⚠️ خطا در پردازش متن فارسی: {e}")
@@ -497,5 +497,6 @@ def process_persian_text_for_pdf(text):
 # تابع کمکی برای استفاده در views
 def perform_ai_analysis_for_order(order_id: str, store_data: Dict[str, Any]) -> Dict[str, Any]:
     """انجام تحلیل AI برای یک سفارش"""
-    service = AIAnalysisService()
+    from .ai_services.registry import ServiceRegistry
+    service = ServiceRegistry.get('ai_analysis')
     return service.perform_complete_analysis(store_data)
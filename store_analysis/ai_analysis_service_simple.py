@@ -1080,9 +1080,9 @@ def process_persian_text_for_pdf(text):
                     return text
                 
                 try:
-                    import arabic_reshaper
-                    # اعمال Character Shaping برای اتصال کاراکترها
-                    processed_text = arabic_reshaper.reshape(text)
+                    from .utils.persian_shaping import PersianShaper
+                    # اعمال Character Shaping برای اتصال کاراکترها (cache‌شده)
+                    processed_text = PersianShaper.reshape(text)
                     return processed_text
                 except Exception as e:
                     logger.warning(f"⚠️ خطا در پردازش متن فارسی: {e}")
@@ -1,9 +1,19 @@
 """
 پکیج سرویس‌های هوش مصنوعی چیدمانو
 شامل سرویس‌های پیشرفته AI برای تحلیل فروشگاه‌ها
+
+سرویس‌ها هنگام import پکیج بارگذاری نمی‌شوند؛ نمونه مشترک هر سرویس از
+ServiceRegistry (registry.py) گرفته شود.
 """
 
-from .liara_ai_service import LiaraAIService
+from .registry import ServiceRegistry
 # from .advanced_ai_manager import AdvancedAIManager  # فایل ai_analysis وجود ندارد
 
-__all__ = ['LiaraAIService']  # , 'AdvancedAIManager']
+__all__ = ['LiaraAIService', 'ServiceRegistry']  # , 'AdvancedAIManager']
+
+
+def __getattr__(name):
+    if name == 'LiaraAIService':
+        from .liara_ai_service import LiaraAIService
+        return LiaraAIService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
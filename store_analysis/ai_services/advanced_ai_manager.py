@@ -9,7 +9,7 @@
 from django.core.cache import cache
 import time
 
-from .liara_ai_service import LiaraAIService
+from .registry import ServiceRegistry
 # from ..ai_analysis import StoreAnalysisAI  # فایل ai_analysis وجود ندارد
 
 logger = logging.getLogger(__name__)
@@ -18,7 +18,7 @@ class AdvancedAIManager:
     """مدیر پیشرفته هوش مصنوعی"""
     
     def __init__(self):
-        self.liara_ai = LiaraAIService()
+        self.liara_ai = ServiceRegistry.get('liara')
         # self.ollama_ai = StoreAnalysisAI()  # فایل ai_analysis وجود ندارد
         self.use_liara = getattr(settings, 'USE_LIARA_AI', True)
         self.fallback_to_ollama = getattr(settings, 'FALLBACK_TO_OLLAMA', True)
@@ -40,8 +40,8 @@ def __init__(self):
     def _init_liara_ai(self):
         """راه‌اندازی سرویس Chidmano1 AI"""
         try:
-            from .liara_ai_service import LiaraAIService
-            self.liara_ai_service = LiaraAIService()
+            from .registry import ServiceRegistry
+            self.liara_ai_service = ServiceRegistry.get('liara')
         except Exception as e:
             logger.warning(f"Chidmano1 AI service not available: {e}")
     
@@ -2,6 +2,7 @@
 AI Consultant Service - مشاوره هوشمند بر اساس تحلیل فروشگاه
 """
 
+import asyncio
 import logging
 import os
 import time
@@ -9,6 +10,12 @@
 from typing import Dict, Any, List
 from django.conf import settings
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
 # Import Ollama برای پلن رایگان
 try:
     import ollama
@@ -28,7 +35,11 @@ def __init__(self):
         # سرویس AI از طریق دامنه ai.liara.ir ارائه می‌شود
         # 🔧 strip کردن فاصله‌های اضافی برای جلوگیری از خطای 403
         workspace_id = (os.getenv('LIARA_AI_PROJECT_ID', 'ai-bqteya6wz') or 'ai-bqteya6wz').strip()
-        self.api_url = f"https://ai.liara.ir/api/{workspace_id}/v1/chat/completions"
+        base_url = getattr(settings, 'LIARA_AI_BASE_URL', 'https://ai.liara.ir/api').rstrip('/')
+        self.api_url = f"{base_url}/{workspace_id}/v1/chat/completions"
+        # کلاینت httpx برای مسیر async؛ به event loop سازنده‌اش وابسته است
+        self._async_client = None
+        self._async_client_loop = None
     
     def chat_with_analysis(
         self,
@@ -70,58 +81,82 @@ def chat_with_analysis(
                 
                 # ارسال به Liara AI
                 response = self._call_liara_ai(messages)
-                processing_time = time.time() - start_time
-                
-                if response:
-                    return {
-                        'response': response,
-                        'ai_model': 'gpt-4.1',
-                        'processing_time': processing_time,
-                        'success': True
-                    }
-                else:
-                    # Fallback: پاسخ ساده
-                    fallback_response = self._generate_fallback_response(user_message, analysis_context)
-                    return {
-                        'response': fallback_response,
-                        'ai_model': 'fallback',
-                        'processing_time': processing_time,
-                        'success': False
-                    }
+                return self._chat_result(response, 'gpt-4.1', user_message, analysis_context, start_time)
             
             # پلن رایگان: استفاده از Ollama
             else:
                 logger.info(f"🆓 استفاده از Ollama برای پلن رایگان")
                 response = self._generate_ollama_response(user_message, analysis_context, chat_history)
-                processing_time = time.time() - start_time
-                
-                if response:
-                    return {
-                        'response': response,
-                        'ai_model': 'ollama-llama3.2',
-                        'processing_time': processing_time,
-                        'success': True
-                    }
-                else:
-                    # Fallback: پاسخ ساده
-                    fallback_response = self._generate_fallback_response(user_message, analysis_context)
-                    return {
-                        'response': fallback_response,
-                        'ai_model': 'fallback',
-                        'processing_time': processing_time,
-                        'success': False
-                    }
+                return self._chat_result(response, 'ollama-llama3.2', user_message, analysis_context, start_time)
+        
+        except Exception as e:
+            return self._chat_error(e, start_time)
+    
+    async def achat_with_analysis(
+        self,
+        user_message: str,
+        store_analysis: Any,
+        chat_history: List[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        نسخه async چت برای viewهای ASGI: درخواست Liara AI با httpx بدون block کردن
+        event loop ارسال می‌شود (Ollama در thread جداگانه). خروجی همانند chat_with_analysis.
+        store_analysis باید از قبل بارگذاری شده باشد (این متد به دیتابیس دسترسی ندارد).
+        """
+        start_time = time.time()
+        
+        try:
+            package_type = getattr(store_analysis, 'package_type', 'basic')
+            is_premium = package_type in ['professional', 'enterprise']
+            analysis_context = self._prepare_analysis_context(store_analysis)
+            
+            if is_premium:
+                messages = self._prepare_messages(user_message, analysis_context, chat_history)
+                response = await self._acall_liara_ai(messages)
+                return self._chat_result(response, 'gpt-4.1', user_message, analysis_context, start_time)
+            
+            response = await asyncio.to_thread(
+                self._generate_ollama_response, user_message, analysis_context, chat_history
+            )
+            return self._chat_result(response, 'ollama-llama3.2', user_message, analysis_context, start_time)
         
         except Exception as e:
-            logger.error(f"❌ خطا در AI consultant: {e}", exc_info=True)
-            processing_time = time.time() - start_time
+            return self._chat_error(e, start_time)
+    
+    def _chat_result(
+        self,
+        response: str,
+        ai_model: str,
+        user_message: str,
+        analysis_context: str,
+        start_time: float
+    ) -> Dict[str, Any]:
+        processing_time = time.time() - start_time
+        if response:
             return {
-                'response': 'متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً امتحان کنید.',
-                'ai_model': 'error',
+                'response': response,
+                'ai_model': ai_model,
                 'processing_time': processing_time,
-                'success': False,
-                'error': str(e)
+                'success': True
             }
+        # Fallback: پاسخ ساده
+        fallback_response = self._generate_fallback_response(user_message, analysis_context)
+        return {
+            'response': fallback_response,
+            'ai_model': 'fallback',
+            'processing_time': processing_time,
+            'success': False
+        }
+    
+    def _chat_error(self, error: Exception, start_time: float) -> Dict[str, Any]:
+        logger.error(f"❌ خطا در AI consultant: {error}", exc_info=True)
+        return {
+            'response': 'متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً امتحان کنید.',
+            'ai_model': 'error',
+            'processing_time': time.time() - start_time,
+            'success': False,
+            'error': str(error)
+        }
     
     def _prepare_analysis_context(self, store_analysis: Any) -> str:
         """آماده‌سازی context از تحلیل فروشگاه"""
@@ -213,6 +248,29 @@ def _prepare_messages(
         
         return messages
     
+    def _liara_request(self, messages: List[Dict[str, str]]):
+        """headers و body درخواست Liara AI"""
+        headers = {
+            "Authorization": f"Bearer {self.liara_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": "gpt-4.1",
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 1500
+        }
+        return headers, data
+    
+    @staticmethod
+    def _liara_content(status_code: int, result: Any) -> str:
+        if status_code == 200:
+            ai_response = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+            logger.info("✅ Liara AI response received")
+            return ai_response
+        logger.error(f"❌ Liara AI error: {status_code}")
+        return None
+    
     def _call_liara_ai(self, messages: List[Dict[str, str]]) -> str:
         """فراخوانی Liara AI"""
         try:
@@ -220,17 +278,7 @@ def _call_liara_ai(self, messages: List[Dict[str, str]]) -> str:
                 logger.warning("⚠️ Liara AI API key not found")
                 return None
             
-            headers = {
-                "Authorization": f"Bearer {self.liara_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "gpt-4.1",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 1500
-            }
+            headers, data = self._liara_request(messages)
             
             logger.info("🚀 Calling Liara AI for consultation...")
             response = requests.post(
@@ -240,19 +288,44 @@ def _call_liara_ai(self, messages: List[Dict[str, str]]) -> str:
                 timeout=30
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result.get('choices', [{}])[0].get('message', {}).get('content', '')
-                logger.info("✅ Liara AI response received")
-                return ai_response
-            else:
-                logger.error(f"❌ Liara AI error: {response.status_code}")
-                return None
+            return self._liara_content(
+                response.status_code, response.json() if response.status_code == 200 else None
+            )
                 
         except Exception as e:
             logger.error(f"❌ خطا در فراخوانی Liara AI: {e}")
             return None
     
+    def _get_async_client(self):
+        """کلاینت httpx مشترک (connection pool) برای event loop جاری"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(max_connections=getattr(settings, 'ASYNC_LLM_MAX_CONNECTIONS', 50)),
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def _acall_liara_ai(self, messages: List[Dict[str, str]]) -> str:
+        """فراخوانی async Liara AI (بدون اشغال thread در طول انتظار پاسخ)"""
+        if not HTTPX_AVAILABLE:
+            return await asyncio.to_thread(self._call_liara_ai, messages)
+        try:
+            if not self.liara_api_key:
+                logger.warning("⚠️ Liara AI API key not found")
+                return None
+            
+            headers, data = self._liara_request(messages)
+            logger.info("🚀 Calling Liara AI for consultation (async)...")
+            response = await self._get_async_client().post(self.api_url, headers=headers, json=data)
+            return self._liara_content(
+                response.status_code, response.json() if response.status_code == 200 else None
+            )
+        except Exception as e:
+            logger.error(f"❌ خطا در فراخوانی Liara AI: {e}")
+            return None
+    
     def _generate_ollama_response(
         self,
         user_message: str,
@@ -13,10 +13,28 @@
 
 logger = logging.getLogger(__name__)
 
+class LiaraRequestError(RuntimeError):
+    pass
+
+
 class LiaraAIService:
     """سرویس هوش مصنوعی پیشرفته لیارا"""
     
-    def __init__(self):
+    SYSTEM_PROMPT = "شما بهترین متخصص تحلیل فروشگاه و مشاور کسب‌وکار دنیا هستید. تخصص شما در بهینه‌سازی چیدمان فروشگاه‌ها و افزایش فروش است. فقط از زبان فارسی استفاده کنید و هرگز از کلمات انگلیسی مثل regards، Small، Kids_Clothing، Neutral، attractiveness، Design، functionality، example استفاده نکنید."
+    
+    # بخش‌هایی که در prompt packing می‌توانند با هم در یک درخواست بروند:
+    # بخش -> (کلید مدل، متد پرامپت، نوع خروجی، نام مدل در خروجی، max_tokens)
+    PACKABLE_SECTIONS = {
+        'design': ('design', '_design_prompt', 'design_analysis', 'claude-3-opus', 3000),
+        'psychology': ('psychology', '_psychology_prompt', 'psychology_analysis', 'claude-3-sonnet', 3000),
+        'marketing': ('marketing', '_marketing_prompt', 'marketing_analysis', 'gpt-4o', 3000),
+        'optimization': ('optimization', '_optimization_prompt', 'optimization_analysis', 'gpt-4-turbo', 3000),
+    }
+    
+    def __init__(self, rate_budget=None):
+        # بودجه نرخ درخواست مشترک (مثلاً RateBudget در بازیابی گروهی)؛ None یعنی بدون محدودیت
+        self.rate_budget = rate_budget
+        
         # URL صحیح API لیارا AI - بر اساس پاسخ پشتیبانی لیارا
         # سرویس AI از طریق دامنه ai.liara.ir ارائه می‌شود
         # Endpoint صحیح: https://ai.liara.ir/api/{workspaceID}/v1/chat/completions
@@ -68,7 +86,7 @@ def __init__(self):
         }
         logger.info(f"🤖 استفاده از مدل AI: {default_model}")
     
-    def _make_request(self, model: str, prompt: str, max_tokens: int = 4000, temperature: float = 0.7) -> Dict:
+    def _make_request(self, model: str, prompt: str, max_tokens: int = 4000, temperature: float = 0.7, json_mode: bool = False) -> Dict:
         """ارسال درخواست به API لیارا"""
         # بررسی وجود API key
         if not self.api_key:
@@ -78,13 +96,16 @@ def _make_request(self, model: str, prompt: str, max_tokens: int = 4000, tempera
                 'error_message': 'کلید API لیارا تنظیم نشده است. لطفاً با پشتیبانی تماس بگیرید.'
             }
         
+        if self.rate_budget is not None:
+            self.rate_budget.acquire()
+        
         try:
             payload = {
                 "model": model,
                 "messages": [
                     {
                         "role": "system",
-                        "content": "شما بهترین متخصص تحلیل فروشگاه و مشاور کسب‌وکار دنیا هستید. تخصص شما در بهینه‌سازی چیدمان فروشگاه‌ها و افزایش فروش است. فقط از زبان فارسی استفاده کنید و هرگز از کلمات انگلیسی مثل regards، Small، Kids_Clothing، Neutral، attractiveness، Design، functionality، example استفاده نکنید."
+                        "content": self.SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -97,6 +118,8 @@ def _make_request(self, model: str, prompt: str, max_tokens: int = 4000, tempera
                 "frequency_penalty": 0.1,
                 "presence_penalty": 0.1
             }
+            if json_mode:
+                payload["response_format"] = {"type": "json_object"}
             
             # ساخت URL API - بر اساس پاسخ پشتیبانی لیارا
             # Endpoint صحیح: https://ai.liara.ir/api/{workspaceID}/v1/chat/completions
@@ -194,8 +217,15 @@ def _make_request(self, model: str, prompt: str, max_tokens: int = 4000, tempera
                 'error_message': f'خطای غیرمنتظره: {str(e)}'
             }
     
-    def analyze_store_comprehensive(self, store_data: Dict[str, Any], images: List[str] = None, videos: List[Dict] = None, sales_data_file: str = None) -> Dict[str, Any]:
-        """تحلیل جامع و حرفه‌ای فروشگاه با استفاده از چندین مدل AI و پردازش تصاویر، ویدیو و داده‌های فروش"""
+    def analyze_store_comprehensive(self, store_data: Dict[str, Any], images: List[str] = None, videos: List[Dict] = None, sales_data_file: str = None, run_id: Any = None) -> Dict[str, Any]:
+        """تحلیل جامع و حرفه‌ای فروشگاه با استفاده از چندین مدل AI و پردازش تصاویر، ویدیو و داده‌های فروش
+        
+        پنج تحلیل تخصصی به‌صورت هم‌زمان اجرا می‌شوند و پاسخ موفق هر کدام چک‌پوینت می‌شود؛
+        اگر run_id (معمولاً شناسه تحلیل) داده شود، فراخوانی مجدد پس از خطا یا timeout
+        فقط درخواست‌های ناموفق را دوباره به API می‌فرستد.
+        """
+        from ..utils.stage_pipeline import Stage, StagePipeline, is_failed_output, stable_hash
+        from .prompt_packing import PackStats, packing_enabled
         
         # بررسی وجود API key
         if not self.api_key:
@@ -208,81 +238,184 @@ def analyze_store_comprehensive(self, store_data: Dict[str, Any], images: List[s
             }
         
         store_name = store_data.get('store_name', 'فروشگاه')
-        store_type = store_data.get('store_type', 'عمومی')
-        
-        logger.info(f"🚀 شروع تحلیل جامع فروشگاه {store_name} با {len(images) if images else 0} تصویر، {len(videos) if videos else 0} ویدیو، {'فایل فروش' if sales_data_file else 'بدون فایل فروش'}")
-        
-        # تحلیل‌های موازی با مدل‌های مختلف
-        analyses = {}
-        errors = []
-        
-        # 1. تحلیل اصلی با GPT-4 Turbo (شامل اطلاعات تصاویر، ویدیو و داده‌های فروش)
-        logger.info(f"🔍 شروع تحلیل اصلی برای {store_name}")
-        main_analysis = self._analyze_main_store(store_data, images, videos, sales_data_file)
-        if main_analysis and not main_analysis.get('error'):
-            analyses['main'] = main_analysis
-            logger.info(f"✅ تحلیل اصلی موفق بود")
-        elif main_analysis and main_analysis.get('error'):
-            errors.append(f"تحلیل اصلی: {main_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ خطا در تحلیل اصلی: {main_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ جزئیات خطا: {main_analysis.get('error', 'unknown')}")
-        else:
-            logger.error(f"❌ تحلیل اصلی None برگشت")
+        images = images or []
+        
+        logger.info(f"🚀 شروع تحلیل جامع فروشگاه {store_name} با {len(images)} تصویر، {len(videos) if videos else 0} ویدیو، {'فایل فروش' if sales_data_file else 'بدون فایل فروش'}")
         
-        # 2. تحلیل طراحی با Claude-3 Opus (با تمرکز بر تصاویر و ویدیو)
         # ترکیب images و videos برای تحلیل طراحی
         all_media_for_design = images + (videos if videos else [])
-        design_analysis = self._analyze_store_design(store_data, all_media_for_design)
-        if design_analysis and not design_analysis.get('error'):
-            analyses['design'] = design_analysis
-        elif design_analysis and design_analysis.get('error'):
-            errors.append(f"تحلیل طراحی: {design_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ خطا در تحلیل طراحی: {design_analysis.get('error_message', 'خطای نامشخص')}")
-        
-        # 3. تحلیل روانشناسی مشتری با Claude-3 Sonnet (با استفاده از ویدیو جریان مشتری)
-        psychology_analysis = self._analyze_customer_psychology(store_data, videos)
-        if psychology_analysis and not psychology_analysis.get('error'):
-            analyses['psychology'] = psychology_analysis
-        elif psychology_analysis and psychology_analysis.get('error'):
-            errors.append(f"تحلیل روانشناسی: {psychology_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ خطا در تحلیل روانشناسی: {psychology_analysis.get('error_message', 'خطای نامشخص')}")
-        
-        # 4. تحلیل بازاریابی با GPT-4o (با استفاده از داده‌های فروش)
-        marketing_analysis = self._analyze_marketing_potential(store_data, sales_data_file)
-        if marketing_analysis and not marketing_analysis.get('error'):
-            analyses['marketing'] = marketing_analysis
-        elif marketing_analysis and marketing_analysis.get('error'):
-            errors.append(f"تحلیل بازاریابی: {marketing_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ خطا در تحلیل بازاریابی: {marketing_analysis.get('error_message', 'خطای نامشخص')}")
-        
-        # 5. بهینه‌سازی با GPT-4 Turbo (با استفاده از همه داده‌ها)
-        optimization_analysis = self._analyze_optimization(store_data, images, videos, sales_data_file)
-        if optimization_analysis and not optimization_analysis.get('error'):
-            analyses['optimization'] = optimization_analysis
-        elif optimization_analysis and optimization_analysis.get('error'):
-            errors.append(f"تحلیل بهینه‌سازی: {optimization_analysis.get('error_message', 'خطای نامشخص')}")
-            logger.error(f"❌ خطا در تحلیل بهینه‌سازی: {optimization_analysis.get('error_message', 'خطای نامشخص')}")
-        
-        # اگر هیچ تحلیلی موفق نبود، خطا برگردان
-        if not analyses:
-            error_msg = "همه تحلیل‌ها با خطا مواجه شدند. " + " | ".join(errors) if errors else "خطای نامشخص"
-            logger.error(f"❌ {error_msg}")
-            return {
-                'error': 'all_analyses_failed',
-                'error_message': error_msg,
-                'analysis_text': f'⚠️ خطا: {error_msg} لطفاً دوباره تلاش کنید یا با پشتیبانی تماس بگیرید.'
-            }
         
-        # ترکیب و خلاصه‌سازی نتایج
-        final_analysis = self._combine_analyses(analyses, store_data, images, videos, sales_data_file)
+        section_labels = {
+            'main': 'تحلیل اصلی',
+            'design': 'تحلیل طراحی',
+            'psychology': 'تحلیل روانشناسی',
+            'marketing': 'تحلیل بازاریابی',
+            'optimization': 'تحلیل بهینه‌سازی',
+        }
+        sections = {
+            'main': lambda inputs: self._analyze_main_store(store_data, images, videos, sales_data_file),
+            'design': lambda inputs: self._analyze_store_design(store_data, all_media_for_design),
+            'psychology': lambda inputs: self._analyze_customer_psychology(store_data),
+            'marketing': lambda inputs: self._analyze_marketing_potential(store_data),
+            'optimization': lambda inputs: self._analyze_optimization(store_data),
+        }
         
-        # اگر خطاهایی وجود داشت، به نتایج اضافه کن
-        if errors:
-            final_analysis['warnings'] = errors
-            logger.warning(f"⚠️ برخی تحلیل‌ها با خطا مواجه شدند: {len(errors)} خطا")
+        def combine(inputs):
+            analyses = {}
+            errors = []
+            for key, result in inputs.items():
+                if result and not is_failed_output(result):
+                    analyses[key] = result
+                elif result:
+                    message = result.get('error_message', 'خطای نامشخص')
+                    errors.append(f"{section_labels[key]}: {message}")
+                    logger.error(f"❌ خطا در {section_labels[key]}: {message}")
+            
+            # اگر هیچ تحلیلی موفق نبود، خطا برگردان
+            if not analyses:
+                error_msg = "همه تحلیل‌ها با خطا مواجه شدند. " + " | ".join(errors) if errors else "خطای نامشخص"
+                logger.error(f"❌ {error_msg}")
+                return {
+                    'error': 'all_analyses_failed',
+                    'error_message': error_msg,
+                    'analysis_text': f'⚠️ خطا: {error_msg} لطفاً دوباره تلاش کنید یا با پشتیبانی تماس بگیرید.'
+                }
+            
+            # ترکیب و خلاصه‌سازی نتایج
+            final_analysis = self._combine_analyses(analyses, store_data, images)
+            
+            # اگر خطاهایی وجود داشت، به نتایج اضافه کن
+            if errors:
+                final_analysis['warnings'] = errors
+                logger.warning(f"⚠️ برخی تحلیل‌ها با خطا مواجه شدند: {len(errors)} خطا")
+            return final_analysis
+        
+        # بخش‌های سازگار در یک درخواست بسته‌بندی می‌شوند؛ مرحله هر بخش فقط سهم خود را برمی‌دارد
+        packs = self._pack_groups() if packing_enabled() else {}
+        packed = {name: pack for pack, members in packs.items() for name in members}
+        stages = []
+        for pack, members in packs.items():
+            section_labels[pack] = ' و '.join(section_labels[name] for name in members)
+            stages.append(Stage(pack, lambda inputs, members=members: self._analyze_packed(store_data, members)))
+        for name, func in sections.items():
+            if name in packed:
+                stages.append(Stage(
+                    name, lambda inputs, pack=packed[name], name=name: inputs[pack]['sections'][name],
+                    depends_on=(packed[name],),
+                ))
+            else:
+                stages.append(Stage(name, func))
+        stages.append(Stage('combined', combine, depends_on=tuple(sections)))
+        
+        input_data = {
+            'store_data': store_data,
+            'images': images,
+            'videos': videos,
+            'sales_data_file': sales_data_file,
+            'model': self.models['analysis'],
+        }
+        # بدون شناسه تحلیل، کلید اجرا از محتوای ورودی ساخته می‌شود
+        run_key = f"liara:{run_id}" if run_id is not None else f"liara:{stable_hash(input_data)[:32]}"
+        on_stage_start = on_stage_complete = None
+        if run_id is not None:
+            from ..utils.progress_bus import ProgressBus
+            section_labels['combined'] = 'جمع‌بندی گزارش نهایی'
+            on_stage_start, on_stage_complete = ProgressBus.stage_callbacks(run_id, labels=section_labels)
+        pipeline = StagePipeline(
+            run_key=run_key,
+            stages=stages,
+            input_data=input_data,
+            on_stage_start=on_stage_start,
+            on_stage_complete=on_stage_complete,
+        )
+        
+        outputs = pipeline.run()
+        final_analysis = outputs['combined']
+        final_analysis['stage_timings'] = pipeline.timings
+        if packs:
+            final_analysis['prompt_packing'] = PackStats.merge([outputs[pack]['packing'] for pack in packs]).as_dict()
+        logger.info(f"⏱️ زمان مراحل تحلیل {store_name}: " + ", ".join(
+            f"{name}={t['seconds']}s{' (checkpoint)' if t['from_checkpoint'] else ''}"
+            for name, t in pipeline.timings.items()
+        ))
+        
+        if not is_failed_output(final_analysis):
+            pipeline.clear()
         
         return final_analysis
     
+    def _pack_groups(self) -> Dict[str, List[str]]:
+        """گروه‌بندی بخش‌های قابل بسته‌بندی با مدل یکسان (سقف PROMPT_PACK_MAX_SECTIONS/MAX_TOKENS)"""
+        from .prompt_packing import PackedSection, PromptPacker
+        
+        by_model: Dict[str, List[PackedSection]] = {}
+        for name, (model_key, _, _, _, max_tokens) in self.PACKABLE_SECTIONS.items():
+            by_model.setdefault(self.models[model_key], []).append(PackedSection(name, '', '', max_tokens=max_tokens))
+        packer = PromptPacker(None)
+        packs = {}
+        for sections in by_model.values():
+            for chunk in packer.chunk(sections):
+                if len(chunk) > 1:
+                    packs['pack:' + '+'.join(s.key for s in chunk)] = [s.key for s in chunk]
+        return packs
+    
+    def _shared_store_context(self, store_data: Dict[str, Any]) -> str:
+        """سرآیند مشترک اطلاعات فروشگاه در درخواست‌های بسته‌بندی‌شده (به جای تکرار در هر بخش)"""
+        return f"""
+        **اطلاعات فروشگاه "{store_data.get('store_name', 'فروشگاه')}" (برای همه بخش‌های زیر):**
+        - نوع: {store_data.get('store_type', 'عمومی')}
+        - اندازه: {store_data.get('store_size', 'نامشخص')}
+        - منطقه: {store_data.get('area', 'نامشخص')}
+        - چیدمان: {store_data.get('layout_type', 'نامشخص')}
+        - نورپردازی: {store_data.get('lighting_type', 'نامشخص')}
+        - رنگ‌بندی: {store_data.get('color_scheme', 'نامشخص')}
+        - محصولات: {store_data.get('products', 'نامشخص')}
+        - مشتریان روزانه: {store_data.get('daily_customers', 'نامشخص')}
+        - فروش روزانه: {store_data.get('daily_sales', 'نامشخص')}
+        """
+    
+    def _request_content(self, model: str, prompt: str, max_tokens: int, json_mode: bool = False) -> str:
+        """متن پاسخ مدل؛ خطای API به صورت LiaraRequestError"""
+        result = self._make_request(model, prompt, max_tokens=max_tokens, json_mode=json_mode)
+        if result and 'error' in result:
+            raise LiaraRequestError(result.get('error_message') or result['error'])
+        if not result or not result.get('choices'):
+            raise LiaraRequestError('پاسخ API فاقد choices است')
+        return result['choices'][0]['message']['content']
+    
+    def _analyze_packed(self, store_data: Dict[str, Any], members: List[str]) -> Dict[str, Any]:
+        """اجرای چند بخش در یک درخواست؛ بخش‌های ناموفق جداگانه دوباره درخواست می‌شوند"""
+        from .prompt_packing import PackedSection, PromptPacker
+        
+        packed = []
+        for name in members:
+            _, prompt_method, _, _, max_tokens = self.PACKABLE_SECTIONS[name]
+            build = getattr(self, prompt_method)
+            packed.append(PackedSection(
+                name, prompt=build(store_data), instructions=build(store_data, include_info=False), max_tokens=max_tokens,
+            ))
+        model = self.models[self.PACKABLE_SECTIONS[members[0]][0]]
+        packer = PromptPacker(
+            lambda prompt, max_tokens, json_mode: self._request_content(model, prompt, max_tokens, json_mode),
+            system_prompt=self.SYSTEM_PROMPT,
+            max_sections=len(packed),
+            max_tokens=sum(section.max_tokens for section in packed),
+        )
+        contents, errors, stats = packer.run(self._shared_store_context(store_data), packed)
+        
+        results = {}
+        for name in members:
+            _, _, output_type, model_label, _ = self.PACKABLE_SECTIONS[name]
+            if name in contents:
+                results[name] = {'type': output_type, 'content': contents[name], 'model': model_label}
+            else:
+                results[name] = {'error': 'api_request_failed', 'error_message': errors.get(name, 'خطای نامشخص')}
+        output = {'sections': results, 'packing': stats.as_dict()}
+        if errors:
+            # گروه دارای بخش ناموفق چک‌پوینت نمی‌شود تا در retry دوباره اجرا شود
+            output['error'] = 'packed_sections_failed'
+        return output
+    
     def _analyze_main_store(self, store_data: Dict[str, Any], images: List[str] = None, videos: List[Dict] = None, sales_data_file: str = None) -> Dict[str, Any]:
         """تحلیل اصلی فروشگاه با GPT-4 Turbo - شامل همه فیلدهای فرم و پردازش ویدیو و داده‌های فروش"""
         
@@ -538,12 +671,9 @@ def _analyze_main_store(self, store_data: Dict[str, Any], images: List[str] = No
             'error_message': 'خطا در دریافت پاسخ از API. لطفاً دوباره تلاش کنید.'
         }
     
-    def _analyze_store_design(self, store_data: Dict[str, Any], images: List[str] = None) -> Dict[str, Any]:
-        """تحلیل طراحی با Claude-3 Opus"""
-        
-        prompt = f"""
-        شما متخصص طراحی فروشگاه و معماری داخلی هستید. تحلیل حرفه‌ای طراحی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
-
+    def _design_prompt(self, store_data: Dict[str, Any], include_info: bool = True) -> str:
+        """پرامپت تحلیل طراحی؛ بدون include_info اطلاعات فروشگاه در سرآیند مشترک درخواست بسته‌بندی‌شده می‌آید"""
+        info = f"""
         **اطلاعات طراحی:**
         - نوع فروشگاه: {store_data.get('store_type', 'عمومی')}
         - اندازه: {store_data.get('store_size', 'نامشخص')}
@@ -551,7 +681,10 @@ def _analyze_store_design(self, store_data: Dict[str, Any], images: List[str] =
         - نورپردازی: {store_data.get('lighting_type', 'نامشخص')}
         - رنگ‌بندی: {store_data.get('color_scheme', 'نامشخص')}
         - محصولات: {store_data.get('products', 'نامشخص')}
-
+""" if include_info else ''
+        return f"""
+        شما متخصص طراحی فروشگاه و معماری داخلی هستید. تحلیل حرفه‌ای طراحی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
+{info}
         **تحلیل طراحی حرفه‌ای:**
 
         ## 🎨 تحلیل طراحی فروشگاه {store_data.get('store_name', 'فروشگاه')}
@@ -593,6 +726,11 @@ def _analyze_store_design(self, store_data: Dict[str, Any], images: List[str] =
 
         **نکته: تحلیل باید کاملاً تخصصی و عملی باشد!**
         """
+    
+    def _analyze_store_design(self, store_data: Dict[str, Any], images: List[str] = None) -> Dict[str, Any]:
+        """تحلیل طراحی با Claude-3 Opus"""
+        
+        prompt = self._design_prompt(store_data)
         
         result = self._make_request(self.models['design'], prompt, max_tokens=3000)
         if result and 'error' in result:
@@ -608,19 +746,19 @@ def _analyze_store_design(self, store_data: Dict[str, Any], images: List[str] =
             'error_message': 'خطا در دریافت پاسخ از API طراحی. لطفاً دوباره تلاش کنید.'
         }
     
-    def _analyze_customer_psychology(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
-        """تحلیل روانشناسی مشتری با Claude-3 Sonnet"""
-        
-        prompt = f"""
-        شما متخصص روانشناسی مصرف‌کننده و رفتارشناسی مشتری هستید. تحلیل روانشناسی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
-
+    def _psychology_prompt(self, store_data: Dict[str, Any], include_info: bool = True) -> str:
+        """پرامپت تحلیل روانشناسی مشتری؛ بدون include_info اطلاعات فروشگاه در سرآیند مشترک درخواست بسته‌بندی‌شده می‌آید"""
+        info = f"""
         **اطلاعات فروشگاه:**
         - نوع: {store_data.get('store_type', 'عمومی')}
         - مشتریان روزانه: {store_data.get('daily_customers', 'نامشخص')}
         - فروش روزانه: {store_data.get('daily_sales', 'نامشخص')}
         - محصولات: {store_data.get('products', 'نامشخص')}
         - منطقه: {store_data.get('area', 'نامشخص')}
-
+""" if include_info else ''
+        return f"""
+        شما متخصص روانشناسی مصرف‌کننده و رفتارشناسی مشتری هستید. تحلیل روانشناسی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
+{info}
         **تحلیل روانشناسی مشتری:**
 
         ## 🧠 تحلیل روانشناسی مشتری - {store_data.get('store_name', 'فروشگاه')}
@@ -669,6 +807,11 @@ def _analyze_customer_psychology(self, store_data: Dict[str, Any]) -> Dict[str,
 
         **نکته: تحلیل باید بر اساس اصول روانشناسی باشد!**
         """
+    
+    def _analyze_customer_psychology(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تحلیل روانشناسی مشتری با Claude-3 Sonnet"""
+        
+        prompt = self._psychology_prompt(store_data)
         
         result = self._make_request(self.models['psychology'], prompt, max_tokens=3000)
         if result and 'error' in result:
@@ -684,12 +827,9 @@ def _analyze_customer_psychology(self, store_data: Dict[str, Any]) -> Dict[str,
             'error_message': 'خطا در دریافت پاسخ از API روانشناسی. لطفاً دوباره تلاش کنید.'
         }
     
-    def _analyze_marketing_potential(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
-        """تحلیل بازاریابی با GPT-4o"""
-        
-        prompt = f"""
-        شما متخصص بازاریابی و استراتژی کسب‌وکار هستید. تحلیل بازاریابی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
-
+    def _marketing_prompt(self, store_data: Dict[str, Any], include_info: bool = True) -> str:
+        """پرامپت تحلیل بازاریابی؛ بدون include_info اطلاعات فروشگاه در سرآیند مشترک درخواست بسته‌بندی‌شده می‌آید"""
+        info = f"""
         **اطلاعات کسب‌وکار:**
         - نام: {store_data.get('store_name', 'فروشگاه')}
         - نوع: {store_data.get('store_type', 'عمومی')}
@@ -697,7 +837,10 @@ def _analyze_marketing_potential(self, store_data: Dict[str, Any]) -> Dict[str,
         - مشتریان روزانه: {store_data.get('daily_customers', 'نامشخص')}
         - فروش روزانه: {store_data.get('daily_sales', 'نامشخص')}
         - محصولات: {store_data.get('products', 'نامشخص')}
-
+""" if include_info else ''
+        return f"""
+        شما متخصص بازاریابی و استراتژی کسب‌وکار هستید. تحلیل بازاریابی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
+{info}
         **تحلیل بازاریابی حرفه‌ای:**
 
         ## 📈 تحلیل بازاریابی - {store_data.get('store_name', 'فروشگاه')}
@@ -749,6 +892,11 @@ def _analyze_marketing_potential(self, store_data: Dict[str, Any]) -> Dict[str,
 
         **نکته: تحلیل باید عملی و قابل اجرا باشد!**
         """
+    
+    def _analyze_marketing_potential(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تحلیل بازاریابی با GPT-4o"""
+        
+        prompt = self._marketing_prompt(store_data)
         
         result = self._make_request(self.models['marketing'], prompt, max_tokens=3000)
         if result and 'error' in result:
@@ -764,12 +912,9 @@ def _analyze_marketing_potential(self, store_data: Dict[str, Any]) -> Dict[str,
             'error_message': 'خطا در دریافت پاسخ از API بازاریابی. لطفاً دوباره تلاش کنید.'
         }
     
-    def _analyze_optimization(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
-        """تحلیل بهینه‌سازی با GPT-4 Turbo"""
-        
-        prompt = f"""
-        شما متخصص بهینه‌سازی فروشگاه و افزایش کارایی هستید. تحلیل بهینه‌سازی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
-
+    def _optimization_prompt(self, store_data: Dict[str, Any], include_info: bool = True) -> str:
+        """پرامپت تحلیل بهینه‌سازی؛ بدون include_info اطلاعات فروشگاه در سرآیند مشترک درخواست بسته‌بندی‌شده می‌آید"""
+        info = f"""
         **اطلاعات فروشگاه:**
         - نام: {store_data.get('store_name', 'فروشگاه')}
         - نوع: {store_data.get('store_type', 'عمومی')}
@@ -777,7 +922,10 @@ def _analyze_optimization(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
         - مشتریان روزانه: {store_data.get('daily_customers', 'نامشخص')}
         - فروش روزانه: {store_data.get('daily_sales', 'نامشخص')}
         - چیدمان: {store_data.get('layout_type', 'نامشخص')}
-
+""" if include_info else ''
+        return f"""
+        شما متخصص بهینه‌سازی فروشگاه و افزایش کارایی هستید. تحلیل بهینه‌سازی برای فروشگاه "{store_data.get('store_name', 'فروشگاه')}" ارائه دهید.
+{info}
         **تحلیل بهینه‌سازی حرفه‌ای:**
 
         ## ⚡ تحلیل بهینه‌سازی - {store_data.get('store_name', 'فروشگاه')}
@@ -836,6 +984,11 @@ def _analyze_optimization(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
 
         **نکته: تحلیل باید قابل اندازه‌گیری و عملی باشد!**
         """
+    
+    def _analyze_optimization(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تحلیل بهینه‌سازی با GPT-4 Turbo"""
+        
+        prompt = self._optimization_prompt(store_data)
         
         result = self._make_request(self.models['optimization'], prompt, max_tokens=3000)
         if result and 'error' in result:
@@ -984,8 +1137,9 @@ def _get_fallback_analysis(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
     def get_ai_insights(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
         """دریافت بینش‌های AI برای فروشگاه"""
         
-        # بررسی cache
-        cache_key = f"ai_analysis_{hash(str(store_data))}"
+        # بررسی cache (کلید پایدار بر اساس hash محتوای فایل‌ها، نه مسیر ذخیره)
+        from ..utils.file_storage import content_cache_key
+        cache_key = content_cache_key('ai_analysis', store_data)
         cached_result = cache.get(cache_key)
         if cached_result:
             return cached_result
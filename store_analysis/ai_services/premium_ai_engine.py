@@ -5,7 +5,7 @@
 import logging
 import requests
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Any, Callable, Dict, List, Optional
 from django.conf import settings
 from django.utils import timezone
 from .professional_report_generator import ProfessionalReportGenerator
@@ -13,23 +13,63 @@
 logger = logging.getLogger(__name__)
 
 class PremiumAIAnalysisEngine:
-    """موتور تحلیل پیشرفته برای پلن‌های پولی با GPT-4.1"""
+    """موتور تحلیل پیشرفته برای پلن‌های پولی با GPT-4.1
     
-    def __init__(self, package_type: str = 'professional'):
+    بخش‌های گزارش با StagePipeline اجرا می‌شوند: هر بخش پیش‌نیازهای خود را اعلام می‌کند،
+    بخش‌های مستقل هم‌زمان (زیر سقف AI_PROVIDER_CONCURRENCY برای openai) فراخوانی می‌شوند و
+    خلاصه بخش‌های پیش‌نیاز به پرامپت بخش وابسته اضافه می‌شود. پلن سازمانی بخش‌های حرفه‌ای
+    را دوباره تولید نمی‌کند و در همان گراف (یا از professional_results داده‌شده) استفاده می‌کند.
+    
+    با PROMPT_PACKING_ENABLED بخش‌های هم‌سطح گراف (با PromptPacker) در یک درخواست با خروجی
+    JSON ارسال و پس از پاسخ بین بخش‌ها تقسیم می‌شوند.
+    """
+    
+    PROVIDER = 'openai'
+    # حداکثر طول خلاصه هر بخش پیش‌نیاز در پرامپت بخش وابسته
+    DEPENDENCY_CONTEXT_CHARS = 800
+    # سقف توکن خروجی مدل و سهم هر بخش در درخواست بسته‌بندی‌شده
+    MAX_OUTPUT_TOKENS = 4096
+    PACKED_SECTION_TOKENS = 1300
+    SYSTEM_PROMPT = 'شما یک متخصص تحلیل فروشگاه با 20 سال تجربه هستید. پاسخ‌های شما باید علمی، دقیق و قابل اجرا باشد. فقط از زبان فارسی استفاده کنید و هرگز از کلمات انگلیسی مثل regards، Small، Kids_Clothing، Neutral، attractiveness، Design، functionality، example استفاده نکنید.'
+    
+    # بخش -> (متد تولید پرامپت، بخش‌های پیش‌نیاز)
+    PROFESSIONAL_SECTIONS = {
+        'current_condition': ('_generate_current_condition_prompt', ()),
+        'sales_analysis': ('_generate_sales_analysis_prompt', ()),
+        'customer_flow': ('_generate_customer_flow_prompt', ()),
+        'design_analysis': ('_generate_design_analysis_prompt', ()),
+        'layout_proposal': ('_generate_layout_proposal_prompt', ('current_condition', 'customer_flow', 'design_analysis')),
+        'financial_analysis': ('_generate_financial_analysis_prompt', ('sales_analysis', 'layout_proposal')),
+    }
+    ENTERPRISE_SECTIONS = {
+        'advanced_psychology': ('_generate_psychology_analysis_prompt', ('customer_flow',)),
+        'competitive_analysis': ('_generate_competitive_analysis_prompt', ('sales_analysis',)),
+        'technology_recommendations': ('_generate_technology_prompt', ('layout_proposal',)),
+        'sustainability_analysis': ('_generate_sustainability_prompt', ()),
+    }
+    
+    def __init__(self, package_type: str = 'professional', on_partial: Optional[Callable[[Dict[str, Any], int, int], None]] = None):
         self.package_type = package_type
         self.gpt4_api_key = getattr(settings, 'OPENAI_API_KEY', '')
         self.gpt4_base_url = getattr(settings, 'OPENAI_BASE_URL', 'https://api.openai.com/v1')
         self.report_generator = ProfessionalReportGenerator()
+        # on_partial(نتیجه ترکیب‌شده تا این لحظه، تعداد بخش‌های آماده، کل بخش‌ها) پس از هر بخش
+        self.on_partial = on_partial
         
-    def analyze_store_premium(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
-        """تحلیل پیشرفته با GPT-4.1 بر اساس نوع پلن"""
+    def analyze_store_premium(self, store_data: Dict[str, Any], professional_results: Optional[Dict[str, Any]] = None, run_id: Any = None) -> Dict[str, Any]:
+        """تحلیل پیشرفته با GPT-4.1 بر اساس نوع پلن
+        
+        professional_results (خروجی قبلی پلن حرفه‌ای همین فروشگاه) در ارتقا به پلن سازمانی
+        دوباره تولید نمی‌شود. با run_id (شناسه تحلیل) پیشرفت هر بخش در ProgressBus منتشر
+        می‌شود و retry پس از خطا فقط بخش‌های ناموفق را دوباره فراخوانی می‌کند.
+        """
         try:
             logger.info(f"🚀 شروع تحلیل پیشرفته برای پلن {self.package_type}")
             
             if self.package_type == 'professional':
-                return self._professional_analysis(store_data)
+                return self._professional_analysis(store_data, run_id=run_id)
             elif self.package_type == 'enterprise':
-                return self._enterprise_analysis(store_data)
+                return self._enterprise_analysis(store_data, professional_results=professional_results, run_id=run_id)
             else:
                 return self._basic_analysis(store_data)
                 
@@ -37,99 +77,260 @@ def analyze_store_premium(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
             logger.error(f"❌ خطا در تحلیل پیشرفته: {e}")
             return self._fallback_analysis(store_data)
     
-    def _professional_analysis(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _professional_analysis(self, store_data: Dict[str, Any], run_id: Any = None) -> Dict[str, Any]:
         """تحلیل حرفه‌ای با GPT-4.1"""
-        analysis_prompts = {
-            'current_condition': self._generate_current_condition_prompt(store_data),
-            'sales_analysis': self._generate_sales_analysis_prompt(store_data),
-            'customer_flow': self._generate_customer_flow_prompt(store_data),
-            'design_analysis': self._generate_design_analysis_prompt(store_data),
-            'layout_proposal': self._generate_layout_proposal_prompt(store_data),
-            'financial_analysis': self._generate_financial_analysis_prompt(store_data)
-        }
+        results, timings, packing = self._run_sections(store_data, self.PROFESSIONAL_SECTIONS, run_id=run_id)
+        professional = {name: results[name] for name in self.PROFESSIONAL_SECTIONS}
+        synthesized = self._synthesize_professional_results(professional, store_data)
+        synthesized['section_timings'] = timings
+        if packing:
+            synthesized['prompt_packing'] = packing
+        return synthesized
+    
+    def _enterprise_analysis(self, store_data: Dict[str, Any], professional_results: Optional[Dict[str, Any]] = None, run_id: Any = None) -> Dict[str, Any]:
+        """تحلیل سازمانی با GPT-4.1 + تحلیل‌های اضافی (بخش‌های حرفه‌ای در همان گراف)"""
+        reused = dict((professional_results or {}).get('analysis_sections') or {})
+        sections = {**self.PROFESSIONAL_SECTIONS, **self.ENTERPRISE_SECTIONS}
+        results, timings, packing = self._run_sections(store_data, sections, reused=reused, run_id=run_id)
         
-        results = {}
-        for section, prompt in analysis_prompts.items():
-            try:
-                response = self._call_gpt4(prompt)
-                results[section] = self._parse_gpt4_response(response)
-            except Exception as e:
-                logger.error(f"❌ خطا در تحلیل {section}: {e}")
-                results[section] = self._get_fallback_analysis(section)
+        professional = {name: results[name] for name in self.PROFESSIONAL_SECTIONS}
+        enterprise = {name: results[name] for name in self.ENTERPRISE_SECTIONS}
+        synthesized = self._synthesize_enterprise_results(
+            self._synthesize_professional_results(professional, store_data), enterprise, store_data
+        )
+        synthesized['section_timings'] = timings
+        if packing:
+            synthesized['prompt_packing'] = packing
+        return synthesized
+    
+    def _run_sections(self, store_data: Dict[str, Any], sections: Dict[str, tuple], reused: Optional[Dict[str, Any]] = None, run_id: Any = None):
+        """اجرای گراف بخش‌ها و برگرداندن (نتیجه هر بخش، زمان هر بخش، آمار prompt packing)"""
+        from ..utils.stage_pipeline import Stage, StagePipeline, is_failed_output, stable_hash
+        from .prompt_packing import PackStats
+        
+        reused = reused or {}
+        packs = self._pack_groups(sections, reused)
+        packed = {section: pack for pack, members in packs.items() for section in members}
+        stages = []
+        for pack, members in packs.items():
+            depends_on = tuple(dict.fromkeys(dep for section in members for dep in sections[section][1]))
+            stages.append(Stage(
+                pack, self._packed_stage(members, sections, store_data),
+                depends_on=depends_on, provider=self.PROVIDER,
+            ))
+        for section, (builder, depends_on) in sections.items():
+            if section in reused:
+                stages.append(Stage(section, lambda inputs, value=reused[section]: value, depends_on=depends_on))
+            elif section in packed:
+                stages.append(Stage(
+                    section, lambda inputs, pack=packed[section], section=section: inputs[pack]['sections'][section],
+                    depends_on=(packed[section],),
+                ))
+            else:
+                stages.append(Stage(
+                    section, self._section_stage(section, builder, store_data),
+                    depends_on=depends_on, provider=self.PROVIDER,
+                ))
+        if reused:
+            logger.info(f"♻️ استفاده مجدد از {len(reused)} بخش پلن حرفه‌ای: {', '.join(sorted(reused))}")
         
-        return self._synthesize_professional_results(results, store_data)
+        # بدون شناسه تحلیل، کلید اجرا از محتوای ورودی ساخته می‌شود
+        input_data = {'store_data': store_data, 'base_url': self.gpt4_base_url}
+        run_key = f"premium:{run_id}" if run_id is not None else f"premium:{stable_hash(input_data)[:32]}"
+        
+        on_stage_start = progress_complete = None
+        if run_id is not None:
+            from ..utils.progress_bus import ProgressBus
+            on_stage_start, progress_complete = ProgressBus.stage_callbacks(run_id)
+        
+        pipeline = None
+        
+        def on_stage_complete(name, done, total):
+            if progress_complete:
+                progress_complete(name, done, total)
+            if self.on_partial:
+                self.on_partial(self._synthesize_partial(pipeline.outputs, store_data), done, total)
+        
+        pipeline = StagePipeline(
+            run_key=run_key,
+            stages=stages,
+            input_data=input_data,
+            # سقف واقعی را ProviderLimiter تعیین می‌کند؛ هر بخش thread خود را دارد
+            max_workers=len(stages),
+            on_stage_start=on_stage_start,
+            on_stage_complete=on_stage_complete,
+        )
+        results = pipeline.run()
+        logger.info(f"⏱️ زمان بخش‌های تحلیل {self.package_type}: " + ", ".join(
+            f"{name}={t['seconds']}s{' (checkpoint)' if t['from_checkpoint'] else ''}"
+            for name, t in pipeline.timings.items()
+        ))
+        # بخش‌های ناموفق با fallback برمی‌گردند (خطا raise نمی‌شود)؛ تا وقتی یکی ناموفق است
+        # چک‌پوینت بقیه حفظ می‌شود تا retry فقط همان‌ها را دوباره فراخوانی کند
+        if not any(is_failed_output(output) for output in results.values()):
+            pipeline.clear()
+        packing = PackStats.merge([results[pack]['packing'] for pack in packs]).as_dict() if packs else None
+        return results, pipeline.timings, packing
     
-    def _enterprise_analysis(self, store_data: Dict[str, Any]) -> Dict[str, Any]:
-        """تحلیل سازمانی با GPT-4.1 + تحلیل‌های اضافی"""
-        # تحلیل حرفه‌ای به عنوان پایه
-        professional_results = self._professional_analysis(store_data)
+    def _pack_groups(self, sections: Dict[str, tuple], reused: Dict[str, Any]) -> Dict[str, List[str]]:
+        """گروه‌بندی بخش‌های هم‌سطح گراف (فاصله یکسان از بخش‌های بدون پیش‌نیاز) برای بسته‌بندی"""
+        from .prompt_packing import PackedSection, PromptPacker, packing_enabled
         
-        # تحلیل‌های اضافی برای پلن سازمانی
-        enterprise_prompts = {
-            'advanced_psychology': self._generate_psychology_analysis_prompt(store_data),
-            'competitive_analysis': self._generate_competitive_analysis_prompt(store_data),
-            'technology_recommendations': self._generate_technology_prompt(store_data),
-            'sustainability_analysis': self._generate_sustainability_prompt(store_data)
-        }
+        if not packing_enabled():
+            return {}
+        levels: Dict[str, int] = {}
+        for section, (_, depends_on) in sections.items():
+            # ترتیب تعریف بخش‌ها پس از پیش‌نیازهایشان است
+            levels[section] = 1 + max((levels[dep] for dep in depends_on), default=-1)
+        packer = PromptPacker(None, max_tokens=min(getattr(settings, 'PROMPT_PACK_MAX_TOKENS', 8000), self.MAX_OUTPUT_TOKENS))
+        packs: Dict[str, List[str]] = {}
+        for level in sorted(set(levels.values())):
+            members = [
+                PackedSection(section, '', '', packed_tokens=self.PACKED_SECTION_TOKENS)
+                for section, section_level in levels.items() if section_level == level and section not in reused
+            ]
+            for chunk in packer.chunk(members):
+                if len(chunk) > 1:
+                    packs['pack:' + '+'.join(s.key for s in chunk)] = [s.key for s in chunk]
+        return packs
+    
+    def _packed_stage(self, members: List[str], sections: Dict[str, tuple], store_data: Dict[str, Any]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        """تابع مرحله یک گروه بسته‌بندی‌شده: یک درخواست JSON و تقسیم پاسخ بین بخش‌ها"""
+        from .prompt_packing import PackedSection, PromptPacker
         
-        enterprise_results = {}
-        for section, prompt in enterprise_prompts.items():
+        def run(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            packed = []
+            for section in members:
+                builder, depends_on = sections[section]
+                instructions = getattr(self, builder)(store_data)
+                own_context = self._dependency_context({dep: inputs[dep] for dep in depends_on})
+                packed.append(PackedSection(
+                    section, prompt=instructions + own_context, instructions=instructions,
+                    max_tokens=4000, packed_tokens=self.PACKED_SECTION_TOKENS,
+                ))
+            packer = PromptPacker(
+                lambda prompt, max_tokens, json_mode: self._request_gpt4(prompt, max_tokens, json_mode=json_mode),
+                system_prompt=self.SYSTEM_PROMPT,
+                max_sections=len(packed),
+                max_tokens=self.MAX_OUTPUT_TOKENS,
+            )
+            context = self._packed_context(store_data) + self._dependency_context(inputs)
+            outputs, errors, stats = packer.run(context, packed)
+            
+            results = {}
+            for section in members:
+                if section in outputs:
+                    results[section] = self._parse_gpt4_response(outputs[section])
+                else:
+                    logger.error(f"❌ خطا در تحلیل {section}: {errors.get(section)}")
+                    results[section] = self._get_fallback_analysis(section)
+                    results[section]['error'] = errors.get(section, 'unknown')
+            output = {'sections': results, 'packing': stats.as_dict()}
+            if errors:
+                # گروه دارای بخش ناموفق چک‌پوینت نمی‌شود تا در retry دوباره اجرا شود
+                output['error'] = f"{len(errors)} packed sections failed"
+            return output
+        return run
+    
+    def _packed_context(self, store_data: Dict[str, Any]) -> str:
+        """سرآیند مشترک درخواست‌های بسته‌بندی‌شده"""
+        return f"""
+تحلیل چند بخش از گزارش فروشگاه {store_data.get('store_name', 'نامشخص')}:
+- نوع: {store_data.get('store_type', 'نامشخص')}
+- شهر: {store_data.get('city', 'نامشخص')}
+- متراژ: {store_data.get('area', 'نامشخص')} متر مربع
+"""
+    
+    def _section_stage(self, section: str, builder: str, store_data: Dict[str, Any]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        """تابع مرحله یک بخش: پرامپت + خلاصه پیش‌نیازها، فراخوانی و پارس پاسخ"""
+        def run(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            prompt = getattr(self, builder)(store_data) + self._dependency_context(inputs)
             try:
-                response = self._call_gpt4(prompt)
-                enterprise_results[section] = self._parse_gpt4_response(response)
+                return self._parse_gpt4_response(self._request_gpt4(prompt))
             except Exception as e:
-                logger.error(f"❌ خطا در تحلیل سازمانی {section}: {e}")
-                enterprise_results[section] = self._get_fallback_analysis(section)
-        
-        # ترکیب نتایج
-        return self._synthesize_enterprise_results(professional_results, enterprise_results, store_data)
+                logger.error(f"❌ خطا در تحلیل {section}: {e}")
+                fallback = self._get_fallback_analysis(section)
+                # کلید error مانع چک‌پوینت شدن می‌شود تا retry بخش را دوباره فراخوانی کند
+                fallback['error'] = str(e)
+                return fallback
+        return run
+    
+    def _dependency_context(self, inputs: Dict[str, Any]) -> str:
+        """خلاصه کوتاه نتایج بخش‌های پیش‌نیاز برای هماهنگی پیشنهادهای بخش وابسته"""
+        parts = []
+        for section, result in inputs.items():
+            if not isinstance(result, dict) or result.get('error'):
+                continue
+            text = result.get('analysis_text') or json.dumps(result, ensure_ascii=False)
+            parts.append(f"- {section}: {str(text)[:self.DEPENDENCY_CONTEXT_CHARS]}")
+        if not parts:
+            return ''
+        return "\nخلاصه نتایج بخش‌های قبلی همین گزارش (پیشنهادها با آن‌ها هماهنگ باشد):\n" + "\n".join(parts) + "\n"
+    
+    def _synthesize_partial(self, outputs: Dict[str, Any], store_data: Dict[str, Any]) -> Dict[str, Any]:
+        """ترکیب بخش‌های آماده‌شده تا این لحظه با همان _synthesize_* نتیجه نهایی"""
+        professional = {name: outputs[name] for name in self.PROFESSIONAL_SECTIONS if name in outputs}
+        synthesized = self._synthesize_professional_results(professional, store_data)
+        if self.package_type == 'enterprise':
+            enterprise = {name: outputs[name] for name in self.ENTERPRISE_SECTIONS if name in outputs}
+            synthesized = self._synthesize_enterprise_results(synthesized, enterprise, store_data)
+        synthesized['partial'] = True
+        return synthesized
     
     def _call_gpt4(self, prompt: str, max_tokens: int = 4000) -> str:
         """فراخوانی GPT-4.1 API"""
-        if not self.gpt4_api_key:
-            logger.warning("⚠️ کلید API OpenAI موجود نیست")
-            return "تحلیل با GPT-4.1 در دسترس نیست."
-        
         try:
-            headers = {
-                'Authorization': f'Bearer {self.gpt4_api_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            data = {
-                'model': 'gpt-4-turbo-preview',  # GPT-4.1
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': 'شما یک متخصص تحلیل فروشگاه با 20 سال تجربه هستید. پاسخ‌های شما باید علمی، دقیق و قابل اجرا باشد. فقط از زبان فارسی استفاده کنید و هرگز از کلمات انگلیسی مثل regards، Small، Kids_Clothing، Neutral، attractiveness، Design، functionality، example استفاده نکنید.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'max_tokens': max_tokens,
-                'temperature': 0.7
-            }
-            
-            response = requests.post(
-                f'{self.gpt4_base_url}/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                logger.error(f"❌ خطا در API GPT-4: {response.status_code}")
-                return "خطا در تحلیل با GPT-4.1"
-                
+            return self._request_gpt4(prompt, max_tokens)
+        except ValueError as e:
+            logger.warning(f"⚠️ {e}")
+            return "تحلیل با GPT-4.1 در دسترس نیست."
+        except requests.HTTPError as e:
+            logger.error(f"❌ خطا در API GPT-4: {e}")
+            return "خطا در تحلیل با GPT-4.1"
         except Exception as e:
             logger.error(f"❌ خطا در فراخوانی GPT-4: {e}")
             return "خطا در ارتباط با GPT-4.1"
     
+    def _request_gpt4(self, prompt: str, max_tokens: int = 4000, json_mode: bool = False) -> str:
+        """درخواست به GPT-4.1 API؛ برخلاف _call_gpt4 در صورت خطا exception می‌دهد"""
+        if not self.gpt4_api_key:
+            raise ValueError("کلید API OpenAI موجود نیست")
+        
+        headers = {
+            'Authorization': f'Bearer {self.gpt4_api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        data = {
+            'model': 'gpt-4-turbo-preview',  # GPT-4.1
+            'messages': [
+                {
+                    'role': 'system',
+                    'content': self.SYSTEM_PROMPT
+                },
+                {
+                    'role': 'user',
+                    'content': prompt
+                }
+            ],
+            'max_tokens': max_tokens,
+            'temperature': 0.7
+        }
+        if json_mode:
+            data['response_format'] = {'type': 'json_object'}
+        
+        response = requests.post(
+            f'{self.gpt4_base_url}/chat/completions',
+            headers=headers,
+            json=data,
+            timeout=60
+        )
+        
+        if response.status_code != 200:
+            raise requests.HTTPError(f"GPT-4 API status {response.status_code}", response=response)
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    
     def _generate_current_condition_prompt(self, store_data: Dict[str, Any]) -> str:
         """تولید پرامپت تحلیل وضعیت فعلی"""
         return f"""
@@ -5,15 +5,12 @@
 import logging
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from django.conf import settings
 from django.utils import timezone
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import os
+from ..utils.pdf_fonts import register_persian_font
 
 logger = logging.getLogger(__name__)
 
@@ -29,9 +26,7 @@ def _setup_persian_fonts(self):
         """تنظیم فونت‌های فارسی"""
         try:
             # ثبت فونت فارسی
-            font_path = os.path.join(settings.STATIC_ROOT, 'fonts', 'Vazir.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('Vazir', font_path))
+            if register_persian_font():
                 logger.info("✅ فونت فارسی ثبت شد")
             else:
                 logger.warning("⚠️ فونت فارسی یافت نشد")
@@ -0,0 +1,207 @@
+"""
+بسته‌بندی چند بخش گزارش در یک درخواست LLM (prompt packing)
+
+موتورهای بخش‌محور برای هر بخش همان پرامپت سیستمی و همان اطلاعات فروشگاه را دوباره
+می‌فرستادند. PromptPacker بخش‌های سازگار را (حداکثر PROMPT_PACK_MAX_SECTIONS بخش و
+مجموع توکن خروجی حداکثر PROMPT_PACK_MAX_TOKENS) در یک درخواست با سرآیند مشترک ارسال
+می‌کند و پاسخ را به‌صورت یک شیء JSON با کلید هر بخش می‌خواهد. پاسخ بررسی و بین بخش‌ها
+تقسیم می‌شود و فقط بخش‌هایی که در پاسخ نبودند یا نامعتبر بودند جداگانه (با پرامپت
+کامل خودشان) دوباره درخواست می‌شوند.
+
+صرفه‌جویی توکن ورودی از روی طول پرامپت‌ها تخمین زده می‌شود (بدون tokenizer).
+"""
+
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# تخمین تعداد کاراکتر هر توکن برای متن فارسی/مختلط
+CHARS_PER_TOKEN = 3
+# پاسخ کوتاه‌تر از این برای یک بخش نامعتبر حساب می‌شود
+MIN_SECTION_CHARS = 40
+
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+@dataclass(frozen=True)
+class PackedSection:
+    """یک بخش گزارش؛ prompt برای درخواست جداگانه و instructions برای درخواست بسته‌بندی‌شده"""
+    key: str
+    prompt: str
+    instructions: str
+    max_tokens: int = 3000
+    # سهم توکن خروجی این بخش در درخواست بسته‌بندی‌شده (پیش‌فرض: max_tokens)
+    packed_tokens: Optional[int] = None
+
+    @property
+    def pack_budget(self) -> int:
+        return self.packed_tokens or self.max_tokens
+
+
+@dataclass
+class PackStats:
+    sections: int = 0
+    requests: int = 0
+    packed_requests: int = 0
+    reissued: List[str] = field(default_factory=list)
+    input_chars: int = 0
+    unpacked_input_chars: int = 0
+    seconds: float = 0.0
+
+    @property
+    def requests_saved(self) -> int:
+        return self.sections - self.requests
+
+    @property
+    def estimated_input_tokens_saved(self) -> int:
+        return (self.unpacked_input_chars - self.input_chars) // CHARS_PER_TOKEN
+
+    @classmethod
+    def merge(cls, items: Sequence[Dict[str, object]]) -> 'PackStats':
+        """جمع آمار چند اجرا (مثلاً هر stage هم‌زمان یک گروه)؛ seconds بیشینه آن‌هاست"""
+        total = cls()
+        for item in items:
+            for name in ('sections', 'requests', 'packed_requests', 'input_chars', 'unpacked_input_chars'):
+                setattr(total, name, getattr(total, name) + int(item.get(name, 0)))
+            total.reissued.extend(item.get('reissued', []))
+            total.seconds = max(total.seconds, float(item.get('seconds', 0)))
+        return total
+
+    def as_dict(self) -> Dict[str, object]:
+        data = asdict(self)
+        data['seconds'] = round(self.seconds, 3)
+        data['requests_saved'] = self.requests_saved
+        data['estimated_input_tokens'] = self.input_chars // CHARS_PER_TOKEN
+        data['estimated_input_tokens_saved'] = self.estimated_input_tokens_saved
+        return data
+
+
+def packing_enabled() -> bool:
+    return bool(getattr(settings, 'PROMPT_PACKING_ENABLED', False))
+
+
+class PromptPacker:
+    """ارسال بخش‌ها به‌صورت بسته‌بندی‌شده و تقسیم پاسخ JSON
+
+    send(prompt, max_tokens, json_mode) متن پاسخ مدل را برمی‌گرداند و در صورت خطا exception می‌دهد.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, int, bool], str],
+        system_prompt: str = '',
+        max_sections: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ):
+        self.send = send
+        self.system_prompt = system_prompt
+        self.max_sections = max_sections or getattr(settings, 'PROMPT_PACK_MAX_SECTIONS', 3)
+        self.max_tokens = max_tokens or getattr(settings, 'PROMPT_PACK_MAX_TOKENS', 8000)
+
+    def chunk(self, sections: Sequence[PackedSection]) -> List[List[PackedSection]]:
+        """گروه‌بندی بخش‌ها به ترتیب با سقف تعداد بخش و مجموع توکن خروجی هر درخواست"""
+        chunks: List[List[PackedSection]] = []
+        current: List[PackedSection] = []
+        budget = 0
+        for section in sections:
+            if current and (len(current) >= self.max_sections or budget + section.pack_budget > self.max_tokens):
+                chunks.append(current)
+                current, budget = [], 0
+            current.append(section)
+            budget += section.pack_budget
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def packed_prompt(context: str, chunk: Sequence[PackedSection]) -> str:
+        keys = ', '.join(f'"{section.key}"' for section in chunk)
+        parts = [
+            context.strip(),
+            '',
+            f"پاسخ فقط یک شیء JSON با کلیدهای {keys}؛ مقدار هر کلید متن کامل همان بخش (Markdown فارسی) به صورت رشته.",
+        ]
+        for section in chunk:
+            parts.extend(['', f'=== بخش "{section.key}" ===', section.instructions.strip()])
+        return '\n'.join(parts)
+
+    @staticmethod
+    def split(text: str, chunk: Sequence[PackedSection]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """تقسیم پاسخ JSON به متن هر بخش؛ (بخش‌های معتبر، خطای بخش‌های نامعتبر)"""
+        keys = [section.key for section in chunk]
+        raw = _FENCE_RE.sub('', (text or '').strip())
+        start, end = raw.find('{'), raw.rfind('}')
+        try:
+            if start < 0 or end <= start:
+                raise ValueError('شیء JSON در پاسخ نیست')
+            data = json.loads(raw[start:end + 1])
+            if not isinstance(data, dict):
+                raise ValueError('پاسخ JSON شیء نیست')
+        except ValueError as e:
+            return {}, {key: f"invalid_json: {e}" for key in keys}
+
+        outputs, errors = {}, {}
+        for key in keys:
+            value = data.get(key)
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            if not isinstance(value, str):
+                errors[key] = 'missing_section'
+            elif len(value.strip()) < MIN_SECTION_CHARS:
+                errors[key] = 'section_too_short'
+            else:
+                outputs[key] = value.strip()
+        return outputs, errors
+
+    def run(self, context: str, sections: Sequence[PackedSection]) -> Tuple[Dict[str, str], Dict[str, str], PackStats]:
+        """اجرای همه بخش‌ها؛ (متن بخش‌های موفق، خطای بخش‌های ناموفق، آمار)"""
+        stats = PackStats(sections=len(sections))
+        stats.unpacked_input_chars = sum(len(self.system_prompt) + len(s.prompt) for s in sections)
+        outputs: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+        start = time.perf_counter()
+
+        retry: List[PackedSection] = []
+        for chunk in self.chunk(sections):
+            if len(chunk) == 1:
+                retry.extend(chunk)
+                continue
+            prompt = self.packed_prompt(context, chunk)
+            stats.requests += 1
+            stats.packed_requests += 1
+            stats.input_chars += len(self.system_prompt) + len(prompt)
+            try:
+                text = self.send(prompt, sum(s.pack_budget for s in chunk), True)
+                chunk_outputs, chunk_errors = self.split(text, chunk)
+            except Exception as e:
+                chunk_outputs, chunk_errors = {}, {s.key: f"{type(e).__name__}: {e}" for s in chunk}
+            outputs.update(chunk_outputs)
+            for section in chunk:
+                if section.key in chunk_errors:
+                    logger.warning(f"⚠️ Packed section {section.key} failed ({chunk_errors[section.key]}); reissuing alone")
+                    stats.reissued.append(section.key)
+                    retry.append(section)
+
+        # بخش‌های تکی و بخش‌های ناموفق درخواست بسته‌بندی‌شده: درخواست جداگانه با پرامپت کامل
+        for section in retry:
+            stats.requests += 1
+            stats.input_chars += len(self.system_prompt) + len(section.prompt)
+            try:
+                outputs[section.key] = self.send(section.prompt, section.max_tokens, False)
+            except Exception as e:
+                errors[section.key] = f"{type(e).__name__}: {e}"
+
+        stats.seconds = time.perf_counter() - start
+        logger.info(
+            f"📦 Prompt packing: {stats.sections} sections in {stats.requests} requests "
+            f"({stats.packed_requests} packed, {len(stats.reissued)} reissued), "
+            f"~{stats.estimated_input_tokens_saved} input tokens saved, {stats.seconds:.2f}s"
+        )
+        return outputs, errors, stats
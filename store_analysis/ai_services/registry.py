@@ -0,0 +1,137 @@
+"""
+رجیستری سرویس‌های تحلیل و کلاینت‌های AI در سطح پروسس
+
+هر سرویس (سطوح free/professional/enterprise و کلاینت‌هایی مثل LiaraAIService) فقط
+در اولین استفاده import و ساخته می‌شود و یک نمونه بین همه درخواست‌های همان worker
+مشترک است. زمان import و ساخت هر سرویس ثبت می‌شود تا هزینه cold start در workerهای
+gunicorn قابل پیگیری باشد؛ warm_up برای بارگذاری پیش از fork (preload_app) است.
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICES = {
+    'free': 'store_analysis.ai_services.free_analysis_service.FreeAnalysisService',
+    'professional': 'store_analysis.ai_services.professional_analysis_service.ProfessionalAnalysisService',
+    'enterprise': 'store_analysis.ai_services.enterprise_analysis_service.EnterpriseAnalysisService',
+    'liara': 'store_analysis.ai_services.liara_ai_service.LiaraAIService',
+    'advanced_ai': 'store_analysis.ai_services.advanced_ai_manager.AdvancedAIManager',
+    'ai_analysis': 'store_analysis.ai_analysis_service.AIAnalysisService',
+    'simple_ai': 'store_analysis.ai_analysis_service_simple.SimpleAIAnalysisService',
+    'consultant': 'store_analysis.ai_services.ai_consultant_service.AIConsultantService',
+}
+
+TIER_SERVICES = ('free', 'professional', 'enterprise')
+
+
+class ServiceRegistry:
+    """ساخت تنبل و اشتراک یک نمونه از هر سرویس در هر پروسس"""
+
+    _factories: Dict[str, str] = dict(DEFAULT_SERVICES)
+    _instances: Dict[str, Any] = {}
+    _stats: Dict[str, Dict[str, Any]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, name: str, path: str) -> None:
+        """ثبت یا جایگزینی سرویس با مسیر dotted کلاس (یا هر callable بدون آرگومان)"""
+        with cls._lock:
+            cls._factories[name] = path
+            cls._instances.pop(name, None)
+            cls._stats.pop(name, None)
+
+    @classmethod
+    def names(cls):
+        return list(cls._factories)
+
+    @classmethod
+    def is_loaded(cls, name: str) -> bool:
+        return name in cls._instances
+
+    @classmethod
+    def get(cls, name: str) -> Any:
+        """نمونه مشترک سرویس؛ در اولین فراخوانی import و ساخته می‌شود"""
+        instance = cls._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in cls._factories:
+            raise KeyError(f"سرویس {name} در رجیستری ثبت نشده است")
+
+        with cls._lock:
+            instance = cls._instances.get(name)
+            if instance is None:
+                instance = cls._build(name)
+                cls._instances[name] = instance
+        return instance
+
+    @classmethod
+    def optional(cls, name: str) -> Optional[Any]:
+        """مانند get اما در صورت خطای import/ساخت None برمی‌گرداند (خطا در آمار ثبت می‌شود)"""
+        try:
+            return cls.get(name)
+        except Exception as e:
+            logger.error(f"❌ سرویس {name} در دسترس نیست: {e}")
+            return None
+
+    @classmethod
+    def _build(cls, name: str) -> Any:
+        module_path, _, attr = cls._factories[name].rpartition('.')
+        start = time.perf_counter()
+        try:
+            factory = getattr(importlib.import_module(module_path), attr)
+            imported = time.perf_counter()
+            instance = factory()
+        except Exception as e:
+            cls._stats[name] = {
+                'loaded': False,
+                'error': str(e),
+                'total_seconds': round(time.perf_counter() - start, 4),
+            }
+            raise
+        done = time.perf_counter()
+        cls._stats[name] = {
+            'loaded': True,
+            'import_seconds': round(imported - start, 4),
+            'init_seconds': round(done - imported, 4),
+            'total_seconds': round(done - start, 4),
+        }
+        logger.info(f"🧩 سرویس {name} در {done - start:.3f} ثانیه ساخته شد")
+        return instance
+
+    @classmethod
+    def warm_up(cls, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        ساخت پیشاپیش سرویس‌ها (مثلاً در master gunicorn با preload_app) تا workerها
+        پس از fork بدون هزینه cold start شروع کنند. پیش‌فرض: AI_SERVICE_WARMUP
+        """
+        if names is None:
+            names = getattr(settings, 'AI_SERVICE_WARMUP', ())
+        for name in names:
+            if name in cls._factories:
+                cls.optional(name)
+            else:
+                logger.warning(f"⚠️ سرویس ناشناخته برای warm-up: {name}")
+        return cls.construction_stats()
+
+    @classmethod
+    def construction_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """هزینه import و ساخت هر سرویس در این پروسس"""
+        return {
+            name: dict(cls._stats.get(name, {'loaded': False}))
+            for name in cls._factories
+        }
+
+    @classmethod
+    def reset(cls) -> None:
+        """حذف نمونه‌های ساخته‌شده و بازگرداندن ثبت‌های پیش‌فرض (برای تست‌ها)"""
+        with cls._lock:
+            cls._factories = dict(DEFAULT_SERVICES)
+            cls._instances.clear()
+            cls._stats.clear()
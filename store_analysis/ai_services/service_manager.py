@@ -8,40 +8,27 @@
 from django.utils import timezone
 from django.conf import settings
 
+from .registry import TIER_SERVICES, ServiceRegistry
+
 logger = logging.getLogger(__name__)
 
 class ServiceManager:
     """مدیریت سرویس‌های تحلیل"""
     
     def __init__(self):
-        self.services = {
-            'free': None,
-            'professional': None,
-            'enterprise': None
-        }
-        self._initialize_services()
+        # سرویس‌های هر سطح در اولین استفاده از ServiceRegistry ساخته و بین درخواست‌ها مشترک می‌شوند
+        self.service_types = TIER_SERVICES
     
-    def _initialize_services(self):
-        """مقداردهی اولیه سرویس‌ها"""
-        try:
-            from .free_analysis_service import FreeAnalysisService
-            from .professional_analysis_service import ProfessionalAnalysisService
-            from .enterprise_analysis_service import EnterpriseAnalysisService
-            
-            self.services['free'] = FreeAnalysisService()
-            self.services['professional'] = ProfessionalAnalysisService()
-            self.services['enterprise'] = EnterpriseAnalysisService()
-            
-            logger.info("✅ سرویس‌های تحلیل با موفقیت مقداردهی شدند")
-            
-        except Exception as e:
-            logger.error(f"❌ خطا در مقداردهی سرویس‌ها: {e}")
+    @property
+    def services(self) -> Dict[str, Any]:
+        """همه سرویس‌های سطوح (سرویس‌های ساخته‌نشده در این لحظه ساخته می‌شوند)"""
+        return {name: ServiceRegistry.optional(name) for name in self.service_types}
     
     def get_service(self, service_type: str) -> Optional[Any]:
         """دریافت سرویس بر اساس نوع"""
         try:
-            if service_type in self.services:
-                return self.services[service_type]
+            if service_type in self.service_types:
+                return ServiceRegistry.optional(service_type)
             else:
                 logger.warning(f"⚠️ سرویس {service_type} یافت نشد")
                 return None
@@ -84,7 +71,8 @@ def get_service_info(self, service_type: str = None) -> Dict[str, Any]:
             else:
                 # اطلاعات تمام سرویس‌ها
                 all_services_info = {}
-                for service_name, service in self.services.items():
+                services = self.services
+                for service_name, service in services.items():
                     if service:
                         all_services_info[service_name] = service.get_service_info()
                     else:
@@ -92,8 +80,8 @@ def get_service_info(self, service_type: str = None) -> Dict[str, Any]:
                 
                 return {
                     'all_services': all_services_info,
-                    'total_services': len(self.services),
-                    'available_services': len([s for s in self.services.values() if s is not None])
+                    'total_services': len(services),
+                    'available_services': len([s for s in services.values() if s is not None])
                 }
                 
         except Exception as e:
@@ -266,15 +254,22 @@ def _fallback_analysis(self, store_data: Dict[str, Any], service_type: str) -> D
     def get_service_statistics(self) -> Dict[str, Any]:
         """آمار سرویس‌ها"""
         try:
+            # آمار بدون ساختن سرویس‌ها؛ سرویس ساخته‌نشده با وضعیت not_loaded گزارش می‌شود
+            construction = ServiceRegistry.construction_stats()
+            status = {}
+            for name in self.service_types:
+                if ServiceRegistry.is_loaded(name):
+                    status[name] = 'available'
+                elif construction[name].get('error'):
+                    status[name] = 'unavailable'
+                else:
+                    status[name] = 'not_loaded'
             stats = {
-                'total_services': len(self.services),
-                'available_services': len([s for s in self.services.values() if s is not None]),
-                'service_types': list(self.services.keys()),
-                'service_status': {
-                    'free': 'available' if self.services['free'] else 'unavailable',
-                    'professional': 'available' if self.services['professional'] else 'unavailable',
-                    'enterprise': 'available' if self.services['enterprise'] else 'unavailable'
-                },
+                'total_services': len(self.service_types),
+                'available_services': len([s for s in status.values() if s == 'available']),
+                'service_types': list(self.service_types),
+                'service_status': status,
+                'construction': {name: construction[name] for name in self.service_types},
                 'last_updated': timezone.now().isoformat()
             }
             
@@ -297,12 +292,12 @@ def validate_service_request(self, service_type: str, user_data: Dict[str, Any])
             }
             
             # بررسی وجود سرویس
-            if service_type not in self.services:
+            if service_type not in self.service_types:
                 validation_result['valid'] = False
                 validation_result['errors'].append(f'سرویس {service_type} وجود ندارد')
             
             # بررسی در دسترس بودن سرویس
-            if service_type in self.services and self.services[service_type] is None:
+            if service_type in self.service_types and self.get_service(service_type) is None:
                 validation_result['valid'] = False
                 validation_result['errors'].append(f'سرویس {service_type} در دسترس نیست')
             
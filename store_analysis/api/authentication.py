@@ -0,0 +1,37 @@
+"""
+احراز هویت DRF با کلید API (هدر Authorization: Api-Key chm_...)
+"""
+
+from rest_framework import authentication, exceptions
+
+from ..services.api_keys import ApiKeyService, InvalidApiKey
+
+
+class ApiKeyAuthentication(authentication.BaseAuthentication):
+    """
+    بررسی کلید API با HMAC و cache داخل پروسس؛ request.auth یک VerifiedKey است که
+    دامنه‌های دسترسی کلید را برای ApiKeyScopePermission نگه می‌دارد.
+    """
+
+    keywords = ('api-key', 'bearer')
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower().decode() not in self.keywords:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('هدر Authorization نامعتبر است')
+        try:
+            raw = header[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('کلید API نامعتبر است')
+
+        try:
+            verified = ApiKeyService.verify(raw)
+        except InvalidApiKey as e:
+            raise exceptions.AuthenticationFailed(str(e))
+
+        return verified.get_user(), verified
+
+    def authenticate_header(self, request):
+        return 'Api-Key'
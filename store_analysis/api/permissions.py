@@ -0,0 +1,23 @@
+"""
+مجوز DRF بر اساس دامنه‌های دسترسی کلید API
+"""
+
+from rest_framework import permissions
+
+from ..services.api_keys import VerifiedKey
+
+
+class ApiKeyScopePermission(permissions.BasePermission):
+    """
+    درخواست‌های با کلید API فقط به actionهایی دسترسی دارند که scope لازم آن‌ها در
+    required_scopes view (نگاشت action -> scope) در کلید باشد. درخواست‌های session
+    بدون تغییر عبور می‌کنند.
+    """
+
+    message = 'کلید API دسترسی لازم برای این عملیات را ندارد'
+
+    def has_permission(self, request, view):
+        if not isinstance(request.auth, VerifiedKey):
+            return True
+        required = getattr(view, 'required_scopes', {}).get(getattr(view, 'action', None))
+        return required is not None and request.auth.has_scope(required)
@@ -6,6 +6,7 @@
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from datetime import timedelta
 import logging
 
@@ -18,6 +19,7 @@
 )
 from ..services.security_service import SecurityService
 from ..decorators import require_secure_headers, log_user_activity
+from .permissions import ApiKeyScopePermission
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +33,20 @@ class StoreAnalysisViewSet(viewsets.ModelViewSet):
     """ViewSet برای تحلیل فروشگاه"""
     serializer_class = StoreAnalysisSerializer
     pagination_class = StoreAnalysisPagination
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, ApiKeyScopePermission]
+    # scope لازم هر action برای درخواست‌های با کلید API
+    required_scopes = {
+        'list': 'analysis:read',
+        'retrieve': 'analysis:read',
+        'statistics': 'analysis:read',
+        'search': 'analysis:read',
+        'status': 'analysis:status',
+        'create': 'analysis:create',
+        'start_analysis': 'analysis:create',
+        'update': 'analysis:write',
+        'partial_update': 'analysis:write',
+        'destroy': 'analysis:write',
+    }
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'store_type', 'city', 'area', 'has_surveillance', 'has_customer_video']
     search_fields = ['store_name', 'store_location', 'description']
@@ -40,7 +55,11 @@ class StoreAnalysisViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """فیلتر کردن queryset بر اساس کاربر"""
-        return StoreAnalysis.objects.filter(user=self.request.user)
+        queryset = StoreAnalysis.objects.filter(user=self.request.user)
+        if self.action == 'retrieve':
+            # StoreAnalysisDetailSerializer همه فیلدها را برمی‌گرداند
+            return queryset.with_payload()
+        return queryset
 
     def get_serializer_class(self):
         """انتخاب serializer مناسب"""
@@ -48,8 +67,8 @@ def get_serializer_class(self):
             return StoreAnalysisDetailSerializer
         return StoreAnalysisSerializer
 
-    @require_secure_headers
-    @log_user_activity('api_list_analyses')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_list_analyses'))
     def list(self, request, *args, **kwargs):
         """لیست تحلیل‌ها با فیلترهای پیشرفته"""
         try:
@@ -87,8 +106,8 @@ def list(self, request, *args, **kwargs):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @require_secure_headers
-    @log_user_activity('api_create_analysis')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_create_analysis'))
     def create(self, request, *args, **kwargs):
         """ایجاد تحلیل جدید"""
         try:
@@ -130,8 +149,8 @@ def create(self, request, *args, **kwargs):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @require_secure_headers
-    @log_user_activity('api_retrieve_analysis')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_retrieve_analysis'))
     def retrieve(self, request, *args, **kwargs):
         """دریافت جزئیات تحلیل"""
         try:
@@ -154,8 +173,8 @@ def retrieve(self, request, *args, **kwargs):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @require_secure_headers
-    @log_user_activity('api_update_analysis')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_update_analysis'))
     def update(self, request, *args, **kwargs):
         """به‌روزرسانی تحلیل"""
         try:
@@ -196,8 +215,8 @@ def update(self, request, *args, **kwargs):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @require_secure_headers
-    @log_user_activity('api_delete_analysis')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_delete_analysis'))
     def destroy(self, request, *args, **kwargs):
         """حذف تحلیل"""
         try:
@@ -226,8 +245,8 @@ def destroy(self, request, *args, **kwargs):
             )
 
     @action(detail=True, methods=['post'])
-    @require_secure_headers
-    @log_user_activity('api_start_analysis')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_start_analysis'))
     def start_analysis(self, request, pk=None):
         """شروع تحلیل"""
         try:
@@ -272,24 +291,45 @@ def start_analysis(self, request, pk=None):
             )
 
     @action(detail=True, methods=['get'])
-    @require_secure_headers
-    @log_user_activity('api_get_analysis_status')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_get_analysis_status'))
     def status(self, request, pk=None):
-        """دریافت وضعیت تحلیل"""
+        """دریافت وضعیت تحلیل از رکورد پیشرفت (بدون بارگذاری ردیف تحلیل، با ETag)"""
+        from django.http import Http404
+        from django.utils.cache import get_conditional_response
+        from django.utils.http import quote_etag
+        from ..utils.progress_bus import ProgressBus
+        
+        def build():
+            owner_id, state = ProgressBus.current(pk)
+            if owner_id is None or owner_id != request.user.id:
+                raise Http404
+            current_status = state['status']
+            return {
+                'id': int(pk),
+                'status': current_status,
+                'progress': state.get('progress', 0),
+                'stage': state.get('stage', ''),
+                'message': state.get('message', ''),
+                'eta_seconds': state.get('eta_seconds'),
+                'created_at': state.get('created_at') or None,
+                'updated_at': state.get('timestamp'),
+                'is_completed': current_status == 'completed',
+                'is_processing': current_status == 'processing',
+                'is_failed': current_status == 'failed',
+            }, ProgressBus.etag(state)
+        
         try:
-            analysis = self.get_object()
-            
-            return Response({
-                'id': analysis.id,
-                'status': analysis.status,
-                'progress': analysis.get_progress(),
-                'created_at': analysis.created_at,
-                'updated_at': analysis.updated_at,
-                'is_completed': analysis.is_completed,
-                'is_processing': analysis.is_processing,
-                'is_failed': analysis.is_failed
-            })
-            
+            # view همگام: ?wait= نادیده گرفته می‌شود (long-poll فقط در view async وضعیت)
+            payload, etag = build()
+            etag = quote_etag(etag)
+            response = get_conditional_response(request, etag=etag) or Response(payload)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+            
+        except Http404:
+            raise
         except Exception as e:
             logger.error(f"API status error: {str(e)}")
             return Response(
@@ -298,8 +338,8 @@ def status(self, request, pk=None):
             )
 
     @action(detail=False, methods=['get'])
-    @require_secure_headers
-    @log_user_activity('api_get_statistics')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_get_statistics'))
     def statistics(self, request):
         """دریافت آمار تحلیل‌ها"""
         try:
@@ -363,8 +403,8 @@ def statistics(self, request):
             )
 
     @action(detail=False, methods=['get'])
-    @require_secure_headers
-    @log_user_activity('api_search_analyses')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_search_analyses'))
     def search(self, request):
         """جستجوی پیشرفته تحلیل‌ها"""
         try:
@@ -401,15 +441,16 @@ def search(self, request):
 class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet برای پرداخت‌ها"""
     serializer_class = PaymentSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, ApiKeyScopePermission]
+    required_scopes = {'list': 'payments:read', 'retrieve': 'payments:read'}
     pagination_class = StoreAnalysisPagination
 
     def get_queryset(self):
         """فیلتر کردن queryset بر اساس کاربر"""
         return Payment.objects.filter(user=self.request.user)
 
-    @require_secure_headers
-    @log_user_activity('api_get_payment_history')
+    @method_decorator(require_secure_headers)
+    @method_decorator(log_user_activity('api_get_payment_history'))
     def list(self, request, *args, **kwargs):
         """لیست پرداخت‌ها"""
         try:
@@ -15,3 +15,6 @@ def ready(self):
         Import signal handlers when the app is ready.
         """
         import store_analysis.signals
+        from store_analysis.services.query_budget import connect_task_signals
+
+        connect_task_signals()
@@ -0,0 +1,80 @@
+"""
+Async Views - نسخه async viewهای I/O-bound برای اجرای ASGI
+
+در حالت ASGI (ASGI_MODE=true) این viewها به‌جای نسخه sync در urls ثبت می‌شوند. انتظار
+برای LLM با httpx و بدون اشغال thread انجام می‌شود و همه دسترسی‌های ORM از طریق
+db_sync_to_async در thread pool محدود دیتابیس اجرا می‌شوند؛ بنابراین یک فراخوانی کند
+LLM دیگر worker را برای سایر درخواست‌ها block نمی‌کند.
+"""
+
+import logging
+
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+
+from .ai_services.registry import ServiceRegistry
+from .chat_views import _finish_chat_turn, _start_chat_turn
+from .decorators import async_login_required
+from .utils.async_db import db_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+@async_login_required
+async def ai_consultant_send(request, analysis_id):
+    """
+    ارسال پیام به AI Consultant و دریافت پاسخ (async)
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        turn = await db_sync_to_async(_start_chat_turn)(request, analysis_id)
+        if isinstance(turn, JsonResponse):
+            return turn
+        store_analysis, chat_session, user_chat_message, chat_history = turn
+
+        ai_consultant = await db_sync_to_async(ServiceRegistry.get)('consultant')
+        ai_response = await ai_consultant.achat_with_analysis(
+            user_message=user_chat_message.content,
+            store_analysis=store_analysis,
+            chat_history=chat_history
+        )
+
+        return await db_sync_to_async(_finish_chat_turn)(chat_session, user_chat_message, ai_response)
+
+    except Exception as e:
+        logger.error(f"Error in ai_consultant_send: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+# برای سادگی - مانند نسخه sync (csrf_exempt در Django 4.2 view async را sync می‌کند)
+ai_consultant_send.csrf_exempt = True
+
+
+def _analysis_status(user_id, pk):
+    from django.core.cache import cache
+    from .utils.progress_bus import ProgressBus
+
+    owner_id, status = ProgressBus.current(pk)
+    if owner_id != user_id:
+        raise Http404
+    return status, cache.get(f'analysis_results_{pk}')
+
+
+@async_login_required
+async def get_analysis_status(request, pk):
+    """دریافت وضعیت تحلیل از گذرگاه پیشرفت (async، با پشتیبانی از 304 و long-poll ?wait=)"""
+    from .utils.progress_bus import ProgressBus
+    from .views import _conditional_status_response
+
+    async def build():
+        status, results = await db_sync_to_async(_analysis_status)(request.user.id, pk)
+        return {'status': status, 'results': results}, f"{ProgressBus.etag(status)}-{int(bool(results))}"
+
+    payload, etag = await ProgressBus.apoll(
+        build, request.headers.get('If-None-Match', ''), ProgressBus.wait_seconds(request.GET.get('wait'))
+    )
+    return _conditional_status_response(request, payload, etag)
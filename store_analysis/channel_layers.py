@@ -0,0 +1,174 @@
+"""
+Channel layer مبتنی بر SQLite برای ارسال پیام بین پروسس‌ها بدون نیاز به Redis
+
+InMemoryChannelLayer فقط داخل یک پروسس کار می‌کند؛ پیشرفت تحلیلی که در Celery یا
+worker دیگری اجرا می‌شود به WebSocket باز در پروسس ASGI نمی‌رسد. این layer پیام‌ها
+و عضویت گروه‌ها را در یک فایل SQLite مشترک (پیش‌فرض زیر /tmp که روی لیارا قابل
+نوشتن است) نگه می‌دارد. برای استقرارهای چندسروری از channels_redis استفاده کنید.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """Channel layer با ذخیره پیام‌ها در SQLite (حالت WAL) و دریافت به روش polling"""
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=None, expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, poll_interval=0.05, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = path or os.path.join(tempfile.gettempdir(), 'chidmano_channels.sqlite3')
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self._initialized = False
+
+    # --- SQLite helpers (اجرا در thread pool تا event loop مسدود نشود) ---
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                'payload TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS groups ('
+                'grp TEXT NOT NULL, channel TEXT NOT NULL, expires REAL NOT NULL, '
+                'PRIMARY KEY (grp, channel))'
+            )
+            self._initialized = True
+        return conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def _send_sync(self, channels, payload):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM messages WHERE expires < ?', (now,))
+            full = []
+            for channel in channels:
+                queued = conn.execute(
+                    'SELECT COUNT(*) FROM messages WHERE channel = ?', (channel,)
+                ).fetchone()[0]
+                if queued >= self.get_capacity(channel):
+                    full.append(channel)
+                    continue
+                conn.execute(
+                    'INSERT INTO messages (channel, payload, expires) VALUES (?, ?, ?)',
+                    (channel, payload, now + self.expiry)
+                )
+            conn.execute('COMMIT')
+            return full
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _pop_sync(self, channel):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, payload FROM messages WHERE channel = ? AND expires >= ? ORDER BY id LIMIT 1',
+                (channel, time.time())
+            ).fetchone()
+            if row:
+                conn.execute('DELETE FROM messages WHERE id = ?', (row[0],))
+            conn.execute('COMMIT')
+            return row[1] if row else None
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _execute_sync(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    # --- Channel layer API ---
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        full = await self._run(self._send_sync, [channel], json.dumps(message, default=str))
+        if full:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        while True:
+            payload = await self._run(self._pop_sync, channel)
+            if payload is not None:
+                return json.loads(payload)
+            await asyncio.sleep(self.poll_interval)
+
+    async def new_channel(self, prefix='specific'):
+        return f'{prefix}.sqlite!{uuid.uuid4().hex}'
+
+    async def flush(self):
+        await self._run(self._execute_sync, 'DELETE FROM messages')
+        await self._run(self._execute_sync, 'DELETE FROM groups')
+
+    async def close(self):
+        pass
+
+    # --- Groups extension ---
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._run(
+            self._execute_sync,
+            'INSERT OR REPLACE INTO groups (grp, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry)
+        )
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._run(
+            self._execute_sync,
+            'DELETE FROM groups WHERE grp = ? AND channel = ?',
+            (group, channel)
+        )
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        rows = await self._run(
+            self._execute_sync,
+            'SELECT channel FROM groups WHERE grp = ? AND expires >= ?',
+            (group, time.time())
+        )
+        if rows:
+            # مانند سایر layerها، ChannelFull در ارسال گروهی نادیده گرفته می‌شود
+            await self._run(
+                self._send_sync,
+                [row[0] for row in rows],
+                json.dumps(message, default=str)
+            )
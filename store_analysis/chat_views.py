@@ -10,7 +10,7 @@
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from .models import StoreAnalysis, ChatSession, ChatMessage
-from .ai_services.ai_consultant_service import AIConsultantService
+from .ai_services.registry import ServiceRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +41,7 @@ def ai_consultant_chat(request, analysis_id):
         messages = chat_session.messages.all()
         
         # پیشنهاد سوالات
-        ai_consultant = AIConsultantService()
+        ai_consultant = ServiceRegistry.get('consultant')
         suggested_questions = ai_consultant.suggest_questions(store_analysis)
         
         context = {
@@ -67,103 +67,20 @@ def ai_consultant_send(request, analysis_id):
     ارسال پیام به AI Consultant و دریافت پاسخ
     """
     try:
-        # پارس کردن body
-        try:
-            data = json.loads(request.body)
-        except json.JSONDecodeError:
-            data = {
-                'message': request.POST.get('message', ''),
-                'session_id': request.POST.get('session_id')
-            }
-        
-        user_message = data.get('message', '').strip()
-        session_id = data.get('session_id')
-        
-        if not user_message:
-            return JsonResponse({
-                'success': False,
-                'error': 'پیام خالی است'
-            }, status=400)
-        
-        # دریافت تحلیل و جلسه چت
-        store_analysis = get_object_or_404(
-            StoreAnalysis,
-            id=analysis_id,
-            user=request.user
-        )
-        
-        if session_id:
-            chat_session = get_object_or_404(
-                ChatSession,
-                id=session_id,
-                user=request.user,
-                store_analysis=store_analysis
-            )
-        else:
-            # ایجاد جلسه جدید
-            chat_session = ChatSession.objects.create(
-                user=request.user,
-                store_analysis=store_analysis,
-                title=f'مشاوره فروشگاه {store_analysis.store_name}'
-            )
-        
-        # بررسی محدودیت سوال (10 سوال رایگان)
-        if not chat_session.has_free_questions_left():
-            return JsonResponse({
-                'success': False,
-                'error': 'شما از 10 سوال رایگان استفاده کرده‌اید.',
-                'upgrade_required': True,
-                'upgrade_message': 'برای پرسیدن سوالات بیشتر، پلن پریمیوم 3 ساعته (200,000 تومان) تهیه کنید.',
-                'questions_used': chat_session.get_user_questions_count(),
-                'free_limit': 10
-            }, status=403)
-        
-        # ذخیره پیام کاربر
-        user_chat_message = ChatMessage.objects.create(
-            session=chat_session,
-            role='user',
-            content=user_message
-        )
-        
-        # دریافت تاریخچه چت
-        chat_history = list(chat_session.messages.values('role', 'content').order_by('created_at')[:20])
+        turn = _start_chat_turn(request, analysis_id)
+        if isinstance(turn, JsonResponse):
+            return turn
+        store_analysis, chat_session, user_chat_message, chat_history = turn
         
         # ارسال به AI
-        ai_consultant = AIConsultantService()
+        ai_consultant = ServiceRegistry.get('consultant')
         ai_response = ai_consultant.chat_with_analysis(
-            user_message=user_message,
+            user_message=user_chat_message.content,
             store_analysis=store_analysis,
-            chat_history=chat_history[:-1]  # بدون پیام جاری
+            chat_history=chat_history
         )
         
-        # ذخیره پاسخ AI
-        assistant_message = ChatMessage.objects.create(
-            session=chat_session,
-            role='assistant',
-            content=ai_response['response'],
-            ai_model=ai_response.get('ai_model'),
-            processing_time=ai_response.get('processing_time'),
-            tokens_used=ai_response.get('tokens_used')
-        )
-        
-        return JsonResponse({
-            'success': True,
-            'session_id': str(chat_session.id),
-            'user_message': {
-                'id': str(user_chat_message.id),
-                'role': 'user',
-                'content': user_chat_message.content,
-                'created_at': user_chat_message.created_at.isoformat()
-            },
-            'assistant_message': {
-                'id': str(assistant_message.id),
-                'role': 'assistant',
-                'content': assistant_message.content,
-                'ai_model': assistant_message.ai_model,
-                'processing_time': assistant_message.processing_time,
-                'created_at': assistant_message.created_at.isoformat()
-            }
-        })
+        return _finish_chat_turn(chat_session, user_chat_message, ai_response)
         
     except Exception as e:
         logger.error(f"Error in ai_consultant_send: {e}", exc_info=True)
@@ -172,3 +89,97 @@ def ai_consultant_send(request, analysis_id):
             'error': str(e)
         }, status=500)
 
+
+def _start_chat_turn(request, analysis_id):
+    """
+    بخش دیتابیسی پیش از فراخوانی AI (مشترک بین نسخه sync و async):
+    پاسخ خطا (JsonResponse) یا (store_analysis, chat_session, user_chat_message, chat_history)
+    """
+    # پارس کردن body
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        data = {
+            'message': request.POST.get('message', ''),
+            'session_id': request.POST.get('session_id')
+        }
+    
+    user_message = data.get('message', '').strip()
+    session_id = data.get('session_id')
+    
+    if not user_message:
+        return JsonResponse({
+            'success': False,
+            'error': 'پیام خالی است'
+        }, status=400)
+    
+    # دریافت تحلیل و جلسه چت؛ results/analysis_data برای context لازم‌اند و در مسیر async
+    # دسترسی تنبل به ستون defer‌شده (کوئری داخل event loop) مجاز نیست
+    store_analysis = get_object_or_404(
+        StoreAnalysis.objects.with_payload('results', 'analysis_data'),
+        id=analysis_id,
+        user=request.user
+    )
+    
+    if session_id:
+        chat_session = get_object_or_404(
+            ChatSession,
+            id=session_id,
+            user=request.user,
+            store_analysis=store_analysis
+        )
+    else:
+        # ایجاد جلسه جدید
+        chat_session = ChatSession.objects.create(
+            user=request.user,
+            store_analysis=store_analysis,
+            title=f'مشاوره فروشگاه {store_analysis.store_name}'
+        )
+    
+    # بررسی و مصرف سهمیه سوال (10 سوال رایگان) و ذخیره پیام کاربر به‌صورت اتمیک
+    user_chat_message = chat_session.add_user_question(user_message)
+    if user_chat_message is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'شما از 10 سوال رایگان استفاده کرده‌اید.',
+            'upgrade_required': True,
+            'upgrade_message': 'برای پرسیدن سوالات بیشتر، پلن پریمیوم 3 ساعته (200,000 تومان) تهیه کنید.',
+            'questions_used': chat_session.get_user_questions_count(),
+            'free_limit': ChatSession.FREE_QUESTIONS_LIMIT
+        }, status=403)
+    
+    # دریافت تاریخچه چت (بدون پیام جاری)
+    chat_history = list(chat_session.messages.values('role', 'content').order_by('created_at')[:20])
+    return store_analysis, chat_session, user_chat_message, chat_history[:-1]
+
+
+def _finish_chat_turn(chat_session, user_chat_message, ai_response):
+    """ذخیره پاسخ AI و ساخت پاسخ JSON (مشترک بین نسخه sync و async)"""
+    assistant_message = ChatMessage.objects.create(
+        session=chat_session,
+        role='assistant',
+        content=ai_response['response'],
+        ai_model=ai_response.get('ai_model'),
+        processing_time=ai_response.get('processing_time'),
+        tokens_used=ai_response.get('tokens_used')
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'session_id': str(chat_session.id),
+        'user_message': {
+            'id': str(user_chat_message.id),
+            'role': 'user',
+            'content': user_chat_message.content,
+            'created_at': user_chat_message.created_at.isoformat()
+        },
+        'assistant_message': {
+            'id': str(assistant_message.id),
+            'role': 'assistant',
+            'content': assistant_message.content,
+            'ai_model': assistant_message.ai_model,
+            'processing_time': assistant_message.processing_time,
+            'created_at': assistant_message.created_at.isoformat()
+        }
+    })
+
@@ -97,10 +97,9 @@ async def analysis_completion_notification(self, event):
     
     async def _send_current_status(self):
         """ارسال وضعیت فعلی تحلیل"""
-        from .services.real_time_analyzer import RealTimeAnalyzer
+        from .utils.progress_bus import ProgressBus
         
-        analyzer = RealTimeAnalyzer()
-        status = analyzer.get_analysis_status(self.analysis_id)
+        status = ProgressBus.latest(self.analysis_id)
         
         if status:
             await self.send(text_data=json.dumps({
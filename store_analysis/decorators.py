@@ -6,6 +6,8 @@
 from .exceptions import SecurityError
 
 logger = logging.getLogger(__name__)
+# لاگ فعالیت در هر درخواست API؛ logger جدا تا در LOG_SAMPLING_RULES نمونه‌برداری شود
+activity_logger = logging.getLogger('store_analysis.activity')
 
 def require_secure_headers(view_func):
     """Decorator برای بررسی هدرهای امنیتی"""
@@ -27,8 +29,12 @@ def decorator(view_func):
         @functools.wraps(view_func)
         def wrapper(request, *args, **kwargs):
             # ثبت فعالیت
-            user_id = request.user.id if request.user.is_authenticated else 'anonymous'
-            logger.info(f"User activity: {activity_type} by user {user_id} on {request.path}")
+            if activity_logger.isEnabledFor(logging.INFO):
+                user_id = request.user.id if request.user.is_authenticated else 'anonymous'
+                activity_logger.info(
+                    "User activity: %s by user %s on %s", activity_type, user_id, request.path,
+                    extra={'activity': activity_type, 'user_id': user_id, 'path': request.path},
+                )
             
             return view_func(request, *args, **kwargs)
         return wrapper
@@ -78,10 +84,24 @@ def wrapper(request, *args, **kwargs):
         return view_func(request, *args, **kwargs)
     return wrapper
 
+def async_login_required(view_func):
+    """معادل login_required برای viewهای async (Django 4.2 از view async پشتیبانی نمی‌کند)"""
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        from django.contrib.auth.views import redirect_to_login
+        from .utils.async_db import db_sync_to_async
+        
+        # request.user یک lazy object است که session و کاربر را از دیتابیس می‌خواند
+        is_authenticated = await db_sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
 def _check_secure_headers(request):
     """بررسی هدرهای امنیتی"""
-    # بررسی CSRF token برای درخواست‌های POST
-    if request.method == 'POST':
+    # بررسی CSRF token برای درخواست‌های POST (درخواست‌های با کلید API در برابر CSRF آسیب‌پذیر نیستند)
+    if request.method == 'POST' and getattr(request, 'auth', None) is None:
         if not request.headers.get('X-CSRFToken'):
             return False
     
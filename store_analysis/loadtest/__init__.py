@@ -0,0 +1 @@
+# Load-testing harness: seeded data, local stand-ins for external APIs and scripted scenarios
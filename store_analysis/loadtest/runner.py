@@ -0,0 +1,169 @@
+"""
+اجرای هم‌زمان سناریوها (closed-loop) و گزارش p50/p95/p99 و throughput
+
+هر worker یک thread با rng مستقل (seed + شماره worker) است که تا پایان مدت یا سقف تکرارها
+سناریو را با وزن‌ها انتخاب و اجرا می‌کند؛ نشست هر کاربر در هر worker یک بار ساخته (login)
+و دوباره استفاده می‌شود. با concurrency=1 اجرا در همین thread انجام می‌شود.
+"""
+
+import itertools
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from django.db import connections
+
+from .scenarios import SCENARIOS, Probe
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class LatencyRecorder:
+    """نمونه‌های تأخیر، خطا و کوئری هر برچسب (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+        self.errors = defaultdict(Counter)
+        self.queries = defaultdict(list)
+
+    def record(self, label, seconds, ok, error=None, queries=None):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if not ok:
+                self.failures[label] += 1
+                self.errors[label][error or 'unexpected'] += 1
+            if queries is not None:
+                self.queries[label].append(queries)
+
+    def row(self, label, latencies, failures, queries, elapsed):
+        return {
+            'scenario': label,
+            'requests': len(latencies),
+            'errors': failures,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            'queries': round(sum(queries) / len(queries), 1) if queries else None,
+        }
+
+    def summary(self, elapsed):
+        with self.lock:
+            rows = [self.row(label, values, self.failures[label], self.queries[label], elapsed)
+                    for label, values in sorted(self.latencies.items())]
+            everything = [v for values in self.latencies.values() for v in values]
+            if everything:
+                rows.append(self.row('total', everything, sum(self.failures.values()),
+                                     [q for values in self.queries.values() for q in values], elapsed))
+            return rows
+
+
+class _Discard:
+    """recorder تکرارهای warmup"""
+
+    def record(self, *args, **kwargs):
+        pass
+
+
+@dataclass
+class LoadReport:
+    elapsed: float
+    concurrency: int
+    rows: List[dict]
+    errors: Dict[str, dict]
+    stubs: Dict[str, dict] = field(default_factory=dict)
+
+    def as_dict(self):
+        return {'elapsed_seconds': round(self.elapsed, 3), 'concurrency': self.concurrency,
+                'scenarios': self.rows, 'errors': self.errors, 'stubs': self.stubs}
+
+
+class LoadRunner:
+    """
+    session_factory(user یا None) نشست می‌سازد (ClientSession یا HttpSession)
+    mix: {نام سناریو: وزن}؛ سناریوهایی که هیچ کاربری داده لازمشان را ندارد حذف می‌شوند.
+    duration (ثانیه) و/یا iterations (کل تکرار سناریوها) پایان اجرا را تعیین می‌کنند.
+    """
+
+    def __init__(self, session_factory, users, mix=None, concurrency=4, duration=None, iterations=None,
+                 warmup=0, seed=42):
+        self.session_factory = session_factory
+        self.concurrency = max(1, concurrency)
+        self.duration = duration
+        self.iterations = iterations if iterations or duration else 100
+        self.warmup = warmup
+        self.seed = seed
+        self.eligible = {}
+        self.skipped = []
+        for name, weight in (mix or {name: s.weight for name, s in SCENARIOS.items()}).items():
+            scenario = SCENARIOS[name]
+            candidates = [u for u in users if not scenario.requires or getattr(u, scenario.requires)]
+            if weight > 0 and (candidates or not scenario.login):
+                self.eligible[name] = (weight, candidates)
+            else:
+                self.skipped.append(name)
+        if not self.eligible:
+            raise ValueError('هیچ سناریوی قابل اجرایی نیست؛ ابتدا داده load test را seed کنید')
+
+    def run(self):
+        recorder = LatencyRecorder()
+        counter = itertools.count()
+        lock = threading.Lock()
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+
+        def take():
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            if self.iterations:
+                with lock:
+                    return next(counter) < self.iterations
+            return True
+
+        if self.concurrency == 1:
+            self._worker(0, recorder, take, threaded=False)
+        else:
+            workers = [threading.Thread(target=self._worker, args=(i, recorder, take), daemon=True)
+                       for i in range(self.concurrency)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = time.perf_counter() - start
+        return LoadReport(elapsed=elapsed, concurrency=self.concurrency, rows=recorder.summary(elapsed),
+                          errors={label: dict(c) for label, c in recorder.errors.items()})
+
+    def _worker(self, index, recorder, take, threaded=True):
+        rng = random.Random(self.seed * 1000 + index)
+        names = list(self.eligible)
+        weights = [self.eligible[name][0] for name in names]
+        sessions = {}
+        discard = _Discard()
+        try:
+            for n in itertools.count():
+                if not take():
+                    break
+                scenario = SCENARIOS[rng.choices(names, weights)[0]]
+                user = rng.choice(self.eligible[scenario.name][1]) if scenario.login else None
+                key = user.id if user else None
+                if key not in sessions:
+                    try:
+                        sessions[key] = self.session_factory(user)
+                    except Exception as e:
+                        recorder.record(scenario.name, 0.0, False, error=f'session: {type(e).__name__}')
+                        continue
+                probe = Probe(sessions[key], recorder if n >= self.warmup else discard, scenario.name)
+                scenario.run(probe, user, rng)
+        finally:
+            if threaded:
+                connections.close_all()
@@ -0,0 +1,192 @@
+"""
+سناریوهای load test و نشست‌های اجرای آن‌ها
+
+هر سناریو تابع (probe, user, rng) است و درخواست‌هایش را با probe می‌فرستد؛ probe زمان هر
+درخواست را با برچسب سناریو ثبت می‌کند و پاسخ با وضعیت خارج از expect خطا حساب می‌شود.
+دو نوع نشست:
+    ClientSession   in-process با django.test.Client (بدون شبکه؛ view + middleware)
+    HttpSession     HTTP واقعی با requests در برابر سرور در حال اجرا (login با فرم و CSRF)
+"""
+
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, NamedTuple, Optional
+
+from django.urls import reverse
+
+from .seed import PASSWORD
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+# شروع تصادفی: سقف نرخ سرور بین اجراهای پشت سر هم باقی می‌ماند
+_addresses = itertools.count(random.SystemRandom().randrange(1, 1 << 23))
+
+QUESTIONS = [
+    'چطور فروش قفسه ورودی را بیشتر کنم؟',
+    'بهترین جای صندوق در فروشگاه من کجاست؟',
+    'نورپردازی ویترین را چطور تغییر دهم؟',
+]
+
+
+def _client_address():
+    """آدرس یکتای هر نشست؛ محدودیت نرخ به‌ازای IP است و کاربران مجازی نباید سقف یکدیگر را مصرف کنند"""
+    n = next(_addresses)
+    return f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'
+
+
+class Response(NamedTuple):
+    status: int
+    headers: dict
+    body: bytes
+
+
+class ClientSession:
+    """نشست in-process؛ کاربر با force_login وارد می‌شود"""
+
+    def __init__(self, user=None):
+        from django.contrib.auth.models import User
+        from django.test import Client
+
+        self.client = Client(REMOTE_ADDR=_client_address(), HTTP_USER_AGENT=USER_AGENT)
+        if user is not None:
+            self.client.force_login(User.objects.get(pk=user.id))
+
+    def request(self, method, path, params=None, data=None, json_body=None, headers=None):
+        kwargs = {'headers': headers or {}}
+        if method == 'GET':
+            response = self.client.get(path, params or {}, **kwargs)
+        elif json_body is not None:
+            response = self.client.post(path, json.dumps(json_body), content_type='application/json', **kwargs)
+        else:
+            response = self.client.post(path, data or {}, **kwargs)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return Response(response.status_code, dict(response.headers), body)
+
+
+class HttpSession:
+    """نشست HTTP؛ کاربر با فرم login و رمز PASSWORD وارد می‌شود"""
+
+    def __init__(self, base_url, user=None, timeout=60):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        # UA کتابخانه requests در SecurityMiddleware مسدود است
+        self.session.headers.update({'User-Agent': USER_AGENT, 'X-Forwarded-For': _client_address()})
+        if user is not None:
+            self._login(user.username)
+
+    def _login(self, username):
+        url = f"{self.base_url}{reverse('login')}"
+        self.session.get(url, timeout=self.timeout)
+        response = self.session.post(url, data={
+            'username': username, 'password': PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        }, headers={'Referer': url}, allow_redirects=False, timeout=self.timeout)
+        if 'sessionid' not in self.session.cookies:
+            raise RuntimeError(f'login failed for {username} (HTTP {response.status_code})')
+
+    def request(self, method, path, params=None, data=None, json_body=None, headers=None):
+        headers = dict(headers or {})
+        if method != 'GET':
+            headers.setdefault('X-CSRFToken', self.session.cookies.get('csrftoken', ''))
+            headers.setdefault('Referer', f'{self.base_url}{path}')
+        response = self.session.request(
+            method, f'{self.base_url}{path}', params=params, data=data, json=json_body, headers=headers,
+            allow_redirects=False, timeout=self.timeout,
+        )
+        return Response(response.status_code, dict(response.headers), response.content)
+
+
+class Probe:
+    """ارسال درخواست با نشست و ثبت تأخیر، موفقیت و تعداد کوئری (هدر X-DB-Queries) در recorder"""
+
+    def __init__(self, session, recorder, label):
+        self.session = session
+        self.recorder = recorder
+        self.label = label
+
+    def __call__(self, method, path, expect=(200,), **kwargs) -> Optional[Response]:
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, path, **kwargs)
+        except Exception as e:
+            self.recorder.record(self.label, time.perf_counter() - start, False, error=type(e).__name__)
+            return None
+        queries = response.headers.get('X-DB-Queries')
+        self.recorder.record(
+            self.label, time.perf_counter() - start, response.status in expect,
+            error=None if response.status in expect else f'HTTP {response.status}',
+            queries=int(queries) if queries and queries.isdigit() else None,
+        )
+        return response
+
+
+def home(probe, user, rng):
+    probe('GET', '/')
+
+
+def form_submit(probe, user, rng):
+    # فرم با AJAX ارسال می‌شود؛ خطای view به‌صورت 500 JSON برمی‌گردد نه صفحه 200
+    probe('POST', reverse('store_analysis:submit_analysis'), data={
+        'store_name': f'فروشگاه بار {rng.randint(1, 10 ** 6)}',
+        'store_type': rng.choice(['supermarket', 'clothing', 'cosmetics']),
+        'store_size': str(rng.randint(50, 1500)),
+        'store_address': 'تهران',
+        'business_goals': 'افزایش فروش',
+    }, headers={'X-Requested-With': 'XMLHttpRequest'})
+
+
+def status_polling(probe, user, rng, polls=3):
+    url = reverse('store_analysis:get_analysis_status', args=[rng.choice(user.processing_ids)])
+    etag = ''
+    for _ in range(polls):
+        response = probe('GET', url, expect=(200, 304), headers={'If-None-Match': etag} if etag else None)
+        if response is None:
+            return
+        etag = response.headers.get('ETag', etag)
+
+
+def pdf_download(probe, user, rng):
+    probe('GET', reverse('store_analysis:download_analysis', args=[rng.choice(user.completed_ids)]),
+          params={'type': 'pdf'})
+
+
+def payment_callback(probe, user, rng):
+    # callback اول verify درگاه (سرور ساختگی) را اجرا می‌کند و بعدی‌ها replay هستند
+    number = rng.choice(user.order_numbers)
+    probe('GET', reverse('store_analysis:payping_callback', args=[number]),
+          params={'refid': f'REF-{number}'}, expect=(302,))
+
+
+def chat(probe, user, rng, turns=2):
+    url = reverse('store_analysis:ai_consultant_send', args=[rng.choice(user.completed_ids)])
+    session_id = None
+    for _ in range(turns):
+        response = probe('POST', url, json_body={'message': rng.choice(QUESTIONS), 'session_id': session_id})
+        if response is None or response.status != 200:
+            return
+        session_id = json.loads(response.body).get('session_id')
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    run: Callable
+    weight: int
+    login: bool = True
+    requires: Optional[str] = None  # فهرست لازم در LoadUser
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario('home', home, weight=30, login=False),
+    Scenario('form_submit', form_submit, weight=10),
+    Scenario('status_polling', status_polling, weight=25, requires='processing_ids'),
+    Scenario('pdf_download', pdf_download, weight=10, requires='completed_ids'),
+    Scenario('payment_callback', payment_callback, weight=10, requires='order_numbers'),
+    Scenario('chat', chat, weight=15, requires='completed_ids'),
+)}
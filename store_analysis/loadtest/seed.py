@@ -0,0 +1,144 @@
+"""
+داده مصنوعی تکرارپذیر برای load test: کاربران، تحلیل‌ها، سفارش/پرداخت‌ها و بازدیدها
+
+همه کاربران با پیشوند PREFIX و رمز PASSWORD ساخته می‌شوند تا اجرای HTTP (login واقعی) و
+پاک‌سازی ممکن باشد. با seed ثابت، داده‌ها در هر اجرا یکسان‌اند.
+"""
+
+import random
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from typing import List
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from store_analysis.models import Order, PageView, Payment, StoreAnalysis
+
+PREFIX = 'loadtest_'
+PASSWORD = 'loadtest-pass'
+ORDER_PREFIX = 'LT-'
+
+
+@dataclass
+class LoadUser:
+    """شناسه‌هایی که سناریوهای یک کاربر seed‌شده لازم دارند"""
+    id: int
+    username: str
+    completed_ids: List[int] = field(default_factory=list)
+    processing_ids: List[int] = field(default_factory=list)
+    order_numbers: List[str] = field(default_factory=list)
+
+
+def insert_analyses(analyses):
+    """درج مستقیم تحلیل‌های ذخیره‌نشده؛ ستون‌های NOT NULL قدیمی خارج از مدل (contact_*) با '' پر می‌شوند"""
+    fields = [f for f in StoreAnalysis._meta.concrete_fields if not f.primary_key]
+    with connection.cursor() as cursor:
+        description = connection.introspection.get_table_description(cursor, StoreAnalysis._meta.db_table)
+    model_columns = {f.column for f in fields}
+    extra = [column.name for column in description
+             if column.name not in model_columns and column.name != 'id' and not column.null_ok]
+    columns = [f.column for f in fields] + extra
+    sql = (f"INSERT INTO {connection.ops.quote_name(StoreAnalysis._meta.db_table)} "
+           f"({', '.join(connection.ops.quote_name(c) for c in columns)}) VALUES ({', '.join(['%s'] * len(columns))})")
+    now = timezone.now()
+    for analysis in analyses:
+        # INSERT خام auto_now/auto_now_add را اعمال نمی‌کند
+        analysis.created_at = analysis.created_at or now
+        analysis.updated_at = analysis.updated_at or analysis.created_at
+    params = [
+        [f.get_db_prep_save(getattr(analysis, f.attname), connection) for f in fields] + [''] * len(extra)
+        for analysis in analyses
+    ]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def _report(rng, index):
+    """گزارش premium ساختگی کوچک برای دانلود PDF"""
+    from store_analysis.management.commands.benchmark_pdf_downloads import synthetic_analysis
+    return synthetic_analysis(index, sections=rng.randint(2, 4)).results
+
+
+@transaction.atomic
+def seed(users=20, analyses=6, orders=5, page_views=2000, seed=42):
+    """
+    ساخت دوباره داده load test (پس از clear) و برگرداندن LoadUserها
+    هر کاربر analyses تحلیل (نیمی completed با گزارش، بقیه processing) و orders سفارش pending
+    با پرداخت و تحلیل متصل (برای callback) دارد.
+    """
+    clear()
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.com', password=password)
+        for i in range(users)
+    ])
+    accounts = list(User.objects.filter(username__startswith=PREFIX).order_by('id'))
+
+    rows = []
+    for account in accounts:
+        for i in range(analyses):
+            completed = i % 2 == 0
+            analysis = StoreAnalysis(
+                user=account, store_name=f'فروشگاه بار {account.id}-{i}',
+                status='completed' if completed else 'processing', store_type=rng.choice(['supermarket', 'clothing']),
+                analysis_data={'city': rng.choice(['تهران', 'اصفهان', 'شیراز'])},
+                results=_report(rng, i) if completed else None,
+            )
+            analysis.created_at = analysis.updated_at = now - timedelta(minutes=rng.randint(1, 60 * 24 * 30))
+            rows.append(analysis)
+
+    order_rows, payment_rows = [], []
+    for account in accounts:
+        for i in range(orders):
+            number = f'{ORDER_PREFIX}{seed}-{account.id}-{i}'
+            amount = Decimal(rng.choice([50000, 150000, 500000]))
+            order_rows.append(Order(order_number=number, user=account, status='pending', original_amount=amount,
+                                    base_amount=amount, final_amount=amount, payment_method='online'))
+            payment_rows.append(Payment(order_id=number, user=account, amount=amount, status='pending',
+                                        authority=f'AUTH-{number}'))
+    Order.objects.bulk_create(order_rows, batch_size=500)
+    Payment.objects.bulk_create(payment_rows, batch_size=500)
+    order_ids = dict(Order.objects.filter(order_number__startswith=ORDER_PREFIX).values_list('order_number', 'id'))
+    for order in order_rows:
+        # callback پی‌پینگ تحلیل سفارش را می‌خواهد؛ بدون آن view یکی می‌سازد
+        rows.append(StoreAnalysis(user=order.user, order_id=order_ids[order.order_number], status='pending',
+                                  store_name=f'سفارش {order.order_number}', analysis_data={}))
+    insert_analyses(rows)
+
+    pages = ['/', '/features/', '/guide/store-layout/', '/store/forms/', '/store/dashboard/']
+    PageView.objects.bulk_create([
+        PageView(page_url=f'https://chidmano.ir{rng.choice(pages)}', page_title='صفحه', ip_address='127.0.0.1',
+                 user=rng.choice(accounts) if rng.random() < 0.3 else None, user_agent='loadtest',
+                 session_id=f'{PREFIX}{rng.randint(0, page_views // 5 + 1)}')
+        for _ in range(page_views)
+    ], batch_size=500)
+    return load_users()
+
+
+def load_users():
+    """LoadUserها از داده seed‌شده موجود (برای اجرای دوباره یا سرور جدا)"""
+    accounts = {u.id: LoadUser(id=u.id, username=u.username)
+                for u in User.objects.filter(username__startswith=PREFIX).order_by('id')}
+    analyses = StoreAnalysis.objects.filter(user_id__in=accounts, order__isnull=True).values_list('id', 'user_id', 'status')
+    for pk, user_id, status in analyses.order_by('id'):
+        target = accounts[user_id].completed_ids if status == 'completed' else accounts[user_id].processing_ids
+        target.append(pk)
+    pending = Order.objects.filter(user_id__in=accounts, order_number__startswith=ORDER_PREFIX, status='pending')
+    for number, user_id in pending.values_list('order_number', 'user_id').order_by('id'):
+        accounts[user_id].order_numbers.append(number)
+    return list(accounts.values())
+
+
+def clear():
+    """حذف همه داده‌های load test (کاربران با cascade؛ بازدیدهای ناشناس جدا)"""
+    PageView.objects.filter(user_agent='loadtest').delete()
+    Order.objects.filter(order_number__startswith=ORDER_PREFIX).delete()
+    Payment.objects.filter(order_id__startswith=ORDER_PREFIX).delete()
+    return User.objects.filter(username__startswith=PREFIX).delete()[0]
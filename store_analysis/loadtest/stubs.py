@@ -0,0 +1,290 @@
+"""
+سرورهای ساختگی محلی برای همه وابستگی‌های خارجی (load test و توسعه آفلاین)
+
+هر سرویس روی پورت جدا با تأخیر، نوسان و نرخ خطای قابل تنظیم پاسخ می‌دهد:
+    liara     chat/completions سازگار با OpenAI (StubLLMHandler)      → LIARA_AI_BASE_URL
+    openai    chat/completions سازگار با OpenAI (موتور premium)       → OPENAI_BASE_URL
+    ollama    /api/chat، /api/generate، /api/tags                       → OLLAMA_HOST
+    payping   /v2/pay و /v2/pay/verify                                  → PAYPING_API_BASE_URL
+    zarinpal  /pg/v4/payment/request.json و verify.json                 → ZARINPAL_API_BASE_URL
+    google    /v3/urlNotifications:publish (Indexing API)               → GOOGLE_INDEXING_API_URL
+    smtp      گفت‌وگوی حداقلی SMTP (بدون TLS/AUTH)                     → EMAIL_HOST / EMAIL_PORT
+"""
+
+import json
+import random
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from store_analysis.management.commands.run_stub_llm_server import StubLLMHandler, StubLLMServer
+
+
+class _SimulatedService:
+    """تأخیر و خطای تصادفی مشترک سرویس‌های ساختگی (همان ویژگی‌های StubLLMHandler)"""
+
+    latency = 0.05
+    jitter = 0.0
+    error_rate = 0.0
+    counter = {'requests': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def _simulate(self):
+        """اعمال تأخیر و ثبت درخواست؛ True یعنی این درخواست باید خطا برگرداند"""
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        with self.lock:
+            self.counter['requests'] += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.counter['errors'] += 1
+        return failed
+
+
+class StubServiceHandler(_SimulatedService, BaseHTTPRequestHandler):
+    """پایه سرویس‌های HTTP ساختگی: (method, path) در routes به نام متد پاسخ‌دهنده نگاشت می‌شود"""
+
+    error_status = 503
+    routes = {}
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        name = self.routes.get((method, urlsplit(self.path).path.rstrip('/')))
+        if name is None:
+            self._reply(404, {'error': f'unknown path {self.path}'})
+            return
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._reply(400, {'error': 'invalid json'})
+            return
+
+        if self._simulate():
+            self._reply(self.error_status, {'error': 'stub failure', 'message': 'stub failure'})
+            return
+        status, data = getattr(self, name)(payload)
+        self._reply(status, data)
+
+    def _reply(self, status, data):
+        encoded = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OllamaStubHandler(StubServiceHandler):
+    """API محلی Ollama (پاسخ غیر stream)"""
+
+    routes = {
+        ('POST', '/api/chat'): 'chat',
+        ('POST', '/api/generate'): 'generate',
+        ('GET', '/api/tags'): 'tags',
+    }
+
+    def chat(self, payload):
+        return 200, {
+            'model': payload.get('model', 'stub'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'message': {'role': 'assistant', 'content': 'تحلیل آزمایشی سرور ساختگی.'},
+            'done': True,
+        }
+
+    def generate(self, payload):
+        return 200, {'model': payload.get('model', 'stub'), 'response': 'تحلیل آزمایشی سرور ساختگی.', 'done': True}
+
+    def tags(self, payload):
+        return 200, {'models': [{'name': 'llama3.2:latest', 'model': 'llama3.2:latest'}]}
+
+
+class PayPingStubHandler(StubServiceHandler):
+    """ایجاد و تأیید پرداخت پی‌پینگ v2 (کد پرداخت 201، verify با refId)"""
+
+    routes = {
+        ('POST', '/v2/pay'): 'create',
+        ('POST', '/v2/pay/verify'): 'verify',
+    }
+    error_status = 500
+
+    def create(self, payload):
+        if not payload.get('amount') or not payload.get('returnUrl'):
+            return 400, {'message': 'amount and returnUrl are required'}
+        return 201, {'code': uuid.uuid4().hex[:12]}
+
+    def verify(self, payload):
+        if not payload.get('refId'):
+            return 400, {'message': 'refId is required'}
+        return 200, {'amount': payload.get('amount'), 'refId': str(payload['refId']), 'cardNumber': '6037****1234'}
+
+
+class ZarinpalStubHandler(StubServiceHandler):
+    """درخواست و تأیید پرداخت زرین‌پال v4 (data.code == 100)"""
+
+    routes = {
+        ('POST', '/pg/v4/payment/request.json'): 'request_payment',
+        ('POST', '/pg/v4/payment/verify.json'): 'verify',
+    }
+
+    def request_payment(self, payload):
+        authority = f"A{uuid.uuid4().int % 10 ** 35:035d}"
+        return 200, {'data': {'code': 100, 'message': 'Success', 'authority': authority, 'fee': 0}, 'errors': []}
+
+    def verify(self, payload):
+        return 200, {
+            'data': {'code': 100, 'message': 'Verified', 'ref_id': random.randint(10 ** 8, 10 ** 9),
+                     'card_pan': '6037****1234'},
+            'errors': [],
+        }
+
+
+class GoogleIndexingStubHandler(StubServiceHandler):
+    """Google Indexing API (urlNotifications:publish)"""
+
+    routes = {('POST', '/v3/urlNotifications:publish'): 'publish'}
+
+    def publish(self, payload):
+        return 200, {'urlNotificationMetadata': {
+            'url': payload.get('url', ''),
+            'latestUpdate': {'url': payload.get('url', ''), 'type': payload.get('type', 'URL_UPDATED'),
+                             'notifyTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+        }}
+
+
+class StubSMTPHandler(_SimulatedService, socketserver.StreamRequestHandler):
+    """گفت‌وگوی حداقلی SMTP؛ تأخیر و خطا (451) روی هر پیام پس از DATA اعمال می‌شود"""
+
+    def handle(self):
+        self._send('220 stub.smtp ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.decode('utf-8', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self._send('250 stub.smtp')
+            elif command == 'DATA':
+                self._send('354 End data with <CR><LF>.<CR><LF>')
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line.rstrip(b'\r\n') == b'.':
+                        break
+                self._send('451 stub failure' if self._simulate() else '250 OK queued')
+            elif command == 'QUIT':
+                self._send('221 Bye')
+                break
+            else:
+                self._send('250 OK')
+
+    def _send(self, reply):
+        self.wfile.write(f'{reply}\r\n'.encode('ascii'))
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+SERVICES = {
+    'liara': StubLLMHandler,
+    'openai': StubLLMHandler,
+    'ollama': OllamaStubHandler,
+    'payping': PayPingStubHandler,
+    'zarinpal': ZarinpalStubHandler,
+    'google': GoogleIndexingStubHandler,
+    'smtp': StubSMTPHandler,
+}
+
+
+class StubCluster:
+    """
+    اجرای همه سرویس‌های ساختگی در threadهای پس‌زمینه
+    overrides: {service: {'latency': ..., 'jitter': ..., 'error_rate': ...}} (ثانیه و نسبت)
+    base_port=0 یعنی پورت آزاد؛ در غیر این صورت سرویس‌ها به ترتیب SERVICES پورت‌های متوالی می‌گیرند.
+    """
+
+    def __init__(self, host='127.0.0.1', base_port=0, latency=0.05, jitter=0.0, error_rate=0.0, overrides=None):
+        self.host = host
+        self.base_port = base_port
+        self.defaults = {'latency': latency, 'jitter': jitter, 'error_rate': error_rate}
+        self.overrides = overrides or {}
+        self.handlers = {}
+        self.servers = {}
+
+    def start(self):
+        for index, (name, base) in enumerate(SERVICES.items()):
+            config = {**self.defaults, **self.overrides.get(name, {})}
+            handler = type(f'{name.title()}StubHandler', (base,), {
+                **config, 'counter': {'requests': 0, 'errors': 0}, 'lock': threading.Lock(),
+            })
+            server_class = StubSMTPServer if name == 'smtp' else StubLLMServer
+            port = self.base_port + index if self.base_port else 0
+            server = server_class((self.host, port), handler)
+            threading.Thread(target=server.serve_forever, name=f'stub-{name}', daemon=True).start()
+            self.handlers[name] = handler
+            self.servers[name] = server
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+        self.servers = {}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def port(self, name):
+        return self.servers[name].server_address[1]
+
+    def url(self, name):
+        scheme = 'smtp' if name == 'smtp' else 'http'
+        return f'{scheme}://{self.host}:{self.port(name)}'
+
+    def settings_overrides(self):
+        """تنظیمات Django برای اجرای in-process (override_settings)"""
+        return {
+            'LIARA_AI_BASE_URL': f"{self.url('liara')}/api",
+            'OPENAI_BASE_URL': f"{self.url('openai')}/v1",
+            'PAYPING_API_BASE_URL': self.url('payping'),
+            'PAYPING_MOCK_MODE': False,
+            'ZARINPAL_API_BASE_URL': self.url('zarinpal'),
+            'GOOGLE_INDEXING_API_URL': f"{self.url('google')}/v3/urlNotifications:publish",
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.port('smtp'),
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+            'LIARA_AI_API_KEY': 'stub',
+            'OPENAI_API_KEY': 'stub',
+        }
+
+    def environment(self):
+        """متغیرهای محیطی معادل برای سرور جدا (gunicorn/runserver) و کتابخانه‌هایی که env می‌خوانند"""
+        env = {
+            name: str(value) for name, value in self.settings_overrides().items()
+            if name not in ('EMAIL_BACKEND', 'EMAIL_USE_SSL', 'EMAIL_HOST_USER', 'EMAIL_HOST_PASSWORD')
+        }
+        env['OLLAMA_HOST'] = self.url('ollama')
+        return env
+
+    def stats(self):
+        return {name: dict(handler.counter) for name, handler in self.handlers.items()}
@@ -0,0 +1,195 @@
+"""
+Management command برای پیشنهاد ایندکس ترکیبی/partial از روی شکل واقعی کوئری‌ها
+استفاده:
+    python manage.py advise_indexes --seed 5000 --explain          # داده مصنوعی + workload مسیرهای پرترافیک
+    python manage.py advise_indexes --url /store/dashboard/ --user admin
+    python manage.py advise_indexes --pg-log /var/log/postgresql/postgresql.log --min-calls 20
+    python manage.py advise_indexes --seed 5000 --write-migration  # ساخت migration از پیشنهادها
+
+منابع شکل کوئری:
+    workload   کوئری‌های مسیرهای پرترافیک (داشبورد، تاریخچه پرداخت، یادآوری بازبینی، چت،
+               ردیابی پلن رایگان، آمار بازدید) با ORM همان کد؛ پیش‌فرض وقتی منبع دیگری نیست
+    --url      درخواست به URLها با test client و ثبت کوئری‌ها (QueryRecorder)
+    --pg-log   لاگ statement پستگرس (log_min_duration_statement=0 یا log_statement=all)
+
+--seed برای هر جدول پرترافیک N ردیف مصنوعی می‌سازد؛ داده‌های seed و ایندکس‌های موقت
+--explain در یک تراکنش ساخته و در پایان rollback می‌شوند. --explain طرح اجرای نمونه هر شکل
+را پیش و پس از ایندکس پیشنهادی چاپ می‌کند (SQLite: EXPLAIN QUERY PLAN، PostgreSQL: EXPLAIN
+و با --analyze زمان واقعی).
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.utils import timezone
+
+from store_analysis.models import (
+    ChatMessage, ChatSession, FreeUsageTracking, PageView, Payment, ReviewReminder, StoreAnalysis,
+)
+from store_analysis.loadtest.seed import insert_analyses
+from store_analysis.services.index_advisor import IndexAdvisor, ShapeCollector, write_migration
+
+
+def _insert_analyses(user, rows):
+    """درج مستقیم تحلیل‌ها (ستون‌های قدیمی خارج از مدل با insert_analyses پر می‌شوند)"""
+    now = timezone.now()
+    statuses = ['completed', 'completed', 'completed', 'pending', 'processing', 'failed']
+    analyses = []
+    for i in range(rows):
+        analysis = StoreAnalysis(user=user, store_name=f'فروشگاه {i}', status=statuses[i % len(statuses)],
+                                 analysis_data={'city': 'تهران'})
+        analysis.created_at = analysis.updated_at = now - timedelta(minutes=i)
+        analyses.append(analysis)
+    insert_analyses(analyses)
+
+
+def _seed(rows):
+    """N ردیف برای هر جدول پرترافیک؛ ردیف‌های کاربر نمونه بخش کوچکی از هر جدول‌اند"""
+    now = timezone.now()
+    User.objects.bulk_create([User(username=f'index_advisor_{i}') for i in range(20)])
+    users = list(User.objects.filter(username__startswith='index_advisor_').order_by('id'))
+    per_user = max(1, rows // len(users))
+    for user in users:
+        _insert_analyses(user, per_user)
+    analyses = list(StoreAnalysis.objects.filter(user__in=users).only('id', 'user_id')[:rows])
+    statuses = ['completed', 'completed', 'pending', 'processing', 'failed', 'refunded']
+
+    Payment.objects.bulk_create([
+        Payment(order_id=f'IA-{uuid.uuid4().hex[:16]}', user=users[i % len(users)], amount=1000,
+                status=statuses[i % len(statuses)], created_at=now - timedelta(minutes=i))
+        for i in range(rows)
+    ], batch_size=500)
+    PageView.objects.bulk_create([
+        PageView(page_url=f'https://chidmano.ir/page/{i % 50}/', page_title='صفحه', ip_address='127.0.0.1',
+                 user_agent='advisor', session_id=f'session-{i % (rows // 3 + 1)}')
+        for i in range(rows)
+    ], batch_size=500)
+    ReviewReminder.objects.bulk_create([
+        ReviewReminder(analysis_id=analyses[i % len(analyses)].id, user_id=analyses[i % len(analyses)].user_id,
+                       analysis_completed_at=now - timedelta(days=60), reminder_date=now + timedelta(days=i % 90 - 10),
+                       status='sent' if i % 10 else 'pending', email_sent=bool(i % 10))
+        for i in range(rows)
+    ], batch_size=500)
+    sessions = ChatSession.objects.bulk_create([
+        ChatSession(user_id=analysis.user_id, store_analysis_id=analysis.id)
+        for analysis in analyses[:max(1, rows // 20)]
+    ])
+    ChatMessage.objects.bulk_create([
+        ChatMessage(session=sessions[i % len(sessions)], role='user' if i % 2 else 'assistant', content='سوال')
+        for i in range(rows)
+    ], batch_size=500)
+    FreeUsageTracking.objects.bulk_create([
+        FreeUsageTracking(username=f'free_{i}', email=f'free_{i}@example.com', phone=f'0912{i:07d}',
+                          ip_address=uuid.uuid4().hex)
+        for i in range(rows)
+    ], batch_size=500)
+
+
+def _run_workload():
+    """کوئری‌های مسیرهای پرترافیک با همان فیلترهای کد برنامه"""
+    now = timezone.now()
+    user = User.objects.filter(username__startswith='index_advisor_').first() or User.objects.first()
+    if user is None:
+        return
+    list(StoreAnalysis.objects.filter(user=user, status='completed').order_by('-created_at')[:10])
+    list(StoreAnalysis.objects.filter(user=user).order_by('-created_at')[:10])
+    Payment.objects.filter(user=user, status='completed').count()
+    list(Payment.objects.filter(user=user, status='completed').order_by('-created_at')[:20])
+    Payment.objects.filter(order_id='IA-missing').first()
+    PageView.objects.filter(
+        session_id='session-1', created_at__gte=now - timedelta(days=1), created_at__lt=now
+    ).exists()
+    list(ReviewReminder.objects.filter(
+        status__in=['pending', 'scheduled'], email_sent=False, reminder_date__lte=now
+    ).order_by()[:50])
+    session = ChatSession.objects.filter(user=user).order_by().first()
+    if session is not None:
+        list(session.messages.all())
+        session.get_last_message()
+    FreeUsageTracking.objects.filter(
+        Q(username='free_1') | Q(email='free_1@example.com') | Q(phone='09120000001') | Q(ip_address='x')
+    ).first()
+    FreeUsageTracking.objects.filter(email__iexact='free_1@example.com').first()
+
+
+class Command(BaseCommand):
+    help = 'Propose composite/partial indexes from captured query shapes, with EXPLAIN before/after and migration output'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='ردیف مصنوعی برای هر جدول پرترافیک (rollback می‌شود)')
+        parser.add_argument('--url', action='append', default=[], help='URL برای اجرای پروفایل (قابل تکرار)')
+        parser.add_argument('--user', help='نام کاربری برای login در اجرای --url')
+        parser.add_argument('--pg-log', help='فایل لاگ statement پستگرس')
+        parser.add_argument('--workload', action='store_true', help='اجرای workload مسیرهای پرترافیک همراه منابع دیگر')
+        parser.add_argument('--min-calls', type=int, default=1, help='حداقل تعداد اجرای یک شکل کوئری')
+        parser.add_argument('--explain', action='store_true', help='چاپ طرح اجرا پیش و پس از ایندکس‌های پیشنهادی')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE در PostgreSQL')
+        parser.add_argument('--write-migration', action='store_true', help='ساخت migration با AddIndex برای پیشنهادها')
+        parser.add_argument('--name', default='index_advisor', help='نام migration')
+
+    def handle(self, *args, **options):
+        collector = ShapeCollector()
+        if options['pg_log']:
+            with open(options['pg_log'], encoding='utf-8', errors='replace') as handle:
+                count = collector.read_postgres_log(handle)
+            self.stdout.write(f"pg-log: {count} statements")
+
+        with transaction.atomic():
+            if options['seed']:
+                _seed(options['seed'])
+                self.stdout.write(f"seeded {options['seed']} rows per hot table ({connection.vendor})")
+
+            if options['workload'] or not (options['url'] or options['pg_log']):
+                with collector.record('index_advisor:workload'):
+                    _run_workload()
+
+            if options['url']:
+                client = Client()
+                if options['user']:
+                    client.force_login(User.objects.get(username=options['user']))
+                for url in options['url']:
+                    with collector.record(f'index_advisor:{url}'):
+                        status = client.get(url).status_code
+                    self.stdout.write(f"profiled {url} -> {status}")
+
+            advisor = IndexAdvisor(collector)
+            proposals = advisor.proposals(min_calls=options['min_calls'])
+            self._report(advisor, proposals)
+
+            if options['explain'] and proposals:
+                self.stdout.write(self.style.MIGRATE_HEADING('\nEXPLAIN before/after'))
+                for row in advisor.explain_report(proposals, analyze=options['analyze']):
+                    self.stdout.write(f"\n[{row['index']}] {row['sql'][:200]}")
+                    self.stdout.write(f"  before: {row['before'].replace(chr(10), chr(10) + '          ')}")
+                    self.stdout.write(f"  after:  {row['after'].replace(chr(10), chr(10) + '          ')}")
+
+            transaction.set_rollback(True)
+
+        if options['write_migration'] and proposals:
+            path = write_migration(proposals, name=options['name'])
+            self.stdout.write(self.style.SUCCESS(f"migration written: {path}"))
+            self.stdout.write("ایندکس‌ها را به Meta.indexes مدل‌ها هم اضافه کنید تا makemigrations آن‌ها را حذف نکند")
+
+    def _report(self, advisor, proposals):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"query shapes: {len(advisor.collector.shapes)}"))
+        if not proposals:
+            self.stdout.write(self.style.SUCCESS('همه شکل‌های کوئری با ایندکس‌های موجود پوشش داده می‌شوند'))
+        for proposal in proposals:
+            self.stdout.write(f"  + {proposal.describe()}")
+
+        redundant = advisor.redundant_indexes()
+        if redundant:
+            self.stdout.write(self.style.MIGRATE_HEADING('redundant indexes (duplicate or prefix of another index)'))
+            for table, name, covered_by in redundant:
+                self.stdout.write(f"  - {table}.{name}  covered by {covered_by}")
+
+        wrapped = advisor.wrapped_predicates()
+        if wrapped:
+            self.stdout.write(self.style.MIGRATE_HEADING('predicates wrapping a column in a function (plain index unusable)'))
+            for table, column, calls in wrapped:
+                self.stdout.write(f"  ! {table}.{column}  calls={calls}")
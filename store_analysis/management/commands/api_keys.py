@@ -0,0 +1,72 @@
+"""
+Management command برای صدور، فهرست و ابطال کلیدهای API
+استفاده:
+    python manage.py api_keys create --user alice --name "poller" --scope analysis:status --scope analysis:read
+    python manage.py api_keys create --user alice --name "ci" --scope analysis:create --days 90
+    python manage.py api_keys list --user alice
+    python manage.py api_keys revoke <prefix>
+
+کلید خام فقط هنگام صدور چاپ می‌شود و در دیتابیس فقط HMAC آن ذخیره است.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store_analysis.models import ApiKey
+from store_analysis.services.api_keys import SCOPES, ApiKeyService
+
+
+class Command(BaseCommand):
+    help = 'Issue, list and revoke scoped API keys'
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest='action', required=True)
+
+        create = sub.add_parser('create', help='صدور کلید جدید')
+        create.add_argument('--user', required=True, help='نام کاربری صاحب کلید')
+        create.add_argument('--name', required=True, help='نام کلید (مثلاً نام سرویس)')
+        create.add_argument('--scope', action='append', choices=sorted(SCOPES), required=True,
+                            help='دامنه دسترسی (قابل تکرار)')
+        create.add_argument('--days', type=int, default=None, help='اعتبار کلید به روز (پیش‌فرض: بدون انقضا)')
+
+        listing = sub.add_parser('list', help='فهرست کلیدها')
+        listing.add_argument('--user', default=None, help='فقط کلیدهای این کاربر')
+
+        revoke = sub.add_parser('revoke', help='ابطال کلید')
+        revoke.add_argument('prefix', help='پیشوند کلید')
+
+    def handle(self, *args, **options):
+        getattr(self, f"_{options['action']}")(options)
+
+    def _create(self, options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"کاربر {options['user']} یافت نشد")
+        expires_at = timezone.now() + timedelta(days=options['days']) if options['days'] else None
+        api_key, raw = ApiKeyService.create(user, options['name'], options['scope'], expires_at=expires_at)
+        self.stdout.write(self.style.SUCCESS(f"✅ API key {api_key.prefix} created for {user.username}"))
+        self.stdout.write(f"scopes: {', '.join(api_key.scopes)}")
+        self.stdout.write(f"key (shown once): {raw}")
+
+    def _list(self, options):
+        keys = ApiKey.objects.select_related('user').order_by('-created_at')
+        if options['user']:
+            keys = keys.filter(user__username=options['user'])
+        for api_key in keys:
+            state = 'revoked' if api_key.revoked_at else ('active' if api_key.is_usable else 'expired')
+            self.stdout.write(
+                f"{api_key.prefix}  {api_key.user.username:<20} {api_key.name:<20} {state:<8} "
+                f"{','.join(api_key.scopes)}  last used: {api_key.last_used_at or '-'}"
+            )
+
+    def _revoke(self, options):
+        try:
+            api_key = ApiKey.objects.get(prefix=options['prefix'])
+        except ApiKey.DoesNotExist:
+            raise CommandError(f"کلید {options['prefix']} یافت نشد")
+        ApiKeyService.revoke(api_key)
+        self.stdout.write(self.style.SUCCESS(f"✅ API key {api_key.prefix} revoked"))
@@ -0,0 +1,150 @@
+"""
+Management command برای سنجش زمان و حافظه لیست‌ها با ستون‌های JSON حجیم StoreAnalysis
+استفاده:
+    python manage.py benchmark_analysis_lists --rows 200 --results-kb 400 --repeat 5
+
+کاربر و --rows تحلیل با results حدود --results-kb کیلوبایت (متن فارسی بخش‌های گزارش) و
+فهرست فایل‌ها در یک تراکنش ساخته و در پایان rollback می‌شوند. ردیف‌ها مثل ردیف‌های قدیمی
+فشرده‌نشده ذخیره می‌شوند. برای هر سناریو زمان میانگین، اوج حافظه Python (tracemalloc) و
+تعداد کوئری گزارش می‌شود:
+    analysis_list   صفحه لیست تحلیل‌ها (progress + has_results برای همه ردیف‌ها)
+    admin_list      changelist ادمین (موقعیت از analysis_data، ۲۵ ردیف)
+    detail          یک تحلیل با results کامل
+هر سناریو با eager (بارگذاری همه ستون‌ها، رفتار قبلی) و deferred (manager فعلی) اجرا می‌شود؛
+detail پس از compress_analysis_payloads دوباره سنجیده می‌شود و حجم ذخیره‌شده results
+پیش و پس از فشرده‌سازی گزارش می‌شود.
+"""
+
+import time
+import tracemalloc
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.fields.json import KT
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from store_analysis.admin import StoreAnalysisAdmin
+from store_analysis.models import StoreAnalysis
+
+SECTION = 'تحلیل چیدمان قفسه‌ها و مسیر حرکت مشتری با پیشنهادهای اجرایی برای افزایش فروش. '
+
+
+def _results_document(kb):
+    sections = {}
+    size = i = 0
+    while size < kb * 1024:
+        text = f"{SECTION * 40} ({i})"
+        sections[f'section_{i}'] = {'title': f'بخش {i}', 'content': text, 'scores': [i, i * 2, i * 3]}
+        size += len(text.encode('utf-8'))
+        i += 1
+    return {'premium_report': sections, 'analysis_text': SECTION * 20}
+
+
+def _seed(user, rows, results_kb):
+    """درج مستقیم ردیف‌ها؛ ستون‌های NOT NULL قدیمی خارج از مدل (contact_*) با '' پر می‌شوند"""
+    now = timezone.now()
+    results = _results_document(results_kb)
+    files = {f'photo_{i}': {'name': f'photo_{i}.jpg', 'path': f'uploads/2025/photo_{i}.jpg', 'size': 2400000} for i in range(8)}
+    model_columns = {field.column: field for field in StoreAnalysis._meta.concrete_fields if not field.primary_key}
+    with connection.cursor() as cursor:
+        description = connection.introspection.get_table_description(cursor, StoreAnalysis._meta.db_table)
+    extra = [column.name for column in description if column.name not in model_columns and column.name != 'id'
+             and not column.null_ok]
+    columns = list(model_columns) + extra
+    table = connection.ops.quote_name(StoreAnalysis._meta.db_table)
+    sql = f"INSERT INTO {table} ({', '.join(connection.ops.quote_name(c) for c in columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    values = {
+        'user_id': user.id, 'status': 'completed', 'package_type': 'professional', 'created_at': now, 'updated_at': now,
+        'analysis_data': {'city': 'تهران', 'store_type': 'supermarket', 'uploaded_files': files},
+        'results': results, 'store_images': [f['path'] for f in files.values()], 'analysis_files': list(files.values()),
+    }
+    params = []
+    for i in range(rows):
+        row = []
+        for column in columns:
+            field = model_columns.get(column)
+            if field is None:
+                row.append('')
+                continue
+            value = values.get(column, f'فروشگاه {i}' if column == 'store_name' else field.get_default())
+            row.append(field.get_db_prep_save(value, connection))
+        params.append(row)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _analysis_list(queryset):
+    items = list(queryset.order_by('-created_at'))
+    for analysis in items:
+        analysis.progress = 100 if analysis.status == 'completed' else 25
+        analysis.has_preliminary_temp = analysis.has_results or bool(analysis.preliminary_analysis)
+    return len(items)
+
+
+def _admin_list(queryset):
+    admin = StoreAnalysisAdmin(StoreAnalysis, None)
+    return sum(admin.get_location(analysis) != '-' for analysis in queryset.order_by('-created_at')[:25])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark list/dashboard query time and memory with heavy StoreAnalysis JSON: eager vs deferred and compressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200)
+        parser.add_argument('--results-kb', type=int, default=400, help='حجم تقریبی results هر تحلیل')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _measure(self, name, func, repeat):
+        timings, peak = [], 0
+        for _ in range(repeat):
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        self.stdout.write(
+            f"{name:<24} mean={sum(timings) / len(timings) * 1000:>9.2f}ms  "
+            f"peak_mem={peak / 1024 / 1024:>8.2f}MB  queries={len(queries)}"
+        )
+
+    def _stored_kb(self, user):
+        table = connection.ops.quote_name(StoreAnalysis._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT SUM(LENGTH(results)) FROM {table} WHERE user_id = %s", [user.id])
+            return (cursor.fetchone()[0] or 0) / 1024
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        with transaction.atomic():
+            user = User.objects.create_user('benchmark_analysis_lists')
+            with override_settings(ANALYSIS_JSON_COMPRESS_MIN_BYTES=0):
+                _seed(user, options['rows'], options['results_kb'])
+            rows = StoreAnalysis._base_manager.filter(user=user)
+            deferred = StoreAnalysis.objects.filter(user=user)
+            first_id = rows.order_by('id').values_list('id', flat=True).first()
+            self.stdout.write(
+                f"rows={options['rows']} results≈{options['results_kb']}KB "
+                f"stored_results={self._stored_kb(user) / 1024:.1f}MB"
+            )
+
+            self._measure('analysis_list eager', lambda: _analysis_list(rows.all()), repeat)
+            self._measure('analysis_list deferred', lambda: _analysis_list(deferred.with_result_flags()), repeat)
+            self._measure('admin_list eager', lambda: _admin_list(rows.all()), repeat)
+            self._measure('admin_list deferred', lambda: _admin_list(deferred.annotate(
+                **{f'location_{key}': KT(f'analysis_data__{key}') for key in StoreAnalysisAdmin.LOCATION_KEYS}
+            )), repeat)
+            self._measure('detail', lambda: len(deferred.get(pk=first_id).load_payload().results), repeat)
+
+            before = self._stored_kb(user)
+            call_command('compress_analysis_payloads', stdout=StringIO())
+            self._measure('detail compressed', lambda: len(deferred.get(pk=first_id).load_payload().results), repeat)
+            self.stdout.write(f"stored results: {before / 1024:.1f}MB -> {self._stored_kb(user) / 1024:.1f}MB")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,67 @@
+"""
+Management command برای سنجش هزینه احراز هویت هر درخواست API
+استفاده:
+    python manage.py benchmark_api_auth --requests 200
+
+کاربر و کلید موقت در یک تراکنش ساخته و در پایان rollback می‌شوند. برای هر روش زمان
+authenticate() کلاس DRF مربوط (بدون اجرای view) سنجیده می‌شود:
+    basic          BasicAuthentication (hasher پیش‌فرض رمز عبور، روش قبلی)
+    api-key-cold   ApiKeyAuthentication با cache خالی (HMAC + یک کوئری)
+    api-key-warm   ApiKeyAuthentication با کلید بررسی‌شده در cache (polling معمول)
+"""
+
+import base64
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store_analysis.api.authentication import ApiKeyAuthentication
+from store_analysis.services.api_keys import ApiKeyService
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-request API authentication overhead: Basic (password hasher) vs HMAC API keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='تعداد درخواست در هر روش')
+        parser.add_argument('--basic-requests', type=int, default=20, help='تعداد درخواست روش basic (کند)')
+
+    def _measure(self, name, authenticator, header, count, before=None):
+        factory = APIRequestFactory()
+        timings = []
+        for _ in range(count):
+            if before:
+                before()
+            request = Request(factory.get('/api/v1/analyses/1/status/', HTTP_AUTHORIZATION=header))
+            start = time.perf_counter()
+            user, _ = authenticator.authenticate(request)
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"{name:<13} {count:>5} req  mean={sum(timings) / count * 1000:>8.3f}ms  "
+            f"p50={_percentile(timings, 50) * 1000:>8.3f}ms  p95={_percentile(timings, 95) * 1000:>8.3f}ms"
+        )
+
+    def handle(self, *args, **options):
+        count = max(1, options['requests'])
+        with transaction.atomic():
+            user = User.objects.create_user('benchmark_api_auth', password='benchmark-pass-1234')
+            _, raw = ApiKeyService.create(user, 'benchmark', ['analysis:status'])
+            basic = 'Basic ' + base64.b64encode(b'benchmark_api_auth:benchmark-pass-1234').decode()
+
+            self._measure('basic', BasicAuthentication(), basic, max(1, options['basic_requests']))
+            self._measure('api-key-cold', ApiKeyAuthentication(), f'Api-Key {raw}', count, before=ApiKeyService.clear)
+            ApiKeyService.clear()
+            self._measure('api-key-warm', ApiKeyAuthentication(), f'Api-Key {raw}', count)
+
+            ApiKeyService.clear()
+            transaction.set_rollback(True)
@@ -0,0 +1,93 @@
+"""
+Management command برای سنجش توان درخواست‌های هم‌زمان مسیر چت در حالت sync و async
+استفاده:
+    python manage.py benchmark_async_views --requests 40 --concurrency 20 --latency-ms 500
+
+یک سرور LLM ساختگی (run_stub_llm_server) با تأخیر ثابت روی پورت آزاد اجرا می‌شود و
+فراخوانی Liara AI سرویس مشاور سه بار سنجیده می‌شود:
+    sync-worker   یک worker sync gunicorn (درخواست‌ها پشت سر هم)
+    sync-threads  worker sync با --threads برابر concurrency
+    async         یک worker ASGI (httpx.AsyncClient، هم‌زمانی محدود به concurrency)
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store_analysis.ai_services.ai_consultant_service import AIConsultantService
+from store_analysis.management.commands.run_stub_llm_server import StubLLMHandler, StubLLMServer
+
+MESSAGES = [
+    {'role': 'system', 'content': 'شما یک مشاور چیدمان فروشگاه هستید.'},
+    {'role': 'user', 'content': 'چطور فروش قفسه ورودی را بیشتر کنم؟'},
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent chat throughput: sync worker vs async (ASGI) path against a slow LLM stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40, help='تعداد کل درخواست‌ها در هر حالت')
+        parser.add_argument('--concurrency', type=int, default=20, help='تعداد درخواست‌های هم‌زمان')
+        parser.add_argument('--latency-ms', type=int, default=500, help='تأخیر پاسخ سرور ساختگی')
+        parser.add_argument('--skip-serial', action='store_true', help='اجرا نکردن حالت sync-worker (کند)')
+
+    def _service(self, url):
+        service = AIConsultantService()
+        service.liara_api_key = 'stub'
+        service.api_url = url
+        return service
+
+    def _report(self, mode, total, ok, elapsed):
+        self.stdout.write(
+            f"{mode:<13} {total:>5} req  {ok:>5} ok  {elapsed:>7.2f}s  {total / elapsed:>7.1f} req/s"
+        )
+
+    def handle(self, *args, **options):
+        handler = type('BenchmarkStubHandler', (StubLLMHandler,), {
+            'latency': options['latency_ms'] / 1000.0,
+            'counter': {'requests': 0, 'errors': 0},
+        })
+        server = StubLLMServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/stub/v1/chat/completions"
+
+        total = options['requests']
+        concurrency = max(1, options['concurrency'])
+        service = self._service(url)
+        self.stdout.write(
+            f"stub latency={options['latency_ms']}ms requests={total} concurrency={concurrency}"
+        )
+
+        try:
+            if not options['skip_serial']:
+                start = time.perf_counter()
+                ok = sum(1 for _ in range(total) if service._call_liara_ai(MESSAGES))
+                self._report('sync-worker', total, ok, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                ok = sum(1 for r in pool.map(lambda _: service._call_liara_ai(MESSAGES), range(total)) if r)
+            self._report('sync-threads', total, ok, time.perf_counter() - start)
+
+            async def run_async():
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one():
+                    async with semaphore:
+                        return await service._acall_liara_ai(MESSAGES)
+
+                try:
+                    return await asyncio.gather(*(one() for _ in range(total)))
+                finally:
+                    await service._async_client.aclose()
+
+            start = time.perf_counter()
+            results = asyncio.run(run_async())
+            self._report('async', total, sum(1 for r in results if r), time.perf_counter() - start)
+        finally:
+            server.shutdown()
+            server.server_close()
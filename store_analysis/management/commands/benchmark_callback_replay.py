@@ -0,0 +1,80 @@
+"""
+Management command برای سنجش هزینه callbackهای تکراری پرداخت
+استفاده:
+    python manage.py benchmark_callback_replay --replays 200
+
+یک پرداخت موقت ساخته می‌شود، callback اول و سپس replayهای آن از PaymentCallbackProcessor
+عبور می‌کنند و تعداد کوئری‌ها و فراخوانی verify درگاه گزارش می‌شود. verify درگاه با
+یک تابع محلی جایگزین می‌شود تا درخواست شبکه‌ای ارسال نشود. داده‌های موقت حذف می‌شوند.
+"""
+
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store_analysis.models import Order, Payment, PaymentCallbackReceipt
+from store_analysis.services.payment_callback import PaymentCallbackProcessor
+
+
+class Command(BaseCommand):
+    help = 'Benchmark duplicate payment callbacks: queries and gateway verifications per replay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replays', type=int, default=100, help='تعداد callbackهای تکراری')
+
+    def handle(self, *args, **options):
+        from store_analysis.payment_views import _apply_payment_callback
+
+        suffix = uuid.uuid4().hex[:10]
+        user = User.objects.create_user(username=f'bench_cb_{suffix}', password=uuid.uuid4().hex)
+        payment = Payment.objects.create(
+            order_id=f'BENCH-{suffix}',
+            payment_id=f'PAY-{suffix}',
+            user=user,
+            amount=Decimal('10000'),
+        )
+        callback_data = {'payment_id': payment.payment_id, 'transaction_id': f'TX-{suffix}', 'status': 'failed'}
+        verifications = []
+
+        def verify():
+            verifications.append(1)
+            return {'success': True, 'status': 'failed', 'transaction_id': callback_data['transaction_id']}
+
+        def callback():
+            return PaymentCallbackProcessor.process(
+                gateway='ping_payment',
+                reference=payment.payment_id,
+                status=callback_data['status'],
+                payment_lookup={'payment_id': payment.payment_id},
+                verify=verify,
+                apply=lambda locked, result: _apply_payment_callback(locked, callback_data, result),
+            )
+
+        try:
+            with CaptureQueriesContext(connection) as first:
+                callback()
+
+            replays = options['replays']
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as replayed:
+                for _ in range(replays):
+                    response, duplicate = callback()
+                    assert duplicate
+            elapsed = time.perf_counter() - start
+        finally:
+            PaymentCallbackReceipt.objects.filter(payment=payment).delete()
+            Order.objects.filter(payment=payment).delete()
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS(f'💳 Payment callback replay benchmark ({replays} replays)'))
+        self.stdout.write(f'   first callback:   {len(first)} queries, 1 gateway verification')
+        self.stdout.write(
+            f'   each replay:      {len(replayed) / replays:.1f} queries, '
+            f'{len(verifications) - 1} gateway verifications in total'
+        )
+        self.stdout.write(f'   replay latency:   {elapsed * 1000 / replays:.2f} ms')
@@ -0,0 +1,91 @@
+"""
+Management command برای سنجش توان ارسال ایمیل (اتصال جداگانه در برابر اتصال مشترک)
+استفاده:
+    python manage.py benchmark_email_dispatch --count 500
+    python -m aiosmtpd -n -l 127.0.0.1:8025 &
+    python manage.py benchmark_email_dispatch --smtp-host 127.0.0.1 --smtp-port 8025
+"""
+
+import time
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+
+from store_analysis.utils.notification import NotificationService
+
+
+LOCMEM_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark email throughput: one connection per message vs pooled bulk dispatch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='تعداد پیام‌ها (پیش‌فرض: 200)')
+        parser.add_argument('--chunk-size', type=int, default=50, help='اندازه هر دسته در ارسال گروهی')
+        parser.add_argument(
+            '--smtp-host',
+            default='',
+            help='میزبان SMTP محلی (مثلاً aiosmtpd)؛ اگر خالی باشد از locmem استفاده می‌شود'
+        )
+        parser.add_argument('--smtp-port', type=int, default=8025)
+
+    def _connection(self, options):
+        if options['smtp_host']:
+            return get_connection(
+                SMTP_BACKEND,
+                host=options['smtp_host'],
+                port=options['smtp_port'],
+                username='',
+                password='',
+                use_tls=False,
+                fail_silently=False,
+            )
+        return get_connection(LOCMEM_BACKEND)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        backend = f"smtp://{options['smtp_host']}:{options['smtp_port']}" if options['smtp_host'] else 'locmem'
+
+        notifications = [
+            {
+                'key': i,
+                'to_email': f'bench{i}@example.com',
+                'subject': f'Benchmark {i}',
+                'message': 'benchmark body ' * 20,
+            }
+            for i in range(count)
+        ]
+
+        self.stdout.write(self.style.SUCCESS(f'📧 Email dispatch benchmark ({count} messages, backend={backend})'))
+
+        # حالت قدیمی: یک اتصال جدید برای هر پیام (مثل send_mail در NotificationService)
+        start = time.perf_counter()
+        for item in notifications:
+            send_mail(
+                subject=item['subject'],
+                message=item['message'],
+                from_email='bench@example.com',
+                recipient_list=[item['to_email']],
+                connection=self._connection(options),
+            )
+        per_message = time.perf_counter() - start
+
+        # حالت جدید: یک اتصال مشترک و ارسال دسته‌ای
+        start = time.perf_counter()
+        stats = NotificationService.send_bulk_email_notifications(
+            notifications,
+            chunk_size=options['chunk_size'],
+            throttle_seconds=0,
+            connection=self._connection(options),
+        )
+        pooled = time.perf_counter() - start
+
+        self.stdout.write(f'   per-message connection: {per_message:.3f}s ({count / per_message:.1f} msg/s)')
+        self.stdout.write(
+            f"   pooled bulk dispatch:   {pooled:.3f}s ({count / pooled:.1f} msg/s), "
+            f"sent={stats['sent']} failed={stats['failed']}"
+        )
+        if pooled > 0:
+            self.stdout.write(self.style.SUCCESS(f'   speedup: {per_message / pooled:.2f}x'))
@@ -0,0 +1,124 @@
+"""
+Management command برای سنجش تأخیر درخواست زیر لاگ سنگین
+استفاده:
+    python manage.py benchmark_logging --requests 2000 --threads 8 --write-latency 0.2
+
+هر «درخواست» همان الگوی لاگ مسیرهای پرتکرار را تولید می‌کند: یک خط فعالیت کاربر
+(log_user_activity)، بدنه callback پرداخت و پاسخ درگاه/AI با حجم --payload-chars.
+خروجی در یک stream ساختگی نوشته می‌شود که هر write آن --write-latency میلی‌ثانیه طول
+می‌کشد (stdout مسدودشده زیر بار). برای هر حالت میانگین و p95 زمان درخواست، زمان کل و
+حجم نوشته‌شده گزارش می‌شود:
+    sync            StreamHandler معمولی با f-string (پیکربندی قبلی production)
+    async           AsyncQueueHandler + JsonFormatter با lazy formatting و سقف طول payload
+    async-sampled   مثل async با SamplingFilter روی خط فعالیت (LOG_SAMPLING_RULES)
+"""
+
+import io
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chidmano.logging_pipeline import AsyncQueueHandler, JsonFormatter, SamplingFilter
+
+
+class SlowStream(io.TextIOBase):
+    """stream با تأخیر ثابت برای هر write و شمارش حجم نوشته‌شده"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.chars = 0
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            if self.latency:
+                time.sleep(self.latency)
+            self.chars += len(text)
+            self.lines += text.count('\n')
+        return len(text)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark request latency under log-heavy flows: sync StreamHandler vs async queue pipeline with sampling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--write-latency', type=float, default=0.2, help='تأخیر هر write روی stdout (میلی‌ثانیه)')
+        parser.add_argument('--payload-chars', type=int, default=20000, help='حجم بدنه callback و پاسخ AI')
+
+    def _flow(self, activity, payments, eager, payload, i):
+        start = time.perf_counter()
+        if eager:
+            activity.info(f"User activity: api_status by user {i} on /api/v1/analyses/{i}/status/")
+            payments.info(f"Payment callback received: {payload}")
+            payments.info(f"PayPing verification response: 200 - {payload['raw']}")
+        else:
+            activity.info("User activity: %s by user %s on %s", 'api_status', i, f"/api/v1/analyses/{i}/status/")
+            payments.info("Payment callback received: %s", payload)
+            payments.info("PayPing verification response: %s - %s", 200, payload['raw'])
+        return time.perf_counter() - start
+
+    def _measure(self, mode, handler, stream, options, eager=False):
+        loggers = [logging.getLogger(f'benchmark_logging.{name}') for name in ('activity', 'payments')]
+        for logger in loggers:
+            logger.handlers = [handler]
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        payload = {
+            'payment_id': 'pay_123', 'status': 'paid', 'amount': 2500000,
+            'raw': 'x' * options['payload_chars'],
+        }
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            timings = list(pool.map(lambda i: self._flow(*loggers, eager, payload, i), range(options['requests'])))
+        request_seconds = time.perf_counter() - started
+        handler.flush()
+        total = time.perf_counter() - started
+        handler.close()
+        for logger in loggers:
+            logger.handlers = []
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{mode:<14} mean={statistics.mean(timings) * 1000:>7.3f}ms  p95={p95 * 1000:>7.3f}ms  "
+            f"requests_done={request_seconds:>6.2f}s  drained={total:>6.2f}s  "
+            f"lines={stream.lines:>6}  written={stream.chars / 1024 / 1024:>6.1f}MB"
+        )
+
+    def handle(self, *args, **options):
+        latency = options['write_latency'] / 1000
+        self.stdout.write(
+            f"requests={options['requests']} threads={options['threads']} "
+            f"write_latency={options['write_latency']}ms payload={options['payload_chars']} chars"
+        )
+
+        stream = SlowStream(latency)
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('{asctime} {levelname} {module} {process:d} {thread:d} {message}', style='{'))
+        self._measure('sync', handler, stream, options, eager=True)
+
+        queue_size = getattr(settings, 'LOG_QUEUE_SIZE', 10000)
+        pipeline = {
+            'queue_size': max(queue_size, options['requests'] * 3),
+            'max_message_chars': getattr(settings, 'LOG_MAX_MESSAGE_CHARS', 4000),
+            'max_field_chars': getattr(settings, 'LOG_MAX_FIELD_CHARS', 1000),
+        }
+        stream = SlowStream(latency)
+        handler = AsyncQueueHandler(stream, **pipeline)
+        handler.setFormatter(JsonFormatter())
+        self._measure('async', handler, stream, options)
+
+        rules = getattr(settings, 'LOG_SAMPLING_RULES', {}).get('store_analysis.activity') or {'sample': 0.1}
+        stream = SlowStream(latency)
+        handler = AsyncQueueHandler(stream, **pipeline)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(SamplingFilter({'benchmark_logging.activity': rules}))
+        self._measure('async-sampled', handler, stream, options)
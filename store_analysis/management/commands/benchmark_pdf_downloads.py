@@ -0,0 +1,148 @@
+"""
+Management command برای سنجش تأخیر و حافظه دانلودهای هم‌زمان PDF
+استفاده:
+    python manage.py benchmark_pdf_downloads --downloads 20 --concurrency 8 --sections 10
+
+برای هر دانلود یک تحلیل ساختگی (ذخیره‌نشده) با گزارش premium ساخته می‌شود و دو حالت
+سنجیده می‌شود:
+    pool        تولید در PdfRenderPool و نوشتن در فایل (مسیر فعلی view)
+    in-process  تولید داخل همین پروسس در BytesIO (مسیر قبلی view)
+برای هر حالت p50/p95 تأخیر و بیشینه رشد RSS پروسس وب (و مجموع RSS پروسس‌های pool)
+گزارش می‌شود. حالت pool اول اجرا می‌شود چون حافظه آزادشده به سیستم‌عامل برنمی‌گردد.
+"""
+
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from chidmano.worker_tuning import MB, PSUTIL_AVAILABLE, process_rss_bytes
+from store_analysis.models import StoreAnalysis
+from store_analysis.services.pdf_renderer import PdfRenderPool
+
+SECTION_KEYS = (
+    'technical_analysis', 'design_analysis', 'sales_analysis', 'behavior_analysis',
+    'competitive_analysis', 'action_plan',
+)
+
+
+def synthetic_analysis(pk, sections):
+    """تحلیل ذخیره‌نشده با گزارش premium ساختگی (هر بخش sections بند)"""
+    paragraph = 'چیدمان قفسه‌های ورودی باید مسیر حرکت مشتری را به سمت محصولات پرفروش هدایت کند. ' * 4
+    report = {
+        'cover_page': {'store_name': f'فروشگاه آزمایشی {pk}', 'layout_score': 72},
+        'executive_summary': {'paragraphs': [paragraph] * 5},
+    }
+    for name in SECTION_KEYS:
+        # متن بندها بین تحلیل‌ها یکتاست (مثل خروجی AI)؛ فقط عنوان‌ها و برچسب‌ها تکرار می‌شوند
+        report[name] = {
+            f'point_{i}': [f'{paragraph} (تحلیل {pk}، بند {i}-{j})' for j in range(3)] for i in range(sections)
+        }
+    return StoreAnalysis(
+        pk=pk, store_name=f'فروشگاه آزمایشی {pk}', status='completed',
+        updated_at=timezone.now(), results={'premium_report': report},
+    )
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class RssSampler(threading.Thread):
+    """نمونه‌برداری دوره‌ای RSS این پروسس و فرزندانش (pool) و نگه‌داری بیشینه"""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.baseline = process_rss_bytes()
+        self.peak_self = self.baseline
+        self.peak_children = 0
+        self._stop_event = threading.Event()
+
+    def _children_rss(self):
+        if not PSUTIL_AVAILABLE:
+            return 0
+        import psutil
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_self = max(self.peak_self, process_rss_bytes())
+            self.peak_children = max(self.peak_children, self._children_rss())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent PDF downloads: isolated process pool vs in-process rendering (p95 latency, peak RSS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--downloads', type=int, default=20, help='تعداد کل دانلودها در هر حالت')
+        parser.add_argument('--concurrency', type=int, default=8, help='تعداد دانلودهای هم‌زمان')
+        parser.add_argument('--sections', type=int, default=10, help='تعداد بند هر بخش گزارش premium ساختگی')
+        parser.add_argument('--skip-inprocess', action='store_true', help='اجرا نکردن حالت in-process')
+
+    def _run(self, mode, render, analyses, concurrency):
+        sampler = RssSampler()
+        sampler.start()
+        latencies = []
+
+        def one(analysis):
+            start = time.perf_counter()
+            ok = render(analysis)
+            latencies.append(time.perf_counter() - start)
+            return ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            ok = sum(1 for r in pool.map(one, analyses) if r)
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        self.stdout.write(
+            f"{mode:<11} {len(analyses):>4} dl {ok:>4} ok  {elapsed:>7.2f}s  "
+            f"p50={_percentile(latencies, 50):.2f}s p95={_percentile(latencies, 95):.2f}s  "
+            f"web_rss_growth={(sampler.peak_self - sampler.baseline) // MB}MB "
+            f"pool_rss_peak={sampler.peak_children // MB}MB"
+        )
+
+    def handle(self, *args, **options):
+        from store_analysis.views import generate_premium_pdf_from_premium_report
+
+        total = options['downloads']
+        concurrency = max(1, options['concurrency'])
+        sections = options['sections']
+        artifact_dir = tempfile.mkdtemp(prefix='pdf_benchmark_')
+        self.stdout.write(f"downloads={total} concurrency={concurrency} sections={sections}")
+
+        try:
+            with override_settings(PDF_ARTIFACT_DIR=artifact_dir):
+                # گرم‌کردن pool (spawn و import views) خارج از زمان‌سنجی
+                PdfRenderPool.render('premium', synthetic_analysis(10 ** 9, 1), wait=300)
+
+                analyses = [synthetic_analysis(10 ** 9 + i + 1, sections) for i in range(total)]
+                self._run('pool', lambda a: PdfRenderPool.render('premium', a, wait=600).ready, analyses, concurrency)
+                PdfRenderPool.shutdown()
+
+                if not options['skip_inprocess']:
+                    self._run(
+                        'in-process',
+                        lambda a: bool(generate_premium_pdf_from_premium_report(a, a.results['premium_report'])),
+                        analyses, concurrency,
+                    )
+        finally:
+            PdfRenderPool.shutdown()
+            shutil.rmtree(artifact_dir, ignore_errors=True)
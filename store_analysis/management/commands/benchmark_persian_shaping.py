@@ -0,0 +1,83 @@
+"""
+Management command برای سنجش هزینه شکل‌دهی متن فارسی در هر گزارش PDF
+استفاده:
+    python manage.py benchmark_persian_shaping --reports 20 --sections 10
+
+رشته‌هایی که تولید PDF premium برای هر تحلیل ساختگی شکل‌دهی می‌کند ضبط می‌شوند و سپس
+هزینه شکل‌دهی همان رشته‌ها دو بار سنجیده می‌شود:
+    uncached  reshape + get_display برای هر فراخوانی (رفتار قبلی)
+    cached    PersianShaper (رشته‌های ثابت گرم‌شده هنگام بوت + LRU)
+"""
+
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from store_analysis import views
+from store_analysis.management.commands.benchmark_pdf_downloads import synthetic_analysis
+from store_analysis.utils.persian_shaping import PersianShaper, _shape_uncached
+
+
+class Command(BaseCommand):
+    help = 'Benchmark Persian text shaping cost per PDF report: uncached vs memoized PersianShaper'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=20, help='تعداد گزارش‌ها')
+        parser.add_argument('--sections', type=int, default=10, help='تعداد بند هر بخش گزارش ساختگی')
+
+    def _record(self, analysis):
+        calls = []
+        original = views.shape_persian
+
+        def recorder(text, bidi=True):
+            calls.append((text, bidi))
+            return original(text, bidi)
+
+        views.shape_persian = recorder
+        try:
+            views.generate_premium_pdf_from_premium_report(
+                analysis, analysis.results['premium_report'], output=BytesIO()
+            )
+        finally:
+            views.shape_persian = original
+        return calls
+
+    def _report(self, mode, per_report):
+        steady = per_report[1:] or per_report
+        self.stdout.write(
+            f"{mode:<9} first={per_report[0] * 1000:>7.1f}ms  "
+            f"steady={sum(steady) / len(steady) * 1000:>7.1f}ms/report  total={sum(per_report):.2f}s"
+        )
+
+    def handle(self, *args, **options):
+        reports = [
+            self._record(synthetic_analysis(10 ** 9 + i, options['sections']))
+            for i in range(max(1, options['reports']))
+        ]
+        calls = sum(len(r) for r in reports)
+        unique = len({c for r in reports for c in r})
+        self.stdout.write(f"reports={len(reports)} shaping calls={calls} ({calls // len(reports)}/report) unique={unique}")
+
+        per_report = []
+        for report in reports:
+            start = time.perf_counter()
+            for text, bidi in report:
+                if text:
+                    _shape_uncached(str(text), bidi)
+            per_report.append(time.perf_counter() - start)
+        self._report('uncached', per_report)
+
+        PersianShaper.clear(static=True)
+        start = time.perf_counter()
+        PersianShaper.warm_from_file()
+        self.stdout.write(f"warm-up (boot, once per master): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        per_report = []
+        for report in reports:
+            start = time.perf_counter()
+            for text, bidi in report:
+                PersianShaper.shape(text, bidi)
+            per_report.append(time.perf_counter() - start)
+        self._report('cached', per_report)
+        self.stdout.write(f"cache: {PersianShaper.cache_info()}")
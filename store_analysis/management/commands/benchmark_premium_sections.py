@@ -0,0 +1,150 @@
+"""
+Management command برای سنجش زمان کل تحلیل پلن‌های پولی با سرور completion محلی
+استفاده:
+    python manage.py benchmark_premium_sections --latency 0.5 --section-latency 0.5 --reports 3
+
+یک سرور HTTP محلی نقش /chat/completions را بازی می‌کند و PremiumAIAnalysisEngine به آن
+وصل می‌شود. هر پاسخ پس از --latency ثانیه (سربار درخواست) به‌علاوه --section-latency ثانیه
+برای هر بخش خواسته‌شده (تولید خروجی) برمی‌گردد؛ درخواست‌های JSON (prompt packing) برای
+هر بخش یک کلید می‌گیرند. برای هر حالت زمان کل هر گزارش، تعداد فراخوانی‌ها، حجم پرامپت
+ارسالی و بیشینه درخواست هم‌زمان دیده‌شده در سرور گزارش می‌شود:
+    serial                 سقف provider برابر ۱ و بدون packing (معادل حلقه ترتیبی قبلی)
+    concurrent             سقف AI_PROVIDER_CONCURRENCY فعلی (یا --concurrency)، بدون packing
+    packed                 مثل concurrent با PROMPT_PACKING_ENABLED
+    enterprise-reuse       پلن سازمانی با professional_results موجود (فقط بخش‌های سازمانی)
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from store_analysis.ai_services.premium_ai_engine import PremiumAIAnalysisEngine
+
+
+class MockCompletionServer:
+    """سرور completion ساختگی با تأخیر ثابت و شمارش درخواست‌های هم‌زمان"""
+
+    def __init__(self, latency, section_latency=0.0):
+        self.latency = latency
+        self.section_latency = section_latency
+        self.calls = 0
+        self.prompt_chars = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                prompt_chars = sum(len(m.get('content', '')) for m in payload.get('messages', []))
+                with server._lock:
+                    server.calls += 1
+                    server.prompt_chars += prompt_chars
+                    server.in_flight += 1
+                    server.peak = max(server.peak, server.in_flight)
+                try:
+                    text = 'نقاط قوت: ورودی روشن. نقاط ضعف: مسیر مشتری. پیشنهاد: جابه‌جایی قفسه‌ها و بهبود نور ویترین.'
+                    content = text
+                    if payload.get('response_format', {}).get('type') == 'json_object':
+                        keys = re.findall(r'=== بخش "(\w+)" ===', payload['messages'][-1]['content'])
+                        content = json.dumps({key: text for key in keys}, ensure_ascii=False)
+                    time.sleep(server.latency + server.section_latency * max(1, content.count(text)))
+                    body = json.dumps({'choices': [{'message': {'content': content}}]}, ensure_ascii=False).encode('utf-8')
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_chars = 0
+            self.peak = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _store_data():
+    # نام یکتا تا چک‌پوینت اجرای قبلی در اجرای بعدی استفاده نشود
+    return {
+        'store_name': f'فروشگاه آزمایشی {uuid.uuid4().hex[:8]}', 'store_type': 'پوشاک',
+        'area': 120, 'city': 'تهران', 'daily_customers': 150, 'daily_sales': 25000000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark premium/enterprise section scheduling and prompt packing against a local mock completion server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.5, help='سربار ثابت هر پاسخ سرور ساختگی (ثانیه)')
+        parser.add_argument('--section-latency', type=float, default=0.5, help='زمان تولید هر بخش در پاسخ (ثانیه)')
+        parser.add_argument('--reports', type=int, default=2, help='تعداد گزارش در هر حالت')
+        parser.add_argument('--concurrency', type=int, default=0, help='سقف provider در حالت concurrent (پیش‌فرض: تنظیمات)')
+        parser.add_argument('--package', choices=['professional', 'enterprise'], default='enterprise')
+
+    def _measure(self, mode, server, reports, run):
+        server.reset()
+        timings = []
+        for _ in range(reports):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"{mode:<17} {reports:>3} reports  mean={sum(timings) / reports:>6.2f}s  "
+            f"max={max(timings):>6.2f}s  calls/report={server.calls / reports:>4.1f}  "
+            f"prompt_chars/report={server.prompt_chars // reports:>6}  peak_in_flight={server.peak}"
+        )
+
+    def handle(self, *args, **options):
+        package = options['package']
+        reports = max(1, options['reports'])
+        limits = dict(getattr(settings, 'AI_PROVIDER_CONCURRENCY', {}))
+        concurrent_limit = options['concurrency'] or limits.get(PremiumAIAnalysisEngine.PROVIDER) or 6
+        self.stdout.write(f"package={package} latency={options['latency']}s reports={reports} concurrency={concurrent_limit}")
+
+        with MockCompletionServer(options['latency'], options['section_latency']) as server:
+            common = {'OPENAI_API_KEY': 'benchmark', 'OPENAI_BASE_URL': server.base_url}
+
+            def analyze(engine_package, **kwargs):
+                return PremiumAIAnalysisEngine(engine_package).analyze_store_premium(_store_data(), **kwargs)
+
+            with override_settings(AI_PROVIDER_CONCURRENCY={**limits, 'openai': 1}, PROMPT_PACKING_ENABLED=False, **common):
+                self._measure('serial', server, reports, lambda: analyze(package))
+
+            with override_settings(AI_PROVIDER_CONCURRENCY={**limits, 'openai': concurrent_limit}, PROMPT_PACKING_ENABLED=False, **common):
+                self._measure('concurrent', server, reports, lambda: analyze(package))
+
+            with override_settings(AI_PROVIDER_CONCURRENCY={**limits, 'openai': concurrent_limit}, PROMPT_PACKING_ENABLED=True, **common):
+                packing = {}
+                self._measure('packed', server, reports, lambda: packing.update(analyze(package).get('prompt_packing') or {}))
+                self.stdout.write(f"  prompt_packing per report: {packing}")
+
+                if package == 'enterprise':
+                    professional = analyze('professional')
+                    self._measure('enterprise-reuse', server, reports,
+                                  lambda: analyze('enterprise', professional_results=professional))
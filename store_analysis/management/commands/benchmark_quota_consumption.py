@@ -0,0 +1,106 @@
+"""
+Management command برای سنجش مصرف هم‌زمان کد تخفیف (read-modify-write در برابر UPDATE شرطی)
+استفاده:
+    python manage.py benchmark_quota_consumption --threads 16 --attempts 25 --max-uses 50
+
+یک کد تخفیف موقت ساخته می‌شود، threadها هم‌زمان سعی در مصرف آن دارند و در پایان
+تعداد مصرف‌های موفق با max_uses مقایسه می‌شود. کد موقت پس از اجرا حذف می‌شود.
+"""
+
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from store_analysis.models import DiscountCode
+
+
+def naive_consume(pk):
+    """رفتار قبلی use_discount: خواندن، بررسی is_valid و save کل ردیف"""
+    code = DiscountCode.objects.get(pk=pk)
+    if code.is_valid():
+        code.used_count += 1
+        code.save()
+        return True
+    return False
+
+
+def atomic_consume(pk):
+    return DiscountCode.consume(pk=pk)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent discount-code consumption: read-modify-write vs conditional UPDATE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='تعداد threadهای هم‌زمان')
+        parser.add_argument('--attempts', type=int, default=20, help='تعداد تلاش هر thread')
+        parser.add_argument('--max-uses', type=int, default=50, help='سقف مصرف کد موقت')
+
+    def _run(self, consume, options):
+        now = timezone.now()
+        code = DiscountCode.objects.create(
+            code=f'BENCH{uuid.uuid4().hex[:10].upper()}',
+            discount_value=10,
+            discount_percentage=10,
+            max_uses=options['max_uses'],
+            valid_from=now - timedelta(minutes=1),
+            valid_until=now + timedelta(hours=1),
+            description='benchmark_quota_consumption',
+        )
+        granted = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker():
+            ok = failed = 0
+            barrier.wait()
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        if consume(code.pk):
+                            ok += 1
+                    except DatabaseError:
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                granted.append(ok)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        used_count = DiscountCode.objects.filter(pk=code.pk).values_list('used_count', flat=True).first()
+        code.delete()
+        return sum(granted), used_count, sum(errors), elapsed
+
+    def handle(self, *args, **options):
+        max_uses = options['max_uses']
+        total = options['threads'] * options['attempts']
+        self.stdout.write(self.style.SUCCESS(
+            f"🎟️  Discount consumption benchmark ({options['threads']} threads x "
+            f"{options['attempts']} attempts, max_uses={max_uses})"
+        ))
+
+        for label, consume in (('read-modify-write', naive_consume), ('conditional UPDATE', atomic_consume)):
+            granted, used_count, errors, elapsed = self._run(consume, options)
+            line = (
+                f"   {label:<19} granted={granted} used_count={used_count} "
+                f"over-issued={max(0, granted - max_uses)} db_errors={errors} "
+                f"{elapsed:.3f}s ({total / elapsed:.0f} attempts/s)"
+            )
+            if granted > max_uses or granted != used_count:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
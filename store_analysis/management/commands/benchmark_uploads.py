@@ -0,0 +1,165 @@
+"""
+Management command برای سنجش حافظه اوج آپلودهای multipart بزرگ هم‌زمان
+استفاده:
+    python manage.py benchmark_uploads --concurrency 8 --photos 3 --photo-mb 6 --video-mb 10
+
+یک بدنه multipart شبیه forms_submit (چند عکس فروشگاه، ویدیوی مشتریان و فایل فروش) روی
+دیسک ساخته می‌شود و --concurrency درخواست هم‌زمان (thread) آن را از طریق WSGIRequest با
+wsgi.input فایل می‌خوانند؛ هر درخواست فایل‌ها را مثل view با SecurityService بررسی و با
+save_uploaded_file ذخیره می‌کند. هر حالت در یک پروسس fork‌شده جدا اجرا می‌شود و رشد RSS
+اوج آن (VmHWM نسبت به RSS ابتدای پروسس) گزارش می‌شود:
+    legacy      MemoryFileUploadHandler + TemporaryFileUploadHandler با سقف حافظه 32MB (تنظیمات قبلی)؛
+                درخواست‌های تا 32MB کامل در حافظه نگه داشته می‌شوند
+    streaming   StreamingUploadHandler (FILE_UPLOAD_HANDLERS فعلی)
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from store_analysis.services.security_service import SecurityService
+from store_analysis.utils.file_storage import save_uploaded_file
+from store_analysis.utils.streaming_upload import rejected_uploads
+
+BOUNDARY = 'chidmanoBenchmarkBoundary'
+MB = 1024 * 1024
+
+MODES = {
+    'legacy': {
+        'FILE_UPLOAD_HANDLERS': [
+            'django.core.files.uploadhandler.MemoryFileUploadHandler',
+            'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+        ],
+        'FILE_UPLOAD_MAX_MEMORY_SIZE': 32 * MB,
+        'DATA_UPLOAD_MAX_MEMORY_SIZE': 64 * MB,
+    },
+    'streaming': {
+        'FILE_UPLOAD_HANDLERS': ['store_analysis.utils.streaming_upload.StreamingUploadHandler'],
+    },
+}
+
+
+def _write_part(out, name, filename, content_type, header, size):
+    out.write(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'.encode()
+    )
+    out.write(header)
+    remaining = size - len(header)
+    block = os.urandom(MB)
+    while remaining > 0:
+        out.write(block[:min(remaining, MB)])
+        remaining -= MB
+    out.write(b'\r\n')
+
+
+def build_body(path, photos, photo_mb, video_mb, sales_mb):
+    with open(path, 'wb') as out:
+        out.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="store_name"\r\n\r\nفروشگاه آزمایشی\r\n'.encode())
+        for i in range(photos):
+            _write_part(out, f'store_photo_{i}', f'photo_{i}.jpg', 'image/jpeg', b'\xff\xd8\xff\xe0', photo_mb * MB)
+        _write_part(out, 'customer_flow_video', 'flow.mp4', 'video/mp4', b'\x00\x00\x00\x18ftypmp42', video_mb * MB)
+        _write_part(out, 'sales_file', 'sales.xlsx', 'application/vnd.ms-excel', b'PK\x03\x04', sales_mb * MB)
+        out.write(f'--{BOUNDARY}--\r\n'.encode())
+    return os.path.getsize(path)
+
+
+def _status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _submit(body_path, body_size):
+    with open(body_path, 'rb') as stream:
+        request = WSGIRequest({
+            'REQUEST_METHOD': 'POST', 'PATH_INFO': '/store/forms/submit/',
+            'SERVER_NAME': 'benchmark', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+            'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+            'CONTENT_LENGTH': str(body_size), 'wsgi.input': stream,
+        })
+        saved = 0
+        for field_name, file_obj in request.FILES.items():
+            ext = os.path.splitext(file_obj.name)[1].lower()
+            SecurityService.validate_file_upload(file_obj, [ext], 1024 * MB)
+            save_uploaded_file(file_obj, base_path='uploads')
+            saved += 1
+        for file_obj in request.FILES.values():
+            file_obj.close()
+        return saved, len(rejected_uploads(request))
+
+
+def _run_mode(mode, body_path, body_size, concurrency, media_root, results):
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')  # صفر کردن VmHWM همین پروسس
+    except OSError:
+        pass
+    baseline = _status('VmRSS:')
+    start = time.perf_counter()
+    with override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_TEMP_DIR=media_root, **MODES[mode]):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(lambda _: _submit(body_path, body_size), range(concurrency)))
+    results[mode] = {
+        'seconds': time.perf_counter() - start,
+        'peak_growth': _status('VmHWM:') - baseline,
+        'saved': sum(saved for saved, _ in outcomes),
+        'rejected': sum(rejected for _, rejected in outcomes),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark peak RSS of concurrent large multipart submissions: in-memory vs streaming upload handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--photos', type=int, default=3)
+        parser.add_argument('--photo-mb', type=int, default=6)
+        parser.add_argument('--video-mb', type=int, default=10)
+        parser.add_argument('--sales-mb', type=int, default=2)
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/status'):
+            self.stderr.write('این benchmark به /proc لینوکس نیاز دارد')
+            return
+        workdir = tempfile.mkdtemp(prefix='upload-benchmark-')
+        try:
+            body_path = os.path.join(workdir, 'body.multipart')
+            body_size = build_body(
+                body_path, options['photos'], options['photo_mb'], options['video_mb'], options['sales_mb'],
+            )
+            self.stdout.write(
+                f"body={body_size / MB:.1f}MB ({options['photos']} photos, video {options['video_mb']}MB) "
+                f"concurrency={options['concurrency']}"
+            )
+            context = multiprocessing.get_context('fork')
+            with context.Manager() as manager:
+                results = manager.dict()
+                for mode in MODES:
+                    media_root = os.path.join(workdir, mode)
+                    os.makedirs(media_root)
+                    process = context.Process(
+                        target=_run_mode,
+                        args=(mode, body_path, body_size, options['concurrency'], media_root, results),
+                    )
+                    process.start()
+                    process.join()
+                    if mode not in results:
+                        self.stderr.write(f"{mode}: پروسس با کد {process.exitcode} خارج شد")
+                        continue
+                    result = results[mode]
+                    self.stdout.write(
+                        f"{mode:<10} peak_rss_growth={result['peak_growth'] / MB:>7.1f}MB  "
+                        f"time={result['seconds']:>6.2f}s  files_saved={result['saved']}  rejected={result['rejected']}"
+                    )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,78 @@
+"""
+Management command برای فشرده‌سازی ستون‌های JSON حجیم ردیف‌های موجود StoreAnalysis
+استفاده:
+    python manage.py compress_analysis_payloads --dry-run
+    python manage.py compress_analysis_payloads --batch-size 200
+    python manage.py compress_analysis_payloads --decompress
+
+ردیف‌های ذخیره‌شده پیش از CompressedJSONField بدون تغییر خوانده می‌شوند؛ این فرمان آن‌ها را
+با آستانه ANALYSIS_JSON_COMPRESS_MIN_BYTES بازنویسی می‌کند (--decompress همه را به JSON
+معمولی برمی‌گرداند، مثلاً پیش از بازگشت به نسخه قبلی). بازنویسی با update() انجام می‌شود،
+پس updated_at و سیگنال‌ها دست نمی‌خورند و اجرای دوباره ردیف‌های بازنویسی‌شده را رد می‌کند.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models import Value
+
+from store_analysis.models import StoreAnalysis
+from store_analysis.utils.json_payload import compress_min_bytes, is_compressed, pack, unpack
+
+COMPRESSED_FIELDS = ('results', 'store_images', 'analysis_files')
+
+
+class Command(BaseCommand):
+    help = 'فشرده‌سازی (یا بازگرداندن) اسناد JSON بزرگ results/store_images/analysis_files ردیف‌های موجود'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='تعداد ردیف در هر دسته')
+        parser.add_argument('--dry-run', action='store_true', help='فقط گزارش بده، تغییر نده')
+        parser.add_argument('--decompress', action='store_true', help='بازگرداندن همه اسناد به JSON معمولی')
+
+    def _raw_rows(self, ids):
+        table = connection.ops.quote_name(StoreAnalysis._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(name) for name in ('id',) + COMPRESSED_FIELDS)
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            # متن خام ستون‌ها؛ from_db_value پوشش فشرده را باز می‌کرد و وضعیت ذخیره معلوم نمی‌شد
+            cursor.execute(f"SELECT {columns} FROM {table} WHERE id IN ({placeholders})", ids)
+            return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        decompress = options['decompress']
+        if not decompress and not compress_min_bytes():
+            self.stderr.write('ANALYSIS_JSON_COMPRESS_MIN_BYTES صفر است؛ فشرده‌سازی غیرفعال است')
+            return
+        ids = list(StoreAnalysis._base_manager.order_by('id').values_list('id', flat=True))
+        batch_size = max(1, options['batch_size'])
+        rewritten = 0
+        bytes_before = bytes_after = 0
+
+        for offset in range(0, len(ids), batch_size):
+            for row in self._raw_rows(ids[offset:offset + batch_size]):
+                pk, changes = row[0], {}
+                for name, raw in zip(COMPRESSED_FIELDS, row[1:]):
+                    if raw is None:
+                        continue
+                    stored = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+                    plain = unpack(stored)
+                    target = plain if decompress else pack(plain)
+                    if is_compressed(target) == is_compressed(stored):
+                        continue
+                    bytes_before += len(raw) if isinstance(raw, (str, bytes)) else len(json.dumps(stored))
+                    bytes_after += len(json.dumps(target))
+                    # JSONField معمولی به‌عنوان output_field تا pack دوباره روی مقدار اعمال نشود
+                    changes[name] = Value(target, output_field=models.JSONField())
+                if changes:
+                    rewritten += 1
+                    if not options['dry_run']:
+                        StoreAnalysis._base_manager.filter(pk=pk).update(**changes)
+
+        action = 'بازگردانده' if decompress else 'فشرده'
+        prefix = '(dry-run) ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{rewritten} از {len(ids)} تحلیل {action} شد؛ "
+            f"{bytes_before / 1024:.1f}KB -> {bytes_after / 1024:.1f}KB"
+        ))
@@ -1,13 +1,18 @@
 """
 Management command برای رفع تحلیل‌های stuck شده
 استفاده: python manage.py fix_stuck_analyses
+
+با --retry تحلیل‌ها به‌صورت هم‌زمان (--concurrency) و با بودجه نرخ مشترک (--rpm)
+دوباره اجرا می‌شوند. claim تحلیل‌ها با قفل ردیف انجام می‌شود، پس اجرای هم‌زمان
+این فرمان روی چند سرور یک تحلیل را دوبار پردازش نمی‌کند.
 """
 
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from django.utils import timezone
-from datetime import timedelta
-from store_analysis.models import StoreAnalysis
 from django.conf import settings
+from store_analysis.models import StoreAnalysis
+from store_analysis.services.stuck_recovery import StuckAnalysisRecovery
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +38,24 @@ def add_arguments(self, parser):
             action='store_true',
             help='تلاش برای retry تحلیل‌ها'
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'STUCK_RECOVERY_CONCURRENCY', 4),
+            help='تعداد تحلیل‌های هم‌زمان در حالت retry'
+        )
+        parser.add_argument(
+            '--rpm',
+            type=float,
+            default=getattr(settings, 'LIARA_AI_REQUESTS_PER_MINUTE', 60),
+            help='سقف درخواست در دقیقه به Liara AI (0 = بدون محدودیت)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='حداکثر تعداد تحلیل‌هایی که در این اجرا retry می‌شوند'
+        )
 
     def handle(self, *args, **options):
         hours = options['hours']
@@ -48,13 +71,14 @@ def handle(self, *args, **options):
             self.stdout.write(self.style.WARNING("⚠️  حالت DRY-RUN فعال است - هیچ تغییری اعمال نمی‌شود"))
             self.stdout.write("")
         
-        # پیدا کردن تحلیل‌های stuck
-        threshold_time = timezone.now() - timedelta(hours=hours)
-        
-        stuck_analyses = StoreAnalysis.objects.filter(
-            status='processing',
-            updated_at__lt=threshold_time
+        recovery = StuckAnalysisRecovery(
+            hours=hours,
+            concurrency=options['concurrency'],
+            requests_per_minute=options['rpm'],
+            limit=options['limit'],
+            on_result=self._report,
         )
+        stuck_analyses = recovery.candidates()
         
         count = stuck_analyses.count()
         self.stdout.write(f"📊 تعداد تحلیل‌های stuck شده (بیش از {hours} ساعت): {count}")
@@ -64,157 +88,29 @@ def handle(self, *args, **options):
             self.stdout.write(self.style.SUCCESS("✅ هیچ تحلیل stuck شده‌ای پیدا نشد!"))
             return
         
-        self.stdout.write("🔍 تحلیل‌های stuck شده:")
-        self.stdout.write("-" * 80)
+        if dry_run:
+            self._list(stuck_analyses)
+            return
         
         fixed_count = 0
         failed_count = 0
         
-        for analysis in stuck_analyses:
-            self.stdout.write(f"\n📋 تحلیل ID: {analysis.id}")
-            self.stdout.write(f"   کاربر: {analysis.user.username if analysis.user else 'N/A'}")
-            self.stdout.write(f"   آخرین بروزرسانی: {analysis.updated_at}")
-            stuck_minutes = (timezone.now() - analysis.updated_at).total_seconds() / 60
-            self.stdout.write(f"   مدت زمان stuck: {stuck_minutes:.1f} دقیقه")
-            
-            if dry_run:
-                self.stdout.write(self.style.WARNING("   [DRY-RUN] این تحلیل باید بررسی شود"))
-                continue
-            
-            # بررسی API key
-            liara_api_key = getattr(settings, 'LIARA_AI_API_KEY', '')
-            
-            if not liara_api_key:
-                self.stdout.write(self.style.ERROR("   ⚠️  LIARA_AI_API_KEY تنظیم نشده است"))
-                if not dry_run:
-                    analysis.status = 'failed'
-                    analysis.error_message = "⚠️ LIARA_AI_API_KEY تنظیم نشده است. تحلیل نمی‌تواند انجام شود."
-                    analysis.save(update_fields=['status', 'error_message'])
-                    failed_count += 1
-                continue
-            
-            # بررسی داده‌ها
-            if not analysis.analysis_data:
-                self.stdout.write(self.style.ERROR("   ⚠️  داده‌های تحلیل موجود نیست"))
-                if not dry_run:
-                    analysis.status = 'failed'
-                    analysis.error_message = "⚠️ داده‌های تحلیل موجود نیست. لطفاً فرم را تکمیل کنید."
-                    analysis.save(update_fields=['status', 'error_message'])
-                    failed_count += 1
-                continue
-            
-            # Retry اگر درخواست شده باشد
-            if retry and not dry_run:
-                self.stdout.write("   🔄 تلاش برای retry تحلیل...")
-                
-                try:
-                    # آماده‌سازی داده‌ها
-                    analysis_data = analysis.analysis_data or {}
-                    store_data = {
-                        'store_name': analysis.store_name or 'فروشگاه',
-                        'store_type': analysis_data.get('store_type', 'عمومی'),
-                        'store_size': str(analysis_data.get('store_size', 0)),
-                        **analysis_data
-                    }
-                    
-                    # استخراج تصاویر
-                    images = []
-                    if 'uploaded_files' in analysis_data:
-                        uploaded_files = analysis_data['uploaded_files']
-                        image_fields = ['store_photos', 'store_layout', 'shelf_photos', 
-                                      'window_display_photos', 'entrance_photos', 'checkout_photos']
-                        for field in image_fields:
-                            if field in uploaded_files:
-                                file_info = uploaded_files[field]
-                                if isinstance(file_info, dict) and 'path' in file_info:
-                                    images.append(file_info['path'])
-                    
-                    # استفاده از Liara AI
-                    from store_analysis.ai_services.liara_ai_service import LiaraAIService
-                    liara_service = LiaraAIService()
-                    
-                    if not liara_service.api_key:
-                        self.stdout.write(self.style.ERROR("   ❌ API key در سرویس موجود نیست"))
-                        analysis.status = 'failed'
-                        analysis.error_message = "⚠️ LIARA_AI_API_KEY در سرویس موجود نیست."
-                        analysis.save(update_fields=['status', 'error_message'])
-                        failed_count += 1
-                        continue
-                    
-                    self.stdout.write("   📡 در حال ارسال درخواست به Liara AI...")
-                    
-                    # تحلیل جامع
-                    comprehensive_analysis = liara_service.analyze_store_comprehensive(
-                        store_data=store_data,
-                        images=images if images else None
-                    )
-                    
-                    # بررسی نتیجه
-                    if comprehensive_analysis and comprehensive_analysis.get('error'):
-                        error_type = comprehensive_analysis.get('error', 'unknown_error')
-                        error_message = comprehensive_analysis.get('error_message', 'خطا در تحلیل AI')
-                        
-                        self.stdout.write(self.style.ERROR(f"   ❌ خطا در تحلیل: {error_type}"))
-                        analysis.status = 'failed'
-                        analysis.error_message = error_message
-                        analysis.save(update_fields=['status', 'error_message'])
-                        failed_count += 1
-                        
-                    elif comprehensive_analysis and not comprehensive_analysis.get('error'):
-                        self.stdout.write(self.style.SUCCESS("   ✅ تحلیل با موفقیت انجام شد!"))
-                        
-                        # به‌روزرسانی نتایج
-                        current_results = analysis.results or {}
-                        
-                        analysis_text = None
-                        if 'final_report' in comprehensive_analysis:
-                            analysis_text = comprehensive_analysis['final_report']
-                        elif 'detailed_analyses' in comprehensive_analysis:
-                            combined = ""
-                            for key, anal in comprehensive_analysis['detailed_analyses'].items():
-                                if anal and 'content' in anal:
-                                    combined += f"\n\n{anal['content']}\n"
-                            analysis_text = combined if combined else None
-                        
-                        current_results.update({
-                            'liara_analysis': comprehensive_analysis,
-                            'analysis_source': 'liara_ai',
-                            'analysis_text': analysis_text or comprehensive_analysis.get('final_report', ''),
-                            'models_used': comprehensive_analysis.get('ai_models_used', []),
-                            'analysis_quality': 'premium',
-                            'analyzed_at': timezone.now().isoformat(),
-                        })
-                        
-                        analysis.results = current_results
-                        analysis.status = 'completed'
-                        analysis.save(update_fields=['results', 'status'])
-                        
-                        self.stdout.write(self.style.SUCCESS("   ✅ وضعیت به 'completed' تغییر یافت"))
-                        fixed_count += 1
-                        
-                    else:
-                        self.stdout.write(self.style.ERROR("   ❌ تحلیل خالی برگشت"))
-                        analysis.status = 'failed'
-                        analysis.error_message = 'تحلیل AI خالی برگشت. لطفاً دوباره تلاش کنید.'
-                        analysis.save(update_fields=['status', 'error_message'])
-                        failed_count += 1
-                        
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"   ❌ خطا در retry: {e}"))
-                    logger.error(f"Error retrying analysis {analysis.id}: {e}", exc_info=True)
-                    
-                    analysis.status = 'failed'
-                    analysis.error_message = f"خطا در retry تحلیل: {str(e)}"
-                    analysis.save(update_fields=['status', 'error_message'])
-                    failed_count += 1
-            else:
-                # فقط تغییر به failed
-                if not dry_run:
-                    self.stdout.write("   🔧 تغییر وضعیت به 'failed'")
-                    analysis.status = 'failed'
-                    analysis.error_message = f"تحلیل بیش از {hours} ساعت در حال پردازش بود و متوقف شد."
-                    analysis.save(update_fields=['status', 'error_message'])
-                    failed_count += 1
+        if retry:
+            self.stdout.write(
+                f"🔄 retry با {recovery.concurrency} worker هم‌زمان "
+                f"(سقف {options['rpm']:g} درخواست در دقیقه)..."
+            )
+            self.stdout.write("-" * 80)
+            stats = recovery.run()
+            fixed_count = stats.completed
+            failed_count = stats.failed
+            self.stdout.write("")
+            self.stdout.write(
+                f"⏱️  {stats.claimed} تحلیل در {stats.elapsed:.1f} ثانیه "
+                f"({stats.per_minute:.1f} تحلیل در دقیقه)"
+            )
+        else:
+            failed_count = self._mark_failed(stuck_analyses, hours)
         
         self.stdout.write("")
         self.stdout.write("=" * 80)
@@ -231,3 +127,65 @@ def handle(self, *args, **options):
         if failed_count > 0:
             self.stdout.write(self.style.WARNING("⚠️  برخی تحلیل‌ها به failed تغییر یافتند"))
 
+    def _list(self, stuck_analyses):
+        self.stdout.write("🔍 تحلیل‌های stuck شده:")
+        self.stdout.write("-" * 80)
+        now = timezone.now()
+        rows = stuck_analyses.select_related('user').only('id', 'updated_at', 'user__username')
+        for analysis in rows.iterator():
+            self.stdout.write(f"\n📋 تحلیل ID: {analysis.id}")
+            self.stdout.write(f"   کاربر: {analysis.user.username if analysis.user else 'N/A'}")
+            self.stdout.write(f"   آخرین بروزرسانی: {analysis.updated_at}")
+            stuck_minutes = (now - analysis.updated_at).total_seconds() / 60
+            self.stdout.write(f"   مدت زمان stuck: {stuck_minutes:.1f} دقیقه")
+            self.stdout.write(self.style.WARNING("   [DRY-RUN] این تحلیل باید بررسی شود"))
+
+    def _mark_failed(self, stuck_analyses, hours):
+        """تغییر وضعیت به failed با bulk_update دسته‌ای به‌جای ذخیره تک‌به‌تک"""
+        if not getattr(settings, 'LIARA_AI_API_KEY', ''):
+            self.stdout.write(self.style.ERROR("⚠️  LIARA_AI_API_KEY تنظیم نشده است"))
+            return self._fail_all(
+                stuck_analyses,
+                "⚠️ LIARA_AI_API_KEY تنظیم نشده است. تحلیل نمی‌تواند انجام شود."
+            )
+        
+        no_data = Q(analysis_data__isnull=True) | Q(analysis_data={})
+        failed_count = self._fail_all(
+            stuck_analyses.filter(no_data),
+            "⚠️ داده‌های تحلیل موجود نیست. لطفاً فرم را تکمیل کنید."
+        )
+        if failed_count:
+            self.stdout.write(self.style.ERROR(f"⚠️  داده‌های {failed_count} تحلیل موجود نیست"))
+        
+        self.stdout.write("🔧 تغییر وضعیت به 'failed'")
+        failed_count += self._fail_all(
+            stuck_analyses,
+            f"تحلیل بیش از {hours} ساعت در حال پردازش بود و متوقف شد."
+        )
+        return failed_count
+
+    def _fail_all(self, analyses, message, batch_size=200):
+        """
+        مثل StuckAnalysisRecovery._fail: پیام در analysis_data['error_message'] (مدل فیلد
+        error_message ندارد). bulk_update مقدار auto_now را اعمال نمی‌کند، پس updated_at صریح است.
+        """
+        ids = list(analyses.values_list('id', flat=True))
+        now = timezone.now()
+        for start in range(0, len(ids), batch_size):
+            rows = StoreAnalysis.objects.with_payload('analysis_data').filter(id__in=ids[start:start + batch_size])
+            batch = list(rows)
+            for analysis in batch:
+                analysis_data = analysis.analysis_data or {}
+                analysis_data['error_message'] = message
+                analysis.analysis_data = analysis_data
+                analysis.status = 'failed'
+                analysis.updated_at = now
+            StoreAnalysis.objects.bulk_update(batch, ['status', 'analysis_data', 'updated_at'])
+        return len(ids)
+
+    def _report(self, outcome):
+        self.stdout.write(f"\n📋 تحلیل ID: {outcome.analysis_id} ({outcome.username}) - {outcome.seconds:.1f}s")
+        if outcome.status == 'completed':
+            self.stdout.write(self.style.SUCCESS("   ✅ وضعیت به 'completed' تغییر یافت"))
+        else:
+            self.stdout.write(self.style.ERROR(f"   ❌ {outcome.message}"))
@@ -0,0 +1,164 @@
+"""
+Management command برای load test تکرارپذیر با داده seed‌شده و سرورهای ساختگی وابستگی‌های خارجی
+استفاده:
+    python manage.py load_test --reseed --duration 30 --concurrency 8           # in-process
+    python manage.py load_test --iterations 500 --scenario home=3 --scenario chat=1
+    python manage.py load_test --duration 60 --json after.json --compare before.json
+    python manage.py load_test --target http://127.0.0.1:8000 --duration 60 --concurrency 32
+
+سناریوها (وزن پیش‌فرض): home(30) form_submit(10) status_polling(25) pdf_download(10)
+payment_callback(10) chat(15). برای هر سناریو p50/p95/p99، میانگین، بیشینه، throughput،
+خطاها و میانگین کوئری (هدر X-DB-Queries اگر QUERY_INSTRUMENTATION_HEADERS فعال باشد) گزارش می‌شود.
+
+حالت in-process (پیش‌فرض): درخواست‌ها با test client در همین پروسس اجرا می‌شوند و همه
+APIهای خارجی با override_settings به StubCluster محلی هدایت می‌شوند (--stub-latency-ms،
+--stub-error-rate، --service NAME:LATENCY_MS[:ERROR_RATE]).
+حالت --target: درخواست HTTP واقعی به سرور در حال اجرا؛ سرور باید با env خروجی
+run_stub_services و همان دیتابیس اجرا شده باشد (داده seed در همین دیتابیس ساخته می‌شود).
+
+داده با --users/--analyses/--orders/--page-views و --seed ساخته می‌شود (اگر داده‌ای نباشد یا
+--reseed)؛ --cleanup پس از اجرا آن را حذف می‌کند.
+"""
+
+import json
+import logging
+import os
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from store_analysis.loadtest import seed as seeding
+from store_analysis.loadtest.runner import LoadRunner
+from store_analysis.loadtest.scenarios import SCENARIOS, ClientSession, HttpSession
+from store_analysis.loadtest.stubs import StubCluster
+from store_analysis.management.commands.run_stub_services import parse_service_overrides
+
+COLUMNS = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'max_ms', 'rps', 'queries')
+
+
+def parse_mix(values):
+    """['home=3', 'chat'] → {'home': 3, 'chat': وزن پیش‌فرض}"""
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f"سناریوی نامعتبر: {name} (سناریوها: {', '.join(SCENARIOS)})")
+        mix[name] = int(weight) if weight else SCENARIOS[name].weight
+    return mix or None
+
+
+class Command(BaseCommand):
+    help = 'Seeded load test of key user journeys with local API stubs; reports p50/p95/p99 and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', help='آدرس سرور در حال اجرا (بدون آن: in-process)')
+        parser.add_argument('--scenario', action='append', default=[], help='NAME[=WEIGHT] (قابل تکرار)')
+        parser.add_argument('--concurrency', type=int, default=8, help='تعداد workerهای هم‌زمان')
+        parser.add_argument('--duration', type=float, help='مدت اجرا (ثانیه)')
+        parser.add_argument('--iterations', type=int, help='تعداد کل اجرای سناریوها (پیش‌فرض 100 بدون --duration)')
+        parser.add_argument('--warmup', type=int, default=2, help='تکرارهای ابتدایی هر worker که ثبت نمی‌شوند')
+        parser.add_argument('--seed', type=int, default=42, help='seed داده و انتخاب سناریوها')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--analyses', type=int, default=6, help='تحلیل برای هر کاربر')
+        parser.add_argument('--orders', type=int, default=5, help='سفارش pending برای هر کاربر')
+        parser.add_argument('--page-views', type=int, default=2000)
+        parser.add_argument('--reseed', action='store_true', help='ساخت دوباره داده load test')
+        parser.add_argument('--cleanup', action='store_true', help='حذف داده load test پس از اجرا')
+        parser.add_argument('--stub-latency-ms', type=int, default=50, help='تأخیر پیش‌فرض سرورهای ساختگی')
+        parser.add_argument('--stub-jitter-ms', type=int, default=0)
+        parser.add_argument('--stub-error-rate', type=float, default=0.0)
+        parser.add_argument('--service', action='append', default=[], help='NAME:LATENCY_MS[:ERROR_RATE]')
+        parser.add_argument('--json', help='ذخیره گزارش در فایل JSON')
+        parser.add_argument('--compare', help='گزارش JSON قبلی برای مقایسه')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['scenario'])
+        users = [] if options['reseed'] else seeding.load_users()
+        if not users:
+            users = seeding.seed(users=options['users'], analyses=options['analyses'], orders=options['orders'],
+                                 page_views=options['page_views'], seed=options['seed'])
+            self.stdout.write(f"seeded {len(users)} users (seed={options['seed']})")
+
+        if options['verbosity'] < 2:
+            # لاگ INFO هر درخواست خروجی را پر می‌کند؛ با -v 2 حفظ می‌شود
+            logging.disable(logging.INFO)
+        try:
+            if options['target']:
+                report = self._run(lambda user: HttpSession(options['target'], user), users, mix, options)
+            else:
+                report = self._run_in_process(users, mix, options)
+        finally:
+            logging.disable(logging.NOTSET)
+            if options['cleanup']:
+                seeding.clear()
+
+        self._print(report)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as handle:
+                json.dump(report.as_dict(), handle, ensure_ascii=False, indent=2)
+            self.stdout.write(f"report written: {options['json']}")
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as handle:
+                self._compare(json.load(handle), report.as_dict())
+
+    def _run(self, session_factory, users, mix, options):
+        runner = LoadRunner(
+            session_factory, users, mix=mix, concurrency=options['concurrency'], duration=options['duration'],
+            iterations=options['iterations'], warmup=options['warmup'], seed=options['seed'],
+        )
+        if runner.skipped:
+            self.stdout.write(self.style.WARNING(f"skipped (no seeded data): {', '.join(runner.skipped)}"))
+        self.stdout.write(
+            f"scenarios={', '.join(runner.eligible)} concurrency={runner.concurrency} "
+            f"{'duration=%ss' % runner.duration if runner.duration else 'iterations=%s' % runner.iterations}"
+        )
+        return runner.run()
+
+    def _run_in_process(self, users, mix, options):
+        from store_analysis.ai_services.registry import ServiceRegistry
+
+        cluster = StubCluster(
+            latency=options['stub_latency_ms'] / 1000.0, jitter=options['stub_jitter_ms'] / 1000.0,
+            error_rate=options['stub_error_rate'], overrides=parse_service_overrides(options['service']),
+        )
+        with cluster, override_settings(**cluster.settings_overrides()), \
+                mock.patch.dict(os.environ, cluster.environment()):
+            # سرویس‌های AI آدرس و کلید را هنگام ساخت می‌خوانند
+            ServiceRegistry.reset()
+            try:
+                report = self._run(ClientSession, users, mix, options)
+            finally:
+                ServiceRegistry.reset()
+            report.stubs = cluster.stats()
+        return report
+
+    def _print(self, report):
+        self.stdout.write(self.style.SUCCESS(
+            f"\n📈 Load test: {report.elapsed:.1f}s, concurrency={report.concurrency}"
+        ))
+        self.stdout.write(f"{'scenario':<17}" + ''.join(f'{c:>10}' for c in COLUMNS))
+        for row in report.rows:
+            cells = ''.join(f"{'-' if row[c] is None else row[c]:>10}" for c in COLUMNS)
+            self.stdout.write(f"{row['scenario']:<17}{cells}")
+        for label, errors in report.errors.items():
+            self.stdout.write(self.style.WARNING(
+                f"   {label} errors: {', '.join(f'{k}×{v}' for k, v in errors.items())}"
+            ))
+        if report.stubs:
+            self.stdout.write('stubs: ' + '  '.join(
+                f"{name}={c['requests']}/{c['errors']}err" for name, c in report.stubs.items() if c['requests']
+            ))
+
+    def _compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING('\nchange vs baseline (p50 / p95 / p99 / rps)'))
+        previous = {row['scenario']: row for row in before.get('scenarios', [])}
+        for row in after['scenarios']:
+            old = previous.get(row['scenario'])
+            if not old:
+                continue
+            deltas = []
+            for column in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+                change = (row[column] - old[column]) / old[column] * 100 if old[column] else 0.0
+                deltas.append(f"{old[column]}→{row[column]} ({change:+.0f}%)")
+            self.stdout.write(f"{row['scenario']:<17}" + '  '.join(deltas))
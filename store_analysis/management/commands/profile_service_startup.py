@@ -0,0 +1,41 @@
+"""
+Management command برای سنجش هزینه cold start سرویس‌های AI در یک پروسس تازه
+استفاده:
+    python manage.py profile_service_startup
+    python manage.py profile_service_startup --services liara consultant
+"""
+
+from django.core.management.base import BaseCommand
+
+from store_analysis.ai_services.registry import ServiceRegistry
+
+
+class Command(BaseCommand):
+    help = 'Report per-service import and construction cost from ServiceRegistry'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--services',
+            nargs='*',
+            default=None,
+            help='سرویس‌هایی که ساخته شوند (پیش‌فرض: همه سرویس‌های ثبت‌شده)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['services'] or ServiceRegistry.names()
+        stats = ServiceRegistry.warm_up(names)
+
+        self.stdout.write(self.style.SUCCESS('🧩 Service construction cost (this process)'))
+        self.stdout.write(f"   {'service':<14}{'import':>10}{'init':>10}{'total':>10}")
+        total = 0.0
+        for name in names:
+            info = stats.get(name, {})
+            if info.get('loaded'):
+                total += info['total_seconds']
+                self.stdout.write(
+                    f"   {name:<14}{info['import_seconds']:>9.3f}s{info['init_seconds']:>9.3f}s"
+                    f"{info['total_seconds']:>9.3f}s"
+                )
+            else:
+                self.stdout.write(self.style.ERROR(f"   {name:<14} failed: {info.get('error', 'unknown service')}"))
+        self.stdout.write(f"   {'total':<14}{'':>20}{total:>9.3f}s")
@@ -0,0 +1,63 @@
+"""
+Management command برای همگام‌سازی دسته‌ای پرداخت‌ها و سفارش‌ها
+استفاده:
+    python manage.py reconcile_payments                      # همه jobها
+    python manage.py reconcile_payments --job orders --chunk-size 5000
+    python manage.py reconcile_payments --job tickets --days 30 --dry-run
+    python manage.py reconcile_payments --job orders --restart  # نادیده گرفتن چک‌پوینت
+
+jobها:
+    orders     ساخت Order برای پرداخت‌های completed/processing بدون سفارش
+    tickets    تیکت پشتیبانی برای پرداخت‌های completed اخیر بدون سفارش
+    no-refund  completed کردن پرداخت‌هایی که فرم تحلیلشان تکمیل شده
+
+اجرای قطع‌شده (یا محدودشده با --limit) در اجرای بعدی از آخرین chunk ثبت‌شده ادامه می‌یابد.
+"""
+
+from django.core.management.base import BaseCommand
+
+from store_analysis.services.reconciliation import JOBS, TicketsForUnlinkedPaymentsJob
+
+
+class Command(BaseCommand):
+    help = 'Batched, resumable reconciliation of payments, orders and support tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', choices=list(JOBS) + ['all'], default='all', help='job مورد نظر (پیش‌فرض: همه)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='تعداد ردیف هر chunk (پیش‌فرض: RECONCILIATION_CHUNK_SIZE)')
+        parser.add_argument('--limit', type=int, default=None, help='حداکثر ردیف‌های بررسی‌شده در این اجرا')
+        parser.add_argument('--days', type=int, default=90, help='بازه زمانی job تیکت‌ها (روز)')
+        parser.add_argument('--restart', action='store_true', help='شروع از ابتدا و نادیده گرفتن چک‌پوینت')
+        parser.add_argument('--dry-run', action='store_true', help='فقط شمارش، بدون نوشتن')
+
+    def handle(self, *args, **options):
+        names = list(JOBS) if options['job'] == 'all' else [options['job']]
+        for name in names:
+            job_class = JOBS[name]
+            kwargs = {
+                'chunk_size': options['chunk_size'],
+                'dry_run': options['dry_run'],
+                'limit': options['limit'],
+                'on_chunk': self._progress,
+            }
+            if job_class is TicketsForUnlinkedPaymentsJob:
+                kwargs['days'] = options['days']
+            job = job_class(**kwargs)
+
+            if not options['restart'] and not options['dry_run'] and job.checkpoint():
+                self.stdout.write(f"↪️  {job.name}: resuming after pk {job.checkpoint()}")
+            stats = job.run(resume=not options['restart'])
+
+            verb = 'would write' if options['dry_run'] else 'written'
+            status = 'done' if stats.finished else f'paused at pk {stats.last_pk}'
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {job.name}: {stats.scanned} scanned, {stats.written} {verb}, "
+                f"{stats.chunks} chunks in {stats.elapsed:.2f}s "
+                f"({stats.rows_per_second:.0f} rows/s) - {status}"
+            ))
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f"   {stats.job}: chunk {stats.chunks} up to pk {stats.last_pk} - "
+            f"{stats.scanned} scanned, {stats.written} written"
+        )
@@ -0,0 +1,119 @@
+"""
+Management command برای اجرای یک سرور LLM ساختگی (سازگار با chat/completions) به‌منظور
+سنجش توان بازیابی تحلیل‌ها بدون مصرف اعتبار Liara AI
+استفاده:
+    python manage.py run_stub_llm_server --port 8089 --latency-ms 800 &
+    LIARA_AI_BASE_URL=http://127.0.0.1:8089/api LIARA_AI_API_KEY=stub \\
+        python manage.py fix_stuck_analyses --retry --concurrency 8 --rpm 600
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """پاسخ به POST .../chat/completions با تأخیر و نرخ خطای قابل تنظیم"""
+
+    latency = 0.5
+    jitter = 0.0
+    error_rate = 0.0
+    counter = {'requests': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._reply(404, {'error': {'message': f'unknown path {self.path}'}})
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._reply(400, {'error': {'message': 'invalid json'}})
+            return
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        with self.lock:
+            self.counter['requests'] += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.counter['errors'] += 1
+        if failed:
+            self._reply(503, {'error': {'message': 'stub overloaded'}})
+            return
+
+        prompt_chars = sum(len(str(m.get('content', ''))) for m in payload.get('messages', []))
+        self._reply(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'تحلیل آزمایشی سرور ساختگی.'},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_chars // 4,
+                'completion_tokens': 8,
+                'total_tokens': prompt_chars // 4 + 8,
+            },
+        })
+
+    def _reply(self, status, data):
+        encoded = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    # backlog پیش‌فرض (5) زیر بار هم‌زمان اتصال‌ها را reset می‌کند
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = 'اجرای سرور LLM ساختگی برای سنجش توان fix_stuck_analyses --retry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency-ms', type=int, default=500, help='تأخیر هر پاسخ (میلی‌ثانیه)')
+        parser.add_argument('--jitter-ms', type=int, default=0, help='نوسان تصادفی تأخیر (میلی‌ثانیه)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='نسبت پاسخ‌های 503 (0 تا 1)')
+
+    def handle(self, *args, **options):
+        handler = type('ConfiguredStubLLMHandler', (StubLLMHandler,), {
+            'latency': options['latency_ms'] / 1000.0,
+            'jitter': options['jitter_ms'] / 1000.0,
+            'error_rate': options['error_rate'],
+            'counter': {'requests': 0, 'errors': 0},
+        })
+        server = StubLLMServer((options['host'], options['port']), handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"🧪 Stub LLM server on http://{options['host']}:{options['port']}/api "
+            f"(latency={options['latency_ms']}ms, error_rate={options['error_rate']})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(
+                f"requests={handler.counter['requests']} errors={handler.counter['errors']}"
+            )
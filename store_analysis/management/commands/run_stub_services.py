@@ -0,0 +1,70 @@
+"""
+Management command برای اجرای سرورهای ساختگی همه وابستگی‌های خارجی (Liara AI، OpenAI،
+Ollama، PayPing، زرین‌پال، Google Indexing و SMTP) به‌منظور load test یک سرور واقعی
+استفاده:
+    python manage.py run_stub_services --base-port 9100 --latency-ms 300 --error-rate 0.02 &
+    # خروجی export را در shell سرور اجرا کنید، سپس:
+    gunicorn chidmano.wsgi -c gunicorn.conf.py
+    python manage.py load_test --target http://127.0.0.1:8000 --duration 60 --concurrency 32
+
+--service NAME:LATENCY_MS[:ERROR_RATE] تأخیر/خطای یک سرویس را جدا تنظیم می‌کند
+(مثلاً --service liara:1500 --service payping:200:0.1).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store_analysis.loadtest.stubs import SERVICES, StubCluster
+
+
+def parse_service_overrides(values):
+    """['liara:1500', 'payping:200:0.1'] → {'liara': {'latency': 1.5}, 'payping': {...}}"""
+    overrides = {}
+    for value in values:
+        name, _, rest = value.partition(':')
+        if name not in SERVICES or not rest:
+            raise CommandError(f"--service نامعتبر: {value} (سرویس‌ها: {', '.join(SERVICES)})")
+        latency, _, error_rate = rest.partition(':')
+        overrides[name] = {'latency': float(latency) / 1000.0}
+        if error_rate:
+            overrides[name]['error_rate'] = float(error_rate)
+    return overrides
+
+
+class Command(BaseCommand):
+    help = 'Run local stand-ins for every external API (LLMs, payment gateways, Google indexing, SMTP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--base-port', type=int, default=9100, help='پورت اولین سرویس؛ بقیه پورت‌های بعدی')
+        parser.add_argument('--latency-ms', type=int, default=50, help='تأخیر پیش‌فرض هر پاسخ (میلی‌ثانیه)')
+        parser.add_argument('--jitter-ms', type=int, default=0, help='نوسان تصادفی تأخیر (میلی‌ثانیه)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='نسبت پاسخ‌های خطا (0 تا 1)')
+        parser.add_argument('--service', action='append', default=[], help='NAME:LATENCY_MS[:ERROR_RATE]')
+
+    def handle(self, *args, **options):
+        cluster = StubCluster(
+            host=options['host'], base_port=options['base_port'],
+            latency=options['latency_ms'] / 1000.0, jitter=options['jitter_ms'] / 1000.0,
+            error_rate=options['error_rate'], overrides=parse_service_overrides(options['service']),
+        ).start()
+        self.stdout.write(self.style.SUCCESS('🧪 Stub services:'))
+        for name in SERVICES:
+            handler = cluster.handlers[name]
+            self.stdout.write(
+                f"   {name:<9} {cluster.url(name):<28} latency={handler.latency * 1000:.0f}ms "
+                f"error_rate={handler.error_rate}"
+            )
+        self.stdout.write('\n# environment for the server under test:')
+        for key, value in cluster.environment().items():
+            self.stdout.write(f'export {key}={value}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cluster.stop()
+            for name, counter in cluster.stats().items():
+                self.stdout.write(f"{name:<9} requests={counter['requests']} errors={counter['errors']}")
@@ -8,7 +8,7 @@
 from django.utils import timezone
 from .models import PageView, SiteStats
 from django.contrib.auth.models import User
-from datetime import date
+from datetime import date, datetime, time, timedelta
 
 
 class AnalyticsMiddleware(MiddlewareMixin):
@@ -119,10 +119,13 @@ def update_daily_stats(self, request, user):
             stats.page_views += 1
             
             # Check if this is a unique visitor (by session)
+            # بازه روز به‌جای created_at__date تا ایندکس (session_id, created_at) استفاده شود
             session_id = request.session.get('analytics_session_id', '')
+            day_start = timezone.make_aware(datetime.combine(today, time.min))
             if not PageView.objects.filter(
                 session_id=session_id,
-                created_at__date=today
+                created_at__gte=day_start,
+                created_at__lt=day_start + timedelta(days=1)
             ).exists():
                 stats.unique_visitors += 1
             
@@ -136,4 +139,37 @@ def update_daily_stats(self, request, user):
             stats.save()
             
         except Exception as e:
-            print(f"Error updating daily stats: {e}")
\ No newline at end of file
+            print(f"Error updating daily stats: {e}")
+
+class QueryInstrumentationMiddleware:
+    """ثبت تعداد کوئری، زمان دیتابیس و کوئری‌های تکراری هر درخواست با نام view
+    
+    بدون QUERY_INSTRUMENTATION_ENABLED (پیش‌فرض خارج از DEBUG) از زنجیره middleware حذف می‌شود.
+    """
+    
+    def __init__(self, get_response):
+        from django.core.exceptions import MiddlewareNotUsed
+        from .services.query_budget import instrumentation_enabled
+        
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        from django.conf import settings
+        from .services.query_budget import QueryRecorder, finish
+        
+        recorder = QueryRecorder()
+        with recorder:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        recorder.stats.label = match.view_name if match else 'unresolved'
+        problems = finish(recorder)
+        
+        if settings.DEBUG or getattr(settings, 'QUERY_INSTRUMENTATION_HEADERS', False):
+            response['X-DB-Queries'] = str(recorder.stats.count)
+            response['X-DB-Time-Ms'] = f"{recorder.stats.db_ms:.2f}"
+            response['X-DB-Repeats'] = str(recorder.stats.max_repeats)
+            if problems:
+                response['X-DB-Budget-Exceeded'] = '1'
+        return response
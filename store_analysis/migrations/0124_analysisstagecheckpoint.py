@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store_analysis', '0123_update_package_prices_final'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisStageCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_key', models.CharField(max_length=100, verbose_name='شناسه اجرا')),
+                ('stage', models.CharField(max_length=50, verbose_name='مرحله')),
+                ('input_hash', models.CharField(max_length=64, verbose_name='hash ورودی')),
+                ('output', models.JSONField(blank=True, default=dict, verbose_name='خروجی مرحله')),
+                ('duration_seconds', models.FloatField(default=0, verbose_name='مدت اجرا (ثانیه)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+            ],
+            options={
+                'verbose_name': 'چک‌پوینت مرحله تحلیل',
+                'verbose_name_plural': 'چک‌پوینت‌های مراحل تحلیل',
+                'indexes': [models.Index(fields=['created_at'], name='store_analy_created_cc266b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('run_key', 'stage', 'input_hash'), name='unique_analysis_stage_checkpoint')],
+            },
+        ),
+    ]
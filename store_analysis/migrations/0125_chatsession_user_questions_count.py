@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_user_questions_count(apps, schema_editor):
+    ChatSession = apps.get_model('store_analysis', 'ChatSession')
+    ChatMessage = apps.get_model('store_analysis', 'ChatMessage')
+    questions = ChatMessage.objects.filter(
+        session=OuterRef('pk'), role='user'
+    ).values('session').annotate(total=Count('pk')).values('total')
+    ChatSession.objects.update(
+        user_questions_count=Coalesce(Subquery(questions, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store_analysis', '0124_analysisstagecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='user_questions_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='تعداد سوالات کاربر'),
+        ),
+        migrations.RunPython(backfill_user_questions_count, migrations.RunPython.noop),
+    ]
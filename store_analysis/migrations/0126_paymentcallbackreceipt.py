@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store_analysis', '0125_chatsession_user_questions_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallbackReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='کلید یکتایی')),
+                ('gateway', models.CharField(max_length=20, verbose_name='درگاه')),
+                ('reference', models.CharField(max_length=100, verbose_name='شناسه پرداخت/سفارش')),
+                ('status', models.CharField(max_length=20, verbose_name='وضعیت callback')),
+                ('response', models.JSONField(blank=True, default=dict, verbose_name='پاسخ ثبت‌شده')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='callback_receipts', to='store_analysis.payment', verbose_name='پرداخت')),
+            ],
+            options={
+                'verbose_name': 'رسید callback پرداخت',
+                'verbose_name_plural': 'رسیدهای callback پرداخت',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
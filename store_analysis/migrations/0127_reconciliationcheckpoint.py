@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store_analysis', '0126_paymentcallbackreceipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=50, unique=True, verbose_name='نام job')),
+                ('last_pk', models.BigIntegerField(default=0, verbose_name='آخرین شناسه پردازش‌شده')),
+                ('processed', models.BigIntegerField(default=0, verbose_name='تعداد ردیف‌های پردازش‌شده')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+            ],
+            options={
+                'verbose_name': 'چک‌پوینت همگام‌سازی',
+                'verbose_name_plural': 'چک‌پوینت‌های همگام‌سازی',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store_analysis', '0128_payment_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='نام')),
+                ('prefix', models.CharField(max_length=16, unique=True, verbose_name='پیشوند')),
+                ('key_hash', models.CharField(max_length=64, verbose_name='HMAC کلید')),
+                ('scopes', models.JSONField(blank=True, default=list, verbose_name='دامنه‌های دسترسی')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='تاریخ انقضا')),
+                ('revoked_at', models.DateTimeField(blank=True, null=True, verbose_name='تاریخ ابطال')),
+                ('last_used_at', models.DateTimeField(blank=True, null=True, verbose_name='آخرین استفاده')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_keys', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'کلید API',
+                'verbose_name_plural': 'کلیدهای API',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+import store_analysis.utils.json_payload
+
+
+class Migration(migrations.Migration):
+    """فقط کلاس فیلد عوض می‌شود (بدون تغییر schema)؛ ردیف‌های موجود با compress_analysis_payloads فشرده می‌شوند"""
+
+    dependencies = [
+        ('store_analysis', '0129_apikey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storeanalysis',
+            name='results',
+            field=store_analysis.utils.json_payload.CompressedJSONField(blank=True, default=dict, null=True, verbose_name='نتایج هوش مصنوعی'),
+        ),
+        migrations.AlterField(
+            model_name='storeanalysis',
+            name='store_images',
+            field=store_analysis.utils.json_payload.CompressedJSONField(default=list, verbose_name='تصاویر فروشگاه'),
+        ),
+        migrations.AlterField(
+            model_name='storeanalysis',
+            name='analysis_files',
+            field=store_analysis.utils.json_payload.CompressedJSONField(default=list, verbose_name='فایل‌های تحلیل'),
+        ),
+    ]
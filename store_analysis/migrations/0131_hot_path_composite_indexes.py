@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """ایندکس‌های ترکیبی مسیرهای پرترافیک (پیشنهاد advise_indexes)"""
+
+    dependencies = [
+        ('store_analysis', '0130_analysis_payload_compression'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storeanalysis',
+            index=models.Index(fields=['user', '-created_at'], name='analysis_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storeanalysis',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='analysis_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='payment_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['session_id', 'created_at'], name='pageview_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'created_at'], name='chatmsg_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewreminder',
+            index=models.Index(condition=models.Q(email_sent=False), fields=['status', 'reminder_date'],
+                               name='reminder_due_unsent_idx'),
+        ),
+    ]
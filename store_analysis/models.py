@@ -2,7 +2,8 @@
 Store Analysis Models
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
@@ -10,6 +11,8 @@
 from datetime import timedelta
 import logging
 
+from .utils.json_payload import CompressedJSONField
+
 logger = logging.getLogger(__name__)
 
 
@@ -92,6 +95,8 @@ class Meta:
             models.Index(fields=['status']),
             models.Index(fields=['user']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at'], name='payment_user_status_idx'),
         ]
     
     def __str__(self):
@@ -169,6 +174,7 @@ class Meta:
             models.Index(fields=['payment']),
             models.Index(fields=['log_type']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['payment', '-created_at'], name='paymentlog_payment_created_idx'),
         ]
     
     def __str__(self):
@@ -266,12 +272,17 @@ def can_use_analysis(self):
         return self.is_active and not self.is_expired() and self.analyses_used < self.max_analyses
     
     def use_analysis(self):
-        """Use one analysis"""
-        if self.can_use_analysis():
+        """Use one analysis (atomic conditional UPDATE; never exceeds max_analyses)"""
+        now = timezone.now()
+        updated = UserSubscription.objects.filter(
+            pk=self.pk,
+            is_active=True,
+            end_date__gte=now,
+            analyses_used__lt=F('max_analyses'),
+        ).update(analyses_used=F('analyses_used') + 1, updated_at=now)
+        if updated:
             self.analyses_used += 1
-            self.save()
-            return True
-        return False
+        return bool(updated)
 
 
 class Order(models.Model):
@@ -335,15 +346,41 @@ def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
 
-class StoreAnalysisManager(models.Manager):
-    """Manager سفارشی برای StoreAnalysis که فیلدهای missing را به صورت خودکار defer می‌کند"""
+# ستون‌های JSON حجیم StoreAnalysis (خروجی کامل LLM و فهرست فایل‌ها) که به‌صورت پیش‌فرض
+# بارگذاری نمی‌شوند؛ با with_payload() در queryset یا load_payload() روی نمونه بارگذاری می‌شوند
+HEAVY_JSON_FIELDS = ('analysis_data', 'results', 'store_images', 'analysis_files')
+
+
+class StoreAnalysisQuerySet(models.QuerySet):
+    """QuerySet تحلیل‌ها با بارگذاری صریح ستون‌های JSON حجیم"""
+    
+    def with_payload(self, *fields):
+        """بارگذاری ستون‌های JSON حجیم (همه یا فقط fields) همراه ردیف‌ها"""
+        wanted = set(fields or HEAVY_JSON_FIELDS)
+        names, defer = self.query.deferred_loading
+        if not defer:
+            # حالت only(): فیلدهای خواسته‌شده به فهرست بارگذاری اضافه می‌شوند
+            return self.only(*(set(names) | wanted))
+        return self.defer(None).defer(*(set(names) - wanted))
+    
+    def with_result_flags(self):
+        """افزودن results_present (نتیجه غیرخالی) بدون بارگذاری ستون results"""
+        from django.db.models import BooleanField, ExpressionWrapper
+        
+        return self.annotate(results_present=ExpressionWrapper(
+            Q(results__isnull=False) & ~Q(results={}), output_field=BooleanField()
+        ))
+
+
+class StoreAnalysisManager(models.Manager.from_queryset(StoreAnalysisQuerySet)):
+    """Manager سفارشی برای StoreAnalysis که فیلدهای missing و ستون‌های JSON حجیم را defer می‌کند"""
     
     def get_queryset(self):
-        """Override queryset برای defer کردن فیلدهای missing"""
+        """Override queryset برای defer کردن فیلدهای missing و HEAVY_JSON_FIELDS"""
         try:
             from store_analysis.utils.safe_db import get_available_columns
             
-            queryset = super().get_queryset()
+            queryset = super().get_queryset().defer(*HEAVY_JSON_FIELDS)
             table_name = 'store_analysis_storeanalysis'
             available_columns = get_available_columns(table_name)
             
@@ -372,7 +409,7 @@ def get_queryset(self):
         except Exception as e:
             # اگر خطا داشت، queryset عادی را برگردان
             logger.warning(f"Error in StoreAnalysisManager.get_queryset: {e}")
-            return super().get_queryset()
+            return super().get_queryset().defer(*HEAVY_JSON_FIELDS)
 
 
 class StoreAnalysis(models.Model):
@@ -423,9 +460,10 @@ class StoreAnalysis(models.Model):
     # priority = models.CharField(max_length=10, default='medium', verbose_name='اولویت')
     
     # Analysis data and order reference
+    # ستون‌های JSON حجیم به‌صورت پیش‌فرض defer می‌شوند (HEAVY_JSON_FIELDS)
     analysis_data = models.JSONField(default=dict, blank=True, verbose_name='داده‌های تحلیل')
     # AI results (structured)
-    results = models.JSONField(default=dict, blank=True, null=True, verbose_name='نتایج هوش مصنوعی')
+    results = CompressedJSONField(default=dict, blank=True, null=True, verbose_name='نتایج هوش مصنوعی')
     order = models.ForeignKey('Order', on_delete=models.SET_NULL, blank=True, null=True, related_name='analyses', verbose_name='سفارش')
     
     # Results
@@ -434,8 +472,8 @@ class StoreAnalysis(models.Model):
     recommendations = models.TextField(blank=True, verbose_name='توصیه‌ها')
     
     # Files
-    store_images = models.JSONField(default=list, verbose_name='تصاویر فروشگاه')
-    analysis_files = models.JSONField(default=list, verbose_name='فایل‌های تحلیل')
+    store_images = CompressedJSONField(default=list, verbose_name='تصاویر فروشگاه')
+    analysis_files = CompressedJSONField(default=list, verbose_name='فایل‌های تحلیل')
     
     @property
     def is_processing(self) -> bool:
@@ -460,6 +498,8 @@ class Meta:
             models.Index(fields=['status']),
             models.Index(fields=['analysis_type']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', '-created_at'], name='analysis_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at'], name='analysis_user_status_idx'),
         ]
     
     def __str__(self):
@@ -480,9 +520,19 @@ def get_analysis_data(self):
         """Get analysis data for PDF generation"""
         return self.analysis_data or {}
     
+    def load_payload(self, *fields):
+        """بارگذاری ستون‌های JSON حجیم defer‌شده (همه یا فقط fields) با یک کوئری"""
+        deferred = self.get_deferred_fields() & set(fields or HEAVY_JSON_FIELDS)
+        if deferred and self.pk is not None:
+            self.refresh_from_db(fields=sorted(deferred))
+        return self
+    
     @property
     def has_results(self):
         """Check if analysis has AI results"""
+        if 'results' in self.get_deferred_fields() and 'results_present' in self.__dict__:
+            # با with_result_flags() ستون results برای این بررسی بارگذاری نمی‌شود
+            return self.results_present
         return bool(self.results and isinstance(self.results, dict))
     
     def _safe_get_field(self, field_name, default=None):
@@ -689,11 +739,9 @@ def get_active_notifications(cls):
     
     @classmethod
     def get_current_discount(cls):
-        """دریافت تخفیف فعلی"""
-        notifications = cls.get_active_notifications()
-        if notifications.exists():
-            return notifications.first()
-        return None
+        """دریافت تخفیف فعلی (از ConfigStore، بدون کوئری در مسیر داغ)"""
+        from .utils.config_store import ConfigStore
+        return ConfigStore.get_current_discount()
 
 class SystemSettings(models.Model):
     """مدل تنظیمات سیستم"""
@@ -713,12 +761,9 @@ def __str__(self):
     
     @classmethod
     def get_setting(cls, key, default=None):
-        """دریافت تنظیمات"""
-        try:
-            setting = cls.objects.get(key=key)
-            return setting.value
-        except cls.DoesNotExist:
-            return default
+        """دریافت تنظیمات (از ConfigStore، بدون کوئری در مسیر داغ)"""
+        from .utils.config_store import ConfigStore
+        return ConfigStore.get(key, default)
     
     @classmethod
     def set_setting(cls, key, value, description=''):
@@ -754,6 +799,7 @@ class Meta:
             models.Index(fields=['created_at']),
             models.Index(fields=['user']),
             models.Index(fields=['session_id']),
+            models.Index(fields=['session_id', 'created_at'], name='pageview_session_created_idx'),
         ]
     
     def __str__(self):
@@ -873,12 +919,29 @@ def is_valid(self):
         )
     
     def use_discount(self):
-        """استفاده از کد تخفیف"""
-        if self.is_valid():
+        """
+        استفاده از کد تخفیف با یک UPDATE شرطی؛ بررسی اعتبار و افزایش used_count در
+        دیتابیس و به‌صورت اتمیک انجام می‌شود، پس درخواست‌های هم‌زمان بیش از max_uses
+        کد مصرف نمی‌کنند.
+        """
+        if self.pk is None:
+            return False
+        updated = self.consume(pk=self.pk)
+        if updated:
             self.used_count += 1
-            self.save()
-            return True
-        return False
+        return updated
+
+    @classmethod
+    def consume(cls, **lookup):
+        """بررسی و مصرف کد تخفیف در یک رفت‌وبرگشت به دیتابیس (مثلاً consume(code='OFF30'))"""
+        now = timezone.now()
+        return bool(cls.objects.filter(
+            is_active=True,
+            valid_from__lte=now,
+            valid_until__gte=now,
+            used_count__lt=F('max_uses'),
+            **lookup
+        ).update(used_count=F('used_count') + 1, updated_at=now))
 
 
 class StoreBasicInfo(models.Model):
@@ -1270,8 +1333,11 @@ class ChatSession(models.Model):
     is_active = models.BooleanField(default=True, verbose_name='فعال')
     
     # محدودیت سوال: 10 سوال رایگان
+    FREE_QUESTIONS_LIMIT = 10
     is_premium = models.BooleanField(default=False, verbose_name='حساب پریمیوم')
     premium_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='تاریخ انقضای پریمیوم')
+    # شمارنده denormalized سوالات کاربر (به‌جای COUNT(*) روی پیام‌ها در هر نوبت چت)
+    user_questions_count = models.PositiveIntegerField(default=0, verbose_name='تعداد سوالات کاربر')
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
@@ -1290,17 +1356,35 @@ def get_messages_count(self):
     
     def get_user_questions_count(self):
         """تعداد سوالات کاربر"""
-        return self.messages.filter(role='user').count()
+        return self.user_questions_count
+    
+    def has_premium_access(self):
+        return bool(self.is_premium and self.premium_expires_at and self.premium_expires_at > timezone.now())
     
     def has_free_questions_left(self):
         """آیا کاربر سوال رایگان باقی دارد؟"""
-        if self.is_premium:
-            from django.utils import timezone
-            if self.premium_expires_at and self.premium_expires_at > timezone.now():
-                return True  # پریمیوم فعال - نامحدود
+        if self.has_premium_access():
+            return True  # پریمیوم فعال - نامحدود
         
         # 10 سوال رایگان
-        return self.get_user_questions_count() < 10
+        return self.user_questions_count < self.FREE_QUESTIONS_LIMIT
+    
+    def add_user_question(self, content, **extra):
+        """
+        ثبت سوال کاربر: سهمیه با یک UPDATE شرطی مصرف و پیام در همان تراکنش ذخیره
+        می‌شود. اگر سهمیه رایگان تمام شده باشد None برمی‌گردد.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            updated = ChatSession.objects.filter(pk=self.pk).filter(
+                Q(is_premium=True, premium_expires_at__gt=now) |
+                Q(user_questions_count__lt=self.FREE_QUESTIONS_LIMIT)
+            ).update(user_questions_count=F('user_questions_count') + 1, updated_at=now)
+            if not updated:
+                self.refresh_from_db(fields=['user_questions_count'])
+                return None
+            self.user_questions_count += 1
+            return ChatMessage.objects.create(session=self, role='user', content=content, **extra)
     
     def get_last_message(self):
         """آخرین پیام"""
@@ -1334,6 +1418,9 @@ class Meta:
         verbose_name = 'پیام چت'
         verbose_name_plural = 'پیام‌های چت'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='chatmsg_session_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
@@ -1498,6 +1585,9 @@ class Meta:
             models.Index(fields=['status']),
             models.Index(fields=['reminder_date']),
             models.Index(fields=['email_sent']),
+            # اسکن send_review_reminders فقط روی یادآوری‌های ارسال‌نشده
+            models.Index(fields=['status', 'reminder_date'], condition=models.Q(email_sent=False),
+                         name='reminder_due_unsent_idx'),
         ]
     
     def __str__(self):
@@ -1568,4 +1658,105 @@ def create_for_analysis(cls, analysis, days_until_reminder=30, discount_percenta
             return reminder
         except Exception as e:
             logger.error(f"Error creating review reminder: {e}")
-            return None
\ No newline at end of file
+            return None
+
+class AnalysisStageCheckpoint(models.Model):
+    """چک‌پوینت خروجی هر مرحله از pipeline تحلیل برای ادامه پس از خطا یا retry"""
+
+    run_key = models.CharField(max_length=100, verbose_name='شناسه اجرا')
+    stage = models.CharField(max_length=50, verbose_name='مرحله')
+    input_hash = models.CharField(max_length=64, verbose_name='hash ورودی')
+    output = models.JSONField(default=dict, blank=True, verbose_name='خروجی مرحله')
+    duration_seconds = models.FloatField(default=0, verbose_name='مدت اجرا (ثانیه)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'چک‌پوینت مرحله تحلیل'
+        verbose_name_plural = 'چک‌پوینت‌های مراحل تحلیل'
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['run_key', 'stage', 'input_hash'],
+                name='unique_analysis_stage_checkpoint'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.run_key} - {self.stage}"
+
+
+class PaymentCallbackReceipt(models.Model):
+    """رسید callback پرداخت؛ callbackهای تکراری درگاه با یک خواندن ایندکس‌شده پاسخ می‌گیرند"""
+
+    idempotency_key = models.CharField(max_length=64, unique=True, verbose_name='کلید یکتایی')
+    gateway = models.CharField(max_length=20, verbose_name='درگاه')
+    reference = models.CharField(max_length=100, verbose_name='شناسه پرداخت/سفارش')
+    status = models.CharField(max_length=20, verbose_name='وضعیت callback')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='callback_receipts', verbose_name='پرداخت')
+    response = models.JSONField(default=dict, blank=True, verbose_name='پاسخ ثبت‌شده')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'رسید callback پرداخت'
+        verbose_name_plural = 'رسیدهای callback پرداخت'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.gateway}:{self.reference} ({self.status})"
+
+
+class ReconciliationCheckpoint(models.Model):
+    """آخرین pk پردازش‌شده هر job همگام‌سازی برای ادامه اجرای قطع‌شده"""
+
+    job = models.CharField(max_length=50, unique=True, verbose_name='نام job')
+    last_pk = models.BigIntegerField(default=0, verbose_name='آخرین شناسه پردازش‌شده')
+    processed = models.BigIntegerField(default=0, verbose_name='تعداد ردیف‌های پردازش‌شده')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
+
+    class Meta:
+        verbose_name = 'چک‌پوینت همگام‌سازی'
+        verbose_name_plural = 'چک‌پوینت‌های همگام‌سازی'
+
+    def __str__(self):
+        return f"{self.job} @ {self.last_pk}"
+
+
+class ApiKey(models.Model):
+    """
+    کلید API با دامنه دسترسی محدود برای یکپارچه‌سازی‌ها
+
+    فقط HMAC بخش مخفی کلید ذخیره می‌شود؛ prefix برای پیدا کردن ردیف و نمایش در پنل است.
+    ساخت و بررسی کلیدها در services.api_keys انجام می‌شود.
+    """
+
+    SCOPE_CHOICES = [
+        ('analysis:status', 'مشاهده وضعیت تحلیل'),
+        ('analysis:read', 'مشاهده تحلیل‌ها'),
+        ('analysis:create', 'ایجاد و شروع تحلیل'),
+        ('analysis:write', 'ویرایش و حذف تحلیل'),
+        ('payments:read', 'مشاهده پرداخت‌ها'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_keys', verbose_name='کاربر')
+    name = models.CharField(max_length=100, verbose_name='نام')
+    prefix = models.CharField(max_length=16, unique=True, verbose_name='پیشوند')
+    key_hash = models.CharField(max_length=64, verbose_name='HMAC کلید')
+    scopes = models.JSONField(default=list, blank=True, verbose_name='دامنه‌های دسترسی')
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name='تاریخ انقضا')
+    revoked_at = models.DateTimeField(null=True, blank=True, verbose_name='تاریخ ابطال')
+    last_used_at = models.DateTimeField(null=True, blank=True, verbose_name='آخرین استفاده')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'کلید API'
+        verbose_name_plural = 'کلیدهای API'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix})"
+
+    @property
+    def is_usable(self):
+        return self.revoked_at is None and (self.expires_at is None or self.expires_at > timezone.now())
@@ -26,6 +26,10 @@ def __init__(self, merchant_id=None, sandbox=True):
         self.merchant_id = merchant_id or getattr(settings, 'ZARINPAL_MERCHANT_ID', 'b6c54352-1d07-4312-9a7a-f4ad83ee69b0')
         self.sandbox = sandbox
         self.base_url = self.SANDBOX_URL if sandbox else self.PRODUCTION_URL
+        # آدرس جایگزین API (مثلاً سرور ساختگی load test در loadtest/stubs.py)
+        api_base_url = (getattr(settings, 'ZARINPAL_API_BASE_URL', '') or '').rstrip('/')
+        if api_base_url:
+            self.base_url = f"{api_base_url}/pg/v4/payment/"
         
         # اگر Merchant ID کوتاه است، از تست استفاده کن
         if len(self.merchant_id) < 36:
@@ -146,6 +150,11 @@ def __init__(self, token: str, sandbox: bool = True):
         # Select base URLs by environment
         self.base_url = self.SANDBOX_BASE_URL if self.sandbox else self.PROD_BASE_URL
         self.verify_url = self.SANDBOX_VERIFY_URL if self.sandbox else self.PROD_VERIFY_URL
+        # آدرس جایگزین API (مثلاً سرور ساختگی load test)؛ در این حالت fallback به production انجام نمی‌شود
+        self.api_base_url = (getattr(settings, 'PAYPING_API_BASE_URL', '') or '').rstrip('/')
+        if self.api_base_url:
+            self.base_url = f"{self.api_base_url}/v2/pay"
+            self.verify_url = f"{self.api_base_url}/v2/pay/verify"
         
         if not self.token:
             # Use test token for development
@@ -239,7 +248,7 @@ def _post(url):
                         timeout=15,
                         allow_redirects=True,
                     )
-                    logger.info(f"PayPing API response ({url}): {r.status_code} - {r.text}")
+                    logger.info("PayPing API response (%s): %s - %s", url, r.status_code, r.text)
                     return r
                 except Exception as ex:
                     logger.error(f"PayPing request error ({url}): {ex}")
@@ -249,7 +258,7 @@ def _post(url):
             resp = _post(self.base_url)
 
             # If sandbox is enabled but we got unauthorized/client/server error OR network error, retry on production endpoint automatically
-            if self.sandbox and (
+            if self.sandbox and not self.api_base_url and (
                 resp is None or resp.status_code in (401, 403, 404, 500)
             ):
                 logger.warning("PayPing sandbox request failed; retrying on production endpoint as fallback")
@@ -262,7 +271,9 @@ def _post(url):
                 code = data.get("code")
                 if code:
                     logger.info(f"✅ PayPing payment created successfully: code={code}")
-                    goto_base = "https://sandbox-api.payping.ir" if self.sandbox else "https://api.payping.ir"
+                    goto_base = self.api_base_url or (
+                        "https://sandbox-api.payping.ir" if self.sandbox else "https://api.payping.ir"
+                    )
                     return {
                         "status": "success",
                         "authority": code,
@@ -346,18 +357,18 @@ def _post_verify(url):
                         headers=headers,
                         timeout=15,
                     )
-                    logger.info(f"PayPing verification response ({url}): {r.status_code} - {r.text}")
+                    logger.info("PayPing verification response (%s): %s - %s", url, r.status_code, r.text)
                     return r
                 except Exception as ex:
                     logger.error(f"PayPing verify error ({url}): {ex}")
                     return None
 
             resp = _post_verify(self.verify_url)
-            if self.sandbox and (resp is None or resp.status_code in (401, 403, 404, 500)):
+            if self.sandbox and not self.api_base_url and (resp is None or resp.status_code in (401, 403, 404, 500)):
                 logger.warning("PayPing sandbox verify failed; retrying on production endpoint as fallback")
                 resp = _post_verify(self.PROD_VERIFY_URL)
             
-            logger.info(f"PayPing verification response: {resp.status_code} - {resp.text}")
+            logger.info("PayPing verification response: %s - %s", resp.status_code, resp.text)
 
             if resp.status_code in (200, 201):
                 data = resp.json() if resp.content else {}
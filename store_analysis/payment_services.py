@@ -278,7 +278,7 @@ def process_payment(self, amount: Decimal, order_id: str, description: str,
                 return payment_result
             
             # Log payment creation
-            logger.info(f"Payment processed successfully: {payment_result}")
+            logger.info("Payment processed successfully: %s", payment_result)
             
             return payment_result
             
@@ -19,9 +19,13 @@
 from .payment_gateways import PaymentGatewayManager
 from .forms import PaymentForm
 from .utils.safe_db import check_table_exists
+from .utils.config_store import ConfigStore
 from django.db import transaction
 from django.urls import reverse
 from .models import Order
+from .services.payment_callback import PaymentCallbackProcessor
+from .services.payment_history import InvalidCursor, PaymentHistory
+from django.db.models import Q
 
 logger = logging.getLogger(__name__)
 
@@ -52,10 +56,9 @@ def payment_packages(request):
     Display available payment packages
     """
     try:
-        from django.core.cache import cache
         packages = list(ServicePackage.objects.filter(is_active=True).order_by('sort_order', 'price'))
         # Determine discount percentage from admin settings cache if set; default to 90
-        admin_settings = cache.get('admin_settings', {}) or {}
+        admin_settings = ConfigStore.get_admin_settings()
         # سیستم تخفیف افتتاحیه: ۹۰% برای ۵ روز اول، سپس ۶۰%
         from datetime import datetime, timezone
         launch_date = datetime(2025, 12, 5, tzinfo=timezone.utc)  # تاریخ شروع تخفیف افتتاحیه
@@ -121,10 +124,9 @@ def create_payment(request, package_id):
                 order_id = f"CHD_{package.id}_{int(timezone.now().timestamp())}"
 
                 # Calculate discounted amount for payment
-                from django.core.cache import cache
                 from decimal import Decimal, ROUND_HALF_UP
                 from datetime import datetime, timezone
-                admin_settings = cache.get('admin_settings', {}) or {}
+                admin_settings = ConfigStore.get_admin_settings()
                 # سیستم تخفیف افتتاحیه: ۹۰% برای ۵ روز اول، سپس ۶۰%
                 launch_date = datetime(2025, 12, 5, tzinfo=timezone.utc)  # تاریخ شروع تخفیف افتتاحیه
                 current_date = datetime.now(timezone.utc)
@@ -355,9 +357,8 @@ def create_payment(request, package_id):
             })
         
         # Calculate discounted price for display
-        from django.core.cache import cache
         from decimal import Decimal, ROUND_HALF_UP
-        admin_settings = cache.get('admin_settings', {}) or {}
+        admin_settings = ConfigStore.get_admin_settings()
         # سیستم تخفیف افتتاحیه: ۹۰% برای ۵ روز اول، سپس ۶۰%
         from datetime import datetime, timezone
         launch_date = datetime(2025, 12, 5, tzinfo=timezone.utc)  # تاریخ شروع تخفیف افتتاحیه
@@ -404,174 +405,197 @@ def create_payment(request, package_id):
 def payment_callback(request):
     """
     Handle payment callback from Ping Payment
+    callbackهای تکراری (همان payment_id و status) پیش از verify درگاه با پاسخ ثبت‌شده
+    جواب داده می‌شوند؛ اعمال callback جدید در یک تراکنش با قفل ردیف پرداخت انجام می‌شود.
     """
     try:
         # Get callback data
         callback_data = json.loads(request.body) if request.body else {}
         
         # Log callback
-        logger.info(f"Payment callback received: {callback_data}")
+        logger.info("Payment callback received: %s", callback_data)
         
         # Get payment ID from callback
         payment_id = callback_data.get('payment_id')
         if not payment_id:
             return JsonResponse({'status': 'error', 'message': 'Payment ID not provided'})
         
-        # Get payment record
-        try:
-            payment = Payment.objects.get(payment_id=payment_id)
-        except Payment.DoesNotExist:
-            logger.error(f"Payment not found: {payment_id}")
-            return JsonResponse({'status': 'error', 'message': 'Payment not found'})
+        def verify():
+            if not Payment.objects.filter(payment_id=payment_id).exists():
+                return {'success': False, 'error': 'Payment not found', 'not_found': True}
+            return payment_manager.handle_callback(callback_data)
         
-        # Handle callback
-        callback_result = payment_manager.handle_callback(callback_data)
+        def apply(payment, callback_result):
+            return _apply_payment_callback(payment, callback_data, callback_result)
         
-        # Log callback
-        safe_create_payment_log(
-            payment=payment,
-            log_type='payment_callback',
-            message='Payment callback received',
-            data=callback_data
+        response, duplicate = PaymentCallbackProcessor.process(
+            gateway='ping_payment',
+            reference=payment_id,
+            status=callback_data.get('status'),
+            payment_lookup={'payment_id': payment_id},
+            verify=verify,
+            apply=apply,
         )
-        
-        if callback_result['success']:
-            # Ensure there is an Order linked to this payment
-            order = Order.objects.filter(payment=payment).first()
-            if not order:
-                order = Order.objects.filter(order_number=payment.order_id).first()
-
-            # If we still don't have an order, create a minimal one for reconciliation
-            if not order:
-                order = Order.objects.create(
-                    order_number=payment.order_id or f"ORD-UNLINKED-{int(timezone.now().timestamp())}",
-                    user=payment.user,
-                    status='pending',
-                    original_amount=payment.amount or Decimal('0.00'),
-                    base_amount=payment.amount or Decimal('0.00'),
-                    final_amount=payment.amount or Decimal('0.00'),
-                    currency=payment.currency or 'IRR',
-                    payment=payment,
-                    payment_method=payment.payment_method or 'ping_payment'
-                )
-                logger.info(f"Created placeholder Order {order.order_number} for payment {payment.id} during callback handling")
-
-            # Handle completed vs failed status from gateway
-            if callback_result.get('status') == 'completed':
-                # Mark payment and order as completed/paid
-                payment.status = 'completed'
-                payment.completed_at = timezone.now()
-                payment.callback_data = callback_data
-                payment.save()
-
-                order.status = 'paid'
-                order.payment = payment
-                order.transaction_id = callback_result.get('transaction_id') or payment.transaction_id
-                order.save()
-
-                # Try to create subscription only if we can determine a ServicePackage
-                created_subscription = False
-                try:
-                    # If Order.plan references a PricingPlan which maps to ServicePackage by name, attempt mapping
-                    if order.plan:
-                        pkg = ServicePackage.objects.filter(price=order.final_amount).first()
-                    else:
-                        # fallback: try to parse package id from payment.description (legacy)
-                        parts = (payment.description or '').split()
-                        pkg = None
-                        if parts:
-                            try:
-                                candidate_id = int(parts[-1])
-                                pkg = ServicePackage.objects.filter(id=candidate_id).first()
-                            except Exception:
-                                pkg = None
-
-                    if pkg:
-                        UserSubscription.objects.create(
-                            user=payment.user,
-                            package=pkg,
-                            payment=payment,
-                            end_date=timezone.now() + timezone.timedelta(days=pkg.validity_days),
-                            max_analyses=pkg.max_analyses
-                        )
-                        created_subscription = True
-
-                except Exception as e:
-                    logger.warning(f"Could not auto-create subscription for payment {payment.id}: {e}")
-
-                safe_create_payment_log(
-                    payment=payment,
-                    log_type='payment_verified',
-                    message='Payment verified and order marked as paid' + (', subscription created' if created_subscription else ', subscription NOT created'),
-                    data=callback_result
-                )
+        return JsonResponse(response)
+            
+    except Exception as e:
+        logger.error(f"Error handling payment callback: {e}")
+        return JsonResponse({'status': 'error', 'message': 'Internal server error'})
 
-                # If subscription could not be auto-created, create a support ticket for manual reconciliation
-                if not created_subscription:
-                    try:
-                        from .models import SupportTicket
-                        SupportTicket.objects.create(
-                            user=payment.user,
-                            subject=f"Manual reconciliation for payment {payment.order_id}",
-                            description=f"Payment {payment.id} completed but subscription not auto-created. Order: {order.order_number}, amount: {payment.amount}",
-                            category='billing',
-                            priority='high',
-                            attachments=[],
-                            tags=['auto-reconcile', 'payment-callback']
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to create support ticket for payment {payment.id}: {e}")
 
-                return JsonResponse({'status': 'success', 'message': 'Payment completed'})
+def _apply_payment_callback(payment, callback_data, callback_result):
+    """
+    اعمال نتیجه verify روی پرداخت قفل‌شده؛ فقط فیلدهای تغییرکرده نوشته می‌شوند.
+    (response, logs) برمی‌گرداند؛ logs پس از commit به‌صورت پس‌زمینه ذخیره می‌شوند.
+    """
+    if payment is None:
+        logger.error(f"Payment not found: {callback_data.get('payment_id')}")
+        return {'status': 'error', 'message': 'Payment not found'}, []
+    
+    logs = [{
+        'payment': payment,
+        'log_type': 'payment_callback',
+        'message': 'Payment callback received',
+        'data': callback_data,
+    }]
+    
+    if not callback_result['success']:
+        # Callback handling failed
+        logs.append({
+            'payment': payment,
+            'log_type': 'error',
+            'message': f'Callback handling failed: {callback_result.get("error", "Unknown error")}',
+            'data': callback_result,
+        })
+        return {'status': 'error', 'message': 'Callback handling failed'}, logs
+    
+    # Ensure there is an Order linked to this payment (سفارش مرتبط با پرداخت در اولویت است)
+    candidates = list(
+        Order.objects.select_for_update()
+        .filter(Q(payment=payment) | Q(order_number=payment.order_id))[:2]
+    )
+    order = next((o for o in candidates if o.payment_id == payment.id), candidates[0] if candidates else None)
+    
+    # If we still don't have an order, create a minimal one for reconciliation
+    if not order:
+        order = Order.objects.create(
+            order_number=payment.order_id or f"ORD-UNLINKED-{int(timezone.now().timestamp())}",
+            user=payment.user,
+            status='pending',
+            original_amount=payment.amount or Decimal('0.00'),
+            base_amount=payment.amount or Decimal('0.00'),
+            final_amount=payment.amount or Decimal('0.00'),
+            currency=payment.currency or 'IRR',
+            payment=payment,
+            payment_method=payment.payment_method or 'ping_payment'
+        )
+        logger.info(f"Created placeholder Order {order.order_number} for payment {payment.id} during callback handling")
+    
+    # Handle completed vs failed status from gateway
+    if callback_result.get('status') == 'completed':
+        # Mark payment and order as completed/paid
+        payment.status = 'completed'
+        payment.completed_at = timezone.now()
+        payment.callback_data = callback_data
+        payment.save(update_fields=['status', 'completed_at', 'callback_data', 'updated_at'])
+        
+        order.status = 'paid'
+        order.payment = payment
+        order.transaction_id = callback_result.get('transaction_id') or payment.transaction_id
+        order.save(update_fields=['status', 'payment', 'transaction_id', 'updated_at'])
+        
+        # Try to create subscription only if we can determine a ServicePackage
+        created_subscription = False
+        try:
+            # If Order.plan references a PricingPlan which maps to ServicePackage by name, attempt mapping
+            if order.plan_id:
+                pkg = ServicePackage.objects.filter(price=order.final_amount).first()
             else:
-                # Payment failed according to gateway
-                # سیاست جدید: حتی اگر gateway بگوید refund شده، status را refunded نکن
-                # کاربر باید تیکت بزند برای refund
-                payment.status = 'failed'
-                payment.callback_data = callback_data
-                payment.save()
-
-                # فقط اگر gateway صراحتاً cancelled گفته باشد، cancelled می‌کنیم
-                # اما refunded نمی‌کنیم - کاربر باید تیکت بزند
-                if callback_result.get('status') == 'refunded':
-                    # تیکت ایجاد کن برای بررسی دستی
+                # fallback: try to parse package id from payment.description (legacy)
+                parts = (payment.description or '').split()
+                pkg = None
+                if parts:
                     try:
-                        from .models import SupportTicket
-                        SupportTicket.objects.create(
-                            user=payment.user,
-                            subject=f"[درخواست بررسی Refund] پرداخت {payment.order_id}",
-                            description=f"Gateway گزارش refund داده است اما status را refunded نمی‌کنیم. کاربر باید تیکت بزند.\\n\\nPayment ID: {payment.id}\\nOrder: {order.order_number}\\nCallback: {callback_result}",
-                            category='billing',
-                            priority='high'
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to create refund ticket: {e}")
-                
-                order.status = 'cancelled'  # فقط cancelled، نه refunded
-                order.save()
-
-                safe_create_payment_log(
-                    payment=payment,
-                    log_type='payment_failed',
-                    message='Payment failed according to gateway',
-                    data=callback_result
-                )
-
-                return JsonResponse({'status': 'failed', 'message': 'Payment failed'})
-        else:
-            # Callback handling failed
-            safe_create_payment_log(
-                payment=payment,
-                log_type='error',
-                message=f'Callback handling failed: {callback_result.get("error", "Unknown error")}',
-                data=callback_result
-            )
-            
-            return JsonResponse({'status': 'error', 'message': 'Callback handling failed'})
+                        candidate_id = int(parts[-1])
+                        pkg = ServicePackage.objects.filter(id=candidate_id).first()
+                    except Exception:
+                        pkg = None
             
-    except Exception as e:
-        logger.error(f"Error handling payment callback: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Internal server error'})
+            if pkg:
+                with transaction.atomic():
+                    UserSubscription.objects.create(
+                        user=payment.user,
+                        package=pkg,
+                        payment=payment,
+                        end_date=timezone.now() + timezone.timedelta(days=pkg.validity_days),
+                        max_analyses=pkg.max_analyses
+                    )
+                created_subscription = True
+        
+        except Exception as e:
+            logger.warning(f"Could not auto-create subscription for payment {payment.id}: {e}")
+        
+        logs.append({
+            'payment': payment,
+            'log_type': 'payment_verified',
+            'message': 'Payment verified and order marked as paid' + (', subscription created' if created_subscription else ', subscription NOT created'),
+            'data': callback_result,
+        })
+        
+        # If subscription could not be auto-created, create a support ticket for manual reconciliation
+        if not created_subscription:
+            try:
+                from .models import SupportTicket
+                with transaction.atomic():
+                    SupportTicket.objects.create(
+                        user=payment.user,
+                        subject=f"Manual reconciliation for payment {payment.order_id}",
+                        description=f"Payment {payment.id} completed but subscription not auto-created. Order: {order.order_number}, amount: {payment.amount}",
+                        category='billing',
+                        priority='high',
+                        attachments=[],
+                        tags=['auto-reconcile', 'payment-callback']
+                    )
+            except Exception as e:
+                logger.error(f"Failed to create support ticket for payment {payment.id}: {e}")
+        
+        return {'status': 'success', 'message': 'Payment completed'}, logs
+    
+    # Payment failed according to gateway
+    # سیاست جدید: حتی اگر gateway بگوید refund شده، status را refunded نکن
+    # کاربر باید تیکت بزند برای refund
+    payment.status = 'failed'
+    payment.callback_data = callback_data
+    payment.save(update_fields=['status', 'callback_data', 'updated_at'])
+    
+    # فقط اگر gateway صراحتاً cancelled گفته باشد، cancelled می‌کنیم
+    # اما refunded نمی‌کنیم - کاربر باید تیکت بزند
+    if callback_result.get('status') == 'refunded':
+        # تیکت ایجاد کن برای بررسی دستی
+        try:
+            from .models import SupportTicket
+            with transaction.atomic():
+                SupportTicket.objects.create(
+                    user=payment.user,
+                    subject=f"[درخواست بررسی Refund] پرداخت {payment.order_id}",
+                    description=f"Gateway گزارش refund داده است اما status را refunded نمی‌کنیم. کاربر باید تیکت بزند.\\n\\nPayment ID: {payment.id}\\nOrder: {order.order_number}\\nCallback: {callback_result}",
+                    category='billing',
+                    priority='high'
+                )
+        except Exception as e:
+            logger.error(f"Failed to create refund ticket: {e}")
+    
+    order.status = 'cancelled'  # فقط cancelled، نه refunded
+    order.save(update_fields=['status', 'updated_at'])
+    
+    logs.append({
+        'payment': payment,
+        'log_type': 'payment_failed',
+        'message': 'Payment failed according to gateway',
+        'data': callback_result,
+    })
+    
+    return {'status': 'failed', 'message': 'Payment failed'}, logs
 
 @login_required
 def payment_return(request):
@@ -612,13 +636,15 @@ def payment_return(request):
 @login_required
 def payment_history(request):
     """
-    Display user payment history
+    Display user payment history (first cursor page; older pages via payment_history_api)
     """
     try:
-        payments = Payment.objects.filter(user=request.user).order_by('-created_at')
+        payments, next_cursor = PaymentHistory.payments(request.user, request.GET.get('cursor'))
         
         context = {
             'payments': payments,
+            'next_cursor': next_cursor,
+            'summary': PaymentHistory.summary(request.user.id),
             'title': 'تاریخچه پرداخت‌ها',
             'description': 'مشاهده تمام پرداخت‌های شما'
         }
@@ -633,15 +659,17 @@ def payment_history(request):
 @login_required
 def payment_detail(request, payment_id):
     """
-    Display payment details
+    Display payment details (log timeline is loaded page by page via payment_logs_api)
     """
     try:
         payment = get_object_or_404(Payment, id=payment_id, user=request.user)
-        logs = payment.logs.all().order_by('-created_at')
+        logs, logs_next_cursor = PaymentHistory.logs(payment.id)
         
         context = {
             'payment': payment,
             'logs': logs,
+            'logs_next_cursor': logs_next_cursor,
+            'logs_url': reverse('store_analysis:payment_logs_api', args=[payment.id]),
             'title': f'جزئیات پرداخت {payment.order_id}',
             'description': 'مشاهده جزئیات و وضعیت پرداخت'
         }
@@ -659,10 +687,11 @@ def user_subscriptions(request):
     Display user subscriptions
     """
     try:
-        subscriptions = UserSubscription.objects.filter(user=request.user).order_by('-created_at')
+        subscriptions, next_cursor = PaymentHistory.subscriptions(request.user, request.GET.get('cursor'))
         
         context = {
             'subscriptions': subscriptions,
+            'next_cursor': next_cursor,
             'title': 'اشتراک‌های من',
             'description': 'مشاهده اشتراک‌های فعال و منقضی شده'
         }
@@ -673,3 +702,48 @@ def user_subscriptions(request):
         logger.error(f"Error displaying user subscriptions: {e}")
         messages.error(request, 'خطا در نمایش اشتراک‌ها')
         return redirect('store_analysis:user_dashboard')
+
+
+def _cursor_page_response(page, extra=None):
+    """پاسخ JSON یک صفحه cursor؛ cursor نامعتبر خطای 400 می‌دهد"""
+    try:
+        results, next_cursor = page()
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    data = {'status': 'success', 'results': results, 'next_cursor': next_cursor}
+    data.update(extra or {})
+    return JsonResponse(data)
+
+@login_required
+@require_http_methods(["GET"])
+def payment_history_api(request):
+    """
+    Cursor-paginated payment history: ?cursor=<next_cursor>&limit=<n>
+    """
+    cursor = request.GET.get('cursor')
+    extra = None if cursor else {'summary': PaymentHistory.summary(request.user.id)}
+    return _cursor_page_response(
+        lambda: PaymentHistory.payments(request.user, cursor, request.GET.get('limit')),
+        extra,
+    )
+
+@login_required
+@require_http_methods(["GET"])
+def payment_logs_api(request, payment_id):
+    """
+    Lazily loaded, cursor-paginated log timeline of one payment
+    """
+    get_object_or_404(Payment.objects.only('id'), id=payment_id, user=request.user)
+    return _cursor_page_response(
+        lambda: PaymentHistory.logs(payment_id, request.GET.get('cursor'), request.GET.get('limit'))
+    )
+
+@login_required
+@require_http_methods(["GET"])
+def user_subscriptions_api(request):
+    """
+    Cursor-paginated subscriptions of the current user
+    """
+    return _cursor_page_response(
+        lambda: PaymentHistory.subscriptions(request.user, request.GET.get('cursor'), request.GET.get('limit'))
+    )
@@ -0,0 +1,224 @@
+"""
+احراز هویت API با کلیدهای دارای دامنه دسترسی
+
+BasicAuthentication در هر درخواست hasher کامل PBKDF2 را اجرا می‌کند (عمداً صدها میلی‌ثانیه
+CPU). کلید API از یک بخش مخفی تصادفی با آنتروپی بالا ساخته می‌شود، پس به جای hasher
+کند، HMAC-SHA256 آن با کلید مخفی سرور کافی است. کلیدهای بررسی‌شده برای چند ثانیه در یک
+LRU داخل پروسس نگه داشته می‌شوند تا polling پشت سر هم حتی کوئری دیتابیس هم نداشته باشد.
+
+ابطال کلید (و هر تغییر ApiKey) مثل ConfigStore یک version stamp مشترک (فایل + کش) را
+عوض می‌کند؛ هر worker حداکثر هر CHECK_INTERVAL ثانیه stamp را می‌خواند و با تغییر آن
+LRU خود را خالی می‌کند.
+
+قالب کلید: chm_<prefix>_<secret>
+"""
+
+import copy
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import ApiKey
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = 'chm'
+SCOPES = frozenset(code for code, _ in ApiKey.SCOPE_CHOICES)
+
+
+class InvalidApiKey(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class VerifiedKey:
+    key_id: int
+    user_id: int
+    scopes: frozenset
+    expires_at: Optional[float] = None  # epoch
+    user: Any = field(default=None, compare=False, repr=False)
+
+    def has_scope(self, scope: str) -> bool:
+        return scope in self.scopes
+
+    def get_user(self):
+        """کپی کاربر cache‌شده تا تغییر آن در یک درخواست به درخواست‌های دیگر نرسد"""
+        return copy.copy(self.user)
+
+
+class ApiKeyService:
+    """ساخت، بررسی و ابطال کلیدهای API با cache کلیدهای بررسی‌شده در سطح پروسس"""
+
+    VERSION_CACHE_KEY = 'api_key_version'
+    # هر چند ثانیه یک بار version stamp ابطال بررسی شود
+    CHECK_INTERVAL = 2.0
+    # ثبت last_used_at حداکثر یک بار در این بازه برای هر کلید
+    TOUCH_INTERVAL = timedelta(minutes=5)
+
+    _verified: 'OrderedDict[str, Tuple[float, VerifiedKey]]' = OrderedDict()
+    _version = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    # ---- ساخت کلید ----
+
+    @staticmethod
+    def _hmac(value: str) -> str:
+        secret = getattr(settings, 'API_KEY_HMAC_SECRET', '') or settings.SECRET_KEY
+        return hmac.new(secret.encode('utf-8'), value.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    @classmethod
+    def create(cls, user, name: str, scopes: Iterable[str], expires_at=None) -> Tuple[ApiKey, str]:
+        """ساخت کلید جدید؛ کلید خام فقط همین یک بار برگردانده می‌شود"""
+        scopes = sorted(set(scopes))
+        unknown = set(scopes) - SCOPES
+        if unknown:
+            raise ValueError(f"دامنه دسترسی نامعتبر: {', '.join(sorted(unknown))}")
+        prefix = secrets.token_hex(4)
+        secret = secrets.token_urlsafe(32)
+        api_key = ApiKey.objects.create(
+            user=user, name=name, prefix=prefix, key_hash=cls._hmac(secret),
+            scopes=scopes, expires_at=expires_at,
+        )
+        return api_key, f"{TOKEN_PREFIX}_{prefix}_{secret}"
+
+    @classmethod
+    def revoke(cls, api_key: ApiKey) -> None:
+        """ابطال کلید؛ post_save همه workerها را از طریق version stamp باخبر می‌کند"""
+        if api_key.revoked_at is None:
+            api_key.revoked_at = timezone.now()
+            api_key.save(update_fields=['revoked_at'])
+
+    # ---- بررسی کلید ----
+
+    @staticmethod
+    def parse(raw: str) -> Tuple[str, str]:
+        parts = (raw or '').split('_', 2)
+        if len(parts) != 3 or parts[0] != TOKEN_PREFIX or not parts[1] or not parts[2]:
+            raise InvalidApiKey('قالب کلید API نامعتبر است')
+        return parts[1], parts[2]
+
+    @classmethod
+    def verify(cls, raw: str) -> VerifiedKey:
+        prefix, secret = cls.parse(raw)
+        digest = cls._hmac(secret)
+        cls._check_version()
+
+        now = time.time()
+        entry = cls._verified.get(digest)
+        if entry is not None:
+            deadline, verified = entry
+            if now < deadline and (verified.expires_at is None or now < verified.expires_at):
+                with cls._lock:
+                    if digest in cls._verified:
+                        cls._verified.move_to_end(digest)
+                return verified
+
+        api_key = ApiKey.objects.select_related('user').filter(prefix=prefix).first()
+        if api_key is None or not hmac.compare_digest(api_key.key_hash, digest):
+            raise InvalidApiKey('کلید API نامعتبر است')
+        if api_key.revoked_at is not None:
+            raise InvalidApiKey('کلید API باطل شده است')
+        if api_key.expires_at is not None and api_key.expires_at <= timezone.now():
+            raise InvalidApiKey('کلید API منقضی شده است')
+        if not api_key.user.is_active:
+            raise InvalidApiKey('حساب کاربری غیرفعال است')
+
+        verified = VerifiedKey(
+            key_id=api_key.pk,
+            user_id=api_key.user_id,
+            scopes=frozenset(api_key.scopes or ()),
+            expires_at=api_key.expires_at.timestamp() if api_key.expires_at else None,
+            user=api_key.user,
+        )
+        cls._remember(digest, verified, now)
+        cls._touch(api_key)
+        return verified
+
+    @classmethod
+    def _remember(cls, digest: str, verified: VerifiedKey, now: float) -> None:
+        ttl = getattr(settings, 'API_KEY_CACHE_TTL', 30)
+        size = getattr(settings, 'API_KEY_CACHE_SIZE', 1024)
+        with cls._lock:
+            cls._verified[digest] = (now + ttl, verified)
+            cls._verified.move_to_end(digest)
+            while len(cls._verified) > size:
+                cls._verified.popitem(last=False)
+
+    @classmethod
+    def _touch(cls, api_key: ApiKey) -> None:
+        now = timezone.now()
+        if api_key.last_used_at is None or now - api_key.last_used_at > cls.TOUCH_INTERVAL:
+            # update مستقیم بدون signal: ثبت استفاده نباید cache همه workerها را خالی کند
+            ApiKey.objects.filter(pk=api_key.pk).update(last_used_at=now)
+
+    # ---- version stamp ابطال ----
+
+    @classmethod
+    def _version_file(cls) -> str:
+        return getattr(
+            settings,
+            'API_KEY_VERSION_FILE',
+            os.path.join(tempfile.gettempdir(), 'chidmano_api_keys.version')
+        )
+
+    @classmethod
+    def _read_version(cls):
+        file_stamp = None
+        try:
+            with open(cls._version_file()) as f:
+                file_stamp = f.read()
+        except OSError:
+            pass
+        try:
+            cache_stamp = cache.get(cls.VERSION_CACHE_KEY)
+        except Exception:
+            cache_stamp = None
+        return (file_stamp, cache_stamp)
+
+    @classmethod
+    def _check_version(cls) -> None:
+        now = time.monotonic()
+        if now - cls._checked_at < cls.CHECK_INTERVAL:
+            return
+        version = cls._read_version()
+        with cls._lock:
+            if version != cls._version:
+                cls._verified.clear()
+                cls._version = version
+            cls._checked_at = now
+
+    @classmethod
+    def bump_version(cls) -> None:
+        """اعلام تغییر کلیدها به همه workerها"""
+        cls.clear()
+        stamp = uuid.uuid4().hex
+        try:
+            with open(cls._version_file(), 'w') as f:
+                f.write(stamp)
+        except OSError as e:
+            logger.warning(f"Could not write API key version file: {e}")
+        try:
+            cache.set(cls.VERSION_CACHE_KEY, stamp, timeout=None)
+        except Exception as e:
+            logger.warning(f"Could not write API key version to cache: {e}")
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._verified.clear()
+            cls._checked_at = 0.0
@@ -0,0 +1,442 @@
+"""
+پیشنهاد ایندکس ترکیبی و partial از روی شکل واقعی کوئری‌ها
+
+ShapeCollector کوئری‌ها را از یکی از این منابع جمع می‌کند:
+    - اجرای پروفایل (record(): همان execute_wrapper ِ QueryRecorder در query_budget)
+    - لاگ statement پستگرس (log_statement / log_min_duration_statement) با read_postgres_log
+
+برای هر کوئری جدول اصلی، ستون‌های شرط برابری، ستون‌های بازه‌ای و ORDER BY استخراج می‌شود.
+IndexAdvisor این شکل‌ها را با ایندکس‌های موجود (introspection دیتابیس) مقایسه می‌کند و برای
+شکل‌های پوشش‌داده‌نشده ایندکس پیشنهاد می‌دهد: اول ستون‌های برابری، بعد ستون‌های مرتب‌سازی یا
+اولین ستون بازه‌ای. ستون boolean که در همه نمونه‌ها یک مقدار ثابت دارد (مثل email_sent=False)
+به شرط ایندکس partial تبدیل می‌شود. ایندکس‌های تکراری یا پیشوند ایندکس دیگر و شرط‌هایی که
+ستون را داخل تابع می‌برند (__date، __iexact و ...) جداگانه گزارش می‌شوند.
+
+explain_report طرح اجرای نمونه هر شکل را پیش و پس از ساخت ایندکس‌های پیشنهادی (در یک
+تراکنش rollback‌شده) برمی‌گرداند و write_migration از پیشنهادها migration می‌سازد.
+فرمان advise_indexes این مراحل را روی دیتابیس محلی (SQLite یا PostgreSQL) اجرا می‌کند.
+"""
+
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.apps import apps
+from django.db import connections, models, transaction
+from django.db.backends.utils import names_digest
+
+from .query_budget import QueryRecorder, fingerprint
+
+logger = logging.getLogger(__name__)
+
+# سهم نمونه‌هایی که باید یک مقدار ثابت داشته باشند تا ستون boolean به شرط partial تبدیل شود
+PARTIAL_MIN_SHARE = 0.9
+
+_TABLE_RE = re.compile(r'^\s*(?:SELECT\b.*?\bFROM|UPDATE|DELETE FROM)\s+"(\w+)"', re.IGNORECASE | re.DOTALL)
+_WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)', re.DOTALL)
+_ORDER_RE = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)', re.DOTALL)
+_PREDICATE_RE = re.compile(
+    r'"(\w+)"\."(\w+)"\s*(=|<=|>=|<>|!=|<|>|\bIN\b|\bIS NOT NULL\b|\bIS NULL\b|\bBETWEEN\b|\bLIKE\b)',
+    re.IGNORECASE,
+)
+# فیلتر boolean در Django به شکل "t"."c" یا NOT "t"."c" (بدون عملگر) نوشته می‌شود
+_BARE_BOOLEAN_RE = re.compile(r'(NOT\s+)?"(\w+)"\."(\w+)"(?=\s*(?:\)|\bAND\b|\bOR\b|$))', re.IGNORECASE)
+_WRAPPED_RE = re.compile(r'\w+\(\s*"(\w+)"\."(\w+)"')
+_ORDER_COLUMN_RE = re.compile(r'"(\w+)"\."(\w+)"(\s+DESC)?', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"\s*('(?:[^']|'')*'|-?\d+(?:\.\d+)?|true|false|%s)", re.IGNORECASE)
+_PG_ENTRY_RE = re.compile(r'(?:duration: ([\d.]+) ms\s+)?(?:statement|execute [^:]*): (.*)$')
+_PG_PARAMS_RE = re.compile(r'DETAIL:\s+parameters: (.*)$')
+_PG_PARAM_RE = re.compile(r"\$(\d+) = ('(?:[^']|'')*'|NULL)")
+
+_EQUALITY_OPS = {'=', 'IN', 'IS NULL'}
+_RANGE_OPS = {'<', '>', '<=', '>=', 'BETWEEN', 'LIKE'}
+
+
+@dataclass
+class QueryShape:
+    """شکل یک کوئری (بدون مقادیر) و آمار اجراهای آن"""
+    table: str
+    equality: Tuple[str, ...] = ()
+    ranges: Tuple[str, ...] = ()
+    order: Tuple[Tuple[str, bool], ...] = ()
+    disjunctive: bool = False
+    wrapped: Tuple[str, ...] = ()
+    calls: int = 0
+    seconds: float = 0.0
+    values: Dict[str, Counter] = field(default_factory=dict)
+    sample: Tuple[str, Optional[tuple]] = ('', None)
+
+    @property
+    def db_ms(self) -> float:
+        return self.seconds * 1000
+
+
+def _literal_value(text: str):
+    text = text.strip()
+    if text.startswith("'"):
+        return text[1:-1].replace("''", "'")
+    if text.lower() in ('true', 'false'):
+        return text.lower() == 'true'
+    try:
+        return float(text) if '.' in text else int(text)
+    except ValueError:
+        return text
+
+
+def parse_shape(sql: str, params=None) -> Optional[QueryShape]:
+    """شکل کوئری روی جدول اصلی آن؛ None برای کوئری‌هایی که شرط یا مرتب‌سازی ندارند"""
+    match = _TABLE_RE.match(sql)
+    if not match:
+        return None
+    table = match.group(1)
+    where_match = _WHERE_RE.search(sql)
+    where = where_match.group(1) if where_match else ''
+    order_match = _ORDER_RE.search(sql)
+
+    equality, ranges, values = [], [], {}
+    for predicate in _PREDICATE_RE.finditer(where):
+        predicate_table, column, op = predicate.group(1), predicate.group(2), predicate.group(3).upper()
+        if predicate_table != table:
+            continue
+        if op in _EQUALITY_OPS:
+            if column not in equality:
+                equality.append(column)
+            if op == '=':
+                literal = _LITERAL_RE.match(where, predicate.end())
+                if literal and literal.group(1) == '%s':
+                    position = sql[:where_match.start(1) + predicate.end()].count('%s')
+                    if params is not None and position < len(params):
+                        values[column] = params[position]
+                elif literal:
+                    values[column] = _literal_value(literal.group(1))
+            elif op == 'IS NULL':
+                values[column] = None
+        elif op in _RANGE_OPS and column not in ranges:
+            ranges.append(column)
+    for predicate in _BARE_BOOLEAN_RE.finditer(where):
+        if predicate.group(2) == table and predicate.group(3) not in equality:
+            equality.append(predicate.group(3))
+            values[predicate.group(3)] = not predicate.group(1)
+
+    order = []
+    if order_match:
+        for column in _ORDER_COLUMN_RE.finditer(order_match.group(1)):
+            if column.group(1) == table:
+                order.append((column.group(2), bool(column.group(3))))
+
+    wrapped = tuple(dict.fromkeys(
+        column for wrapped_table, column in _WRAPPED_RE.findall(where) if wrapped_table == table
+    ))
+    if not (equality or ranges or order or wrapped):
+        return None
+    return QueryShape(
+        table=table,
+        equality=tuple(equality),
+        ranges=tuple(column for column in ranges if column not in equality),
+        order=tuple(order),
+        disjunctive=bool(re.search(r'\bOR\b', where)),
+        wrapped=wrapped,
+        values={column: Counter([value]) for column, value in values.items() if _hashable(value)},
+        sample=(sql, tuple(params) if params is not None else None),
+    )
+
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class _CollectingRecorder(QueryRecorder):
+    """QueryRecorder که هر کوئری را با پارامترهایش به ShapeCollector هم می‌دهد"""
+
+    def __init__(self, collector: 'ShapeCollector', label: str = ''):
+        super().__init__(label)
+        self.collector = collector
+
+    def __call__(self, execute, sql, params, many, context):
+        before = self.stats.db_seconds
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            if not many:
+                self.collector.add(sql, params, self.stats.db_seconds - before)
+
+
+class ShapeCollector:
+    """تجمیع شکل کوئری‌ها بر اساس اثر انگشت"""
+
+    def __init__(self):
+        self.shapes: Dict[str, QueryShape] = {}
+
+    def add(self, sql: str, params=None, seconds: float = 0.0) -> None:
+        shape = parse_shape(sql, params)
+        if shape is None:
+            return
+        key = fingerprint(sql)
+        existing = self.shapes.get(key)
+        if existing is None:
+            existing = self.shapes[key] = shape
+        else:
+            for column, counter in shape.values.items():
+                existing.values.setdefault(column, Counter()).update(counter)
+        existing.calls += 1
+        existing.seconds += seconds
+
+    def record(self, label: str = 'index_advisor') -> QueryRecorder:
+        """with collector.record(): ... کوئری‌های بلوک را (با پارامترها) جمع می‌کند"""
+        return _CollectingRecorder(self, label)
+
+    def read_postgres_log(self, lines: Iterable[str]) -> int:
+        """خواندن statementها از لاگ پستگرس؛ پارامترهای DETAIL در SQL جایگذاری می‌شوند"""
+        entries: List[List] = []
+        for line in lines:
+            line = line.rstrip('\n')
+            params = _PG_PARAMS_RE.search(line)
+            if params and entries:
+                substitutions = {int(n): value for n, value in _PG_PARAM_RE.findall(params.group(1))}
+                entries[-1][0] = re.sub(
+                    r'\$(\d+)\b', lambda m: substitutions.get(int(m.group(1)), m.group(0)), entries[-1][0]
+                )
+                continue
+            entry = _PG_ENTRY_RE.search(line)
+            if entry and ('LOG:' in line or line.startswith(('statement', 'duration'))):
+                entries.append([entry.group(2), float(entry.group(1) or 0) / 1000])
+            elif entries and line[:1] in ('\t', ' '):
+                entries[-1][0] += ' ' + line.strip()
+        for sql, seconds in entries:
+            self.add(sql, None, seconds)
+        return len(entries)
+
+
+@dataclass
+class IndexProposal:
+    """یک ایندکس پیشنهادی و شکل‌هایی که آن را لازم کرده‌اند"""
+    model: type
+    fields: List[str]
+    condition: Optional[models.Q] = None
+    calls: int = 0
+    seconds: float = 0.0
+    shapes: List[QueryShape] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        table = self.model._meta.db_table
+        first = self.fields[0].lstrip('-')
+        digest = names_digest(table, *self.fields, str(self.condition or ''), length=6)
+        return f"{table[len(self.model._meta.app_label) + 1:][:11]}_{first[:7]}_{digest}_idx"
+
+    @property
+    def index(self) -> models.Index:
+        return models.Index(fields=self.fields, condition=self.condition, name=self.name)
+
+    def describe(self) -> str:
+        condition = f" WHERE {dict(self.condition.children)}" if self.condition else ''
+        return (f"{self.model.__name__}({', '.join(self.fields)}){condition}  "
+                f"calls={self.calls} db={self.seconds * 1000:.1f}ms name={self.name}")
+
+
+class IndexAdvisor:
+    """مقایسه شکل کوئری‌ها با ایندکس‌های موجود و پیشنهاد ایندکس‌های ترکیبی/partial"""
+
+    def __init__(self, collector: ShapeCollector, app_labels=('store_analysis',), using: str = 'default'):
+        self.collector = collector
+        self.app_labels = set(app_labels)
+        self.connection = connections[using]
+        self.models = {
+            model._meta.db_table: model for model in apps.get_models()
+            if model._meta.app_label in self.app_labels and model._meta.managed
+        }
+        self._existing: Dict[str, Dict[str, dict]] = {}
+
+    def existing_indexes(self, table: str) -> Dict[str, dict]:
+        if table not in self._existing:
+            with self.connection.cursor() as cursor:
+                constraints = self.connection.introspection.get_constraints(cursor, table)
+            self._existing[table] = {
+                name: info for name, info in constraints.items()
+                if (info.get('index') or info.get('primary_key') or info.get('unique')) and info.get('columns')
+            }
+        return self._existing[table]
+
+    def _unique(self, table: str, column: str) -> bool:
+        return any(
+            (info.get('unique') or info.get('primary_key')) and info['columns'] == [column]
+            for info in self.existing_indexes(table).values()
+        )
+
+    def _covered(self, table: str, equality: List[str], tail: List[str]) -> bool:
+        """ایندکسی که ستون‌های برابری (به هر ترتیب) و بعد tail را پیشوند خود دارد"""
+        for info in self.existing_indexes(table).values():
+            columns = info['columns']
+            if len(columns) < len(equality) + len(tail):
+                continue
+            if set(columns[:len(equality)]) == set(equality) and columns[len(equality):len(equality) + len(tail)] == tail:
+                return True
+        return False
+
+    def _candidates(self, shape: QueryShape, model) -> List[Tuple[List[str], Optional[models.Q], set]]:
+        """(ستون‌ها، شرط partial، ستون‌های نزولی) برای ایندکس‌هایی که این شکل لازم دارد"""
+        by_column = {f.column: f for f in model._meta.concrete_fields}
+        if any(column not in by_column for column in shape.equality + shape.ranges):
+            # ستون خارج از مدل (schema قدیمی)؛ ایندکس روی آن از طریق migration قابل تعریف نیست
+            return []
+        if shape.disjunctive:
+            # شرط‌های OR با ایندکس‌های تک‌ستونی (bitmap/multi-index OR) پوشش داده می‌شوند
+            return [([column], None, set()) for column in shape.equality + shape.ranges]
+
+        equality = list(shape.equality)
+        condition = None
+        if self.connection.features.supports_partial_indexes and (len(equality) > 1 or shape.ranges or shape.order):
+            for column in equality:
+                counter = shape.values.get(column)
+                if not counter or not isinstance(by_column[column], models.BooleanField):
+                    continue
+                value, hits = counter.most_common(1)[0]
+                if value is not None and hits / sum(counter.values()) >= PARTIAL_MIN_SHARE:
+                    equality.remove(column)
+                    condition = models.Q(**{by_column[column].name: bool(value)})
+                    break
+
+        # کلید اصلی در انتهای ORDER BY فقط tie-breaker است
+        order = [(column, desc) for column, desc in shape.order
+                 if column in by_column and column not in equality and column != model._meta.pk.column]
+        if order:
+            tail = order
+        elif shape.ranges:
+            tail = [(shape.ranges[0], False)]
+        else:
+            tail = []
+        columns = [*equality, *(column for column, _ in tail)]
+        if not columns:
+            return []
+        return [(columns, condition, {column for column, desc in tail if desc})]
+
+    def proposals(self, min_calls: int = 1) -> List[IndexProposal]:
+        merged: Dict[Tuple, IndexProposal] = {}
+        for shape in self.collector.shapes.values():
+            model = self.models.get(shape.table)
+            if model is None or shape.calls < min_calls:
+                continue
+            by_column = {f.column: f for f in model._meta.concrete_fields}
+            if not shape.disjunctive and any(self._unique(shape.table, column) for column in shape.equality):
+                # برابری روی ستون unique حداکثر یک ردیف برمی‌گرداند
+                continue
+            for columns, condition, descending in self._candidates(shape, model):
+                if columns == [model._meta.pk.column]:
+                    continue
+                split = 0
+                while split < len(columns) and columns[split] in shape.equality:
+                    split += 1
+                if self._covered(shape.table, columns[:split], columns[split:]):
+                    continue
+                fields = [('-' if column in descending else '') + by_column[column].name for column in columns]
+                # B-tree در هر دو جهت پیمایش می‌شود؛ جهت یکسان همه ستون‌ها ایندکس جدیدی لازم ندارد
+                key = (model, tuple(columns), str(condition), len(descending) not in (0, len(columns) - split))
+                proposal = merged.setdefault(key, IndexProposal(model=model, fields=fields, condition=condition))
+                proposal.calls += shape.calls
+                proposal.seconds += shape.seconds
+                proposal.shapes.append(shape)
+
+        # پیشنهادی که پیشوند پیشنهاد دیگری (با همان شرط) است لازم نیست
+        result = list(merged.values())
+        for proposal in list(result):
+            plain = [f.lstrip('-') for f in proposal.fields]
+            for other in result:
+                other_plain = [f.lstrip('-') for f in other.fields]
+                if (other is not proposal and other.model is proposal.model and str(other.condition) == str(proposal.condition)
+                        and len(other_plain) > len(plain) and other_plain[:len(plain)] == plain):
+                    other.calls += proposal.calls
+                    other.seconds += proposal.seconds
+                    other.shapes.extend(proposal.shapes)
+                    result.remove(proposal)
+                    break
+        return sorted(result, key=lambda p: (p.seconds, p.calls), reverse=True)
+
+    def redundant_indexes(self) -> List[Tuple[str, str, str]]:
+        """(جدول، ایندکس، ایندکس پوشش‌دهنده) برای ایندکس‌های غیر unique تکراری یا پیشوند ایندکس دیگر"""
+        found = []
+        for table in sorted(self.models):
+            existing = self.existing_indexes(table)
+            for name, info in sorted(existing.items()):
+                if info.get('primary_key') or info.get('unique'):
+                    continue
+                for other_name, other in sorted(existing.items()):
+                    if other_name == name:
+                        continue
+                    columns, other_columns = info['columns'], other['columns']
+                    same = columns == other_columns and (other.get('unique') or other.get('primary_key') or other_name < name)
+                    prefix = len(other_columns) > len(columns) and other_columns[:len(columns)] == columns
+                    if same or prefix:
+                        found.append((table, name, other_name))
+                        break
+        return found
+
+    def wrapped_predicates(self) -> List[Tuple[str, str, int]]:
+        """(جدول، ستون، تعداد اجرا) برای شرط‌هایی که ستون را داخل تابع می‌برند و ایندکس ساده را بی‌اثر می‌کنند"""
+        counter = Counter()
+        for shape in self.collector.shapes.values():
+            if shape.table in self.models:
+                for column in shape.wrapped:
+                    counter[(shape.table, column)] += shape.calls
+        return [(table, column, calls) for (table, column), calls in counter.most_common()]
+
+    def explain(self, sql: str, params=None, analyze: bool = False) -> str:
+        vendor = self.connection.vendor
+        if vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        elif vendor == 'postgresql':
+            prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+        else:
+            prefix = 'EXPLAIN '
+        with self.connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        return '\n'.join(str(row[-1]) if vendor == 'sqlite' else ' '.join(str(v) for v in row) for row in rows)
+
+    def explain_report(self, proposals: List[IndexProposal], analyze: bool = False) -> List[Dict[str, str]]:
+        """طرح اجرای نمونه هر شکل پیش و پس از ساخت ایندکس‌ها؛ ایندکس‌ها در پایان rollback می‌شوند"""
+        samples = [(proposal, shape.sample) for proposal in proposals for shape in proposal.shapes]
+        report = []
+        with transaction.atomic(using=self.connection.alias):
+            for proposal, (sql, params) in samples:
+                report.append({'index': proposal.name, 'sql': sql, 'before': self.explain(sql, params, analyze)})
+            editor = self.connection.schema_editor(collect_sql=True)
+            with self.connection.cursor() as cursor:
+                for proposal in proposals:
+                    cursor.execute(str(proposal.index.create_sql(proposal.model, editor)))
+                if self.connection.vendor == 'postgresql':
+                    for table in {proposal.model._meta.db_table for proposal in proposals}:
+                        cursor.execute(f"ANALYZE {self.connection.ops.quote_name(table)}")
+            for row, (proposal, (sql, params)) in zip(report, samples):
+                row['after'] = self.explain(sql, params, analyze)
+            transaction.set_rollback(True, using=self.connection.alias)
+        return report
+
+
+def write_migration(proposals: List[IndexProposal], app_label: str = 'store_analysis', name: str = 'index_advisor') -> str:
+    """ساخت فایل migration با AddIndex برای پیشنهادها؛ مسیر فایل را برمی‌گرداند"""
+    from django.db import migrations
+    from django.db.migrations.loader import MigrationLoader
+    from django.db.migrations.writer import MigrationWriter
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    leaves = loader.graph.leaf_nodes(app_label)
+    number = max((int(leaf[1].split('_')[0]) for leaf in leaves if leaf[1][:4].isdigit()), default=0) + 1
+
+    migration = migrations.Migration(f"{number:04d}_{name}", app_label)
+    migration.dependencies = leaves
+    migration.operations = [
+        migrations.AddIndex(model_name=proposal.model._meta.model_name, index=proposal.index)
+        for proposal in proposals if proposal.model._meta.app_label == app_label
+    ]
+    writer = MigrationWriter(migration)
+    with open(writer.path, 'w', encoding='utf-8') as handle:
+        handle.write(writer.as_string())
+    logger.info("Index migration written: %s (%d indexes)", os.path.basename(writer.path), len(migration.operations))
+    return writer.path
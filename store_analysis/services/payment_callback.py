@@ -0,0 +1,129 @@
+"""
+پردازش یکتای callbackهای پرداخت
+
+درگاه‌ها callback را چند بار ارسال می‌کنند (retry شبکه، refresh کاربر). هر callback
+با کلید (gateway, reference, status) شناسایی می‌شود:
+- callback تکراری فقط با یک SELECT روی ایندکس یکتای idempotency_key پاسخ ذخیره‌شده را
+  برمی‌گرداند و verify درگاه دوباره صدا زده نمی‌شود؛
+- callback جدید پس از verify، در یک تراکنش با قفل ردیف پرداخت اعمال و رسید آن ثبت
+  می‌شود؛ نوشتن PaymentLogها پس از commit و خارج از مسیر پاسخ انجام می‌شود.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import IntegrityError, connections, transaction
+
+from ..models import Payment, PaymentCallbackReceipt, PaymentLog
+
+logger = logging.getLogger(__name__)
+
+# پاسخ‌هایی با این وضعیت ثبت نمی‌شوند تا retry درگاه دوباره پردازش شود
+RETRYABLE_STATUSES = ('error',)
+
+
+class PaymentCallbackProcessor:
+    """پردازشگر مشترک callbackها برای همه درگاه‌ها"""
+
+    @staticmethod
+    def idempotency_key(gateway: str, reference: Any, status: Any) -> str:
+        basis = f"{gateway}:{reference}:{status}"
+        return hashlib.sha256(basis.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def replay(cls, key: str) -> Optional[Dict[str, Any]]:
+        """پاسخ ثبت‌شده callback قبلی (یک خواندن ایندکس‌شده) یا None"""
+        return PaymentCallbackReceipt.objects.filter(
+            idempotency_key=key
+        ).values_list('response', flat=True).first()
+
+    @classmethod
+    def process(
+        cls,
+        gateway: str,
+        reference: Any,
+        status: Any,
+        payment_lookup: Dict[str, Any],
+        verify: Callable[[], Dict[str, Any]],
+        apply: Callable[[Optional[Payment], Dict[str, Any]], Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        اجرای callback و برگرداندن (response, duplicate).
+        apply(payment, verification) با ردیف قفل‌شده پرداخت صدا زده می‌شود و باید فقط با
+        update_fields بنویسد؛ (response, logs) برمی‌گرداند که logs پس از commit ذخیره می‌شوند.
+        """
+        key = cls.idempotency_key(gateway, reference, status)
+        recorded = cls.replay(key)
+        if recorded is not None:
+            logger.info(f"Duplicate {gateway} callback for {reference} ({status}) - replaying stored response")
+            return recorded, True
+
+        # verify درگاه (درخواست شبکه) خارج از تراکنش انجام می‌شود تا قفل طولانی نشود
+        verification = verify()
+
+        try:
+            with transaction.atomic():
+                payment = Payment.objects.select_for_update().filter(**payment_lookup).first()
+                # callback هم‌زمان دیگری ممکن است تا گرفتن قفل همین کار را انجام داده باشد
+                recorded = cls.replay(key)
+                if recorded is not None:
+                    return recorded, True
+
+                response, logs = apply(payment, verification)
+                if response.get('status') not in RETRYABLE_STATUSES:
+                    PaymentCallbackReceipt.objects.create(
+                        idempotency_key=key,
+                        gateway=gateway,
+                        reference=str(reference)[:100],
+                        status=str(status)[:20],
+                        payment=payment,
+                        response=response,
+                    )
+                if logs:
+                    transaction.on_commit(lambda: cls.write_logs_async(logs))
+        except IntegrityError:
+            # رسید هم‌زمان توسط callback دیگری ثبت شد (درگاه بدون ردیف پرداخت قابل قفل)
+            recorded = cls.replay(key)
+            if recorded is None:
+                raise
+            return recorded, True
+
+        return response, False
+
+    @classmethod
+    def record(cls, gateway: str, reference: Any, status: Any, response: Dict[str, Any],
+               payment: Optional[Payment] = None) -> None:
+        """ثبت رسید برای مسیرهایی که خودشان callback را پردازش می‌کنند (مثل PayPing)"""
+        try:
+            PaymentCallbackReceipt.objects.get_or_create(
+                idempotency_key=cls.idempotency_key(gateway, reference, status),
+                defaults={
+                    'gateway': gateway,
+                    'reference': str(reference)[:100],
+                    'status': str(status)[:20],
+                    'payment': payment,
+                    'response': response,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Could not record {gateway} callback receipt for {reference}: {e}")
+
+    @staticmethod
+    def write_logs(logs: List[Dict[str, Any]]) -> None:
+        try:
+            PaymentLog.objects.bulk_create([PaymentLog(**entry) for entry in logs])
+        except Exception as e:
+            logger.warning(f"Could not create PaymentLog: {e}")
+
+    @classmethod
+    def write_logs_async(cls, logs: List[Dict[str, Any]]) -> None:
+        """ذخیره PaymentLogها در thread پس‌زمینه تا پاسخ به درگاه معطل نشود"""
+        def worker():
+            try:
+                cls.write_logs(logs)
+            finally:
+                connections.close_all()
+
+        threading.Thread(target=worker, daemon=True).start()
@@ -0,0 +1,132 @@
+"""
+تاریخچه صفحه‌بندی‌شده پرداخت‌ها، لاگ‌ها و اشتراک‌های کاربر
+
+صفحه‌بندی cursor-based (keyset) روی (created_at, id) نزولی است؛ برخلاف OFFSET هزینه
+هر صفحه به تعداد کل ردیف‌های کاربر بستگی ندارد و از ایندکس (user, -created_at)
+استفاده می‌کند. فقط ستون‌های نمایشی خوانده می‌شوند (بدون JSONهای درگاه) و خلاصه
+پرداخت‌های هر کاربر با TTL کوتاه cache می‌شود و با تغییر پرداخت باطل می‌شود.
+"""
+
+import base64
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+
+from ..models import Payment, PaymentLog, UserSubscription
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_FIELDS = (
+    'id', 'order_id', 'amount', 'currency', 'status', 'payment_method',
+    'created_at', 'completed_at',
+)
+LOG_FIELDS = ('id', 'log_type', 'message', 'created_at')
+SUBSCRIPTION_FIELDS = (
+    'id', 'package__name', 'start_date', 'end_date', 'is_active',
+    'analyses_used', 'max_analyses', 'created_at',
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class PaymentHistory:
+    """صفحه‌بندی keyset و خلاصه cache‌شده پرداخت‌های کاربر"""
+
+    SUMMARY_CACHE_KEY = 'payment_summary:{user_id}'
+    MAX_PAGE_SIZE = 100
+
+    # ---- cursor ----
+
+    @staticmethod
+    def encode_cursor(created_at: datetime, pk: int) -> str:
+        raw = f"{created_at.isoformat()}|{pk}".encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, pk = base64.urlsafe_b64decode(padded).decode('utf-8').rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise InvalidCursor(f"cursor نامعتبر: {cursor}") from e
+
+    @classmethod
+    def page_size(cls, limit: Any = None) -> int:
+        default = getattr(settings, 'PAYMENT_HISTORY_PAGE_SIZE', 20)
+        try:
+            size = int(limit) if limit else default
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, cls.MAX_PAGE_SIZE))
+
+    @classmethod
+    def paginate(
+        cls,
+        queryset,
+        fields: Iterable[str],
+        cursor: Optional[str] = None,
+        limit: Any = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """یک صفحه (ردیف‌ها به صورت dict) و cursor صفحه بعد یا None"""
+        size = cls.page_size(limit)
+        queryset = queryset.order_by('-created_at', '-id')
+        if cursor:
+            created_at, pk = cls.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        rows = list(queryset.values(*fields)[:size + 1])
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = cls.encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    # ---- صفحه‌ها ----
+
+    @classmethod
+    def payments(cls, user, cursor=None, limit=None):
+        return cls.paginate(Payment.objects.filter(user=user), PAYMENT_FIELDS, cursor, limit)
+
+    @classmethod
+    def logs(cls, payment_id: int, cursor=None, limit=None):
+        """timeline لاگ‌های پرداخت بدون ستون data"""
+        return cls.paginate(PaymentLog.objects.filter(payment_id=payment_id), LOG_FIELDS, cursor, limit)
+
+    @classmethod
+    def subscriptions(cls, user, cursor=None, limit=None):
+        return cls.paginate(UserSubscription.objects.filter(user=user), SUBSCRIPTION_FIELDS, cursor, limit)
+
+    # ---- خلاصه cache‌شده ----
+
+    @classmethod
+    def summary(cls, user_id: int) -> Dict[str, Any]:
+        key = cls.SUMMARY_CACHE_KEY.format(user_id=user_id)
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        data = Payment.objects.filter(user_id=user_id).aggregate(
+            total_count=Count('id'),
+            completed_count=Count('id', filter=Q(status='completed')),
+            pending_count=Count('id', filter=Q(status__in=['pending', 'processing'])),
+            total_paid=Sum('amount', filter=Q(status='completed')),
+            last_payment_at=Max('created_at'),
+        )
+        data['total_paid'] = data['total_paid'] or 0
+        cache.set(key, data, getattr(settings, 'PAYMENT_SUMMARY_CACHE_TTL', 60))
+        return data
+
+    @classmethod
+    def invalidate(cls, *user_ids: int) -> None:
+        try:
+            cache.delete_many([cls.SUMMARY_CACHE_KEY.format(user_id=user_id) for user_id in set(user_ids) if user_id])
+        except Exception as e:
+            logger.warning(f"Could not invalidate payment summary cache: {e}")
@@ -0,0 +1,251 @@
+"""
+تولید PDF گزارش‌ها در process pool جداگانه
+
+ساخت سند reportlab (شکل‌دهی متن فارسی با arabic_reshaper/bidi و نگه‌داری کل سند)
+داخل worker وب انجام می‌شد؛ دانلودهای هم‌زمان حافظه worker را بالا می‌برد و worker
+sync چند ثانیه مشغول می‌ماند. اکنون هر PDF در پروسس جداگانه با سقف حافظه (RLIMIT_AS)
+و مهلت زمانی ساخته می‌شود و مستقیم در فایل نوشته می‌شود؛ view فایل آماده را با
+FileResponse به‌صورت stream برمی‌گرداند و برای گزارش‌های طولانی وضعیت job را گزارش می‌دهد.
+
+نام فایل خروجی از (نوع گزارش، شناسه تحلیل، updated_at، hash نتایج) ساخته می‌شود؛ پس گزارش یک تحلیل
+تا تغییر نتایج فقط یک بار ساخته می‌شود و بین workerهای وب (از طریق دیسک) مشترک است.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import resource
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# نوع گزارش -> تابع(های) تولید در views (به ترتیب تلاش)
+RENDERERS = {
+    'premium': ('generate_premium_pdf_from_premium_report',),
+    'professional': ('generate_professional_persian_pdf_report', 'generate_professional_persian_pdf_report_fixed'),
+}
+MIN_PDF_BYTES = 100
+
+
+class PdfJobError(RuntimeError):
+    pass
+
+
+class PdfJobTimeout(PdfJobError):
+    pass
+
+
+@dataclass
+class PdfJob:
+    key: str
+    path: str
+    status: str  # ready / queued / running / failed / missing
+    error: str = ''
+
+    @property
+    def ready(self) -> bool:
+        return self.status == 'ready'
+
+
+# ---- داخل پروسس‌های pool ----
+
+def _init_worker(memory_mb: int) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chidmano.settings')
+    import django
+    django.setup()
+    if memory_mb:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = memory_mb * MB
+        resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+    # import سنگین views، ثبت فونت و شکل‌دهی رشته‌های ثابت یک بار برای هر پروسس pool
+    from .. import views  # noqa: F401
+    from ..utils.pdf_fonts import preload_persian_font
+    from ..utils.persian_shaping import PersianShaper
+    preload_persian_font()
+    PersianShaper.warm_from_file()
+
+
+def _on_timeout(signum, frame):
+    raise PdfJobTimeout('مهلت تولید PDF تمام شد')
+
+
+def _render(kind: str, analysis, path: str, timeout: int) -> Dict[str, Any]:
+    """ساخت PDF در فایل موقت و جایگزینی اتمیک؛ تحلیل به‌صورت pickle‌شده می‌آید (بدون کوئری)"""
+    from .. import views
+
+    start = time.perf_counter()
+    tmp_path = f"{path}.{os.getpid()}.part"
+    previous = signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        size = None
+        for name in RENDERERS[kind]:
+            args = (analysis, (analysis.results or {}).get('premium_report')) if kind == 'premium' else (analysis,)
+            with open(tmp_path, 'wb') as output:
+                size = getattr(views, name)(*args, output=output)
+            if size and size >= MIN_PDF_BYTES:
+                break
+        if not size or size < MIN_PDF_BYTES:
+            raise PdfJobError(f"PDF {kind} برای تحلیل {analysis.pk} تولید نشد")
+        os.replace(tmp_path, path)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {
+        'size': size,
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    }
+
+
+# ---- سمت worker وب ----
+
+class PdfRenderPool:
+    """process pool تولید PDF (یکی برای هر پروسس وب، با ساخت تنبل پس از fork)"""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _jobs: Dict[str, Future] = {}
+    _errors: Dict[str, str] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def artifact_dir() -> str:
+        directory = getattr(settings, 'PDF_ARTIFACT_DIR', '') or os.path.join(settings.MEDIA_ROOT, 'pdf_reports')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @staticmethod
+    def artifact_key(kind: str, analysis) -> str:
+        # فقط مقادیر ذخیره‌شده (pk و hash نتایج): ذخیره‌های update_fields=['results'] مقدار updated_at را
+        # نمی‌نویسند و updated_at نمونه حافظه ممکن است با ردیف تازه pdf_report_status فرق کند
+        digest = hashlib.sha1(json.dumps(analysis.results or {}, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+        return f"{kind}-{analysis.pk}-{digest}"
+
+    @classmethod
+    def artifact_path(cls, key: str) -> str:
+        return os.path.join(cls.artifact_dir(), f"{key}.pdf")
+
+    @classmethod
+    def executor(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'PDF_POOL_WORKERS', 2),
+                    # spawn: fork از worker چند-threadی (gthread) امن نیست
+                    mp_context=get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(getattr(settings, 'PDF_JOB_MEMORY_MB', 1024),),
+                    max_tasks_per_child=getattr(settings, 'PDF_POOL_MAX_TASKS_PER_CHILD', 50),
+                )
+                cls.purge_expired()
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls, wait: bool = True) -> None:
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+            cls._jobs.clear()
+            cls._errors.clear()
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    @classmethod
+    def status(cls, key: str) -> PdfJob:
+        path = cls.artifact_path(key)
+        if os.path.exists(path):
+            return PdfJob(key, path, 'ready')
+        future = cls._jobs.get(key)
+        if future is not None:
+            if not future.done():
+                return PdfJob(key, path, 'running' if future.running() else 'queued')
+            if not future.cancelled() and future.exception() is not None:
+                error = future.exception()
+                return PdfJob(key, path, 'failed', f"{type(error).__name__}: {error}")
+        if key in cls._errors:
+            return PdfJob(key, path, 'failed', cls._errors[key])
+        return PdfJob(key, path, 'missing')
+
+    @classmethod
+    def submit(cls, kind: str, analysis) -> PdfJob:
+        """ثبت job (در صورت نبود فایل آماده یا job جاری) و برگرداندن وضعیت آن"""
+        if kind not in RENDERERS:
+            raise ValueError(f"نوع گزارش PDF نامعتبر: {kind}")
+        key = cls.artifact_key(kind, analysis)
+        job = cls.status(key)
+        if job.status in ('ready', 'queued', 'running'):
+            return job
+
+        timeout = getattr(settings, 'PDF_JOB_TIMEOUT', 120)
+        try:
+            future = cls.executor().submit(_render, kind, analysis, job.path, timeout)
+        except BrokenProcessPool:
+            # پروسسی از pool (مثلاً با kill شدن توسط OOM) از بین رفته؛ pool از نو ساخته می‌شود
+            logger.warning("⚠️ PDF pool broken; recreating")
+            cls.shutdown(wait=False)
+            future = cls.executor().submit(_render, kind, analysis, job.path, timeout)
+
+        with cls._lock:
+            cls._jobs[key] = future
+            cls._errors.pop(key, None)
+        future.add_done_callback(lambda f, key=key: cls._finished(key, f))
+        return cls.status(key)
+
+    @classmethod
+    def _finished(cls, key: str, future: Future) -> None:
+        with cls._lock:
+            if cls._jobs.get(key) is future:
+                del cls._jobs[key]
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                cls._errors[key] = f"{type(error).__name__}: {error}"
+                logger.error(f"❌ PDF job {key} failed: {cls._errors[key]}")
+            else:
+                logger.info(f"✅ PDF job {key} done: {future.result()}")
+
+    @classmethod
+    def render(cls, kind: str, analysis, wait: Optional[float] = None) -> PdfJob:
+        """ثبت job و انتظار حداکثر wait ثانیه برای آماده شدن (بدون ساخت سند در این پروسس)"""
+        job = cls.submit(kind, analysis)
+        future = cls._jobs.get(job.key)
+        if future is not None:
+            wait = getattr(settings, 'PDF_SYNC_WAIT_SECONDS', 15) if wait is None else wait
+            try:
+                future.result(timeout=wait)
+            except FutureTimeout:
+                pass
+            except Exception:
+                pass  # خطا در وضعیت job گزارش می‌شود
+        return cls.status(job.key)
+
+    @classmethod
+    def purge_expired(cls, max_age_hours: Optional[float] = None) -> int:
+        """حذف فایل‌های PDF قدیمی‌تر از PDF_ARTIFACT_MAX_AGE_HOURS"""
+        max_age_hours = getattr(settings, 'PDF_ARTIFACT_MAX_AGE_HOURS', 24) if max_age_hours is None else max_age_hours
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        directory = cls.artifact_dir()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
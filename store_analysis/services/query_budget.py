@@ -0,0 +1,252 @@
+"""
+اندازه‌گیری کوئری‌های هر view و task، تشخیص N+1 و بودجه کوئری
+
+QueryRecorder با connection.execute_wrapper (بدون نیاز به DEBUG) برای هر واحد کار تعداد
+کوئری، زمان کل دیتابیس و اثر انگشت هر کوئری (SQL با پارامترها و لیست‌های IN یکسان‌شده) را
+می‌شمارد. اثر انگشتی که در یک درخواست چند بار تکرار شود نشانه N+1 است.
+
+    - QueryInstrumentationMiddleware هر درخواست را با نام view ثبت می‌کند و در DEBUG
+      هدرهای X-DB-Queries / X-DB-Time-Ms / X-DB-Repeats را اضافه می‌کند. پیش‌فرض
+      QUERY_INSTRUMENTATION_ENABLED همان DEBUG است؛ در production فقط با تنظیم صریح فعال شود
+    - taskهای Celery با سیگنال‌های task_prerun/task_postrun با برچسب task:<نام> ثبت می‌شوند
+    - QueryReport آمار پنجره غلتان هر برچسب را در cache نگه می‌دارد (گزارش «کوئری‌ها» در
+      admin_reports)؛ به‌روزرسانی get/set اتمیک نیست و با LocMem فقط پروسس جاری را پوشش می‌دهد
+    - QUERY_BUDGETS سقف کوئری هر برچسب را تعیین می‌کند؛ عبور از آن لاگ هشدار می‌دهد و با
+      QUERY_BUDGET_STRICT خطا می‌شود. تست‌ها با query_budget() بودجه را assert می‌کنند:
+
+        with query_budget('store_analysis:analysis_list'):
+            self.client.get(reverse('store_analysis:analysis_list'))
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT_LIMIT = 10
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+
+
+def fingerprint(sql: str) -> str:
+    """شکل کوئری بدون مقادیر؛ دو کوئری با اثر انگشت یکسان فقط در پارامترها فرق دارند"""
+    sql = _WHITESPACE_RE.sub(' ', sql).strip()
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _STRING_RE.sub('?', sql)
+    return _NUMBER_RE.sub('?', sql)
+
+
+@dataclass
+class QueryStats:
+    label: str = ''
+    count: int = 0
+    db_seconds: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+
+    @property
+    def db_ms(self) -> float:
+        return self.db_seconds * 1000
+
+    @property
+    def max_repeats(self) -> int:
+        """بیشترین تکرار یک کوئری (1 یعنی بدون تکرار)"""
+        return max(self.fingerprints.values(), default=0)
+
+    def repeated(self, limit: int = 3) -> List[Tuple[str, int]]:
+        return [(sql, n) for sql, n in self.fingerprints.most_common(limit) if n > 1]
+
+
+class QueryRecorder:
+    """ثبت کوئری‌های همه اتصال‌های دیتابیس thread جاری در یک بلوک with"""
+
+    def __init__(self, label: str = ''):
+        self.stats = QueryStats(label=label)
+        self._stack: Optional[ExitStack] = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.db_seconds += time.perf_counter() - start
+            self.stats.count += 1
+            self.stats.fingerprints[fingerprint(sql)] += 1
+
+    def __enter__(self) -> QueryStats:
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+        return False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """عبور از بودجه کوئری یک view/task"""
+
+
+def budget_for(label: str) -> Dict[str, int]:
+    """{'queries': سقف کل، 'repeats': سقف تکرار یک کوئری} برای یک برچسب"""
+    budget = dict(getattr(settings, 'QUERY_BUDGETS', {}).get(label) or {})
+    budget.setdefault('repeats', getattr(settings, 'QUERY_REPEAT_LIMIT', DEFAULT_REPEAT_LIMIT))
+    return budget
+
+
+def violations(stats: QueryStats, budget: Dict[str, int]) -> List[str]:
+    problems = []
+    if budget.get('queries') is not None and stats.count > budget['queries']:
+        problems.append(f"{stats.count} queries > budget {budget['queries']}")
+    if budget.get('repeats') and stats.max_repeats > budget['repeats']:
+        sql, n = stats.repeated(1)[0]
+        problems.append(f"query repeated {n}x > {budget['repeats']} (N+1?): {sql[:300]}")
+    return problems
+
+
+def check_budget(stats: QueryStats, budget: Optional[Dict[str, int]] = None) -> List[str]:
+    """لاگ (و در QUERY_BUDGET_STRICT خطای) عبور از بودجه؛ فهرست مشکلات را برمی‌گرداند"""
+    problems = violations(stats, budget if budget is not None else budget_for(stats.label))
+    if problems:
+        logger.warning(
+            "Query budget exceeded for %s: %s", stats.label, '; '.join(problems),
+            extra={'query_label': stats.label, 'queries': stats.count, 'db_ms': round(stats.db_ms, 2)},
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(f"{stats.label}: {'; '.join(problems)}")
+    return problems
+
+
+@contextmanager
+def query_budget(label: str = '', queries: Optional[int] = None, repeats: Optional[int] = None):
+    """assert بودجه کوئری در تست؛ بدون queries/repeats بودجه QUERY_BUDGETS همان برچسب استفاده می‌شود"""
+    budget = budget_for(label)
+    if queries is not None:
+        budget['queries'] = queries
+    if repeats is not None:
+        budget['repeats'] = repeats
+    with QueryRecorder(label) as stats:
+        yield stats
+    problems = violations(stats, budget)
+    if problems:
+        details = '\n'.join(f"  {n}x {sql[:300]}" for sql, n in stats.repeated(5))
+        raise QueryBudgetExceeded(f"{label or 'block'}: {'; '.join(problems)}\n{details}")
+
+
+class QueryReport:
+    """آمار پنجره غلتان کوئری‌ها برای هر برچسب در cache"""
+
+    INDEX_KEY = 'query_report:labels'
+    LABEL_KEY = 'query_report:{}'
+
+    @classmethod
+    def window(cls) -> int:
+        return int(getattr(settings, 'QUERY_REPORT_WINDOW', 200))
+
+    @classmethod
+    def record(cls, stats: QueryStats, problems: Optional[List[str]] = None) -> None:
+        if not stats.label:
+            return
+        ttl = int(getattr(settings, 'QUERY_REPORT_TTL', 86400))
+        key = cls.LABEL_KEY.format(stats.label)
+        entry = cache.get(key) or {'samples': [], 'runs': 0, 'violations': 0, 'repeated': []}
+        entry['samples'] = (entry['samples'] + [(stats.count, round(stats.db_ms, 2), stats.max_repeats)])[-cls.window():]
+        entry['runs'] += 1
+        if problems:
+            entry['violations'] += 1
+        if stats.max_repeats > 1:
+            entry['repeated'] = stats.repeated(3)
+        cache.set(key, entry, ttl)
+        labels = cache.get(cls.INDEX_KEY) or []
+        if stats.label not in labels:
+            cache.set(cls.INDEX_KEY, labels + [stats.label], ttl)
+
+    @classmethod
+    def summary(cls) -> List[Dict[str, object]]:
+        """یک ردیف برای هر برچسب، پرکوئری‌ترین اول"""
+        rows = []
+        for label in cache.get(cls.INDEX_KEY) or []:
+            entry = cache.get(cls.LABEL_KEY.format(label))
+            if not entry or not entry['samples']:
+                continue
+            counts = sorted(sample[0] for sample in entry['samples'])
+            rows.append({
+                'label': label,
+                'runs': entry['runs'],
+                'samples': len(counts),
+                'mean_queries': round(sum(counts) / len(counts), 1),
+                'p95_queries': counts[min(len(counts) - 1, int(len(counts) * 0.95))],
+                'max_queries': counts[-1],
+                'mean_db_ms': round(sum(sample[1] for sample in entry['samples']) / len(counts), 2),
+                'max_repeats': max(sample[2] for sample in entry['samples']),
+                'violations': entry['violations'],
+                'budget': budget_for(label).get('queries'),
+                'repeated': entry['repeated'],
+            })
+        return sorted(rows, key=lambda row: row['p95_queries'], reverse=True)
+
+    @classmethod
+    def clear(cls) -> None:
+        for label in cache.get(cls.INDEX_KEY) or []:
+            cache.delete(cls.LABEL_KEY.format(label))
+        cache.delete(cls.INDEX_KEY)
+
+
+def instrumentation_enabled() -> bool:
+    return bool(getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', settings.DEBUG))
+
+
+def finish(recorder: QueryRecorder) -> List[str]:
+    """ثبت آمار یک واحد کار تمام‌شده در گزارش و بررسی بودجه آن"""
+    problems = violations(recorder.stats, budget_for(recorder.stats.label))
+    QueryReport.record(recorder.stats, problems)
+    return check_budget(recorder.stats) if problems else problems
+
+
+_active_tasks: Dict[str, QueryRecorder] = {}
+_tasks_lock = threading.Lock()
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    if not instrumentation_enabled():
+        return
+    recorder = QueryRecorder(f"task:{getattr(task, 'name', task)}")
+    recorder.__enter__()
+    with _tasks_lock:
+        _active_tasks[task_id] = recorder
+
+
+def _task_postrun(task_id=None, **kwargs):
+    with _tasks_lock:
+        recorder = _active_tasks.pop(task_id, None)
+    if recorder is not None:
+        recorder.__exit__(None, None, None)
+        try:
+            finish(recorder)
+        except QueryBudgetExceeded:
+            # نتیجه task تعیین شده است؛ عبور از بودجه فقط لاگ می‌شود
+            pass
+
+
+def connect_task_signals() -> None:
+    """اتصال ثبت کوئری taskها به سیگنال‌های Celery (اگر Celery نصب باشد)"""
+    try:
+        from celery.signals import task_postrun, task_prerun
+    except ImportError:
+        return
+    task_prerun.connect(_task_prerun, weak=False, dispatch_uid='query_budget_prerun')
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='query_budget_postrun')
@@ -23,12 +23,7 @@ def optimize_store_analysis_queryset(self, queryset, user=None):
             queryset = queryset.filter(user=user)
         
         # Select related fields to avoid N+1 queries
-        queryset = queryset.select_related(
-            'user',
-            'analysis_result'
-        ).prefetch_related(
-            'product_categories'
-        )
+        queryset = queryset.select_related('user')
         
         # Only fetch necessary fields
         queryset = queryset.only(
@@ -89,14 +84,14 @@ def get_analytics_data(self, user=None, date_range=None):
         if date_range:
             base_qs = base_qs.filter(created_at__range=date_range)
         
-        # Get counts efficiently
-        analytics = {
-            'total_analyses': base_qs.count(),
-            'completed_analyses': base_qs.filter(status='completed').count(),
-            'pending_analyses': base_qs.filter(status='pending').count(),
-            'processing_analyses': base_qs.filter(status='processing').count(),
-            'failed_analyses': base_qs.filter(status='failed').count(),
-        }
+        # Get counts efficiently (one aggregate query)
+        analytics = base_qs.aggregate(
+            total_analyses=Count('id'),
+            completed_analyses=Count('id', filter=Q(status='completed')),
+            pending_analyses=Count('id', filter=Q(status='pending')),
+            processing_analyses=Count('id', filter=Q(status='processing')),
+            failed_analyses=Count('id', filter=Q(status='failed')),
+        )
         
         # Get store type distribution
         store_type_stats = base_qs.values('store_type').annotate(
@@ -110,12 +105,12 @@ def get_analytics_data(self, user=None, date_range=None):
         if user:
             payment_qs = payment_qs.filter(user=user)
         
-        analytics['total_payments'] = payment_qs.count()
-        analytics['total_revenue'] = payment_qs.filter(
-            status='completed'
-        ).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
+        payment_stats = payment_qs.aggregate(
+            total=Count('id'),
+            revenue=Sum('amount', filter=Q(status='completed'))
+        )
+        analytics['total_payments'] = payment_stats['total']
+        analytics['total_revenue'] = payment_stats['revenue'] or 0
         
         return analytics
     
@@ -125,8 +120,8 @@ def search_analyses(self, query, user=None, filters=None):
         
         # Build search query
         search_q = Q(store_name__icontains=query) | \
-                   Q(store_location__icontains=query) | \
-                   Q(description__icontains=query)
+                   Q(store_address__icontains=query) | \
+                   Q(additional_info__icontains=query)
         
         queryset = StoreAnalysis.objects.filter(search_q)
         
@@ -152,7 +147,7 @@ def get_user_dashboard_data(self, user):
         # Get recent analyses
         recent_analyses = StoreAnalysis.objects.filter(
             user=user
-        ).select_related('analysis_result').order_by('-created_at')[:5]
+        ).select_related('user').order_by('-created_at')[:5]
         
         # Get recent payments
         recent_payments = Payment.objects.filter(
@@ -169,19 +164,18 @@ def get_user_dashboard_data(self, user):
         }
     
     def monitor_query_performance(self):
-        """Monitor and log query performance."""
-        if hasattr(settings, 'DEBUG') and settings.DEBUG:
-            queries = connection.queries
-            total_time = sum(float(q['time']) for q in queries)
-            
-            logger.info(f"Total queries: {len(queries)}, Total time: {total_time:.3f}s")
-            
-            # Log slow queries
-            slow_queries = [q for q in queries if float(q['time']) > 1.0]
-            if slow_queries:
-                logger.warning(f"Found {len(slow_queries)} slow queries")
-                for q in slow_queries:
-                    logger.warning(f"Slow query: {q['sql'][:100]}... ({q['time']}s)")
+        """Log views/tasks over their query budget (rolling QueryReport, works without DEBUG)."""
+        from .query_budget import QueryReport
+        
+        rows = QueryReport.summary()
+        logger.info(f"Query report: {len(rows)} views/tasks recorded")
+        for row in rows:
+            if row['violations'] or (row['budget'] is not None and row['p95_queries'] > row['budget']):
+                logger.warning(
+                    f"Query budget exceeded: {row['label']} p95={row['p95_queries']} "
+                    f"budget={row['budget']} max_repeats={row['max_repeats']}"
+                )
+        return rows
     
     def clear_query_log(self):
         """Clear the query log."""
@@ -7,6 +7,7 @@
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from ..ai_models.advanced_analyzer import AdvancedStoreAnalyzer, AnalysisType
+from ..utils.progress_bus import FAILED, STAGE_STARTED, ProgressBus, ProgressEvent
 
 logger = logging.getLogger(__name__)
 
@@ -76,33 +77,12 @@ async def start_analysis(self, store_data: Dict, user_id: int, analysis_id: int)
             raise
     
     async def _update_status(self, analysis_id: int, message: str, progress: int):
-        """به‌روزرسانی وضعیت تحلیل"""
-        status_data = {
-            'analysis_id': analysis_id,
-            'message': message,
-            'progress': progress,
-            'timestamp': timezone.now().isoformat()
-        }
-        
-        # ذخیره در cache
-        cache_key = f'analysis_status_{analysis_id}'
-        cache.set(cache_key, status_data, 3600)  # 1 ساعت
-        
-        # ارسال به WebSocket
-        await self._send_status_update(analysis_id, status_data)
-    
-    async def _send_status_update(self, analysis_id: int, status_data: Dict):
-        """ارسال به‌روزرسانی وضعیت به WebSocket"""
-        try:
-            await self.channel_layer.group_send(
-                f'analysis_{analysis_id}',
-                {
-                    'type': 'analysis.status_update',
-                    'data': status_data
-                }
-            )
-        except Exception as e:
-            logger.error(f"Error sending status update: {e}")
+        """به‌روزرسانی وضعیت تحلیل (cache + WebSocket از طریق گذرگاه پیشرفت)"""
+        if progress < 0:
+            event = ProgressEvent(analysis_id=analysis_id, event=FAILED, status='failed', message=message, progress=0)
+        else:
+            event = ProgressEvent(analysis_id=analysis_id, event=STAGE_STARTED, message=message, progress=progress)
+        await ProgressBus.apublish(event)
     
     async def _send_analysis_update(self, analysis_id: int, analysis_type: str, result):
         """ارسال نتیجه تحلیل به WebSocket"""
@@ -148,8 +128,7 @@ async def _send_completion_notification(self, analysis_id: int, user_id: int):
     
     def get_analysis_status(self, analysis_id: int) -> Optional[Dict]:
         """دریافت وضعیت تحلیل از cache"""
-        cache_key = f'analysis_status_{analysis_id}'
-        return cache.get(cache_key)
+        return ProgressBus.latest(analysis_id)
     
     def get_analysis_results(self, analysis_id: int) -> Optional[Dict]:
         """دریافت نتایج تحلیل از cache"""
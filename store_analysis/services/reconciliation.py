@@ -0,0 +1,298 @@
+"""
+jobهای همگام‌سازی دسته‌ای پرداخت‌ها و سفارش‌ها
+
+هر job مجموعه ردیف‌های ناسازگار را با یک کوئری (anti-join با NOT EXISTS) محاسبه
+می‌کند، آن را به ترتیب pk با iterator(chunk_size) استریم می‌کند و هر chunk را در یک
+تراکنش با bulk_create/update می‌نویسد. آخرین pk هر chunk در همان تراکنش در
+ReconciliationCheckpoint ثبت می‌شود تا اجرای قطع‌شده از همان نقطه ادامه یابد؛ پس از
+اجرای کامل چک‌پوینت حذف می‌شود و اجرای شبانه بعدی از ابتدا شروع می‌کند.
+"""
+
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import CharField, Exists, OuterRef, Q, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from ..models import Order, Payment, ReconciliationCheckpoint, SupportTicket
+from .payment_history import PaymentHistory
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReconcileStats:
+    job: str
+    resumed_from: int = 0
+    scanned: int = 0
+    written: int = 0
+    chunks: int = 0
+    last_pk: int = 0
+    elapsed: float = 0.0
+    finished: bool = False
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+
+class ReconciliationJob:
+    """
+    پایه jobها: missing() مجموعه ناسازگار، fields ستون‌های استریم‌شده، select() فیلتر
+    نهایی سمت پایتون (پیش‌فرض همه ردیف‌ها) و apply() نوشتن یک chunk را تعریف می‌کنند.
+    """
+
+    name = ''
+    fields: tuple = ('pk',)
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        dry_run: bool = False,
+        limit: Optional[int] = None,
+        on_chunk: Optional[Callable[[ReconcileStats], None]] = None,
+    ):
+        self.chunk_size = max(1, chunk_size or getattr(settings, 'RECONCILIATION_CHUNK_SIZE', 2000))
+        self.dry_run = dry_run
+        self.limit = limit
+        self.on_chunk = on_chunk
+
+    def missing(self):
+        raise NotImplementedError
+
+    def select(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return rows
+
+    def apply(self, rows: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    # ---- چک‌پوینت ----
+
+    def checkpoint(self) -> int:
+        return ReconciliationCheckpoint.objects.filter(job=self.name).values_list('last_pk', flat=True).first() or 0
+
+    def reset(self) -> None:
+        ReconciliationCheckpoint.objects.filter(job=self.name).delete()
+
+    def _save_checkpoint(self, stats: ReconcileStats) -> None:
+        ReconciliationCheckpoint.objects.update_or_create(
+            job=self.name,
+            defaults={'last_pk': stats.last_pk, 'processed': stats.scanned},
+        )
+
+    # ---- اجرا ----
+
+    def stream(self, after_pk: int = 0):
+        """ردیف‌های ناسازگار با pk بزرگ‌تر از after_pk، به ترتیب pk و بدون ساخت instance"""
+        return (
+            self.missing()
+            .filter(pk__gt=after_pk)
+            .order_by('pk')
+            .values('pk', *self.fields)
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+    def _flush(self, rows: List[Dict[str, Any]], stats: ReconcileStats) -> None:
+        selected = self.select(rows)
+        stats.scanned += len(rows)
+        stats.last_pk = rows[-1]['pk']
+        stats.chunks += 1
+        if self.dry_run:
+            stats.written += len(selected)
+        else:
+            # نوشتن chunk و جلو بردن چک‌پوینت در یک تراکنش: یا هر دو یا هیچ‌کدام
+            with transaction.atomic():
+                if selected:
+                    stats.written += self.apply(selected)
+                self._save_checkpoint(stats)
+        if self.on_chunk:
+            self.on_chunk(stats)
+
+    def run(self, resume: bool = True) -> ReconcileStats:
+        start_pk = self.checkpoint() if resume and not self.dry_run else 0
+        stats = ReconcileStats(job=self.name, resumed_from=start_pk, last_pk=start_pk)
+        start = time.perf_counter()
+
+        buffer: List[Dict[str, Any]] = []
+        stopped = False
+        for row in self.stream(start_pk):
+            buffer.append(row)
+            if len(buffer) >= self.chunk_size:
+                self._flush(buffer, stats)
+                buffer = []
+                if self.limit is not None and stats.scanned >= self.limit:
+                    stopped = True
+                    break
+        if buffer:
+            self._flush(buffer, stats)
+
+        stats.elapsed = time.perf_counter() - start
+        stats.finished = not stopped
+        if stats.finished and not self.dry_run:
+            self.reset()
+        logger.info(
+            f"🔄 {self.name}: {stats.scanned} scanned, {stats.written} written in {stats.chunks} chunks "
+            f"({stats.rows_per_second:.0f} rows/s)"
+        )
+        return stats
+
+
+class OrdersForPaymentsJob(ReconciliationJob):
+    """ساخت Order برای پرداخت‌های completed/processing که سفارش متناظر ندارند"""
+
+    name = 'orders_for_payments'
+    fields = ('order_id', 'user_id', 'status', 'amount', 'currency', 'payment_method')
+
+    def missing(self):
+        return Payment.objects.filter(
+            status__in=['completed', 'processing'],
+        ).exclude(order_id='').filter(
+            ~Exists(Order.objects.filter(order_number=OuterRef('order_id')))
+        )
+
+    def apply(self, rows):
+        orders = []
+        for row in rows:
+            amount = row['amount'] or Decimal('0.00')
+            orders.append(Order(
+                order_number=row['order_id'],
+                user_id=row['user_id'],
+                status='paid' if row['status'] == 'completed' else 'pending',
+                original_amount=amount,
+                base_amount=amount,
+                final_amount=amount,
+                currency=row['currency'] or 'IRR',
+                payment_id=row['pk'],
+                payment_method=row['payment_method'] or 'ping_payment',
+            ))
+        # سفارشی که هم‌زمان توسط callback ساخته شده باشد با unique order_number رد می‌شود
+        Order.objects.bulk_create(orders, ignore_conflicts=True)
+        return len(orders)
+
+
+class TicketsForUnlinkedPaymentsJob(ReconciliationJob):
+    """تیکت پشتیبانی برای پرداخت‌های completed اخیر که Order متناظر ندارند"""
+
+    name = 'tickets_for_unlinked_payments'
+    fields = ('order_id', 'user_id', 'user__email', 'amount', 'currency', 'authority', 'created_at')
+    TICKET_PREFIX = 'TICK-PAY-'
+
+    def __init__(self, days: int = 90, **kwargs):
+        super().__init__(**kwargs)
+        self.days = days
+        self._fallback_user_id = None
+
+    def missing(self):
+        cutoff = timezone.now() - timedelta(days=self.days)
+        ticket_prefix = Concat(
+            Value(self.TICKET_PREFIX), Cast(OuterRef('pk'), CharField()), Value('-'),
+            output_field=CharField(),
+        )
+        return Payment.objects.filter(
+            created_at__gte=cutoff,
+            status='completed',
+        ).exclude(order_id='').filter(
+            ~Exists(Order.objects.filter(order_number=OuterRef('order_id'))),
+            # تیکت‌های قبلی همین پرداخت (شناسه TICK-PAY-<id>-...) دوباره ساخته نمی‌شوند
+            ~Exists(SupportTicket.objects.filter(ticket_id__startswith=ticket_prefix)),
+        )
+
+    def fallback_user_id(self):
+        if self._fallback_user_id is None:
+            self._fallback_user_id = get_user_model().objects.filter(
+                is_superuser=True
+            ).values_list('id', flat=True).first()
+        return self._fallback_user_id
+
+    def apply(self, rows):
+        tickets = []
+        for row in rows:
+            tickets.append(SupportTicket(
+                ticket_id=f"{self.TICKET_PREFIX}{row['pk']}-{uuid.uuid4().hex[:8].upper()}",
+                user_id=row['user_id'] or self.fallback_user_id(),
+                subject=f"[Auto] پرداخت بدون سفارش: {row['order_id']} (پرداخت #{row['pk']})",
+                description=(
+                    f"پرداختی با شناسه داخلی {row['pk']} دریافت شده ولی Order متناظر یافت نشد.\n"
+                    f"User: {row['user_id']} / {row['user__email']}\n"
+                    f"Amount: {row['amount']} {row['currency']}\n"
+                    f"Order reference: {row['order_id']}\n"
+                    f"Authority: {row['authority']}\n"
+                    f"Created at: {row['created_at']}\n\n"
+                    "لطفاً بررسی و در صورت نیاز وضعیت مالی/سفارش را همگام‌سازی کنید."
+                ),
+                category='billing',
+                priority='high',
+                attachments=[],
+                tags=['auto-ticket', 'payment-no-order'],
+            ))
+        SupportTicket.objects.bulk_create(tickets)
+        return len(tickets)
+
+
+class CompletedFormPaymentsJob(ReconciliationJob):
+    """
+    سیاست عدم استرداد: پرداخت pending/failed که فرم تحلیلش تکمیل شده (تحلیل در حال
+    پردازش/تکمیل یا دارای فایل آپلودی) completed و سفارش آن paid می‌شود.
+    """
+
+    name = 'completed_form_payments'
+    fields = ('order_id', 'user_id', 'transaction_id', 'authority', 'store_analysis__status', 'uploaded_files')
+    FORM_STATUSES = ('processing', 'completed')
+
+    def missing(self):
+        return Payment.objects.filter(
+            status__in=['pending', 'failed'],
+            store_analysis__isnull=False,
+        ).filter(
+            Q(store_analysis__status__in=self.FORM_STATUSES)
+            | Q(store_analysis__analysis_data__has_key='uploaded_files')
+        ).annotate(
+            # فقط کلید uploaded_files خوانده می‌شود، نه کل analysis_data
+            uploaded_files=KT('store_analysis__analysis_data__uploaded_files'),
+        )
+
+    def select(self, rows):
+        return [
+            row for row in rows
+            if row['store_analysis__status'] in self.FORM_STATUSES
+            or row['uploaded_files'] not in (None, '', '{}', '[]', 'null')
+        ]
+
+    def apply(self, rows):
+        now = timezone.now()
+        updated = Payment.objects.filter(
+            pk__in=[row['pk'] for row in rows],
+            status__in=['pending', 'failed'],
+        ).update(status='completed', completed_at=now, updated_at=now)
+
+        by_order = {row['order_id']: row for row in rows if row['order_id']}
+        orders = list(Order.objects.filter(order_number__in=list(by_order)).exclude(status='paid'))
+        for order in orders:
+            row = by_order[order.order_number]
+            order.status = 'paid'
+            order.payment_id = row['pk']
+            order.transaction_id = row['transaction_id'] or row['authority']
+            order.updated_at = now
+        if orders:
+            Order.objects.bulk_update(orders, ['status', 'payment', 'transaction_id', 'updated_at'])
+        # update() سیگنال post_save ندارد؛ خلاصه پرداخت کاربران پس از commit باطل می‌شود
+        user_ids = [row['user_id'] for row in rows]
+        transaction.on_commit(lambda: PaymentHistory.invalidate(*user_ids))
+        return updated
+
+
+JOBS = {
+    'orders': OrdersForPaymentsJob,
+    'tickets': TicketsForUnlinkedPaymentsJob,
+    'no-refund': CompletedFormPaymentsJob,
+}
@@ -46,9 +46,9 @@ def validate_file_upload(file, allowed_extensions: List[str], max_size: int) ->
             if not any(file_name.endswith(ext) for ext in allowed_extensions):
                 raise SecurityError(f"پسوند فایل مجاز نیست. پسوندهای مجاز: {', '.join(allowed_extensions)}")
             
-            # بررسی نوع MIME
+            # بررسی نوع MIME (فایل‌های StreamingUploadHandler هنگام دریافت بررسی شده‌اند)
             mime_type, _ = mimetypes.guess_type(file_name)
-            if mime_type and mime_type.startswith('text/'):
+            if mime_type and mime_type.startswith('text/') and not getattr(file, 'upload_kind', None):
                 # بررسی محتوای فایل‌های متنی
                 content = file.read(1024).decode('utf-8', errors='ignore')
                 if '<script' in content.lower():
@@ -0,0 +1,273 @@
+"""
+بازیابی هم‌زمان و محدودشده تحلیل‌های stuck
+
+تحلیل‌های stuck با قفل سطح ردیف (select_for_update + skip_locked) claim می‌شوند و
+updated_at آن‌ها تمدید می‌شود تا اجرای هم‌زمان همین فرمان روی hostهای دیگر سراغشان
+نرود. هر تحلیل در یک worker pool با هم‌زمانی محدود اجرا و نتیجه‌اش بلافاصله ذخیره
+می‌شود؛ درخواست‌های LLM از یک بودجه نرخ مشترک برای هر provider استفاده می‌کنند.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from ..models import StoreAnalysis
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = [
+    'store_photos', 'store_layout', 'shelf_photos',
+    'window_display_photos', 'entrance_photos', 'checkout_photos',
+]
+
+
+class RateBudget:
+    """بودجه نرخ درخواست (token bucket) مشترک بین threadهای یک provider"""
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None):
+        self.rate = per_minute / 60.0 if per_minute and per_minute > 0 else 0.0
+        self.capacity = (burst or max(1, int(per_minute // 10))) if self.rate else 0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """گرفتن یک توکن؛ در صورت نیاز منتظر می‌ماند و مدت انتظار را برمی‌گرداند"""
+        if not self.rate:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.waited += waited
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+@dataclass
+class RecoveryOutcome:
+    analysis_id: int
+    username: str
+    status: str
+    message: str = ''
+    seconds: float = 0.0
+
+
+@dataclass
+class RecoveryStats:
+    claimed: int = 0
+    completed: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    outcomes: List[RecoveryOutcome] = field(default_factory=list)
+
+    @property
+    def per_minute(self) -> float:
+        return (self.completed + self.failed) * 60 / self.elapsed if self.elapsed else 0.0
+
+
+def build_recovery_input(analysis):
+    """store_data و فهرست تصاویر برای ارسال مجدد به Liara AI"""
+    analysis_data = analysis.analysis_data or {}
+    store_data = {
+        'store_name': analysis.store_name or 'فروشگاه',
+        'store_type': analysis_data.get('store_type', 'عمومی'),
+        'store_size': str(analysis_data.get('store_size', 0)),
+        **analysis_data
+    }
+
+    images = []
+    uploaded_files = analysis_data.get('uploaded_files') or {}
+    for field_name in IMAGE_FIELDS:
+        file_info = uploaded_files.get(field_name)
+        if isinstance(file_info, dict) and 'path' in file_info:
+            images.append(file_info['path'])
+    return store_data, images
+
+
+def apply_comprehensive_result(analysis, comprehensive_analysis):
+    """ادغام نتیجه تحلیل جامع در results تحلیل (همان ساختار مسیر اصلی)"""
+    analysis_text = None
+    if 'final_report' in comprehensive_analysis:
+        analysis_text = comprehensive_analysis['final_report']
+    elif 'detailed_analyses' in comprehensive_analysis:
+        combined = ""
+        for anal in comprehensive_analysis['detailed_analyses'].values():
+            if anal and 'content' in anal:
+                combined += f"\n\n{anal['content']}\n"
+        analysis_text = combined if combined else None
+
+    current_results = analysis.results or {}
+    current_results.update({
+        'liara_analysis': comprehensive_analysis,
+        'analysis_source': 'liara_ai',
+        'analysis_text': analysis_text or comprehensive_analysis.get('final_report', ''),
+        'models_used': comprehensive_analysis.get('ai_models_used', []),
+        'analysis_quality': 'premium',
+        'analyzed_at': timezone.now().isoformat(),
+    })
+    analysis.results = current_results
+
+
+class StuckAnalysisRecovery:
+    """موتور بازیابی: claim با قفل ردیف، اجرای هم‌زمان محدود و ذخیره تدریجی نتایج"""
+
+    def __init__(
+        self,
+        hours: int = 2,
+        concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        limit: Optional[int] = None,
+        on_result: Optional[Callable[[RecoveryOutcome], None]] = None,
+    ):
+        self.hours = hours
+        self.concurrency = max(1, concurrency or getattr(settings, 'STUCK_RECOVERY_CONCURRENCY', 4))
+        if requests_per_minute is None:
+            requests_per_minute = getattr(settings, 'LIARA_AI_REQUESTS_PER_MINUTE', 60)
+        self.budget = RateBudget(requests_per_minute)
+        self.limit = limit
+        self.on_result = on_result
+        self.stats = RecoveryStats()
+
+    def candidates(self):
+        threshold_time = timezone.now() - timedelta(hours=self.hours)
+        return StoreAnalysis.objects.filter(status='processing', updated_at__lt=threshold_time)
+
+    def claim(self, size: int) -> List[int]:
+        """claim تا size تحلیل stuck؛ ردیف‌های قفل‌شده توسط host دیگر رد می‌شوند"""
+        if size <= 0:
+            return []
+        with transaction.atomic():
+            ids = list(
+                self.candidates()
+                .select_for_update(skip_locked=True)
+                .order_by('updated_at')
+                .values_list('id', flat=True)[:size]
+            )
+            if ids:
+                # تمدید lease: با updated_at جدید از فهرست stuck سایر اجراها خارج می‌شوند
+                StoreAnalysis.objects.filter(id__in=ids).update(updated_at=timezone.now())
+        return ids
+
+    def _fail(self, analysis, message: str) -> None:
+        # StoreAnalysis فیلد error_message ندارد؛ مثل save_analysis_error در analysis_data ذخیره می‌شود
+        analysis_data = analysis.analysis_data or {}
+        analysis_data['error_message'] = message
+        analysis.analysis_data = analysis_data
+        analysis.status = 'failed'
+        analysis.save(update_fields=['status', 'analysis_data', 'updated_at'])
+
+    def recover(self, analysis, service) -> RecoveryOutcome:
+        """اجرای مجدد یک تحلیل و ذخیره فوری نتیجه آن"""
+        username = analysis.user.username if analysis.user else 'N/A'
+
+        if not service.api_key:
+            message = "⚠️ LIARA_AI_API_KEY تنظیم نشده است. تحلیل نمی‌تواند انجام شود."
+            self._fail(analysis, message)
+            return RecoveryOutcome(analysis.id, username, 'failed', message)
+
+        if not analysis.analysis_data:
+            message = "⚠️ داده‌های تحلیل موجود نیست. لطفاً فرم را تکمیل کنید."
+            self._fail(analysis, message)
+            return RecoveryOutcome(analysis.id, username, 'failed', message)
+
+        store_data, images = build_recovery_input(analysis)
+        comprehensive_analysis = service.analyze_store_comprehensive(
+            store_data=store_data,
+            images=images if images else None,
+            run_id=analysis.id
+        )
+
+        if not comprehensive_analysis:
+            message = 'تحلیل AI خالی برگشت. لطفاً دوباره تلاش کنید.'
+            self._fail(analysis, message)
+            return RecoveryOutcome(analysis.id, username, 'failed', message)
+
+        if comprehensive_analysis.get('error'):
+            message = comprehensive_analysis.get('error_message', 'خطا در تحلیل AI')
+            self._fail(analysis, message)
+            return RecoveryOutcome(analysis.id, username, 'failed', message)
+
+        apply_comprehensive_result(analysis, comprehensive_analysis)
+        analysis.status = 'completed'
+        analysis.save(update_fields=['results', 'status', 'updated_at'])
+        return RecoveryOutcome(analysis.id, username, 'completed')
+
+    def _recover_one(self, analysis_id: int, service) -> RecoveryOutcome:
+        start = time.perf_counter()
+        analysis = None
+        try:
+            analysis = StoreAnalysis.objects.with_payload('analysis_data', 'results').select_related('user').get(id=analysis_id)
+            outcome = self.recover(analysis, service)
+        except Exception as e:
+            logger.error(f"Error retrying analysis {analysis_id}: {e}", exc_info=True)
+            message = f"خطا در retry تحلیل: {str(e)}"
+            if analysis is not None:
+                try:
+                    self._fail(analysis, message)
+                except Exception as save_error:
+                    logger.error(f"Could not mark analysis {analysis_id} as failed: {save_error}")
+            username = analysis.user.username if analysis is not None and analysis.user else 'N/A'
+            outcome = RecoveryOutcome(analysis_id, username, 'failed', message)
+        finally:
+            # اتصال دیتابیس thread فعلی پس از هر تحلیل بسته می‌شود
+            connections.close_all()
+        outcome.seconds = time.perf_counter() - start
+        return outcome
+
+    def _record(self, outcome: RecoveryOutcome) -> None:
+        self.stats.outcomes.append(outcome)
+        if outcome.status == 'completed':
+            self.stats.completed += 1
+        else:
+            self.stats.failed += 1
+        if self.on_result:
+            self.on_result(outcome)
+
+    def _service(self):
+        from ..ai_services.liara_ai_service import LiaraAIService
+        return LiaraAIService(rate_budget=self.budget)
+
+    def run(self) -> RecoveryStats:
+        """claim و اجرای تحلیل‌ها تا خالی شدن صف یا رسیدن به limit"""
+        service = self._service()
+        start = time.perf_counter()
+        running = set()
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                free = self.concurrency - len(running)
+                if self.limit is not None:
+                    free = min(free, self.limit - self.stats.claimed)
+                if not exhausted and free > 0:
+                    ids = self.claim(free)
+                    exhausted = len(ids) < free
+                    self.stats.claimed += len(ids)
+                    for analysis_id in ids:
+                        running.add(pool.submit(self._recover_one, analysis_id, service))
+
+                if not running:
+                    break
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._record(future.result())
+
+        self.stats.elapsed = time.perf_counter() - start
+        return self.stats
@@ -2,13 +2,21 @@
 Signals for Store Analysis
 """
 
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.files.storage import default_storage
 import os
 import logging
 
-from .models import Payment, PaymentLog, ServicePackage, UserSubscription
+from .models import (
+    Payment, PaymentLog, ServicePackage, UserSubscription,
+    SystemSettings, DiscountNotification, StoreAnalysis, ApiKey
+)
+from .utils.config_store import ConfigStore
+from .utils.progress_bus import ProgressBus
+from .services.payment_history import PaymentHistory
+from .services.api_keys import ApiKeyService
 from .utils.safe_db import check_table_exists
 
 logger = logging.getLogger(__name__)
@@ -38,6 +46,8 @@ def handle_payment_save(sender, instance, created, **kwargs):
         logger.info(f"Payment {instance.order_id} created with status: {instance.status}")
     else:
         logger.info(f"Payment {instance.order_id} updated with status: {instance.status}")
+    # خلاصه cache‌شده تاریخچه پرداخت کاربر با هر تغییر پرداخت باطل می‌شود
+    PaymentHistory.invalidate(instance.user_id)
 
 @receiver(post_save, sender=UserSubscription)
 def handle_subscription_save(sender, instance, created, **kwargs):
@@ -54,4 +64,39 @@ def handle_payment_delete(sender, instance, **kwargs):
     """
     Handle post-delete signal for Payment model.
     """
-    logger.info(f"Payment {instance.order_id} deleted")
\ No newline at end of file
+    logger.info(f"Payment {instance.order_id} deleted")
+    PaymentHistory.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=SystemSettings)
+@receiver(post_delete, sender=SystemSettings)
+@receiver(post_save, sender=DiscountNotification)
+@receiver(post_delete, sender=DiscountNotification)
+def handle_config_change(sender, instance, **kwargs):
+    """
+    Refresh the process-wide ConfigStore snapshot in every worker once the change
+    is committed; bumping earlier lets another worker cache the old rows under the new stamp.
+    """
+    transaction.on_commit(ConfigStore.bump_version)
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def handle_api_key_change(sender, instance, **kwargs):
+    """
+    Drop verified API keys cached in every worker (revocation, scope changes) once the
+    change is committed, so no worker re-caches the key as it was before the change.
+    """
+    transaction.on_commit(ApiKeyService.bump_version)
+
+
+@receiver(post_save, sender=StoreAnalysis)
+def handle_analysis_status_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Publish analysis status transitions to the progress bus (websocket + polling cache)
+    once the transaction commits, so clients never see a state that is rolled back.
+    """
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    analysis_id, status, user_id = instance.id, instance.status, instance.user_id
+    transaction.on_commit(lambda: ProgressBus.publish_status(analysis_id, status, user_id))
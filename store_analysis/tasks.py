@@ -2,7 +2,7 @@
 import json
 import logging
 import traceback
-from datetime import datetime, timedelta
+from datetime import datetime
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from django.core.cache import cache
@@ -27,11 +27,7 @@
 import threading
 import time as time_module
 
-from .models import (
-    StoreAnalysis, StoreAnalysisResult, DetailedAnalysis, 
-    StoreBasicInfo, StoreLayout, StoreTraffic, StoreDesign, 
-    StoreSurveillance, StoreProducts, ReviewReminder
-)
+from .models import StoreAnalysis, StoreAnalysisResult, ReviewReminder
 
 logger = get_task_logger(__name__)
 
@@ -74,18 +70,15 @@ def analyze_store_task(self, analysis_id):
     start_time = timezone.now()
     
     try:
-        # دریافت تحلیل
-        analysis = StoreAnalysis.objects.select_related(
-            'store_info', 'store_info__layout', 'store_info__traffic',
-            'store_info__design', 'store_info__surveillance', 'store_info__products'
-        ).get(id=analysis_id)
+        # دریافت تحلیل (ورودی مراحل از analysis_data ساخته می‌شود)
+        analysis = StoreAnalysis.objects.with_payload('analysis_data').get(id=analysis_id)
         
         # به‌روزرسانی وضعیت
         analysis.status = 'processing'
         analysis.save(update_fields=['status', 'updated_at'])
         
         # ثبت شروع
-        logger.info(f"Starting analysis for store: {analysis.store_info.store_name}")
+        logger.info(f"Starting analysis for store: {analysis.store_name}")
         log_memory_usage("Analysis Start")
         
         # به‌روزرسانی پیشرفت
@@ -94,26 +87,11 @@ def analyze_store_task(self, analysis_id):
             meta={'current': 0, 'total': 6, 'status': 'شروع تحلیل...'}
         )
         
-        # اجرای مراحل تحلیل
-        results = {}
-        
-        # مرحله 1: تحلیل چیدمان (OpenCV)
-        results['layout_analysis'] = perform_layout_analysis(analysis, self)
-        
-        # مرحله 2: تحلیل رفتار مشتری (TensorFlow)
-        results['customer_behavior'] = perform_customer_behavior_analysis(analysis, self)
-        
-        # مرحله 3: تحلیل ترافیک (Scikit-learn)
-        results['traffic_analysis'] = perform_traffic_analysis(analysis, self)
-        
-        # مرحله 4: بهینه‌سازی
-        results['optimization'] = perform_optimization_analysis(analysis, self)
-        
-        # مرحله 5: پیش‌بینی فروش (Deep Learning)
-        results['sales_prediction'] = perform_sales_prediction(analysis, self)
-        
-        # مرحله 6: تولید گزارش نهایی
-        results['final_report'] = generate_final_report(analysis, results, self)
+        # اجرای مراحل تحلیل: پنج مرحله مستقل هم‌زمان و گزارش نهایی پس از آن‌ها؛
+        # در retry مراحلی که قبلاً موفق بوده‌اند از چک‌پوینت خوانده می‌شوند
+        pipeline = build_analysis_pipeline(analysis, self)
+        results = pipeline.run()
+        results['stage_timings'] = pipeline.timings
         
         # ذخیره نتایج
         with transaction.atomic():
@@ -129,11 +107,14 @@ def analyze_store_task(self, analysis_id):
                 analysis_type='comprehensive'
             )
         
+        # نتیجه نهایی ذخیره شد؛ چک‌پوینت‌ها دیگر لازم نیستند
+        pipeline.clear()
+        
         # پاکسازی حافظه
         cleanup_memory()
         log_memory_usage("Analysis Complete")
         
-        logger.info(f"Analysis completed successfully for store: {analysis.store_info.store_name}")
+        logger.info(f"Analysis completed successfully for store: {analysis.store_name}")
         
         return {
             'status': 'success',
@@ -151,9 +132,12 @@ def analyze_store_task(self, analysis_id):
         
         # به‌روزرسانی وضعیت خطا
         if analysis:
+            # StoreAnalysis فیلد error_message ندارد؛ مثل save_analysis_error در analysis_data ذخیره می‌شود
+            analysis_data = analysis.analysis_data or {}
+            analysis_data['error_message'] = str(e)
+            analysis.analysis_data = analysis_data
             analysis.status = 'failed'
-            analysis.error_message = str(e)
-            analysis.save(update_fields=['status', 'error_message', 'updated_at'])
+            analysis.save(update_fields=['status', 'analysis_data', 'updated_at'])
         
         # پاکسازی حافظه
         cleanup_memory()
@@ -169,7 +153,7 @@ def analyze_store_task(self, analysis_id):
                 'analysis_id': analysis_id
             }
 
-def perform_layout_analysis(analysis, task_instance):
+def perform_layout_analysis(store_info, task_instance):
     """تحلیل چیدمان با OpenCV"""
     try:
         task_instance.update_state(
@@ -177,7 +161,7 @@ def perform_layout_analysis(analysis, task_instance):
             meta={'current': 1, 'total': 6, 'status': 'تحلیل چیدمان...'}
         )
         
-        layout = analysis.store_info.layout
+        layout = store_info.layout
         results = {
             'efficiency_score': 0,
             'space_utilization': 0,
@@ -185,8 +169,8 @@ def perform_layout_analysis(analysis, task_instance):
         }
         
         # تحلیل متراژ
-        if layout.store_info.store_size and layout.unused_area_size:
-            total_size = layout.store_info.store_size
+        if store_info.store_size and layout.unused_area_size:
+            total_size = store_info.store_size
             unused_size = layout.unused_area_size
             used_size = total_size - unused_size
 
@@ -216,7 +200,7 @@ def perform_layout_analysis(analysis, task_instance):
         
         # تحلیل تعداد قفسه‌ها
         if layout.shelf_count:
-            shelf_density = layout.shelf_count / (layout.store_info.store_size or 1)
+            shelf_density = layout.shelf_count / (store_info.store_size or 1)
             if shelf_density < 0.1:
                 results['recommendations'].append({
                     'type': 'warning',
@@ -240,7 +224,7 @@ def perform_layout_analysis(analysis, task_instance):
         logger.error(f"Layout analysis error: {e}")
         return {'error': str(e)}
 
-def perform_customer_behavior_analysis(analysis, task_instance):
+def perform_customer_behavior_analysis(store_info, task_instance):
     """تحلیل رفتار مشتری با TensorFlow"""
     try:
         task_instance.update_state(
@@ -248,7 +232,7 @@ def perform_customer_behavior_analysis(analysis, task_instance):
             meta={'current': 2, 'total': 6, 'status': 'تحلیل رفتار مشتری...'}
         )
         
-        traffic = analysis.store_info.traffic
+        traffic = store_info.traffic
         results = {
             'behavior_score': 0,
             'movement_pattern': '',
@@ -308,7 +292,7 @@ def perform_customer_behavior_analysis(analysis, task_instance):
         logger.error(f"Customer behavior analysis error: {e}")
         return {'error': str(e)}
 
-def perform_traffic_analysis(analysis, task_instance):
+def perform_traffic_analysis(store_info, task_instance):
     """تحلیل ترافیک با Scikit-learn"""
     try:
         task_instance.update_state(
@@ -316,7 +300,7 @@ def perform_traffic_analysis(analysis, task_instance):
             meta={'current': 3, 'total': 6, 'status': 'تحلیل ترافیک...'}
         )
         
-        traffic = analysis.store_info.traffic
+        traffic = store_info.traffic
         results = {
             'traffic_score': 0,
             'capacity_analysis': {},
@@ -334,8 +318,8 @@ def perform_traffic_analysis(analysis, task_instance):
         base_score = traffic_weights.get(traffic.customer_traffic, 0.5)
         
         # تحلیل ظرفیت
-        store_size = analysis.store_info.store_size or 100
-        entrances = analysis.store_info.layout.entrances or 1
+        store_size = store_info.store_size or 100
+        entrances = store_info.layout.entrances or 1
         
         # محاسبه ظرفیت نظری
         theoretical_capacity = store_size * 0.1 * entrances  # 0.1 نفر در متر مربع
@@ -370,7 +354,7 @@ def perform_traffic_analysis(analysis, task_instance):
         logger.error(f"Traffic analysis error: {e}")
         return {'error': str(e)}
 
-def perform_optimization_analysis(analysis, task_instance):
+def perform_optimization_analysis(store_info, task_instance):
     """تحلیل بهینه‌سازی"""
     try:
         task_instance.update_state(
@@ -385,16 +369,16 @@ def perform_optimization_analysis(analysis, task_instance):
         }
         
         # جمع‌آوری داده‌ها
-        layout = analysis.store_info.layout
-        traffic = analysis.store_info.traffic
-        design = analysis.store_info.design
-        surveillance = analysis.store_info.surveillance
+        layout = store_info.layout
+        traffic = store_info.traffic
+        design = store_info.design
+        surveillance = store_info.surveillance
         
         improvements = []
         
         # بهبود فضای بلااستفاده
-        if layout.unused_area_size and layout.store_info.store_size:
-            unused_percentage = (layout.unused_area_size / layout.store_info.store_size) * 100
+        if layout.unused_area_size and store_info.store_size:
+            unused_percentage = (layout.unused_area_size / store_info.store_size) * 100
             if unused_percentage > 20:
                 improvements.append({
                     'area': 'فضای بلااستفاده',
@@ -451,7 +435,7 @@ def perform_optimization_analysis(analysis, task_instance):
         logger.error(f"Optimization analysis error: {e}")
         return {'error': str(e)}
 
-def perform_sales_prediction(analysis, task_instance):
+def perform_sales_prediction(store_info, task_instance):
     """پیش‌بینی فروش با Deep Learning"""
     try:
         task_instance.update_state(
@@ -467,13 +451,13 @@ def perform_sales_prediction(analysis, task_instance):
         }
         
         # جمع‌آوری فاکتورها
-        store_size = analysis.store_info.store_size or 100
-        traffic_level = analysis.store_info.traffic.customer_traffic
+        store_size = store_info.store_size or 100
+        traffic_level = store_info.traffic.customer_traffic
         space_utilization = 0
         
-        if analysis.store_info.layout.unused_area_size:
-            total_size = analysis.store_info.store_size
-            unused_size = analysis.store_info.layout.unused_area_size
+        if store_info.layout.unused_area_size and store_info.store_size:
+            total_size = store_info.store_size
+            unused_size = store_info.layout.unused_area_size
             space_utilization = ((total_size - unused_size) / total_size) * 100
         
         # محاسبه امتیاز پیش‌بینی
@@ -590,7 +574,7 @@ def generate_final_report(analysis, all_results, task_instance):
             'grade': grade,
             'status': status,
             'summary': {
-                'store_name': analysis.store_info.store_name,
+                'store_name': analysis.store_name,
                 'analysis_date': timezone.now().isoformat(),
                 'total_recommendations': len(all_recommendations),
                 'critical_issues': len(critical_recommendations),
@@ -616,21 +600,128 @@ def generate_final_report(analysis, all_results, task_instance):
         logger.error(f"Final report generation error: {e}")
         return {'error': str(e)}
 
+ANALYSIS_STAGES = (
+    ('layout_analysis', perform_layout_analysis),
+    ('customer_behavior', perform_customer_behavior_analysis),
+    ('traffic_analysis', perform_traffic_analysis),
+    ('optimization', perform_optimization_analysis),
+    ('sales_prediction', perform_sales_prediction),
+)
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _flag(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on', 'بله', 'دارد')
+
+
+def build_stage_input(analysis):
+    """
+    ورودی مراحل analyze_store_task از analysis_data فرم (مثل build_recovery_input)؛ همان ساختار
+    store_info.layout/traffic/design/surveillance با پیش‌فرض‌های مدل‌های قدیمی StoreBasicInfo
+    """
+    data = analysis.analysis_data or {}
+    return {
+        'store_name': analysis.store_name or data.get('store_name', ''),
+        'store_size': _number(data.get('store_size')),
+        'layout': {
+            'entrances': int(_number(data.get('entrances'), 1)),
+            'shelf_count': int(_number(data.get('shelf_count'))),
+            'unused_area_size': _number(data.get('unused_area_size')),
+        },
+        'traffic': {
+            'customer_traffic': data.get('customer_traffic') or 'medium',
+            'customer_movement_paths': data.get('customer_movement_paths') or '',
+            'peak_hours': data.get('peak_hours') or '',
+        },
+        'design': {'main_lighting': data.get('main_lighting') or data.get('lighting_type') or ''},
+        'surveillance': {'has_surveillance': _flag(data.get('has_surveillance'))},
+    }
+
+
+def build_analysis_pipeline(analysis, task_instance):
+    """ساخت گراف مراحل analyze_store_task با چک‌پوینت به ازای هر تحلیل"""
+    from types import SimpleNamespace
+    from .utils.progress_bus import ProgressBus
+    from .utils.stage_pipeline import Stage, StagePipeline
+    
+    stage_input = build_stage_input(analysis)
+    store_info = SimpleNamespace(**{
+        key: SimpleNamespace(**value) if isinstance(value, dict) else value
+        for key, value in stage_input.items()
+    })
+    
+    def stage_func(func):
+        return lambda inputs: func(store_info, task_instance)
+    
+    stages = [Stage(name, stage_func(func)) for name, func in ANALYSIS_STAGES]
+    stages.append(Stage(
+        'final_report',
+        lambda inputs: generate_final_report(analysis, inputs, task_instance),
+        depends_on=tuple(name for name, _ in ANALYSIS_STAGES),
+    ))
+    
+    publish_start, publish_complete = ProgressBus.stage_callbacks(analysis.id, analysis.user_id)
+    
+    def on_stage_complete(name, done, total):
+        task_instance.update_state(
+            state='PROGRESS',
+            meta={'current': done, 'total': total, 'status': f'مرحله {name} انجام شد'}
+        )
+        publish_complete(name, done, total)
+    
+    return StagePipeline(
+        run_key=f'analysis:{analysis.id}',
+        stages=stages,
+        input_data={'analysis_id': analysis.id, **stage_input},
+        on_stage_start=publish_start,
+        on_stage_complete=on_stage_complete,
+    )
+
 # --- Background Tasks ---
 @shared_task
 def cleanup_old_files():
-    """پاکسازی فایل‌های قدیمی"""
+    """پاکسازی فایل‌های آپلودی بدون ارجاع بر اساس سن و سقف حجم"""
+    from .utils.file_storage import content_hashes, reclaim_blobs
+    
     try:
-        cutoff_date = timezone.now() - timedelta(days=30)
+        max_age_days = getattr(settings, 'UPLOAD_BLOB_MAX_AGE_DAYS', 30)
+        max_total_bytes = getattr(settings, 'UPLOAD_BLOB_MAX_TOTAL_MB', 2048) * 1024 * 1024
+        
+        # جمع‌آوری hash فایل‌هایی که هنوز در تحلیل‌ها استفاده می‌شوند
+        referenced = set()
+        rows = StoreAnalysis.objects.filter(
+            analysis_data__has_key='uploaded_files'
+        ).values_list('analysis_data', flat=True)
+        for analysis_data in rows.iterator(chunk_size=500):
+            for digest in content_hashes((analysis_data or {}).get('uploaded_files')).values():
+                if isinstance(digest, list):
+                    referenced.update(digest)
+                else:
+                    referenced.add(digest)
+        
+        stats = reclaim_blobs(
+            referenced,
+            max_age_seconds=max_age_days * 86400,
+            max_total_bytes=max_total_bytes
+        )
         
-        # پاکسازی فایل‌های قدیمی
-        from django.core.files.storage import default_storage
-        from django.core.files.base import ContentFile
+        logger.info(
+            f"Old files cleanup completed: {stats['deleted']} files, "
+            f"{stats['freed_bytes'] / 1024 / 1024:.2f} MB freed, "
+            f"{len(referenced)} referenced blobs kept"
+        )
         
-        # اینجا می‌توانید منطق پاکسازی فایل‌ها را اضافه کنید
+        # چک‌پوینت اجراهای ناتمام قدیمی
+        from .utils.stage_pipeline import purge_stale_checkpoints
+        stats['stale_checkpoints'] = purge_stale_checkpoints()
         
-        logger.info("Old files cleanup completed")
-        return {'status': 'success', 'cleaned_files': 0}
+        return {'status': 'success', 'cleaned_files': stats['deleted'], **stats}
         
     except Exception as e:
         logger.error(f"File cleanup error: {e}")
@@ -731,7 +822,7 @@ def monitor_system_performance():
         # ذخیره در کش برای نمایش در داشبورد
         cache.set('system_performance', performance_data, 300)  # 5 دقیقه
         
-        logger.info(f"System performance monitored: {performance_data}")
+        logger.info("System performance monitored: %s", performance_data)
         return performance_data
         
     except Exception as e:
@@ -813,50 +904,31 @@ def process_analysis_with_liara(analysis_id):
         return {'status': 'error', 'error': str(e)} 
 
 
-@shared_task(name='store_analysis.send_review_reminders')
-def send_review_reminders():
-    """ارسال ایمیل یادآوری برای بازبینی تحلیل‌ها"""
-    from django.conf import settings
-    from django.template.loader import render_to_string
-    from .utils.notification import NotificationService
-    
-    try:
-        # دریافت یادآوری‌هایی که باید ارسال شوند
-        reminders = ReviewReminder.objects.filter(
-            status__in=['pending', 'scheduled'],
-            email_sent=False,
-            reminder_date__lte=timezone.now()
-        )
-        
-        sent_count = 0
-        failed_count = 0
-        
-        for reminder in reminders:
-            try:
-                user = reminder.user
-                analysis = reminder.analysis
-                
-                # ساخت لینک رزرو با کد تخفیف
-                site_url = getattr(settings, 'SITE_URL', 'https://chidmano.liara.app')
-                discount_code_str = reminder.discount_code.code if reminder.discount_code else ''
-                booking_url = f"{site_url}/store/buy/?discount_code={discount_code_str}"
-                
-                # محتوای ایمیل
-                subject = f"یادآوری بازبینی - {analysis.store_name}"
-                days_since = (timezone.now() - reminder.analysis_completed_at).days
-                context = {
-                    'user': user,
-                    'analysis': analysis,
-                    'discount_percentage': reminder.discount_percentage,
-                    'discount_code': discount_code_str,
-                    'booking_url': booking_url,
-                    'site_url': site_url,
-                    'analysis_date': reminder.analysis_completed_at,
-                    'days_since_analysis': days_since,
-                }
-                
-                # پیام متنی ساده
-                plain_message = f"""
+def _build_review_reminder_notification(reminder, site_url):
+    """ساخت محتوای ایمیل یادآوری بازبینی برای ارسال گروهی"""
+    user = reminder.user
+    analysis = reminder.analysis
+
+    # ساخت لینک رزرو با کد تخفیف
+    discount_code_str = reminder.discount_code.code if reminder.discount_code else ''
+    booking_url = f"{site_url}/store/buy/?discount_code={discount_code_str}"
+
+    # محتوای ایمیل
+    subject = f"یادآوری بازبینی - {analysis.store_name}"
+    days_since = (timezone.now() - reminder.analysis_completed_at).days
+    context = {
+        'user': user,
+        'analysis': analysis,
+        'discount_percentage': reminder.discount_percentage,
+        'discount_code': discount_code_str,
+        'booking_url': booking_url,
+        'site_url': site_url,
+        'analysis_date': reminder.analysis_completed_at,
+        'days_since_analysis': days_since,
+    }
+
+    # پیام متنی ساده
+    plain_message = f"""
 سلام {user.get_full_name() or user.username},
 
 تحلیل فروشگاه {analysis.store_name} شما {days_since} روز پیش تکمیل شد.
@@ -872,32 +944,75 @@ def send_review_reminders():
 با تشکر
 تیم چیدمانو
 """
-                
-                success = NotificationService.send_email_notification(
-                    to_email=user.email,
-                    subject=subject,
-                    message=plain_message,
-                    html_template='store_analysis/emails/review_reminder.html',
-                    context=context
-                )
-                
-                if success:
-                    reminder.mark_sent()
-                    sent_count += 1
-                    logger.info(f"Review reminder sent to {user.email} for analysis {analysis.id}")
-                else:
-                    failed_count += 1
-                    logger.warning(f"Failed to send review reminder to {user.email}")
-                    
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"Error sending review reminder {reminder.id}: {e}", exc_info=True)
+
+    return {
+        'key': reminder.id,
+        'to_email': user.email,
+        'subject': subject,
+        'message': plain_message,
+        'html_template': 'store_analysis/emails/review_reminder.html',
+        'context': context,
+    }
+
+
+@shared_task(name='store_analysis.send_review_reminders')
+def send_review_reminders():
+    """ارسال ایمیل یادآوری برای بازبینی تحلیل‌ها"""
+    from django.conf import settings
+    from .utils.notification import NotificationService
+    
+    try:
+        chunk_size = getattr(settings, 'EMAIL_BULK_CHUNK_SIZE', 50)
+        site_url = getattr(settings, 'SITE_URL', 'https://chidmano.liara.app')
+
+        # دریافت یادآوری‌هایی که باید ارسال شوند (کاربر، تحلیل و کد تخفیف در همان کوئری)
+        reminders = ReviewReminder.objects.select_related(
+            'user', 'analysis', 'discount_code'
+        ).filter(
+            status__in=['pending', 'scheduled'],
+            email_sent=False,
+            reminder_date__lte=timezone.now()
+        )
+        
+        build_failed = [0]
+
+        def _notifications():
+            for reminder in reminders.iterator(chunk_size=chunk_size):
+                try:
+                    yield _build_review_reminder_notification(reminder, site_url)
+                except Exception as e:
+                    build_failed[0] += 1
+                    logger.error(f"Error building review reminder {reminder.id}: {e}", exc_info=True)
+
+        def _mark_chunk_sent(sent_ids, failed_ids):
+            # معادل گروهی ReviewReminder.mark_sent برای هر دسته
+            if sent_ids:
+                now = timezone.now()
+                with transaction.atomic():
+                    ReviewReminder.objects.filter(id__in=sent_ids).update(
+                        email_sent=True,
+                        email_sent_at=now,
+                        status='sent',
+                        updated_at=now
+                    )
+                logger.info(f"Review reminders sent: {len(sent_ids)}")
+            if failed_ids:
+                logger.warning(f"Failed to send review reminders: {failed_ids}")
+
+        stats = NotificationService.send_bulk_email_notifications(
+            _notifications(),
+            chunk_size=chunk_size,
+            on_chunk=_mark_chunk_sent
+        )
+
+        sent_count = stats['sent']
+        failed_count = stats['failed'] + build_failed[0]
         
         return {
             'status': 'success',
             'sent': sent_count,
             'failed': failed_count,
-            'total': reminders.count()
+            'total': sent_count + failed_count
         }
         
     except Exception as e:
@@ -1,5 +1,6 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth.models import User
+from django.http import Http404
 from django.urls import reverse
 from .models import StoreAnalysis, StoreAnalysisResult, Payment
 from .ai_models.customer_behavior_analyzer import CustomerBehaviorAnalyzer
@@ -318,3 +319,1875 @@ def test_security_service_error_handling(self):
         # ورودی خالی
         result = service.sanitize_input("")
         self.assertEqual(result, "")
+
+
+class BulkEmailDispatchTestCase(TestCase):
+    """تست ارسال گروهی ایمیل با اتصال مشترک"""
+
+    def test_bulk_dispatch_reuses_connection_and_reports_chunks(self):
+        """تست ارسال دسته‌ای و فراخوانی on_chunk برای هر دسته"""
+        from django.core import mail
+        from django.core.mail import get_connection
+        from .utils.notification import NotificationService
+
+        notifications = [
+            {'key': i, 'to_email': f'user{i}@example.com', 'subject': 's', 'message': 'm'}
+            for i in range(5)
+        ]
+        chunks = []
+        stats = NotificationService.send_bulk_email_notifications(
+            notifications,
+            chunk_size=2,
+            throttle_seconds=0,
+            on_chunk=lambda sent, failed: chunks.append((sent, failed)),
+            connection=get_connection('django.core.mail.backends.locmem.EmailBackend'),
+        )
+
+        self.assertEqual(stats, {'sent': 5, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual([sent for sent, _ in chunks], [[0, 1], [2, 3], [4]])
+
+
+class ConfigStoreTestCase(TestCase):
+    """تست کش پیکربندی در سطح پروسس"""
+
+    def setUp(self):
+        from .utils.config_store import ConfigStore
+        ConfigStore.invalidate()
+
+    def test_settings_are_served_without_queries(self):
+        """تست خواندن تنظیمات بدون کوئری و تازه‌سازی بعد از ذخیره"""
+        from .models import SystemSettings
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSettings.set_setting('opening_discount_percentage', '40')
+        self.assertEqual(SystemSettings.get_setting('opening_discount_percentage'), '40')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(SystemSettings.get_setting('opening_discount_percentage'), '40')
+            self.assertEqual(SystemSettings.get_setting('missing_key', '0'), '0')
+
+        # snapshot تا commit تغییر تازه نمی‌شود
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSettings.set_setting('opening_discount_percentage', '55')
+            self.assertEqual(SystemSettings.get_setting('opening_discount_percentage'), '40')
+        self.assertEqual(SystemSettings.get_setting('opening_discount_percentage'), '55')
+
+    def test_current_discount_respects_time_window(self):
+        """تست انتخاب بیشترین تخفیف فعال و نادیده گرفتن تخفیف آینده"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import DiscountNotification
+
+        now = timezone.now()
+        DiscountNotification.objects.create(
+            title='low', message='m', discount_percentage=10,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1)
+        )
+        DiscountNotification.objects.create(
+            title='future', message='m', discount_percentage=90,
+            start_date=now + timedelta(days=1), end_date=now + timedelta(days=2)
+        )
+        DiscountNotification.objects.create(
+            title='high', message='m', discount_percentage=30,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1)
+        )
+
+        self.assertEqual(DiscountNotification.get_current_discount().title, 'high')
+        with self.assertNumQueries(0):
+            self.assertEqual(DiscountNotification.get_current_discount().title, 'high')
+
+
+class UploadIngestionTestCase(TestCase):
+    """تست ذخیره‌سازی محتوامحور فایل‌های آپلودی"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_identical_uploads_are_deduplicated(self):
+        """تست ذخیره یک‌باره فایل‌های تکراری و ثبت hash محتوا"""
+        import hashlib
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils.file_storage import save_uploaded_file, content_cache_key
+
+        content = b'store-photo-bytes' * 1000
+        first = save_uploaded_file(SimpleUploadedFile('a.jpg', content, 'image/jpeg'), 'uploads/store_photos')
+        second = save_uploaded_file(SimpleUploadedFile('b.JPG', content, 'image/jpeg'), 'uploads/store_photos')
+
+        self.assertEqual(first['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(first['path'], second['path'])
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(first['size'], len(content))
+
+        key_a = content_cache_key('ai', {'store_name': 's', 'uploaded_files': {'store_photos': first}})
+        key_b = content_cache_key('ai', {'store_name': 's', 'uploaded_files': {'store_photos': dict(second, path='/other')}})
+        self.assertEqual(key_a, key_b)
+
+    def test_reclaim_keeps_referenced_blobs(self):
+        """تست حذف فایل‌های بدون ارجاع و حفظ فایل‌های در حال استفاده"""
+        import os
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils.file_storage import save_uploaded_file, reclaim_blobs
+
+        kept = save_uploaded_file(SimpleUploadedFile('k.png', b'keep', 'image/png'))
+        dropped = save_uploaded_file(SimpleUploadedFile('d.png', b'drop', 'image/png'))
+
+        stats = reclaim_blobs(
+            {kept['sha256']},
+            max_age_seconds=0,
+            max_total_bytes=0,
+            min_age_seconds=0,
+            roots=[('default', self.media_root)],
+        )
+
+        self.assertEqual(stats['deleted'], 1)
+        self.assertTrue(os.path.exists(kept['absolute_path']))
+        self.assertFalse(os.path.exists(dropped['absolute_path']))
+
+
+class StagePipelineTestCase(TestCase):
+    """تست اجرای مرحله‌ای تحلیل با چک‌پوینت"""
+
+    def test_independent_stages_run_concurrently(self):
+        """تست اجرای هم‌زمان مراحل مستقل و ثبت زمان هر مرحله"""
+        import threading
+        from .utils.stage_pipeline import Stage, StagePipeline
+
+        # اگر دو مرحله هم‌زمان اجرا نشوند، barrier با timeout شکسته می‌شود
+        barrier = threading.Barrier(2, timeout=5)
+
+        def rendezvous(value):
+            def func(inputs):
+                barrier.wait()
+                return {'value': value}
+            return func
+
+        stages = [
+            Stage('a', rendezvous(1)),
+            Stage('b', rendezvous(2)),
+            Stage('total', lambda inputs: {'value': inputs['a']['value'] + inputs['b']['value']}, depends_on=('a', 'b')),
+        ]
+        pipeline = StagePipeline('test:concurrent', stages, input_data={'x': 1}, max_workers=2)
+
+        outputs = pipeline.run()
+
+        self.assertEqual(outputs['total'], {'value': 3})
+        self.assertEqual(set(pipeline.timings), {'a', 'b', 'total'})
+        self.assertFalse(pipeline.timings['total']['from_checkpoint'])
+
+    def test_retry_resumes_from_checkpoint(self):
+        """تست ادامه از چک‌پوینت پس از خطا و اجرای مجدد مراحل ناموفق"""
+        from .utils.stage_pipeline import Stage, StagePipeline
+
+        calls = {'paid': 0, 'flaky': 0, 'soft': 0}
+
+        def paid(inputs):
+            calls['paid'] += 1
+            return {'content': 'expensive'}
+
+        def flaky(inputs):
+            calls['flaky'] += 1
+            if calls['flaky'] == 1:
+                raise TimeoutError('upstream timeout')
+            return {'content': 'ok'}
+
+        def soft(inputs):
+            calls['soft'] += 1
+            return {'error': 'api_request_failed'} if calls['soft'] == 1 else {'content': 'ok'}
+
+        def build():
+            return StagePipeline('test:resume', [
+                Stage('paid', paid),
+                Stage('flaky', flaky),
+                Stage('soft', soft),
+                Stage('report', lambda inputs: {'sections': sorted(inputs)}, depends_on=('paid', 'flaky', 'soft')),
+            ], input_data={'store_name': 'test'})
+
+        with self.assertRaises(TimeoutError):
+            build().run()
+
+        pipeline = build()
+        outputs = pipeline.run()
+
+        self.assertEqual(calls, {'paid': 1, 'flaky': 2, 'soft': 2})
+        self.assertTrue(pipeline.timings['paid']['from_checkpoint'])
+        self.assertEqual(outputs['report'], {'sections': ['flaky', 'paid', 'soft']})
+
+        pipeline.clear()
+        build().run()
+        self.assertEqual(calls['paid'], 2)
+
+    def test_cyclic_dependencies_are_rejected(self):
+        """تست رد گراف مراحل با وابستگی حلقوی"""
+        from .utils.stage_pipeline import Stage, StagePipeline
+
+        with self.assertRaises(ValueError):
+            StagePipeline('test:cycle', [
+                Stage('a', lambda inputs: {}, depends_on=('b',)),
+                Stage('b', lambda inputs: {}, depends_on=('a',)),
+            ])
+
+
+class ProgressBusTestCase(TestCase):
+    """تست گذرگاه رویدادهای پیشرفت و endpoint وضعیت"""
+
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        from django.test import override_settings
+        self.tmpdir = tempfile.mkdtemp()
+        self.override = override_settings(CHANNEL_LAYERS={
+            'default': {
+                'BACKEND': 'store_analysis.channel_layers.SQLiteChannelLayer',
+                'CONFIG': {'path': f'{self.tmpdir}/channels.sqlite3'},
+            },
+        })
+        self.override.enable()
+        cache.clear()
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_sqlite_layer_delivers_across_instances(self):
+        """تست رسیدن پیام گروهی از یک نمونه layer (پروسس دیگر) به نمونه دیگر"""
+        from asgiref.sync import async_to_sync
+        from .channel_layers import SQLiteChannelLayer
+
+        path = f'{self.tmpdir}/channels.sqlite3'
+        consumer_layer = SQLiteChannelLayer(path=path)
+        worker_layer = SQLiteChannelLayer(path=path)
+
+        async def scenario():
+            channel = await consumer_layer.new_channel()
+            await consumer_layer.group_add('analysis_7', channel)
+            await worker_layer.group_send('analysis_7', {'type': 'analysis.status_update', 'data': {'progress': 40}})
+            return await consumer_layer.receive(channel)
+
+        message = async_to_sync(scenario)()
+        self.assertEqual(message['data'], {'progress': 40})
+
+    def test_pipeline_stages_publish_events(self):
+        """تست انتشار رویداد شروع/پایان هر مرحله به channel layer و cache"""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .utils.progress_bus import ProgressBus
+        from .utils.stage_pipeline import Stage, StagePipeline
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('analysis_9', channel)
+
+        on_start, on_complete = ProgressBus.stage_callbacks(9, user_id=1)
+        StagePipeline('test:events', [Stage('layout', lambda inputs: {'score': 1})],
+                      on_stage_start=on_start, on_stage_complete=on_complete).run()
+
+        events = [async_to_sync(layer.receive)(channel)['data'] for _ in range(2)]
+        self.assertEqual([e['event'] for e in events], ['stage_started', 'stage_completed'])
+        self.assertEqual(ProgressBus.latest(9)['stage'], 'layout')
+
+    def test_status_signal_publishes_after_commit_once(self):
+        """تست انتشار وضعیت فقط پس از commit و نبود اعلان تکمیل تکراری در save بعدی"""
+        from unittest import mock
+        from django.db import transaction
+        from .loadtest.seed import insert_analyses
+        from .utils.progress_bus import ProgressBus
+
+        user = User.objects.create_user(username='bus_signal', password='pass12345')
+        insert_analyses([StoreAnalysis(user=user, store_name='تست', status='processing')])
+        analysis = StoreAnalysis.objects.get(user=user)
+        analysis.status = 'completed'
+
+        with mock.patch.object(ProgressBus, 'publish', wraps=ProgressBus.publish) as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    analysis.save(update_fields=['status'])
+                    raise RuntimeError('rollback')
+            publish.assert_not_called()
+
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    analysis.save(update_fields=['status'])
+        self.assertEqual([c.args[0].status for c in publish.call_args_list], ['completed'])
+
+    def test_status_endpoint_serves_cache_with_etag(self):
+        """تست پاسخ endpoint وضعیت از cache بدون کوئری تحلیل و پاسخ 304"""
+        from django.core.cache import cache
+        from .utils.progress_bus import ProgressBus, ProgressEvent, STAGE_COMPLETED
+
+        user = User.objects.create_user(username='poller', password='pass12345')
+        self.client.force_login(user)
+        ProgressBus.publish(ProgressEvent(analysis_id=11, event=STAGE_COMPLETED, stage='design', progress=60, user_id=user.id))
+        cache.set(ProgressBus.OWNER_CACHE_KEY.format(11), user.id)
+        cache.set(ProgressBus.CHECKED_CACHE_KEY.format(11), True)
+
+        url = reverse('store_analysis:get_analysis_status', args=[11])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status']['progress'], 60)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        cache.set(ProgressBus.OWNER_CACHE_KEY.format(11), user.id + 1)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class StuckRecoveryTestCase(TestCase):
+    """تست موتور بازیابی هم‌زمان تحلیل‌های stuck"""
+
+    def test_rate_budget_allows_burst_then_waits(self):
+        """تست مصرف burst بدون انتظار و انتظار برای توکن بعدی"""
+        from .services.stuck_recovery import RateBudget
+
+        budget = RateBudget(per_minute=600, burst=3)
+        self.assertEqual([budget.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(budget.acquire(), 0.0)
+        self.assertEqual(RateBudget(per_minute=0).acquire(), 0.0)
+
+    def test_run_respects_concurrency_and_limit(self):
+        """تست سقف workerهای هم‌زمان، claim تدریجی و توقف در limit"""
+        import threading
+        import time
+        from .services.stuck_recovery import RecoveryOutcome, StuckAnalysisRecovery
+
+        class FakeRecovery(StuckAnalysisRecovery):
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.queue = list(range(1, 11))
+                self.claims = []
+                self.active = 0
+                self.peak = 0
+                self.lock = threading.Lock()
+
+            def _service(self):
+                return None
+
+            def claim(self, size):
+                ids, self.queue = self.queue[:size], self.queue[size:]
+                self.claims.append(len(ids))
+                return ids
+
+            def _recover_one(self, analysis_id, service):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time.sleep(0.02)
+                with self.lock:
+                    self.active -= 1
+                status = 'failed' if analysis_id % 4 == 0 else 'completed'
+                return RecoveryOutcome(analysis_id, 'user', status)
+
+        reported = []
+        recovery = FakeRecovery(concurrency=3, requests_per_minute=0, limit=7, on_result=reported.append)
+        stats = recovery.run()
+
+        self.assertEqual(stats.claimed, 7)
+        self.assertEqual(stats.completed + stats.failed, 7)
+        self.assertEqual(stats.failed, 1)
+        self.assertLessEqual(recovery.peak, 3)
+        self.assertEqual(recovery.claims[0], 3)
+        self.assertEqual(len(reported), 7)
+        self.assertEqual(recovery.queue, [8, 9, 10])
+
+
+    def test_final_state_records_completion_time_not_lease(self):
+        """تست اینکه updated_at وضعیت نهایی (completed/failed) زمان پایان است نه زمان lease"""
+        from datetime import timedelta
+        from types import SimpleNamespace
+        from django.utils import timezone
+        from .loadtest.seed import insert_analyses
+        from .services.stuck_recovery import StuckAnalysisRecovery
+
+        user = User.objects.create_user(username='stuck_owner', password='pass12345')
+        insert_analyses([
+            StoreAnalysis(user=user, store_name='بدون داده', status='processing', analysis_data={}),
+            StoreAnalysis(user=user, store_name='با داده', status='processing', analysis_data={'store_type': 'پوشاک'}),
+        ])
+        leased_at = timezone.now() - timedelta(hours=1)
+        StoreAnalysis.objects.filter(user=user).update(updated_at=leased_at)
+        service = SimpleNamespace(api_key='stub', analyze_store_comprehensive=lambda **kwargs: {'final_report': 'گزارش'})
+
+        recovery = StuckAnalysisRecovery()
+        for analysis in StoreAnalysis.objects.with_payload('analysis_data').filter(user=user):
+            recovery.recover(analysis, service)
+
+        final = dict(StoreAnalysis.objects.filter(user=user).values_list('store_name', 'status'))
+        self.assertEqual(final, {'بدون داده': 'failed', 'با داده': 'completed'})
+        failed = StoreAnalysis.objects.with_payload('analysis_data').get(user=user, status='failed')
+        self.assertIn('داده‌های تحلیل موجود نیست', failed.analysis_data['error_message'])
+        for updated_at in StoreAnalysis.objects.filter(user=user).values_list('updated_at', flat=True):
+            self.assertGreater(updated_at, leased_at + timedelta(minutes=59))
+
+    def test_command_marks_stuck_failed_without_retry(self):
+        """تست مسیر پیش‌فرض fix_stuck_analyses (بدون --retry): پیام خطا در analysis_data و updated_at تازه"""
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.test import override_settings
+        from django.utils import timezone
+        from .loadtest.seed import insert_analyses
+
+        user = User.objects.create_user(username='stuck_command', password='pass12345')
+        insert_analyses([
+            StoreAnalysis(user=user, store_name='بدون داده', status='processing', analysis_data={}),
+            StoreAnalysis(user=user, store_name='با داده', status='processing', analysis_data={'store_type': 'پوشاک'}),
+        ])
+        stuck_at = timezone.now() - timedelta(hours=5)
+        StoreAnalysis.objects.filter(user=user).update(updated_at=stuck_at)
+
+        with override_settings(LIARA_AI_API_KEY='stub'):
+            call_command('fix_stuck_analyses', stdout=StringIO())
+
+        rows = {
+            analysis.store_name: analysis
+            for analysis in StoreAnalysis.objects.with_payload('analysis_data').filter(user=user)
+        }
+        self.assertEqual({name: row.status for name, row in rows.items()}, {'بدون داده': 'failed', 'با داده': 'failed'})
+        self.assertIn('داده‌های تحلیل موجود نیست', rows['بدون داده'].analysis_data['error_message'])
+        self.assertIn('بیش از 2 ساعت', rows['با داده'].analysis_data['error_message'])
+        self.assertEqual(rows['با داده'].analysis_data['store_type'], 'پوشاک')
+        for row in rows.values():
+            self.assertGreater(row.updated_at, stuck_at + timedelta(hours=4))
+
+class AtomicQuotaTestCase(TestCase):
+    """تست مصرف اتمیک سهمیه کد تخفیف"""
+
+    def test_discount_code_never_exceeds_max_uses(self):
+        """تست توقف مصرف در max_uses و رد کد منقضی"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import DiscountCode
+
+        now = timezone.now()
+        code = DiscountCode.objects.create(
+            code='ATOMIC2', discount_value=10, discount_percentage=10, max_uses=2,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        stale = DiscountCode.objects.get(pk=code.pk)
+
+        self.assertTrue(code.use_discount())
+        self.assertTrue(DiscountCode.consume(code='ATOMIC2'))
+        # نمونه قدیمی هنوز used_count=0 می‌بیند ولی UPDATE شرطی آن را رد می‌کند
+        self.assertFalse(stale.use_discount())
+        code.refresh_from_db()
+        self.assertEqual(code.used_count, 2)
+
+        DiscountCode.objects.filter(pk=code.pk).update(max_uses=5, valid_until=now - timedelta(minutes=1))
+        self.assertFalse(DiscountCode.consume(code='ATOMIC2'))
+
+
+class PaymentCallbackProcessorTestCase(TestCase):
+    """تست پردازش یکتای callback پرداخت"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='callback_user', password='pass12345')
+        self.payment = Payment.objects.create(
+            order_id='ORD-CB-1', payment_id='PAY-CB-1', user=self.user, amount=10000
+        )
+        self.verifications = 0
+
+    def _process(self, status, result):
+        from .payment_views import _apply_payment_callback
+        from .services.payment_callback import PaymentCallbackProcessor
+
+        callback_data = {'payment_id': 'PAY-CB-1', 'transaction_id': 'TX-1', 'status': status}
+
+        def verify():
+            self.verifications += 1
+            return result
+
+        return PaymentCallbackProcessor.process(
+            gateway='ping_payment',
+            reference='PAY-CB-1',
+            status=status,
+            payment_lookup={'payment_id': 'PAY-CB-1'},
+            verify=verify,
+            apply=lambda payment, res: _apply_payment_callback(payment, callback_data, res),
+        )
+
+    def test_duplicate_callback_replays_with_one_query(self):
+        """تست پاسخ callback تکراری با یک کوئری و بدون verify مجدد"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response, duplicate = self._process('failed', {'success': True, 'status': 'failed'})
+        self.assertEqual(response['status'], 'failed')
+        self.assertFalse(duplicate)
+        self.assertEqual(len(callbacks), 1)  # لاگ‌ها پس از commit نوشته می‌شوند
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+
+        with self.assertNumQueries(1):
+            response, duplicate = self._process('failed', {'success': True, 'status': 'failed'})
+        self.assertTrue(duplicate)
+        self.assertEqual(response, {'status': 'failed', 'message': 'Payment failed'})
+        self.assertEqual(self.verifications, 1)
+
+    def test_failed_verification_is_not_recorded(self):
+        """تست عدم ثبت رسید برای خطای verify تا retry درگاه دوباره پردازش شود"""
+        from .models import PaymentCallbackReceipt
+
+        with self.captureOnCommitCallbacks(execute=False):
+            response, duplicate = self._process('success', {'success': False, 'error': 'timeout'})
+            self.assertEqual(response['status'], 'error')
+            self._process('success', {'success': False, 'error': 'timeout'})
+        self.assertEqual(self.verifications, 2)
+        self.assertFalse(PaymentCallbackReceipt.objects.exists())
+
+
+class ServiceRegistryTestCase(TestCase):
+    """تست ساخت تنبل و اشتراک سرویس‌ها در ServiceRegistry"""
+
+    def tearDown(self):
+        from .ai_services.registry import ServiceRegistry
+        ServiceRegistry.reset()
+
+    def test_services_are_built_once_on_first_use(self):
+        """تست ساخت سرویس فقط در اولین استفاده و ثبت هزینه ساخت"""
+        from .ai_services.registry import ServiceRegistry
+        from .ai_services.service_manager import ServiceManager
+
+        ServiceRegistry.reset()
+        manager = ServiceManager()
+        self.assertFalse(ServiceRegistry.is_loaded('professional'))
+        self.assertEqual(manager.get_service_statistics()['service_status']['professional'], 'not_loaded')
+
+        service = manager.get_service('professional')
+        self.assertIs(service, ServiceRegistry.get('professional'))
+        self.assertIs(service, ServiceManager().get_service('professional'))
+        self.assertFalse(ServiceRegistry.is_loaded('enterprise'))
+
+        stats = ServiceRegistry.construction_stats()['professional']
+        self.assertTrue(stats['loaded'])
+        self.assertGreaterEqual(stats['total_seconds'], stats['init_seconds'])
+
+    def test_warm_up_reports_failures(self):
+        """تست گزارش خطای ساخت در warm-up بدون توقف سایر سرویس‌ها"""
+        from .ai_services.registry import ServiceRegistry
+
+        ServiceRegistry.register('broken', 'store_analysis.missing_module.Service')
+        stats = ServiceRegistry.warm_up(['free', 'broken'])
+        self.assertTrue(stats['free']['loaded'])
+        self.assertFalse(stats['broken']['loaded'])
+        self.assertIn('error', stats['broken'])
+        self.assertIsNone(ServiceRegistry.optional('broken'))
+
+
+class ReconciliationJobTestCase(TestCase):
+    """تست jobهای همگام‌سازی دسته‌ای پرداخت و سفارش"""
+
+    def setUp(self):
+        from .models import Order
+
+        self.user = User.objects.create_user(username='reconcile_user', password='pass12345')
+        for i in range(5):
+            Payment.objects.create(
+                order_id=f'ORD-REC-{i}', user=self.user, amount=1000 + i, status='completed'
+            )
+        Payment.objects.create(order_id='ORD-REC-PENDING', user=self.user, amount=500, status='pending')
+        Order.objects.create(order_number='ORD-REC-0', user=self.user, status='paid')
+
+    def test_orders_created_in_chunks_and_resumable(self):
+        """تست ساخت سفارش‌های گمشده در chunkها و ادامه از چک‌پوینت"""
+        from .models import Order, ReconciliationCheckpoint
+        from .services.reconciliation import OrdersForPaymentsJob
+
+        self.assertEqual(OrdersForPaymentsJob().missing().count(), 4)
+
+        first = OrdersForPaymentsJob(chunk_size=2, limit=2).run()
+        self.assertFalse(first.finished)
+        self.assertEqual(first.written, 2)
+        checkpoint = ReconciliationCheckpoint.objects.get(job='orders_for_payments')
+        self.assertEqual(checkpoint.last_pk, first.last_pk)
+
+        second = OrdersForPaymentsJob(chunk_size=2).run()
+        self.assertEqual(second.resumed_from, first.last_pk)
+        self.assertTrue(second.finished)
+        self.assertEqual(second.written, 2)
+        self.assertFalse(ReconciliationCheckpoint.objects.filter(job='orders_for_payments').exists())
+
+        self.assertEqual(Order.objects.filter(order_number__startswith='ORD-REC-').count(), 5)
+        self.assertEqual(OrdersForPaymentsJob().missing().count(), 0)
+        order = Order.objects.get(order_number='ORD-REC-3')
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual(order.final_amount, 1003)
+
+    def test_tickets_not_duplicated(self):
+        """تست عدم ساخت تیکت تکراری برای پرداخت بدون سفارش"""
+        from .models import SupportTicket
+        from .services.reconciliation import CompletedFormPaymentsJob, TicketsForUnlinkedPaymentsJob
+
+        dry = TicketsForUnlinkedPaymentsJob(dry_run=True).run()
+        self.assertEqual(dry.written, 4)
+        self.assertFalse(SupportTicket.objects.exists())
+
+        self.assertEqual(TicketsForUnlinkedPaymentsJob().run().written, 4)
+        self.assertEqual(TicketsForUnlinkedPaymentsJob().run().written, 0)
+        self.assertEqual(SupportTicket.objects.filter(ticket_id__startswith='TICK-PAY-').count(), 4)
+
+        self.assertEqual(CompletedFormPaymentsJob().run().scanned, 0)
+
+
+class PaymentHistoryTestCase(TestCase):
+    """تست تاریخچه صفحه‌بندی‌شده پرداخت‌ها"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='history_user', password='pass12345')
+        self.payments = [
+            Payment.objects.create(order_id=f'ORD-HIST-{i}', user=self.user, amount=1000, status='completed')
+            for i in range(5)
+        ]
+        self.client.login(username='history_user', password='pass12345')
+
+    def test_cursor_pages_cover_all_payments_once(self):
+        """تست پیمایش کامل تاریخچه با cursor بدون تکرار"""
+        url = reverse('store_analysis:payment_history_api')
+        response = self.client.get(url, {'limit': 2})
+        data = response.json()
+        self.assertEqual(data['summary']['total_count'], 5)
+        seen = [row['order_id'] for row in data['results']]
+        self.assertNotIn('callback_data', data['results'][0])
+
+        while data['next_cursor']:
+            data = self.client.get(url, {'limit': 2, 'cursor': data['next_cursor']}).json()
+            seen.extend(row['order_id'] for row in data['results'])
+        self.assertEqual(seen, [f'ORD-HIST-{i}' for i in reversed(range(5))])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_summary_cache_invalidated_on_status_change(self):
+        """تست باطل شدن خلاصه cache‌شده با تغییر وضعیت پرداخت"""
+        from .services.payment_history import PaymentHistory
+
+        self.assertEqual(PaymentHistory.summary(self.user.id)['completed_count'], 5)
+        with self.assertNumQueries(0):
+            PaymentHistory.summary(self.user.id)
+
+        payment = self.payments[0]
+        payment.status = 'refunded'
+        payment.save(update_fields=['status'])
+        self.assertEqual(PaymentHistory.summary(self.user.id)['completed_count'], 4)
+
+    def test_logs_only_for_owner(self):
+        """تست دسترسی به timeline لاگ فقط برای صاحب پرداخت"""
+        other = User.objects.create_user(username='history_other', password='pass12345')
+        foreign = Payment.objects.create(order_id='ORD-HIST-OTHER', user=other, amount=1000)
+        response = self.client.get(reverse('store_analysis:payment_logs_api', args=[foreign.id]))
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('store_analysis:payment_logs_api', args=[self.payments[0].id]))
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncViewsTestCase(TransactionTestCase):
+    """تست viewهای async مسیر ASGI (ORM در thread pool محدود)"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='async_user', password='pass12345')
+
+    def _seed_status(self, analysis_id, owner_id):
+        from django.core.cache import cache
+        from .utils.progress_bus import ProgressBus
+
+        cache.set(ProgressBus.OWNER_CACHE_KEY.format(analysis_id), owner_id)
+        cache.set(ProgressBus.CHECKED_CACHE_KEY.format(analysis_id), True)
+        ProgressBus.remember({'analysis_id': analysis_id, 'status': 'processing', 'progress': 40,
+                              'timestamp': '2025-01-01T00:00:00'})
+
+    def test_async_status_view(self):
+        """تست وضعیت async: ورود لازم، فقط برای مالک، و پاسخ 304 با ETag"""
+        from asgiref.sync import async_to_sync
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import AsyncRequestFactory
+        from .async_views import get_analysis_status
+
+        self._seed_status(501, self.user.id)
+        self._seed_status(502, self.user.id + 1)
+        factory = AsyncRequestFactory()
+
+        def call(pk, user, headers=None):
+            request = factory.get(f'/store/analysis/{pk}/status/', headers=headers)
+            request.user = user
+            return async_to_sync(get_analysis_status)(request, pk=pk)
+
+        self.assertEqual(call(501, AnonymousUser()).status_code, 302)
+
+        response = call(501, self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['status']['progress'], 40)
+        self.assertEqual(call(501, self.user, {'If-None-Match': response['ETag']}).status_code, 304)
+
+        with self.assertRaises(Http404):
+            call(502, self.user)
+
+    def test_async_chat_call_does_not_block_loop(self):
+        """تست فراخوانی هم‌زمان LLM در مسیر async روی سرور ساختگی کند"""
+        import asyncio
+        import threading
+        import time
+        from unittest import mock
+        from django.test import RequestFactory
+        from .ai_services.ai_consultant_service import AIConsultantService
+        from .chat_views import _start_chat_turn
+        from .loadtest.seed import insert_analyses
+        from .management.commands.run_stub_llm_server import StubLLMHandler, StubLLMServer
+
+        handler = type('TestStubHandler', (StubLLMHandler,), {'latency': 0.3, 'counter': {'requests': 0, 'errors': 0}})
+        server = StubLLMServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        service = AIConsultantService()
+        service.liara_api_key = 'stub'
+        service.api_url = f"http://127.0.0.1:{server.server_address[1]}/api/stub/v1/chat/completions"
+        insert_analyses([StoreAnalysis(
+            user=self.user, store_name='تست', package_type='professional', status='completed',
+            results={'analysis_text': 'ویترین ورودی کم‌نور است'}, analysis_data={'store_type': 'پوشاک'},
+        )])
+        # تحلیل همان‌طور که view async بارگذاری می‌کند (ستون‌های حجیم به‌طور پیش‌فرض defer‌اند)
+        request = RequestFactory().post('/', json.dumps({'message': 'سلام'}), content_type='application/json')
+        request.user = self.user
+        analysis = _start_chat_turn(request, StoreAnalysis.objects.get(user=self.user).id)[0]
+
+        async def scenario():
+            try:
+                return await asyncio.gather(*(
+                    service.achat_with_analysis('سلام', analysis) for _ in range(5)
+                ))
+            finally:
+                await service._async_client.aclose()
+
+        start = time.perf_counter()
+        with mock.patch.object(service, '_prepare_messages', wraps=service._prepare_messages) as prepare:
+            responses = asyncio.run(scenario())
+        elapsed = time.perf_counter() - start
+        self.assertTrue(all(r['success'] and r['ai_model'] == 'gpt-4.1' for r in responses))
+        # context از نتایج تحلیل ساخته شده است، نه fallback نام فروشگاه
+        self.assertIn('ویترین ورودی کم‌نور است', prepare.call_args.args[1])
+        self.assertIn('پوشاک', prepare.call_args.args[1])
+        self.assertEqual(handler.counter['requests'], 5)
+        self.assertLess(elapsed, 1.2)  # پنج درخواست 300ms هم‌زمان، نه پشت سر هم
+
+
+class WorkerTuningTestCase(TestCase):
+    """تست تعیین تعداد worker، بازنشستگی بر اساس RSS و انتظار برای کارهای جاری"""
+
+    def test_plan_limited_by_memory_and_cpu(self):
+        from chidmano.worker_tuning import plan_workers
+
+        by_memory = plan_workers(cpus=8, memory_mb=1024, worker_mb=450, reserve_mb=124)
+        self.assertEqual((by_memory.workers, by_memory.reason), (2, 'memory'))
+        by_cpu = plan_workers(cpus=1, memory_mb=16384, worker_mb=450)
+        self.assertEqual((by_cpu.workers, by_cpu.reason, by_cpu.worker_class), (3, 'cpu', 'gthread'))
+        self.assertEqual(plan_workers(cpus=0.5, memory_mb=300, worker_mb=450).workers, 1)
+
+    def test_fixed_web_concurrency(self):
+        from chidmano.worker_tuning import plan_from_environ
+
+        plan = plan_from_environ({'WEB_CONCURRENCY': '2', 'GUNICORN_THREADS': '1'})
+        self.assertEqual((plan.workers, plan.worker_class, plan.reason), (2, 'sync', 'WEB_CONCURRENCY'))
+        plan = plan_from_environ({'GUNICORN_WORKERS': '3', 'WEB_CONCURRENCY': '2'})
+        self.assertEqual((plan.workers, plan.reason), (3, 'GUNICORN_WORKERS'))
+        # auto در GUNICORN_WORKERS است؛ WEB_CONCURRENCY را gunicorn خودش با int() می‌خواند
+        plan = plan_from_environ({'GUNICORN_WORKERS': 'auto', 'WEB_CONCURRENCY': '2'})
+        self.assertNotIn(plan.reason, ('GUNICORN_WORKERS', 'WEB_CONCURRENCY'))
+
+    def test_liara_env_loads_gunicorn_config(self):
+        """تست اینکه env سرویس web در liara.json پیش‌فرض‌های gunicorn را نمی‌شکند"""
+        import json
+        import os
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        with open(os.path.join(settings.BASE_DIR, 'liara.json')) as f:
+            service_env = json.load(f)['services'][0]['env']
+        # پیش‌فرض workers در gunicorn.config برابر int(os.environ['WEB_CONCURRENCY']) است
+        concurrency = service_env.get('WEB_CONCURRENCY')
+        if concurrency is not None:
+            self.assertTrue(concurrency.isdigit(), concurrency)
+        env = {**os.environ, **service_env}
+        result = subprocess.run([sys.executable, '-c', 'import gunicorn.config'], env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_rss_recycler(self):
+        from chidmano.worker_tuning import MB, RssRecycler
+
+        recycler = RssRecycler(max_growth_mb=100, check_every=2)
+        recycler.start(rss=200 * MB)
+        self.assertIsNone(recycler.should_recycle(rss=900 * MB))  # فقط هر دو درخواست بررسی می‌شود
+        self.assertIsNone(recycler.should_recycle(rss=250 * MB))
+        recycler.should_recycle(rss=0)
+        self.assertIn('RSS grew', recycler.should_recycle(rss=350 * MB))
+
+    def test_inflight_wait_idle(self):
+        import threading
+        from .utils.inflight import InflightTracker
+
+        release = threading.Event()
+        thread = threading.Thread(target=InflightTracker.track(release.wait))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        while not InflightTracker.active():
+            pass
+        self.assertFalse(InflightTracker.wait_idle(0.05, interval=0.01))
+        threading.Timer(0.05, release.set).start()
+        self.assertTrue(InflightTracker.wait_idle(5))
+        self.assertEqual(InflightTracker.active(), 0)
+
+    def test_pdf_font_registered_once(self):
+        from unittest import mock
+        from reportlab.pdfbase import pdfmetrics
+        from .utils import report_generator
+        from .utils.pdf_fonts import preload_persian_font, register_persian_font
+
+        path = preload_persian_font()
+        if path is None:
+            self.skipTest('Vazir.ttf not available')
+        font = pdfmetrics.getFont('Vazir')
+        self.assertEqual((font.face.subset, font.face.embedding), (0, 1))
+        # همه گزارش‌ها (با هر STATIC_ROOT) همان نمونه preload شده را به کار می‌برند و TTF دوباره پارس نمی‌شود
+        with mock.patch('reportlab.pdfbase.ttfonts.TTFont') as ttfont:
+            self.assertEqual(register_persian_font(), 'Vazir')
+            report_generator.ReportGenerator()
+        ttfont.assert_not_called()
+        self.assertIs(pdfmetrics.getFont('Vazir'), font)
+
+
+class PdfRenderPoolTestCase(TestCase):
+    """تست تولید PDF در process pool و نوشتن مستقیم در فایل"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        artifact_dir = tempfile.mkdtemp(prefix='pdf_test_')
+        self.addCleanup(shutil.rmtree, artifact_dir, ignore_errors=True)
+        overrides = override_settings(PDF_ARTIFACT_DIR=artifact_dir, PDF_POOL_WORKERS=1)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _analysis(self, pk=424242):
+        from django.utils import timezone
+        return StoreAnalysis(pk=pk, store_name='فروشگاه تست', status='completed', updated_at=timezone.now(), results={
+            'premium_report': {
+                'cover_page': {'store_name': 'فروشگاه تست', 'layout_score': 70},
+                'executive_summary': {'paragraphs': ['خلاصه آزمایشی گزارش.'] * 3},
+            }
+        })
+
+    def test_render_writes_artifact_once(self):
+        from .services.pdf_renderer import PdfRenderPool
+
+        self.addCleanup(PdfRenderPool.shutdown)
+        analysis = self._analysis()
+        job = PdfRenderPool.render('premium', analysis, wait=120)
+        self.assertEqual(job.status, 'ready', job.error)
+        with open(job.path, 'rb') as f:
+            self.assertEqual(f.read(5), b'%PDF-')
+        self.assertEqual(PdfRenderPool.submit('premium', analysis).status, 'ready')
+        self.assertEqual(PdfRenderPool._jobs, {})
+
+        analysis.results['premium_report']['cover_page']['layout_score'] = 80
+        self.assertNotEqual(PdfRenderPool.artifact_key('premium', analysis), job.key)
+
+    def test_artifact_key_ignores_unsaved_updated_at(self):
+        """تست ساخت کلید فایل فقط از pk و نتایج؛ updated_at حافظه (ذخیره‌نشده) با ردیف تازه pdf_report_status فرق دارد"""
+        from datetime import timedelta
+        from .services.pdf_renderer import PdfRenderPool
+
+        analysis = self._analysis()
+        key = PdfRenderPool.artifact_key('premium', analysis)
+        analysis.updated_at += timedelta(hours=1)
+        self.assertEqual(PdfRenderPool.artifact_key('premium', analysis), key)
+        self.assertNotEqual(PdfRenderPool.artifact_key('premium', self._analysis(pk=424243)), key)
+
+    def test_generator_writes_to_file_object(self):
+        import io
+        from .views import generate_premium_pdf_from_premium_report
+
+        analysis = self._analysis()
+        output = io.BytesIO()
+        size = generate_premium_pdf_from_premium_report(analysis, analysis.results['premium_report'], output=output)
+        self.assertEqual(size, len(output.getvalue()))
+        self.assertTrue(output.getvalue().startswith(b'%PDF-'))
+
+    def test_unknown_kind(self):
+        from .services.pdf_renderer import PdfRenderPool
+
+        with self.assertRaises(ValueError):
+            PdfRenderPool.submit('unknown', self._analysis())
+
+
+class PersianShaperTestCase(TestCase):
+    """تست cache شکل‌دهی متن فارسی"""
+
+    def setUp(self):
+        from .utils.persian_shaping import PersianShaper
+        PersianShaper.clear(static=True)
+        self.addCleanup(PersianShaper.clear, static=True)
+
+    def test_shape_matches_reshaper_and_is_cached(self):
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+        from .utils.persian_shaping import PersianShaper
+
+        text = 'تحلیل رفتار مشتری ۱۲'
+        expected = get_display(arabic_reshaper.reshape(text))
+        self.assertEqual(PersianShaper.shape(text), expected)
+        self.assertEqual(PersianShaper.shape(text), expected)
+        self.assertEqual(PersianShaper.reshape(text), arabic_reshaper.reshape(text))
+        info = PersianShaper.cache_info()
+        self.assertEqual((info['hits'], info['misses']), (1, 2))
+        self.assertEqual(PersianShaper.shape(''), '')
+        self.assertIsNone(PersianShaper.shape(None))
+
+    def test_long_text_bypasses_cache(self):
+        from django.test import override_settings
+        from .utils.persian_shaping import PersianShaper
+
+        with override_settings(PERSIAN_SHAPING_CACHE_MAX_CHARS=10):
+            PersianShaper.shape('متن بلندتر از ده کاراکتر')
+        self.assertEqual(PersianShaper.cache_info()['size'], 0)
+
+    def test_warm_static_strings(self):
+        import json
+        import os
+        import tempfile
+        from .utils.persian_shaping import PersianShaper, STATIC_STRINGS
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            json.dump(['عبارت ثابت سفارشی'], f)
+        self.addCleanup(os.remove, f.name)
+        self.assertGreaterEqual(PersianShaper.warm_from_file(f.name), 2 * (len(STATIC_STRINGS) + 1))
+        PersianShaper.shape('عبارت ثابت سفارشی')
+        PersianShaper.shape('خلاصه اجرایی', bidi=False)
+        self.assertEqual(PersianShaper.cache_info()['misses'], 0)
+
+
+class ApiKeyAuthenticationTestCase(TestCase):
+    """تست کلیدهای API: بررسی HMAC، cache داخل پروسس، scope و ابطال بین workerها"""
+
+    def setUp(self):
+        import os
+        import tempfile
+        from django.test import override_settings
+        from .services.api_keys import ApiKeyService
+
+        fd, version_file = tempfile.mkstemp(prefix='api_keys_version_')
+        os.close(fd)
+        self.addCleanup(os.remove, version_file)
+        overrides = override_settings(API_KEY_VERSION_FILE=version_file)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        ApiKeyService.clear()
+        self.addCleanup(ApiKeyService.clear)
+        self.user = User.objects.create_user('api_user', password='pass-1234')
+
+    def test_verify_is_cached(self):
+        from .services.api_keys import ApiKeyService, InvalidApiKey
+
+        api_key, raw = ApiKeyService.create(self.user, 'poller', ['analysis:status'])
+        self.assertNotIn(raw.split('_', 2)[2], api_key.key_hash)
+        verified = ApiKeyService.verify(raw)
+        self.assertEqual((verified.user_id, verified.scopes), (self.user.id, frozenset({'analysis:status'})))
+        with self.assertNumQueries(0):
+            self.assertEqual(ApiKeyService.verify(raw).get_user().username, 'api_user')
+
+        for bad in (raw[:-1] + ('A' if raw[-1] != 'A' else 'B'), 'chm_nope', 'token'):
+            with self.assertRaises(InvalidApiKey):
+                ApiKeyService.verify(bad)
+        with self.assertRaises(ValueError):
+            ApiKeyService.create(self.user, 'bad', ['admin:all'])
+
+    def test_revocation_propagates(self):
+        from django.utils import timezone
+        from .models import ApiKey
+        from .services.api_keys import ApiKeyService, InvalidApiKey
+
+        api_key, raw = ApiKeyService.create(self.user, 'poller', ['analysis:status'])
+        ApiKeyService.verify(raw)
+        with self.captureOnCommitCallbacks(execute=True):
+            ApiKeyService.revoke(api_key)
+        with self.assertRaises(InvalidApiKey):
+            ApiKeyService.verify(raw)
+
+        # worker دیگر: ابطال در دیتابیس و تغییر version stamp مشترک بدون signal در این پروسس
+        other, other_raw = ApiKeyService.create(self.user, 'other', ['analysis:status'])
+        ApiKeyService.verify(other_raw)
+        ApiKey.objects.filter(pk=other.pk).update(revoked_at=timezone.now())
+        with open(ApiKeyService._version_file(), 'w') as f:
+            f.write('changed-by-another-worker')
+        ApiKeyService._checked_at = 0.0
+        with self.assertRaises(InvalidApiKey):
+            ApiKeyService.verify(other_raw)
+
+    def test_scopes_enforced_on_viewset(self):
+        from rest_framework.test import APIRequestFactory
+        from .api.views import PaymentViewSet
+        from .services.api_keys import ApiKeyService
+
+        _, status_only = ApiKeyService.create(self.user, 'poller', ['analysis:status'])
+        _, payments = ApiKeyService.create(self.user, 'billing', ['payments:read'])
+        view = PaymentViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+
+        response = view(factory.get('/api/v1/payments/', HTTP_AUTHORIZATION=f'Api-Key {status_only}'))
+        self.assertEqual(response.status_code, 403)
+        response = view(factory.get('/api/v1/payments/', HTTP_AUTHORIZATION=f'Api-Key {payments}'))
+        self.assertEqual(response.status_code, 200)
+        response = view(factory.get('/api/v1/payments/', HTTP_AUTHORIZATION='Api-Key chm_x_y'))
+        self.assertEqual(response.status_code, 401)
+
+
+class PremiumSectionSchedulerTestCase(TestCase):
+    """تست اجرای هم‌زمان و وابستگی‌دار بخش‌های PremiumAIAnalysisEngine"""
+
+    def _engine(self, package_type, on_partial=None, latency=0.05):
+        import json
+        import re
+        import threading
+        import time
+        from .ai_services.premium_ai_engine import PremiumAIAnalysisEngine
+
+        engine = PremiumAIAnalysisEngine(package_type, on_partial=on_partial)
+        engine.prompts = []
+        engine.peak = 0
+        lock = threading.Lock()
+        state = {'in_flight': 0}
+
+        def fake_request(prompt, max_tokens=4000, json_mode=False):
+            with lock:
+                engine.prompts.append(prompt)
+                state['in_flight'] += 1
+                engine.peak = max(engine.peak, state['in_flight'])
+            time.sleep(latency)
+            with lock:
+                state['in_flight'] -= 1
+            if json_mode:
+                keys = re.findall(r'=== بخش "(\w+)" ===', prompt)
+                return json.dumps({key: f'تحلیل کامل بخش {key}: نقاط قوت و پیشنهادهای اجرایی فروشگاه' for key in keys})
+            return f'پاسخ شماره {len(engine.prompts)}'
+
+        engine._request_gpt4 = fake_request
+        return engine
+
+    def test_enterprise_runs_each_section_once_under_provider_limit(self):
+        """تست ده فراخوانی (بدون تکرار بخش‌های حرفه‌ای)، سقف هم‌زمانی و ارسال نتایج جزئی"""
+        from django.test import override_settings
+
+        partials = []
+        engine = self._engine('enterprise', on_partial=lambda result, done, total: partials.append((result, done, total)))
+        with override_settings(AI_PROVIDER_CONCURRENCY={'openai': 2}, PROMPT_PACKING_ENABLED=False):
+            result = engine.analyze_store_premium({'store_name': 'فروشگاه تست'})
+
+        self.assertEqual(result['package_type'], 'enterprise')
+        self.assertEqual(len(engine.prompts), 10)
+        self.assertEqual(engine.peak, 2)
+        self.assertEqual(set(result['professional_analysis']['analysis_sections']), set(engine.PROFESSIONAL_SECTIONS))
+        self.assertEqual(set(result['enterprise_additions']), set(engine.ENTERPRISE_SECTIONS))
+
+        # پرامپت بخش وابسته خلاصه بخش‌های پیش‌نیاز را دارد
+        layout_prompt = next(p for p in engine.prompts if 'پیشنهادات چیدمان جدید' in p)
+        self.assertIn('current_condition:', layout_prompt)
+        self.assertNotIn('sales_analysis:', layout_prompt)
+
+        self.assertEqual([done for _, done, _ in partials], list(range(1, 11)))
+        self.assertTrue(all(partial['partial'] for partial, _, _ in partials))
+        self.assertEqual(len(partials[0][0]['professional_analysis']['analysis_sections'])
+                         + len(partials[0][0]['enterprise_additions']), 1)
+
+    def test_enterprise_reuses_professional_results(self):
+        """تست عدم تولید دوباره بخش‌های حرفه‌ای موجود در ارتقا به پلن سازمانی"""
+        from django.test import override_settings
+
+        engine = self._engine('enterprise')
+        with override_settings(PROMPT_PACKING_ENABLED=False):
+            professional = self._engine('professional').analyze_store_premium({'store_name': 'فروشگاه تست'})
+            self.assertEqual(professional['package_type'], 'professional')
+            result = engine.analyze_store_premium({'store_name': 'فروشگاه تست'}, professional_results=professional)
+
+        self.assertEqual(len(engine.prompts), 4)
+        self.assertEqual(
+            result['professional_analysis']['analysis_sections'],
+            professional['analysis_sections'],
+        )
+        for name in engine.PROFESSIONAL_SECTIONS:
+            self.assertLess(result['section_timings'][name]['seconds'], 0.05)
+
+    def test_retry_reruns_only_failed_section(self):
+        """تست fallback بخش ناموفق، حفظ چک‌پوینت بخش‌های موفق و فراخوانی فقط بخش ناموفق در retry"""
+        from django.test import override_settings
+        from .models import AnalysisStageCheckpoint
+
+        def flaky(engine, fail):
+            request = engine._request_gpt4
+
+            def send(prompt, max_tokens=4000, json_mode=False):
+                if fail and 'تحلیل مالی' in prompt:
+                    raise ConnectionError('provider down')
+                return request(prompt, max_tokens, json_mode)
+            engine._request_gpt4 = send
+            return engine
+
+        with override_settings(PROMPT_PACKING_ENABLED=False):
+            first = flaky(self._engine('professional', latency=0), fail=True)
+            result = first.analyze_store_premium({'store_name': 'فروشگاه تست'}, run_id=999)
+            sections = result['analysis_sections']
+            self.assertEqual(sections['financial_analysis']['source'], 'fallback')
+            self.assertIn('error', sections['financial_analysis'])
+            checkpointed = set(AnalysisStageCheckpoint.objects.filter(run_key='premium:999').values_list('stage', flat=True))
+            self.assertEqual(checkpointed, set(first.PROFESSIONAL_SECTIONS) - {'financial_analysis'})
+
+            retry = flaky(self._engine('professional', latency=0), fail=False)
+            result = retry.analyze_store_premium({'store_name': 'فروشگاه تست'}, run_id=999)
+
+        self.assertEqual(len(retry.prompts), 1)
+        self.assertIn('تحلیل مالی', retry.prompts[0])
+        self.assertNotIn('error', result['analysis_sections']['financial_analysis'])
+        # پس از اجرای کامل موفق چک‌پوینت‌ها پاک می‌شوند
+        self.assertFalse(AnalysisStageCheckpoint.objects.filter(run_key='premium:999').exists())
+
+
+class PromptPackingTestCase(TestCase):
+    """تست بسته‌بندی چند بخش گزارش در یک درخواست LLM"""
+
+    def _sections(self, *keys):
+        from .ai_services.prompt_packing import PackedSection
+        return [PackedSection(key, prompt=f'اطلاعات فروشگاه\nدستور بخش {key}', instructions=f'دستور بخش {key}', max_tokens=1000)
+                for key in keys]
+
+    def test_split_and_reissue_only_failed_sections(self):
+        """تست تقسیم پاسخ JSON و درخواست دوباره فقط بخش ناقص به‌صورت جداگانه"""
+        import json
+        from .ai_services.prompt_packing import PromptPacker
+
+        calls = []
+
+        def send(prompt, max_tokens, json_mode):
+            calls.append((json_mode, max_tokens))
+            if json_mode:
+                # بخش c در پاسخ نیست و b بیش از حد کوتاه است
+                return '```json\n' + json.dumps({'a': 'متن کامل بخش الف با جزئیات کافی برای گزارش فروشگاه', 'b': 'کوتاه'}) + '\n```'
+            return 'پاسخ جداگانه: ' + prompt
+
+        packer = PromptPacker(send, system_prompt='سیستم', max_sections=3, max_tokens=5000)
+        outputs, errors, stats = packer.run('اطلاعات فروشگاه', self._sections('a', 'b', 'c', 'd'))
+
+        self.assertEqual(errors, {})
+        self.assertTrue(outputs['a'].startswith('متن کامل بخش الف'))
+        self.assertEqual(outputs['c'], 'پاسخ جداگانه: اطلاعات فروشگاه\nدستور بخش c')
+        # گروه a,b,c بسته‌بندی می‌شود؛ d تنها می‌ماند و b,c جداگانه دوباره درخواست می‌شوند
+        self.assertEqual(calls, [(True, 3000), (False, 1000), (False, 1000), (False, 1000)])
+        self.assertEqual(stats.reissued, ['b', 'c'])
+        self.assertEqual(stats.as_dict()['requests_saved'], 0)
+
+    def test_premium_engine_packs_sections_of_the_same_level(self):
+        """تست کاهش درخواست‌های پلن سازمانی با بسته‌بندی بخش‌های هم‌سطح گراف"""
+        import json
+        import re
+        from django.test import override_settings
+        from .ai_services.premium_ai_engine import PremiumAIAnalysisEngine
+
+        prompts = []
+
+        def fake_request(prompt, max_tokens=4000, json_mode=False):
+            prompts.append((prompt, json_mode))
+            keys = re.findall(r'=== بخش "(\w+)" ===', prompt)
+            return json.dumps({key: f'تحلیل بسته‌بندی‌شده {key}: نقاط قوت، نقاط ضعف و پیشنهادهای اجرایی' for key in keys})
+
+        engine = PremiumAIAnalysisEngine('enterprise')
+        engine._request_gpt4 = fake_request
+        with override_settings(PROMPT_PACKING_ENABLED=True, PROMPT_PACK_MAX_SECTIONS=3):
+            result = engine.analyze_store_premium({'store_name': 'فروشگاه تست'})
+
+        self.assertEqual(len(prompts), 4)
+        self.assertTrue(all(json_mode for _, json_mode in prompts))
+        sections = {**result['professional_analysis']['analysis_sections'], **result['enterprise_additions']}
+        self.assertEqual(len(sections), 10)
+        self.assertTrue(sections['financial_analysis']['analysis_text'].startswith('تحلیل بسته‌بندی‌شده financial_analysis'))
+        packing = result['prompt_packing']
+        self.assertEqual((packing['sections'], packing['requests'], packing['requests_saved']), (10, 4, 6))
+        self.assertGreater(packing['estimated_input_tokens_saved'], 0)
+
+    def test_liara_packs_secondary_sections_with_shared_context(self):
+        """تست ارسال بخش‌های فرعی Liara در درخواست‌های بسته‌بندی‌شده با سرآیند مشترک"""
+        import json
+        import re
+        from django.test import override_settings
+        from .ai_services.liara_ai_service import LiaraAIService
+
+        requests_sent = []
+
+        def fake_make_request(model, prompt, max_tokens=4000, temperature=0.7, json_mode=False):
+            requests_sent.append((prompt, json_mode))
+            keys = re.findall(r'=== بخش "(\w+)" ===', prompt)
+            content = json.dumps({key: f'تحلیل {key} فروشگاه با جزئیات کامل و پیشنهادهای قابل اجرا' for key in keys}) if keys else 'گزارش کامل'
+            return {'choices': [{'message': {'content': content}}]}
+
+        with override_settings(PROMPT_PACKING_ENABLED=True, PROMPT_PACK_MAX_SECTIONS=3, PROMPT_PACK_MAX_TOKENS=6000):
+            service = LiaraAIService()
+            service.api_key = 'test'
+            service._make_request = fake_make_request
+            result = service.analyze_store_comprehensive({'store_name': 'فروشگاه تست', 'products': 'کیف'})
+
+        packed = [prompt for prompt, json_mode in requests_sent if json_mode]
+        # main + دو درخواست بسته‌بندی‌شده (هر کدام دو بخش) + خلاصه نهایی
+        self.assertEqual(len(requests_sent), 4)
+        self.assertEqual(len(packed), 2)
+        for prompt in packed:
+            self.assertEqual(prompt.count('- محصولات: کیف'), 1)
+        self.assertEqual(
+            result['detailed_analyses']['psychology']['content'],
+            'تحلیل psychology فروشگاه با جزئیات کامل و پیشنهادهای قابل اجرا',
+        )
+        self.assertEqual(result['prompt_packing']['requests_saved'], 2)
+
+
+class LoggingPipelineTestCase(TestCase):
+    """تست‌های خط لوله لاگ غیرمسدودکننده (chidmano.logging_pipeline)"""
+
+    def _logger(self, name, handler):
+        import logging
+
+        logger = logging.getLogger(f'logging_pipeline_test.{name}')
+        logger.handlers = [handler]
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'handlers', [])
+        return logger
+
+    def test_async_handler_writes_capped_json_records(self):
+        """تست نوشتن رکورد JSON با سقف طول args و فیلدهای extra در thread پس‌زمینه"""
+        import io
+        import json
+        from chidmano.logging_pipeline import AsyncQueueHandler, JsonFormatter
+
+        stream = io.StringIO()
+        handler = AsyncQueueHandler(stream, max_message_chars=500, max_field_chars=100)
+        handler.setFormatter(JsonFormatter())
+        logger = self._logger('payments', handler)
+
+        body = {'payment_id': 'pay_1', 'raw': 'x' * 5000}
+        logger.info("Payment callback received: %s", body, extra={'gateway': 'payping', 'response': 'y' * 300})
+        try:
+            raise ValueError('درگاه در دسترس نیست')
+        except ValueError:
+            logger.exception("PayPing verify error")
+        handler.flush()
+        handler.close()
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(first['logger'], 'logging_pipeline_test.payments')
+        self.assertIn("'payment_id': 'pay_1'", first['msg'])
+        self.assertLess(len(first['msg']), 300)
+        self.assertEqual(first['gateway'], 'payping')
+        self.assertTrue(first['response'].endswith('…[+200 chars]'))
+        self.assertEqual(len(body['raw']), 5000)
+        self.assertEqual(second['level'], 'ERROR')
+        self.assertIn('ValueError: درگاه در دسترس نیست', second['exc'])
+
+    def test_production_logging_config_applies(self):
+        """تست اعمال settings.LOGGING محیط production با dictConfig (handler غیرمسدودکننده JSON)"""
+        import logging.handlers
+        import os
+        import subprocess
+        import sys
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+
+        # پروسس جدا: تنظیمات production هنگام import ساخته می‌شوند و dictConfig لاگ همین پروسس را عوض نکند
+        script = (
+            "import json, logging, logging.config\n"
+            "from django.conf import settings\n"
+            "logging.config.dictConfig(settings.LOGGING)\n"
+            "print('handler=' + type(logging.getLogger().handlers[0]).__name__)\n"
+            "print('handlers=' + json.dumps(settings.LOGGING['handlers'], default=str))\n"
+            "logging.getLogger('store_analysis.check').info('configured')\n"
+            "logging.shutdown()\n"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'chidmano.settings', 'LIARA': 'true',
+               'LOG_ASYNC': 'True', 'LOG_FORMAT': 'json'}
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('handler=AsyncQueueHandler', result.stdout)
+        # runtime فعلی 3.11 است؛ قاعده 3.12+ (زیرکلاس QueueHandler با 'class' بدون handlers رد می‌شود) جدا بررسی می‌شود
+        handlers = json.loads(next(line for line in result.stdout.splitlines() if line.startswith('handlers='))[9:])
+        for name, config in handlers.items():
+            if 'class' in config and 'handlers' not in config:
+                self.assertFalse(issubclass(import_string(config['class']), logging.handlers.QueueHandler), name)
+        records = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+        self.assertIn('configured', [record['msg'] for record in records])
+
+    def test_sampling_filter_keeps_fraction_and_counts_dropped(self):
+        """تست نمونه‌برداری قطعی، عبور همیشگی WARNING و ثبت تعداد رکوردهای حذف‌شده"""
+        import logging
+        from chidmano.logging_pipeline import SamplingFilter
+
+        sampling = SamplingFilter({'logging_pipeline_test.activity': {'sample': 0.25}})
+        records = [
+            logging.LogRecord('logging_pipeline_test.activity.api', logging.INFO, __file__, 1, 'hit %s', (i,), None)
+            for i in range(8)
+        ]
+        kept = [record for record in records if sampling.filter(record)]
+        self.assertEqual([record.args[0] for record in kept], [0, 4])
+        self.assertEqual(kept[1].sampled_out, 3)
+
+        warning = logging.LogRecord('logging_pipeline_test.activity', logging.WARNING, __file__, 1, 'slow', (), None)
+        self.assertTrue(sampling.filter(warning))
+        other = logging.LogRecord('logging_pipeline_test.payments', logging.INFO, __file__, 1, 'paid', (), None)
+        self.assertTrue(sampling.filter(other))
+
+    def test_rate_limit_drops_bursts_above_per_second(self):
+        """تست محدودیت نرخ token bucket برای loggerهای پرتکرار"""
+        import logging
+        from chidmano.logging_pipeline import SamplingFilter
+
+        sampling = SamplingFilter({'logging_pipeline_test': {'per_second': 3}})
+        records = [
+            logging.LogRecord('logging_pipeline_test.seo', logging.INFO, __file__, 1, 'SEO Request', (), None)
+            for _ in range(10)
+        ]
+        self.assertEqual(sum(sampling.filter(record) for record in records), 3)
+
+
+class StreamingUploadTestCase(TestCase):
+    """تست‌های آپلود جریانی با اعتبارسنجی تدریجی (StreamingUploadHandler)"""
+
+    def _post(self, files, **overrides):
+        from django.test import RequestFactory, override_settings
+
+        settings_overrides = {
+            'FILE_UPLOAD_HANDLERS': ['store_analysis.utils.streaming_upload.StreamingUploadHandler'],
+            **overrides,
+        }
+        with override_settings(**settings_overrides):
+            request = RequestFactory().post('/store/forms/submit/', {'store_name': 'فروشگاه تست', **files})
+            uploaded = dict(request.FILES.items())
+        for file_obj in uploaded.values():
+            self.addCleanup(file_obj.close)
+        return request, uploaded
+
+    def test_valid_files_stream_to_disk_and_move_into_blob_store(self):
+        """تست نوشتن فایل معتبر روی دیسک با hash و انتقال مستقیم آن به blob store"""
+        import hashlib
+        import os
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import override_settings
+        from .utils.file_storage import save_uploaded_file
+        from .utils.streaming_upload import rejected_uploads
+
+        photo = b'\xff\xd8\xff\xe0' + b'j' * 200000
+        request, uploaded = self._post({
+            'store_photos': SimpleUploadedFile('shop.JPG', photo, content_type='image/jpeg'),
+            'sales_file': SimpleUploadedFile('sales.csv', 'تاریخ,فروش\n1403/01/01,2500000\n'.encode(), content_type='text/csv'),
+        })
+        self.assertEqual(rejected_uploads(request), {})
+        store_photo = uploaded['store_photos']
+        self.assertEqual(store_photo.upload_kind, 'image')
+        self.assertEqual(store_photo.sha256, hashlib.sha256(photo).hexdigest())
+        self.assertEqual(store_photo.size, len(photo))
+        temp_path = store_photo.temporary_file_path()
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            info = save_uploaded_file(store_photo)
+            self.assertEqual(info['sha256'], hashlib.sha256(photo).hexdigest())
+            self.assertFalse(os.path.exists(temp_path))
+            with open(info['absolute_path'], 'rb') as f:
+                self.assertEqual(f.read(), photo)
+
+    def test_rejects_disallowed_type_and_mismatched_content(self):
+        """تست رد فایل با پسوند غیرمجاز یا محتوای ناسازگار بدون توقف بقیه فایل‌ها"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils.streaming_upload import rejected_uploads
+
+        request, uploaded = self._post({
+            'store_photos': SimpleUploadedFile('shop.jpg', b'%PDF-1.4 not an image', content_type='image/jpeg'),
+            'store_map': SimpleUploadedFile('map.exe', b'MZ' + b'\x00' * 100),
+            'product_catalog': SimpleUploadedFile('catalog.pdf', b'%PDF-1.7\n' + b'c' * 5000),
+        })
+        self.assertEqual(set(uploaded), {'product_catalog'})
+        errors = rejected_uploads(request)
+        self.assertEqual(set(errors), {'store_photos', 'store_map'})
+        self.assertIn('.jpg', errors['store_photos'])
+        self.assertIn('.exe', errors['store_map'])
+
+    def test_size_limits_reject_early(self):
+        """تست سقف حجم هر نوع فایل و سقف کل درخواست"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils.streaming_upload import rejected_uploads
+
+        big_photo = b'\x89PNG\r\n\x1a\n' + b'p' * (2 * 1024 * 1024)
+        request, uploaded = self._post(
+            {
+                'store_photos': SimpleUploadedFile('big.png', big_photo, content_type='image/png'),
+                'sales_file': SimpleUploadedFile('sales.xlsx', b'PK\x03\x04' + b'x' * 1000),
+            },
+            UPLOAD_MAX_FILE_MB={'image': 1},
+        )
+        self.assertEqual(set(uploaded), {'sales_file'})
+        self.assertIn('مگابایت', rejected_uploads(request)['store_photos'])
+
+        request, uploaded = self._post(
+            {'store_photos': SimpleUploadedFile('big.png', big_photo, content_type='image/png')},
+            UPLOAD_MAX_REQUEST_MB=1,
+        )
+        self.assertEqual(uploaded, {})
+        self.assertIn('حجم کل درخواست', rejected_uploads(request)['store_photos'])
+
+
+class AnalysisStatusLongPollTestCase(TestCase):
+    """تست endpointهای وضعیت روی رکورد پیشرفت: ETA، ETag، long-poll و API"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='long_poller', password='pass12345')
+
+    def _seed(self, analysis_id, owner_id, progress=40):
+        from django.core.cache import cache
+        from .utils.progress_bus import ProgressBus
+
+        cache.set(ProgressBus.OWNER_CACHE_KEY.format(analysis_id), owner_id)
+        cache.set(ProgressBus.CHECKED_CACHE_KEY.format(analysis_id), True, 600)
+        ProgressBus.remember({'analysis_id': analysis_id, 'status': 'processing', 'progress': progress,
+                              'stage': 'layout', 'eta_seconds': 30, 'created_at': '2025-01-01T00:00:00',
+                              'timestamp': '2025-01-01T00:01:00'})
+
+    def test_stage_events_carry_eta_and_created_at(self):
+        """تست تخمین زمان باقی‌مانده از مراحل تمام‌شده و حفظ created_at رکورد"""
+        from .utils.progress_bus import ProgressBus
+
+        self._seed(21, self.user.id)
+        on_start, on_complete = ProgressBus.stage_callbacks(21, user_id=self.user.id)
+        on_start('design', 0, 4)
+        self.assertIsNone(ProgressBus.latest(21)['eta_seconds'])
+        on_complete('design', 1, 4)
+        state = ProgressBus.latest(21)
+        self.assertEqual((state['stage'], state['progress']), ('design', 25))
+        self.assertIsInstance(state['eta_seconds'], int)
+        self.assertEqual(state['created_at'], '2025-01-01T00:00:00')
+
+    def test_api_status_reads_only_progress_record(self):
+        """تست action وضعیت API بدون کوئری دیتابیس، با 304 و فقط برای مالک"""
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .api.views import StoreAnalysisViewSet
+
+        self._seed(22, self.user.id, progress=60)
+        self._seed(23, self.user.id + 1)
+        view = StoreAnalysisViewSet.as_view({'get': 'status'})
+        factory = APIRequestFactory()
+
+        def call(pk, **headers):
+            request = factory.get(f'/api/v1/analyses/{pk}/status/', **headers)
+            force_authenticate(request, user=self.user)
+            return view(request, pk=pk)
+
+        with self.assertNumQueries(0):
+            response = call(22)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['progress'], response.data['stage'], response.data['eta_seconds']), (60, 'layout', 30)
+        )
+        self.assertTrue(response.data['is_processing'])
+        self.assertEqual(call(22, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(call(23).status_code, 404)
+
+    def test_long_poll_returns_on_publish(self):
+        """تست بیدار شدن long-poll view async با انتشار رویداد جدید و پاسخ 304 پس از پایان انتظار"""
+        import threading
+        import time
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncRequestFactory, override_settings
+        from .async_views import get_analysis_status
+        from .utils.progress_bus import ProgressBus, ProgressEvent, STAGE_COMPLETED
+
+        self._seed(24, self.user.id)
+
+        def call(etag, wait=10):
+            request = AsyncRequestFactory().get('/', {'wait': wait}, headers={'If-None-Match': etag})
+            request.user = self.user
+            return async_to_sync(get_analysis_status)(request, pk=24)
+
+        etag = call('', wait=0)['ETag']
+        timer = threading.Timer(0.2, ProgressBus.publish, args=[ProgressEvent(
+            analysis_id=24, event=STAGE_COMPLETED, stage='sales', progress=75, user_id=self.user.id,
+        )])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with override_settings(ANALYSIS_STATUS_POLL_INTERVAL=0.05):
+            start = time.monotonic()
+            response = call(etag)
+            elapsed = time.monotonic() - start
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['status']['progress'], 75)
+        self.assertLess(elapsed, 3)
+
+        with override_settings(ANALYSIS_STATUS_LONG_POLL_MAX=0.3):
+            self.assertEqual(call(response['ETag']).status_code, 304)
+
+    def test_sync_status_view_ignores_wait(self):
+        """تست اینکه view همگام وضعیت با ?wait= منتظر نمی‌ماند و thread worker را اشغال نمی‌کند"""
+        import time
+
+        self._seed(25, self.user.id)
+        self.client.force_login(self.user)
+        url = reverse('store_analysis:get_analysis_status', args=[25])
+        etag = self.client.get(url)['ETag']
+
+        start = time.monotonic()
+        response = self.client.get(url, {'wait': 10}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class AnalysisPayloadTestCase(TestCase):
+    """تست defer پیش‌فرض ستون‌های JSON حجیم و فشرده‌سازی اسناد بزرگ"""
+
+    def test_heavy_json_fields_deferred_by_default(self):
+        """تست اینکه لیست‌ها ستون‌های JSON را نمی‌خوانند مگر با with_payload"""
+        from .models import HEAVY_JSON_FIELDS
+
+        def selected(queryset):
+            sql = str(queryset.query)
+            return {name for name in HEAVY_JSON_FIELDS if f'"{name}"' in sql}
+
+        self.assertEqual(selected(StoreAnalysis.objects.filter(status='completed')), set())
+        self.assertEqual(selected(StoreAnalysis.objects.with_payload('results')), {'results'})
+        self.assertEqual(selected(StoreAnalysis.objects.with_payload()), set(HEAVY_JSON_FIELDS))
+        self.assertEqual(selected(StoreAnalysis.objects.only('id', 'status').with_payload('store_images')), {'store_images'})
+        flagged = StoreAnalysis.objects.with_result_flags()
+        self.assertIn('results_present', flagged.query.annotations)
+        self.assertEqual(flagged.query.deferred_loading, StoreAnalysis.objects.all().query.deferred_loading)
+
+    def test_large_documents_compressed_transparently(self):
+        """تست فشرده‌سازی سند بزرگ در ذخیره و بازشدن آن هنگام خواندن"""
+        from django.db import connection
+        from django.test import override_settings
+        from .utils.json_payload import is_compressed, pack
+
+        field = StoreAnalysis._meta.get_field('results')
+        document = {'premium_report': {'sections': ['تحلیل چیدمان فروشگاه ' * 50] * 40}}
+        small = {'scores': {'layout': 80}}
+        with override_settings(ANALYSIS_JSON_COMPRESS_MIN_BYTES=1024):
+            stored = field.get_db_prep_value(document, connection)
+            self.assertFalse(is_compressed(field.get_prep_value(small)))
+            self.assertTrue(is_compressed(field.get_prep_value(document)))
+        self.assertLess(len(str(stored)), len(str(document)) // 5)
+        self.assertEqual(field.from_db_value(stored, None, connection), document)
+        # ردیف‌های قدیمی فشرده‌نشده بدون تغییر خوانده می‌شوند
+        self.assertEqual(field.from_db_value('{"scores": {"layout": 80}}', None, connection), small)
+        with override_settings(ANALYSIS_JSON_COMPRESS_MIN_BYTES=0):
+            self.assertIs(pack(document), document)
+
+
+class QueryBudgetTestCase(TestCase):
+    """تست شمارش کوئری، تشخیص N+1 و بودجه کوئری viewهای پرترافیک"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_superuser('budget_admin', 'budget@example.com', 'pass12345')
+        self.client.force_login(self.user)
+
+    def _add_rows(self, count):
+        from django.db import connection
+
+        # جدول تست ستون‌های NOT NULL قدیمی contact_email/contact_phone را دارد که در مدل نیستند
+        fields = [f for f in StoreAnalysis._meta.concrete_fields if not f.primary_key]
+        columns = [f.column for f in fields] + ['contact_email', 'contact_phone']
+        start = StoreAnalysis.objects.count()
+        for i in range(start, start + count):
+            analysis = StoreAnalysis(user=self.user, store_name=f'فروشگاه {i}', status='completed',
+                                     analysis_data={'city': 'تهران'})
+            values = [f.get_db_prep_save(f.pre_save(analysis, True), connection) for f in fields]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {StoreAnalysis._meta.db_table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join(['%s'] * len(columns))})",
+                    values + ['budget@example.com', '']
+                )
+            Payment.objects.create(order_id=f'ORD-BUDGET-{i}', user=self.user, amount=1000, status='completed')
+
+    def test_fingerprint_groups_queries_by_shape(self):
+        """تست یکسان شدن اثر انگشت کوئری‌هایی که فقط در مقادیر فرق دارند"""
+        from .services.query_budget import fingerprint
+
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id = 5 AND name = \'a\''),
+            fingerprint('SELECT  *  FROM t WHERE id = 17 AND name = \'bb\''),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s, %s)'),
+        )
+        self.assertNotEqual(fingerprint('SELECT * FROM t1'), fingerprint('SELECT * FROM t2'))
+
+    def test_n_plus_one_detected(self):
+        """تست خطای بودجه برای کوئری تکراری در حلقه"""
+        from .services.query_budget import QueryBudgetExceeded, query_budget
+
+        self._add_rows(4)
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            with query_budget(repeats=2):
+                for payment in Payment.objects.all():
+                    payment.user.username
+        self.assertIn('N+1', str(caught.exception))
+
+        with query_budget(queries=1, repeats=1) as stats:
+            list(Payment.objects.select_related('user'))
+        self.assertEqual(stats.count, 1)
+
+    def test_hot_views_within_budget_regardless_of_row_count(self):
+        """تست ثابت ماندن تعداد کوئری viewهای پرترافیک با افزایش ردیف‌ها"""
+        from .services.query_budget import query_budget
+
+        labels = [
+            'store_analysis:user_dashboard',
+            'store_analysis:analysis_list',
+            'store_analysis:admin_dashboard',
+            'admin:store_analysis_storeanalysis_changelist',
+            'admin:store_analysis_payment_changelist',
+        ]
+        urls = {
+            'admin:store_analysis_storeanalysis_changelist': reverse('admin:store_analysis_storeanalysis_changelist'),
+            'admin:store_analysis_payment_changelist': reverse('admin:store_analysis_payment_changelist'),
+        }
+        counts = {}
+        for rows in (2, 10):
+            self._add_rows(rows - StoreAnalysis.objects.count())
+            for label in labels:
+                with query_budget(label) as stats:
+                    response = self.client.get(urls.get(label) or reverse(label))
+                self.assertEqual(response.status_code, 200, label)
+                counts.setdefault(label, []).append(stats.count)
+        # اولین درخواست کارهای یک‌باره (cache و آمار روزانه) هم دارد؛ فقط رشد با ردیف‌ها خطاست
+        for label, (small, large) in counts.items():
+            self.assertLessEqual(large, small, f"{label}: {small} -> {large} queries")
+
+    def test_middleware_headers_and_report(self):
+        """تست هدرهای X-DB-* و ثبت در گزارش «کوئری‌ها»"""
+        from django.test import override_settings
+        from .services.query_budget import QueryReport
+
+        with override_settings(QUERY_INSTRUMENTATION_ENABLED=True, QUERY_INSTRUMENTATION_HEADERS=True):
+            response = self.client.get(reverse('store_analysis:analysis_list'))
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+        self.assertIn('X-DB-Time-Ms', response)
+
+        rows = {row['label']: row for row in QueryReport.summary()}
+        self.assertEqual(rows['store_analysis:analysis_list']['runs'], 1)
+        self.assertEqual(rows['store_analysis:analysis_list']['budget'], 20)
+
+        response = self.client.get(reverse('store_analysis:admin_reports'), {'type': 'queries'})
+        self.assertContains(response, 'store_analysis:analysis_list')
+
+    def test_cold_requests_within_budget_in_strict_mode(self):
+        """تست اینکه اولین درخواست روز (با کار یک‌باره middlewareها) با QUERY_BUDGET_STRICT خطای 500 نمی‌دهد"""
+        from django.conf import settings
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .models import SiteStats
+
+        self._add_rows(3)
+        labels = [label for label in settings.QUERY_BUDGETS if not label.startswith('task:')]
+        with override_settings(QUERY_INSTRUMENTATION_ENABLED=True, QUERY_BUDGET_STRICT=True):
+            for label in labels:
+                with self.subTest(label=label):
+                    SiteStats.objects.all().delete()
+                    cache.clear()
+                    response = self.client.get(reverse(label))
+                    self.assertIn(response.status_code, (200, 302))
+
+    def test_instrumentation_off_by_default_outside_debug(self):
+        """تست خاموش بودن پیش‌فرض ثبت کوئری در production و حذف middleware از زنجیره"""
+        import os
+        import subprocess
+        import sys
+        from django.conf import settings
+        from django.test import Client, override_settings
+        from .services.query_budget import QueryReport
+
+        script = (
+            "from django.conf import settings\n"
+            "print('enabled=%s' % settings.QUERY_INSTRUMENTATION_ENABLED)\n"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'chidmano.settings', 'DEBUG': 'False'}
+        env.pop('QUERY_INSTRUMENTATION_ENABLED', None)
+        env.pop('RENDER', None)
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('enabled=False', result.stdout)
+
+        with override_settings(QUERY_INSTRUMENTATION_ENABLED=False, QUERY_INSTRUMENTATION_HEADERS=True):
+            client = Client()
+            client.force_login(self.user)
+            response = client.get(reverse('store_analysis:analysis_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Queries', response)
+        self.assertEqual(QueryReport.summary(), [])
+
+
+class IndexAdvisorTestCase(TestCase):
+    """تست پیشنهاد ایندکس از شکل کوئری‌ها و پوشش مسیرهای پرترافیک با migration 0131"""
+
+    def test_hot_path_workload_covered_by_existing_indexes(self):
+        """تست اینکه workload مسیرهای پرترافیک پس از migrationها ایندکس جدیدی لازم ندارد"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('advise_indexes', '--seed', '200', stdout=out)
+        self.assertIn('همه شکل‌های کوئری با ایندکس‌های موجود پوشش داده می‌شوند', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='index_advisor_').exists())
+
+    def test_uncovered_shape_gets_composite_index_and_plan_changes(self):
+        """تست پیشنهاد ایندکس ترکیبی برای شکل پوشش‌داده‌نشده و تغییر طرح اجرا"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import PageView
+        from .services.index_advisor import IndexAdvisor, ShapeCollector
+
+        collector = ShapeCollector()
+        with collector.record():
+            list(PageView.objects.filter(ip_address='127.0.0.1', created_at__gte=timezone.now() - timedelta(days=1)))
+            Payment.objects.filter(order_id='ORD-UNIQUE').first()
+
+        advisor = IndexAdvisor(collector)
+        proposals = advisor.proposals()
+        # order_id یکتاست و ایندکس جدیدی لازم ندارد
+        self.assertEqual([(p.model, p.fields) for p in proposals], [(PageView, ['ip_address', '-created_at'])])
+
+        report = advisor.explain_report(proposals)
+        self.assertEqual(len(report), 1)
+        self.assertNotIn(proposals[0].name, report[0]['before'])
+        self.assertIn(proposals[0].name, report[0]['after'])
+        # ایندکس موقت rollback شده است
+        self.assertEqual(advisor.proposals()[0].name, proposals[0].name)
+
+    def test_postgres_log_shapes_and_partial_condition(self):
+        """تست خواندن لاگ پستگرس و تبدیل ستون boolean ثابت به شرط ایندکس partial"""
+        from django.db import connection
+        from .services.index_advisor import IndexAdvisor, ShapeCollector
+
+        collector = ShapeCollector()
+        count = collector.read_postgres_log([
+            'LOG:  duration: 2.0 ms  execute <unnamed>: SELECT "store_analysis_reviewreminder"."id" '
+            'FROM "store_analysis_reviewreminder" WHERE ("store_analysis_reviewreminder"."analysis_id" = $1\n',
+            '\tAND NOT "store_analysis_reviewreminder"."email_sent") ORDER BY "store_analysis_reviewreminder"."created_at" DESC\n',
+            "DETAIL:  parameters: $1 = '7'\n",
+        ])
+        self.assertEqual(count, 1)
+        shape = next(iter(collector.shapes.values()))
+        self.assertEqual(shape.equality, ('analysis_id', 'email_sent'))
+        self.assertIn("= '7'", shape.sample[0])
+
+        proposals = IndexAdvisor(collector).proposals()
+        self.assertEqual(proposals[0].fields, ['analysis', '-created_at'])
+        if connection.features.supports_partial_indexes:
+            self.assertEqual(proposals[0].condition.children, [('email_sent', False)])
+
+
+class LoadTestHarnessTestCase(TestCase):
+    """تست سرورهای ساختگی، داده seed‌شده و اجرای سناریوهای load test"""
+
+    def test_stub_cluster_serves_gateways_llm_and_smtp(self):
+        """تست پاسخ سرورهای ساختگی به درگاه‌ها، Ollama و SMTP از طریق تنظیمات جایگزین"""
+        import requests
+        from django.core.mail import send_mail
+        from django.test import override_settings
+        from .loadtest.stubs import StubCluster
+        from .payment_gateways import PayPingGateway, ZarinpalGateway
+
+        with StubCluster(latency=0.0) as cluster, override_settings(**cluster.settings_overrides()):
+            payping = PayPingGateway(token='stub', sandbox=True)
+            self.assertTrue(payping.base_url.startswith(cluster.url('payping')))
+            result = payping.verify_payment('REF-1', 1000)
+            self.assertEqual(result['status'], 'success')
+
+            zarinpal = ZarinpalGateway(sandbox=True)
+            self.assertEqual(zarinpal.base_url, f"{cluster.url('zarinpal')}/pg/v4/payment/")
+            result = zarinpal.create_payment_request(1000, 'تست', 'http://testserver/callback')
+            self.assertEqual(result['status'], 'success')
+
+            response = requests.post(f"{cluster.url('ollama')}/api/chat", json={'model': 'llama3.2'}, timeout=5)
+            self.assertTrue(response.json()['done'])
+
+            self.assertEqual(send_mail('تست', 'متن', 'from@test.com', ['to@test.com']), 1)
+            stats = cluster.stats()
+        for name in ('payping', 'zarinpal', 'ollama', 'smtp'):
+            self.assertEqual(stats[name], {'requests': 1, 'errors': 0})
+
+    def test_stub_error_rate_per_service(self):
+        """تست اعمال نرخ خطای سرویس از overrides بدون تأثیر روی سرویس‌های دیگر"""
+        import requests
+        from .loadtest.stubs import StubCluster
+
+        with StubCluster(latency=0.0, overrides={'payping': {'error_rate': 1.0}}) as cluster:
+            failed = requests.post(f"{cluster.url('payping')}/v2/pay/verify", json={'refId': 'x'}, timeout=5)
+            passed = requests.post(f"{cluster.url('zarinpal')}/pg/v4/payment/verify.json", json={}, timeout=5)
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(passed.json()['data']['code'], 100)
+
+    def test_seed_is_reproducible_and_clear_removes_data(self):
+        """تست اینکه seed کاربران و داده هر سناریو را می‌سازد، load_users همان را می‌خواند و clear حذف می‌کند"""
+        from .loadtest import seed as seeding
+
+        users = seeding.seed(users=2, analyses=4, orders=1, page_views=10, seed=7)
+        self.assertEqual(len(users), 2)
+        for user in users:
+            self.assertEqual(len(user.completed_ids), 2)
+            self.assertEqual(len(user.processing_ids), 2)
+            self.assertEqual(len(user.order_numbers), 1)
+        self.assertEqual(seeding.load_users(), users)
+
+        seeding.clear()
+        self.assertEqual(seeding.load_users(), [])
+        self.assertFalse(Payment.objects.filter(order_id__startswith=seeding.ORDER_PREFIX).exists())
+
+    def test_runner_reports_percentiles_per_scenario(self):
+        """تست اجرای سناریوها با ClientSession و گزارش p50/p95/p99 و throughput"""
+        from .loadtest import seed as seeding
+        from .loadtest.runner import LoadRunner, percentile
+        from .loadtest.scenarios import ClientSession
+
+        self.assertEqual(percentile([4, 1, 3, 2, 5], 50), 3)
+        users = seeding.seed(users=1, analyses=2, orders=0, page_views=0)
+        runner = LoadRunner(ClientSession, users, mix={'home': 1, 'status_polling': 1, 'payment_callback': 1},
+                            concurrency=1, iterations=6)
+        self.assertEqual(runner.skipped, ['payment_callback'])
+
+        report = runner.run()
+        rows = {row['scenario']: row for row in report.rows}
+        self.assertEqual(report.errors, {})
+        self.assertEqual(rows['total']['requests'], sum(rows[n]['requests'] for n in rows if n != 'total'))
+        for row in rows.values():
+            self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+            self.assertLessEqual(row['p95_ms'], row['p99_ms'])
+            self.assertGreater(row['rps'], 0)
@@ -3,11 +3,21 @@
 from . import payment_views
 from . import chat_views
 from . import admin_payment_test_views
+from django.conf import settings
 from django.http import HttpResponse
 from django.views.generic import RedirectView
 
 app_name = 'store_analysis'
 
+# در حالت ASGI نسخه async viewهای I/O-bound (LLM، polling وضعیت) ثبت می‌شود
+if getattr(settings, 'ASGI_MODE', False):
+    from . import async_views
+    chat_send_view = async_views.ai_consultant_send
+    analysis_status_view = async_views.get_analysis_status
+else:
+    chat_send_view = chat_views.ai_consultant_send
+    analysis_status_view = views.get_analysis_status
+
 def health(request):
     return HttpResponse("OK")
 
@@ -40,16 +50,17 @@ def health(request):
         # Backwards-compatible alias for previous URL name used in tests/clients
         path('<int:pk>/results/', views.analysis_results, name='analysis_detail'),
         path('<int:pk>/download/', views.download_analysis_report, name='download_analysis'),
+        path('<int:pk>/download/pdf/status/', views.pdf_report_status, name='pdf_report_status'),
         path('<int:pk>/view-report/', views.view_analysis_report, name='view_analysis_report'),
         path('<int:pk>/progress/', views.analysis_progress, name='analysis_progress'),
         path('<int:pk>/start/', views.start_analysis, name='start_analysis'),
-        path('<int:pk>/status/', views.get_analysis_status, name='get_analysis_status'),
+        path('<int:pk>/status/', analysis_status_view, name='get_analysis_status'),
         path('<int:pk>/process/', views.admin_process_analysis, name='admin_process_analysis'),
         path('<int:pk>/delete/', views.delete_analysis, name='delete_analysis'),
         
         # AI Consultant (چت‌بات هوشمند)
         path('<str:analysis_id>/chat/', chat_views.ai_consultant_chat, name='ai_consultant_chat'),
-        path('<str:analysis_id>/chat/send/', chat_views.ai_consultant_send, name='ai_consultant_send'),
+        path('<str:analysis_id>/chat/send/', chat_send_view, name='ai_consultant_send'),
     ])),
     
     # پشتیبانی - فقط توابع اصلی
@@ -108,6 +119,9 @@ def health(request):
     path('payment/history/', payment_views.payment_history, name='payment_history'),
     path('payment/detail/<int:payment_id>/', payment_views.payment_detail, name='payment_detail'),
     path('subscriptions/', payment_views.user_subscriptions, name='user_subscriptions'),
+    path('payment/history/api/', payment_views.payment_history_api, name='payment_history_api'),
+    path('payment/detail/<int:payment_id>/logs/', payment_views.payment_logs_api, name='payment_logs_api'),
+    path('subscriptions/api/', payment_views.user_subscriptions_api, name='user_subscriptions_api'),
         path('mock/payment/success/<str:authority>/', views.mock_payment_success, name='mock_payment_success'),
     
     # PayPing Callback URLs
@@ -0,0 +1,49 @@
+"""
+دسترسی امن ORM از viewهای async
+
+viewهای async در حالت ASGI کار پایگاه داده را در یک thread pool محدود اجرا می‌کنند؛
+تعداد threadها (و در نتیجه اتصال‌های هم‌زمان دیتابیس هر worker) با ASYNC_DB_THREADS
+محدود است و event loop هیچ‌وقت روی کوئری یا قفل دیتابیس block نمی‌شود. اتصال‌های
+منقضی (CONN_MAX_AGE) پیش و پس از هر فراخوانی مانند چرخه request/response بسته می‌شوند.
+"""
+
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def db_executor() -> ThreadPoolExecutor:
+    """thread pool مشترک پروسس برای کارهای ORM viewهای async"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, getattr(settings, 'ASYNC_DB_THREADS', 8)),
+                    thread_name_prefix='async-db',
+                )
+    return _executor
+
+
+def db_sync_to_async(func: Callable) -> Callable:
+    """
+    نسخه awaitable تابع sync که در thread pool محدود دیتابیس اجرا می‌شود؛
+    کل تابع در یک thread اجرا می‌شود تا transaction.atomic داخل آن معتبر بماند.
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=db_executor())
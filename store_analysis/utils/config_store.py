@@ -0,0 +1,208 @@
+"""
+ذخیره‌ساز پیکربندی در حافظه پروسس برای SystemSettings و تخفیف‌های فعال
+
+تمام SystemSettings و اطلاعیه‌های تخفیف فعال با یک کوئری برای هر جدول بارگذاری
+می‌شوند و خواندن‌های بعدی بدون هیچ کوئری دیتابیس انجام می‌شود. تغییرات از طریق
+سیگنال‌های post_save/post_delete یک version stamp مشترک (فایل + کش) را عوض می‌کنند
+تا سایر workerها هم snapshot خود را تازه کنند.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """نمای فقط‌خواندنی از تنظیمات و تخفیف‌ها در یک لحظه"""
+    settings: Dict[str, str] = field(default_factory=dict)
+    discounts: List[Any] = field(default_factory=list)
+    version: Any = None
+    loaded_at: float = 0.0
+
+
+class ConfigStore:
+    """پیکربندی کش‌شده در سطح پروسس با خواندن بدون کوئری در مسیر داغ"""
+
+    VERSION_CACHE_KEY = 'config_store_version'
+    ADMIN_SETTINGS_KEY = 'admin_settings'
+
+    # هر چند ثانیه یک بار version stamp بررسی شود
+    CHECK_INTERVAL = 2.0
+    # حداکثر عمر snapshot حتی بدون تغییر version (شبکه ایمنی)
+    MAX_AGE = 300.0
+
+    _snapshot: Optional[ConfigSnapshot] = None
+    _checked_at: float = 0.0
+    _lock = threading.Lock()
+
+    # --- Version stamp ---
+
+    @classmethod
+    def _version_file(cls) -> str:
+        return getattr(
+            settings,
+            'CONFIG_STORE_VERSION_FILE',
+            os.path.join(tempfile.gettempdir(), 'chidmano_config.version')
+        )
+
+    @classmethod
+    def _read_version(cls):
+        """خواندن version stamp مشترک بین workerها (بدون کوئری دیتابیس)"""
+        file_stamp = None
+        try:
+            with open(cls._version_file()) as f:
+                file_stamp = f.read()
+        except OSError:
+            pass
+        try:
+            cache_stamp = cache.get(cls.VERSION_CACHE_KEY)
+        except Exception:
+            cache_stamp = None
+        return (file_stamp, cache_stamp)
+
+    @classmethod
+    def bump_version(cls) -> None:
+        """اعلام تغییر پیکربندی به همه workerها"""
+        cls.invalidate()
+        stamp = uuid.uuid4().hex
+        try:
+            with open(cls._version_file(), 'w') as f:
+                f.write(stamp)
+        except OSError as e:
+            logger.warning(f"Could not write config version file: {e}")
+        try:
+            cache.set(cls.VERSION_CACHE_KEY, stamp, timeout=None)
+        except Exception as e:
+            logger.warning(f"Could not write config version to cache: {e}")
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """دور انداختن snapshot محلی همین worker"""
+        with cls._lock:
+            cls._snapshot = None
+            cls._checked_at = 0.0
+
+    # --- Loading ---
+
+    @classmethod
+    def _load(cls, version) -> ConfigSnapshot:
+        from ..models import DiscountNotification, SystemSettings
+
+        loaded_settings: Dict[str, str] = {}
+        try:
+            loaded_settings = dict(SystemSettings.objects.values_list('key', 'value'))
+        except Exception as e:
+            logger.error(f"Error loading system settings: {e}")
+
+        discounts: List[Any] = []
+        try:
+            # تخفیف‌های آینده هم بارگذاری می‌شوند تا شروعشان بدون reload دیده شود
+            discounts = list(
+                DiscountNotification.objects.filter(
+                    is_active=True,
+                    end_date__gte=timezone.now()
+                ).order_by('-discount_percentage', '-created_at')
+            )
+        except Exception as e:
+            logger.error(f"Error loading discount notifications: {e}")
+
+        return ConfigSnapshot(
+            settings=loaded_settings,
+            discounts=discounts,
+            version=version,
+            loaded_at=time.monotonic(),
+        )
+
+    @classmethod
+    def snapshot(cls) -> ConfigSnapshot:
+        """دریافت snapshot جاری؛ فقط هنگام تغییر version یا انقضا بارگذاری مجدد می‌شود"""
+        now = time.monotonic()
+        snap = cls._snapshot
+        if snap is not None and now - cls._checked_at < cls.CHECK_INTERVAL:
+            return snap
+
+        with cls._lock:
+            snap = cls._snapshot
+            version = cls._read_version()
+            if (
+                snap is None
+                or snap.version != version
+                or now - snap.loaded_at > cls.MAX_AGE
+            ):
+                snap = cls._load(version)
+                cls._snapshot = snap
+            cls._checked_at = now
+            return snap
+
+    # --- Typed read API ---
+
+    @classmethod
+    def get(cls, key: str, default: Optional[str] = None) -> Optional[str]:
+        """معادل SystemSettings.get_setting بدون کوئری"""
+        return cls.snapshot().settings.get(key, default)
+
+    @classmethod
+    def get_int(cls, key: str, default: int = 0) -> int:
+        try:
+            return int(cls.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    @classmethod
+    def get_decimal(cls, key: str, default: Decimal = Decimal('0')) -> Decimal:
+        try:
+            return Decimal(str(cls.get(key, default)))
+        except (InvalidOperation, TypeError, ValueError):
+            return default
+
+    @classmethod
+    def get_bool(cls, key: str, default: bool = False) -> bool:
+        value = cls.get(key)
+        if value is None:
+            return default
+        return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    @classmethod
+    def get_json(cls, key: str, default: Any = None) -> Any:
+        value = cls.get(key)
+        if value is None:
+            return default
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return default
+
+    @classmethod
+    def get_active_discounts(cls) -> List[Any]:
+        """اطلاعیه‌های تخفیف فعال در همین لحظه، به ترتیب درصد تخفیف"""
+        now = timezone.now()
+        return [
+            d for d in cls.snapshot().discounts
+            if d.start_date <= now <= d.end_date
+        ]
+
+    @classmethod
+    def get_current_discount(cls):
+        """معادل DiscountNotification.get_current_discount بدون کوئری"""
+        active = cls.get_active_discounts()
+        return active[0] if active else None
+
+    @classmethod
+    def get_admin_settings(cls) -> Dict[str, Any]:
+        """تنظیمات صفحه مدیریت که در SystemSettings ذخیره شده‌اند"""
+        value = cls.get_json(cls.ADMIN_SETTINGS_KEY, {})
+        return value if isinstance(value, dict) else {}
@@ -2,8 +2,11 @@
 Helper functions for file storage that work with read-only filesystem (Liara)
 """
 import os
-import uuid
+import json
 import errno
+import hashlib
+import tempfile
+import time
 from django.core.files.storage import default_storage
 from django.conf import settings
 import logging
@@ -11,62 +14,155 @@
 logger = logging.getLogger(__name__)
 
 
+TMP_MEDIA_ROOT = '/tmp/media'
+BLOB_DIR = 'blobs'
+
+
+def _is_liara():
+    """
+    تشخیص Liara از طریق چند روش:
+    1. متغیر LIARA
+    2. وجود LIARA_AI_API_KEY (که در Liara تنظیم می‌شود)
+    3. hostname که شامل liara باشد
+    """
+    return (
+        os.getenv('LIARA') == 'true' or
+        bool(os.getenv('LIARA_AI_API_KEY')) or
+        bool(os.getenv('LIARA_APP_NAME')) or
+        bool(os.getenv('LIARA_PROJECT_ID')) or
+        'liara' in os.getenv('HOSTNAME', '').lower() or
+        'liara' in os.getenv('ALLOWED_HOSTS', '').lower()
+    )
+
+
+def get_blob_roots():
+    """
+    All directories that may hold content-addressed blobs, as (storage, root) pairs.
+    """
+    roots = [('tmp', TMP_MEDIA_ROOT)]
+    try:
+        roots.append(('default', default_storage.path('')))
+    except NotImplementedError:
+        pass
+    return roots
+
+
+def _ingest(file_obj, media_root):
+    """
+    Stream an upload into the content-addressed store under media_root.
+
+    Chunks are written to a temporary file while the SHA-256 digest is
+    computed; the file is then moved to blobs/<aa>/<sha256><ext>. If a blob
+    with the same content already exists the temporary copy is dropped.
+
+    Returns (sha256, relative_path, absolute_path, size, deduplicated).
+    """
+    blob_root = os.path.join(media_root, BLOB_DIR)
+    os.makedirs(blob_root, exist_ok=True)
+
+    moved = _ingest_streamed(file_obj, media_root)
+    if moved:
+        return moved
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=blob_root)
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in file_obj.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                destination.write(chunk)
+
+        sha256 = digest.hexdigest()
+        ext = os.path.splitext(file_obj.name or '')[1].lower()[:10]
+        relative_path = f'{BLOB_DIR}/{sha256[:2]}/{sha256}{ext}'
+        absolute_path = os.path.join(media_root, relative_path)
+        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+
+        deduplicated = os.path.exists(absolute_path)
+        if deduplicated:
+            os.remove(tmp_path)
+            # به‌روزرسانی زمان دسترسی تا cleanup آن را تازه در نظر بگیرد
+            os.utime(absolute_path, None)
+        else:
+            os.replace(tmp_path, absolute_path)
+        return sha256, relative_path, absolute_path, size, deduplicated
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _ingest_streamed(file_obj, media_root):
+    """
+    Fast path for uploads received by StreamingUploadHandler.
+
+    The handler already wrote the file to FILE_UPLOAD_TEMP_DIR and computed
+    its SHA-256, so the temporary file is renamed into the blob store instead
+    of being read and copied again. Returns None when the file was not
+    streamed or cannot be renamed (e.g. temp dir on another filesystem).
+    """
+    sha256 = getattr(file_obj, 'sha256', None)
+    if not sha256 or not hasattr(file_obj, 'temporary_file_path'):
+        return None
+    ext = os.path.splitext(file_obj.name or '')[1].lower()[:10]
+    relative_path = f'{BLOB_DIR}/{sha256[:2]}/{sha256}{ext}'
+    absolute_path = os.path.join(media_root, relative_path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+
+    deduplicated = os.path.exists(absolute_path)
+    if deduplicated:
+        os.utime(absolute_path, None)
+    else:
+        try:
+            os.replace(file_obj.temporary_file_path(), absolute_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            return None
+    return sha256, relative_path, absolute_path, file_obj.size, deduplicated
+
+
 def _save_to_tmp(file_obj, base_path):
     """
     Helper to persist files under /tmp when the main filesystem is read-only.
     """
-    tmp_base = '/tmp/media'
-    tmp_dir = os.path.join(tmp_base, base_path)
-    os.makedirs(tmp_dir, exist_ok=True)
-    
-    safe_filename = f"{uuid.uuid4().hex[:8]}_{file_obj.name}"
-    file_path = os.path.join(tmp_dir, safe_filename)
-    
-    with open(file_path, 'wb+') as destination:
-        for chunk in file_obj.chunks():
-            destination.write(chunk)
-    
-    file_size = os.path.getsize(file_path)
-    relative_path = f'/tmp/media/{base_path}/{safe_filename}'
+    sha256, relative_path, file_path, file_size, deduplicated = _ingest(file_obj, TMP_MEDIA_ROOT)
     
     result = {
         'name': file_obj.name,
-        'path': relative_path,
+        'path': f'{TMP_MEDIA_ROOT}/{relative_path}',
         'absolute_path': file_path,
         'size': file_size,
         'type': getattr(file_obj, 'content_type', None),
+        'sha256': sha256,
+        'deduplicated': deduplicated,
+        'field': base_path,
         'storage': 'tmp'
     }
     
-    logger.info(f"✅ File saved to /tmp: {relative_path}, size={file_size}")
+    logger.info(f"✅ File saved to /tmp: {result['path']}, size={file_size}, deduplicated={deduplicated}")
     return result
 
 
 def save_uploaded_file(file_obj, base_path='uploads'):
     """
-    Save uploaded file to storage.
+    Save uploaded file to the content-addressed store.
     In Liara (read-only filesystem), uses /tmp
-    In development, uses default_storage
+    In development, uses the default_storage location (MEDIA_ROOT)
+
+    Identical uploads (e.g. the same photo re-submitted on a retry) are
+    stored once and share the same path and sha256.
     
     Args:
         file_obj: Django UploadedFile object
-        base_path: Base path for file (e.g., 'uploads', 'analyses')
+        base_path: Logical upload group (e.g., 'uploads', 'uploads/store_photos')
     
     Returns:
-        dict with 'path', 'name', 'size', 'type', 'storage' keys
+        dict with 'path', 'name', 'size', 'type', 'sha256', 'storage' keys
     """
-    # تشخیص Liara از طریق چند روش:
-    # 1. متغیر LIARA
-    # 2. وجود LIARA_AI_API_KEY (که در Liara تنظیم می‌شود)
-    # 3. hostname که شامل liara باشد
-    is_liara = (
-        os.getenv('LIARA') == 'true' or
-        bool(os.getenv('LIARA_AI_API_KEY')) or
-        bool(os.getenv('LIARA_APP_NAME')) or
-        bool(os.getenv('LIARA_PROJECT_ID')) or
-        'liara' in os.getenv('HOSTNAME', '').lower() or
-        'liara' in os.getenv('ALLOWED_HOSTS', '').lower()
-    )
+    is_liara = _is_liara()
     
     logger.debug(f"🔍 File storage check: is_liara={is_liara}, LIARA={os.getenv('LIARA')}, has_LIARA_AI_API_KEY={bool(os.getenv('LIARA_AI_API_KEY'))}")
     
@@ -79,28 +175,124 @@ def save_uploaded_file(file_obj, base_path='uploads'):
             raise
     
     else:
-        # در development از default_storage
+        # در development از محل default_storage
         try:
-            file_path = default_storage.save(f'{base_path}/{file_obj.name}', file_obj)
+            media_root = default_storage.path('')
+            sha256, relative_path, absolute_path, file_size, deduplicated = _ingest(file_obj, media_root)
             result = {
                 'name': file_obj.name,
-                'path': file_path,
-                'size': file_obj.size,
-                'type': file_obj.content_type,
+                'path': relative_path,
+                'absolute_path': absolute_path,
+                'size': file_size,
+                'type': getattr(file_obj, 'content_type', None),
+                'sha256': sha256,
+                'deduplicated': deduplicated,
+                'field': base_path,
                 'storage': 'default'
             }
             
-            logger.info(f"✅ File saved via default_storage: {file_path}, size={file_obj.size}")
+            logger.info(f"✅ File saved via default_storage: {relative_path}, size={file_size}, deduplicated={deduplicated}")
             return result
         except Exception as e:
             logger.error(f"❌ Error saving file via default_storage: {e}", exc_info=True)
-            # در صورت خطای Read-only FS، به /tmp سوییچ کن
-            if isinstance(e, OSError) and e.errno == errno.EROFS or 'Read-only file system' in str(e):
+            # در صورت خطای Read-only FS یا storage غیرمحلی، به /tmp سوییچ کن
+            if (
+                isinstance(e, NotImplementedError)
+                or (isinstance(e, OSError) and e.errno == errno.EROFS)
+                or 'Read-only file system' in str(e)
+            ):
                 logger.warning("⚠️ default_storage is read-only; falling back to /tmp storage")
+                if hasattr(file_obj, 'seek'):
+                    file_obj.seek(0)
                 return _save_to_tmp(file_obj, base_path)
             raise
 
 
+def content_hashes(uploaded_files):
+    """
+    Extract {field: sha256} from an uploaded_files metadata dict.
+    """
+    hashes = {}
+    for field, info in (uploaded_files or {}).items():
+        if isinstance(info, dict) and info.get('sha256'):
+            hashes[field] = info['sha256']
+        elif isinstance(info, list):
+            digests = [item.get('sha256') for item in info if isinstance(item, dict) and item.get('sha256')]
+            if digests:
+                hashes[field] = digests
+    return hashes
+
+
+def content_cache_key(prefix, store_data):
+    """
+    Stable cache key for store data that refers to uploads by content hash.
+
+    Storage paths differ between identical re-submissions, so the
+    uploaded_files entry is replaced by its content hashes before hashing.
+    """
+    data = dict(store_data or {})
+    if 'uploaded_files' in data:
+        data['uploaded_files'] = content_hashes(data['uploaded_files'])
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{prefix}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def reclaim_blobs(referenced, max_age_seconds, max_total_bytes, min_age_seconds=3600, roots=None):
+    """
+    Delete unreferenced blobs by age and total-size budget.
+
+    Blobs whose sha256 is in `referenced` are never deleted. Unreferenced
+    blobs older than max_age_seconds are removed; if the store is still above
+    max_total_bytes, the oldest unreferenced blobs are removed until it fits.
+    Blobs younger than min_age_seconds are kept so uploads whose analysis has
+    not been saved yet survive. `roots` defaults to get_blob_roots().
+
+    Returns dict with 'deleted', 'freed_bytes' and 'remaining_bytes'.
+    """
+    now = time.time()
+    blobs = []
+    deleted = 0
+    freed = 0
+
+    for _storage, root in (roots if roots is not None else get_blob_roots()):
+        blob_root = os.path.join(root, BLOB_DIR)
+        if not os.path.isdir(blob_root):
+            continue
+        for dirpath, _dirnames, filenames in os.walk(blob_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # فایل‌های موقت نیمه‌کاره از آپلودهای قطع‌شده
+                if filename.startswith('.upload-'):
+                    if now - stat.st_mtime > 86400:
+                        os.remove(path)
+                        deleted += 1
+                        freed += stat.st_size
+                    continue
+                sha256 = os.path.splitext(filename)[0]
+                blobs.append((stat.st_mtime, stat.st_size, sha256, path))
+
+    total = sum(size for _mtime, size, _sha, _path in blobs)
+    for mtime, size, sha256, path in sorted(blobs):
+        age = now - mtime
+        if sha256 in referenced or age < min_age_seconds:
+            continue
+        if age > max_age_seconds or total > max_total_bytes:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove blob {path}: {e}")
+                continue
+            deleted += 1
+            freed += size
+            total -= size
+
+    return {'deleted': deleted, 'freed_bytes': freed, 'remaining_bytes': total}
+
+
 def get_file_path(stored_file_info):
     """
     Get actual file path from stored file info dict
@@ -111,8 +303,10 @@ def get_file_path(stored_file_info):
     Returns:
         str: absolute path to file
     """
+    if stored_file_info.get('absolute_path'):
+        return stored_file_info['absolute_path']
     if stored_file_info.get('storage') == 'tmp':
-        return stored_file_info.get('absolute_path', stored_file_info.get('path'))
+        return stored_file_info.get('path')
     else:
         # برای default_storage، از MEDIA_ROOT استفاده می‌کنیم
         return os.path.join(settings.MEDIA_ROOT, stored_file_info.get('path', ''))
@@ -0,0 +1,58 @@
+"""
+شمارش کارهای طولانی در حال اجرای پروسس (تحلیل‌های پس‌زمینه در thread)
+
+worker gunicorn پیش از خروج (بازنشستگی بر اساس RSS یا shutdown) تا پایان این کارها
+صبر می‌کند تا تحلیل نیمه‌کاره با kill شدن worker از بین نرود.
+"""
+
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InflightTracker:
+    """شمارنده thread-safe کارهای در حال اجرا در سطح پروسس"""
+
+    _active = 0
+    _condition = threading.Condition()
+
+    @classmethod
+    def track(cls, func: Callable) -> Callable:
+        """پوشاندن target یک thread پس‌زمینه تا در شمارش کارهای جاری حساب شود"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with cls._condition:
+                cls._active += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with cls._condition:
+                    cls._active -= 1
+                    cls._condition.notify_all()
+        return wrapper
+
+    @classmethod
+    def active(cls) -> int:
+        return cls._active
+
+    @classmethod
+    def wait_idle(cls, timeout: float, tick: Optional[Callable[[], None]] = None, interval: float = 1.0) -> bool:
+        """
+        انتظار تا صفر شدن کارهای جاری (حداکثر timeout ثانیه). tick در هر دور صدا زده
+        می‌شود (مثلاً worker.notify تا master در زمان انتظار worker را kill نکند).
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with cls._condition:
+            while cls._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"⚠️ {cls._active} کار طولانی هنوز در حال اجراست؛ مهلت انتظار تمام شد")
+                    return False
+                if tick:
+                    tick()
+                cls._condition.wait(min(interval, remaining))
+        return True
@@ -0,0 +1,63 @@
+"""
+فشرده‌سازی اختیاری اسناد JSON بزرگ StoreAnalysis
+
+خروجی کامل LLM در results و فهرست فایل‌ها می‌توانند چند مگابایت باشند. CompressedJSONField
+مثل JSONField معمولی رفتار می‌کند، اما سندی که JSON آن از ANALYSIS_JSON_COMPRESS_MIN_BYTES
+بزرگ‌تر باشد به‌صورت {"__zlib__": "<base64>"} ذخیره و هنگام خواندن به‌طور شفاف باز می‌شود.
+ردیف‌های قدیمی (فشرده‌نشده) بدون تغییر خوانده می‌شوند؛ compress_analysis_payloads ردیف‌های
+موجود را بازنویسی می‌کند. مقدار 0 فشرده‌سازی را غیرفعال می‌کند.
+
+سند فشرده‌شده با lookupهای کلید JSON (has_key، results__x) قابل جست‌وجو نیست؛ برای همین
+analysis_data که در reconciliation و tasks با has_key فیلتر می‌شود JSONField معمولی می‌ماند.
+"""
+
+import base64
+import json
+import zlib
+from typing import Any
+
+from django.conf import settings
+from django.db import models
+from django.db.models.fields.json import KeyTransform
+
+COMPRESSED_KEY = '__zlib__'
+DEFAULT_COMPRESS_MIN_BYTES = 256 * 1024
+
+
+def compress_min_bytes() -> int:
+    return int(getattr(settings, 'ANALYSIS_JSON_COMPRESS_MIN_BYTES', DEFAULT_COMPRESS_MIN_BYTES))
+
+
+def is_compressed(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(COMPRESSED_KEY), str)
+
+
+def pack(value: Any, encoder=None, min_bytes: int = None) -> Any:
+    """نسخه ذخیره‌ای یک سند: خود سند یا پوشش فشرده آن اگر از آستانه بزرگ‌تر باشد"""
+    threshold = compress_min_bytes() if min_bytes is None else min_bytes
+    if not threshold or not isinstance(value, (dict, list)) or is_compressed(value):
+        return value
+    raw = json.dumps(value, cls=encoder, ensure_ascii=False).encode('utf-8')
+    if len(raw) < threshold:
+        return value
+    level = int(getattr(settings, 'ANALYSIS_JSON_COMPRESS_LEVEL', 6))
+    return {COMPRESSED_KEY: base64.b64encode(zlib.compress(raw, level)).decode('ascii')}
+
+
+def unpack(value: Any, decoder=None) -> Any:
+    if is_compressed(value):
+        return json.loads(zlib.decompress(base64.b64decode(value[COMPRESSED_KEY])), cls=decoder)
+    return value
+
+
+class CompressedJSONField(models.JSONField):
+    """JSONField با فشرده‌سازی zlib اسناد بزرگ هنگام ذخیره"""
+
+    def get_prep_value(self, value):
+        return pack(super().get_prep_value(value), self.encoder)
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        if isinstance(expression, KeyTransform):
+            return value
+        return unpack(value, self.decoder)
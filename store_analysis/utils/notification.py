@@ -1,8 +1,9 @@
 import logging
-from typing import List, Optional
-from django.core.mail import send_mail
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from django.core.mail import send_mail, get_connection, EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.template.loader import render_to_string, get_template
 import requests
 
 logger = logging.getLogger(__name__)
@@ -46,6 +47,99 @@ def send_email_notification(
             logger.error(f"Failed to send email notification: {e}")
             return False
     
+    @staticmethod
+    def send_bulk_email_notifications(
+        notifications: Iterable[dict],
+        chunk_size: Optional[int] = None,
+        throttle_seconds: Optional[float] = None,
+        on_chunk: Optional[Callable[[List, List], None]] = None,
+        connection=None
+    ) -> Dict[str, int]:
+        """
+        ارسال گروهی اعلان ایمیل با یک اتصال SMTP مشترک
+
+        هر آیتم notifications یک dict با کلیدهای to_email، subject، message و
+        در صورت نیاز html_template، context و key است. پیام‌ها در دسته‌های
+        chunk_size تایی ارسال می‌شوند و بعد از هر دسته on_chunk(sent_keys, failed_keys)
+        فراخوانی می‌شود؛ بین دسته‌ها throttle_seconds ثانیه مکث می‌شود.
+        """
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'EMAIL_BULK_CHUNK_SIZE', 50)
+        if throttle_seconds is None:
+            throttle_seconds = getattr(settings, 'EMAIL_BULK_THROTTLE_SECONDS', 1.0)
+        chunk_size = max(1, int(chunk_size))
+
+        stats = {'sent': 0, 'failed': 0}
+
+        if connection is None:
+            if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
+                logger.warning("Email settings not configured")
+                for item in notifications:
+                    stats['failed'] += 1
+                return stats
+            connection = get_connection(fail_silently=False)
+
+        from_email = settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER
+        templates = {}
+
+        def _build(item):
+            html_template = item.get('html_template')
+            context = item.get('context')
+            msg = EmailMultiAlternatives(
+                subject=item['subject'],
+                body=item['message'],
+                from_email=from_email,
+                to=[item['to_email']],
+                connection=connection,
+            )
+            if html_template and context:
+                if html_template not in templates:
+                    templates[html_template] = get_template(html_template)
+                msg.attach_alternative(templates[html_template].render(context), 'text/html')
+            return msg
+
+        def _flush(chunk):
+            sent_keys, failed_keys = [], []
+            for item in chunk:
+                key = item.get('key', item['to_email'])
+                try:
+                    if connection.send_messages([_build(item)]):
+                        sent_keys.append(key)
+                    else:
+                        failed_keys.append(key)
+                except Exception as e:
+                    logger.error(f"Failed to send bulk email to {item['to_email']}: {e}")
+                    failed_keys.append(key)
+            stats['sent'] += len(sent_keys)
+            stats['failed'] += len(failed_keys)
+            if on_chunk:
+                on_chunk(sent_keys, failed_keys)
+
+        chunk = []
+        try:
+            connection.open()
+            for item in notifications:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    pending, chunk = chunk, []
+                    _flush(pending)
+                    if throttle_seconds:
+                        time.sleep(throttle_seconds)
+            if chunk:
+                pending, chunk = chunk, []
+                _flush(pending)
+        except Exception as e:
+            logger.error(f"Bulk email dispatch aborted: {e}")
+            stats['failed'] += len(chunk)
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+        logger.info(f"Bulk email dispatch finished: {stats['sent']} sent, {stats['failed']} failed")
+        return stats
+
     @staticmethod
     def send_whatsapp_notification(phone: str, message: str) -> bool:
         """ارسال اعلان واتساپ"""
@@ -0,0 +1,68 @@
+"""
+ثبت یک‌باره فونت‌های PDF در هر پروسس
+
+پارس فایل TTF (وزیر) در هر تولید PDF تکرار می‌شد. همه گزارش‌ها فونت فارسی را فقط با
+register_persian_font() ثبت می‌کنند: یک مسیر و یک تنظیم subset/embedding برای نام
+'Vazir'، پس ثبت بعدی همان نمونه preload شده را نگه می‌دارد. با preload_app در master
+gunicorn ثبت شده و نمونه آن بین workerها به‌صورت copy-on-write مشترک است.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+PERSIAN_FONT = 'Vazir'
+
+# وزیر بدون subset و embed شده ثبت می‌شود تا همه حروف فارسی در همه گزارش‌ها درست نمایش داده شوند
+_FONT_OPTIONS = {PERSIAN_FONT: {'subset': 0, 'embedding': 1}}
+
+_registered: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def persian_font_path() -> Optional[str]:
+    """مسیر Vazir.ttf: static برنامه و در نبود آن نسخه collectstatic"""
+    from django.conf import settings
+
+    candidates = (
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'fonts', 'Vazir.ttf'),
+        os.path.join(getattr(settings, 'STATIC_ROOT', None) or '', 'fonts', 'Vazir.ttf'),
+    )
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _register(name: str, path: str) -> None:
+    """ثبت فونت TTF با تنظیمات ثابت همان نام؛ هر نام فقط یک بار در هر پروسس پارس می‌شود"""
+    if name in _registered:
+        return
+
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    with _lock:
+        if name in _registered:
+            return
+        font = TTFont(name, path)
+        for option, value in _FONT_OPTIONS.get(name, {}).items():
+            setattr(font.face, option, value)
+        pdfmetrics.registerFont(font)
+        _registered[name] = path
+
+
+def register_persian_font() -> Optional[str]:
+    """ثبت فونت وزیر برای گزارش‌های PDF؛ نام فونت یا None اگر فایل آن موجود نباشد"""
+    path = persian_font_path()
+    if path is None:
+        return None
+    _register(PERSIAN_FONT, path)
+    return PERSIAN_FONT
+
+
+def preload_persian_font() -> Optional[str]:
+    """ثبت فونت وزیر در master/پروسس pool پیش از اولین گزارش؛ مسیر فایل ثبت‌شده"""
+    if register_persian_font() is None:
+        return None
+    return _registered[PERSIAN_FONT]
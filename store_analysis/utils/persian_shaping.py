@@ -0,0 +1,132 @@
+"""
+شکل‌دهی متن فارسی (arabic_reshaper + bidi) با cache مشترک برای PDF و تصویر
+
+reshape و get_display پایتون خالص‌اند و در گزارش‌های طولانی بیشترین زمان CPU را
+می‌گیرند، در حالی که عنوان‌ها، برچسب‌ها، سرستون‌ها و جمله‌های ثابت در هر گزارش و بین
+گزارش‌ها تکرار می‌شوند. نتیجه در یک LRU محدود (PERSIAN_SHAPING_CACHE_SIZE) نگه داشته
+می‌شود و رشته‌های ثابت شناخته‌شده هنگام بوت (preload در master gunicorn) در جدولی جدا و
+بدون eviction شکل‌دهی می‌شوند تا بین workerها به‌صورت copy-on-write مشترک باشند.
+"""
+
+import functools
+import json
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+try:
+    import arabic_reshaper  # type: ignore
+    from bidi.algorithm import get_display  # type: ignore
+    SHAPING_AVAILABLE = True
+except ImportError:
+    arabic_reshaper = None
+    get_display = None
+    SHAPING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# عنوان‌ها و برچسب‌های ثابت گزارش‌های PDF
+STATIC_STRINGS = (
+    'بخش', 'صفحه', 'فهرست مطالب', 'خلاصه اجرایی', 'شاخص‌های کلیدی:',
+    'تحلیل فنی چیدمان', 'تحلیل طراحی و برند', 'تحلیل فروش', 'تحلیل رفتار مشتری',
+    'تحلیل رقابتی و موقعیت‌یابی', 'اقدامات قابل اجرا', 'داشبورد KPI', 'وضعیت تکمیل داده‌ها',
+    'پیوست و محدودیت داده', 'اطلاعات کامل فرم (پیوست)', '© چیدمانو | گزارش حرفه‌ای',
+    'این بخش در حال تکمیل است. لطفاً بعداً دوباره بررسی کنید.',
+    'گزارش در حال تولید است. لطفاً بعداً دوباره تلاش کنید.',
+    'سیستم تحلیل فروشگاه هوشمند', 'گزارش تفصیلی و حرفه‌ای', 'گزارش تحلیل و برنامه اجرایی',
+    'اطلاعات کلی پروژه', 'تهیه شده توسط: سیستم تحلیل فروشگاه هوشمند چیدمانو',
+    'گزارش تحلیل جامع فروشگاه', 'نقاط قوت', 'نقاط ضعف', 'شاخص', 'وضعیت موجود', 'پیش‌بینی',
+    'افزایش', 'فروش روزانه', 'فروش ماهانه', 'فروش سالانه', 'مشتریان روزانه', 'نرخ تبدیل',
+    'رضایت مشتری', 'دوره بازگشت', 'نام فروشگاه', 'نوع فروشگاه', 'اندازه فروشگاه',
+    'گزارش مدیریتی تحلیل فروشگاه', 'اطلاعات فروشگاه:', 'امتیازات کلی:', 'پیش‌تحلیل اولیه:',
+    'امتیاز کلی', 'امتیاز چیدمان', 'امتیاز ترافیک', 'امتیاز طراحی', 'امتیاز فروش',
+    'نامشخص', 'تهیه شده توسط چیدمانو',
+)
+
+
+def _shape_uncached(text: str, bidi: bool) -> str:
+    reshaped = arabic_reshaper.reshape(text)
+    return get_display(reshaped) if bidi else reshaped
+
+
+class PersianShaper:
+    """شکل‌دهی cache‌شده متن فارسی در سطح پروسس (thread-safe)"""
+
+    _static: Dict[tuple, str] = {}
+    _cached = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _cache(cls):
+        if cls._cached is None:
+            with cls._lock:
+                if cls._cached is None:
+                    cls._cached = functools.lru_cache(
+                        maxsize=getattr(settings, 'PERSIAN_SHAPING_CACHE_SIZE', 4096)
+                    )(_shape_uncached)
+        return cls._cached
+
+    @classmethod
+    def shape(cls, text, bidi: bool = True) -> str:
+        """reshape (و در صورت bidi، ترتیب نمایش RTL)؛ بدون کتابخانه‌ها متن بدون تغییر برمی‌گردد"""
+        if not text or not SHAPING_AVAILABLE:
+            return text
+        text = str(text)
+        static = cls._static.get((text, bidi))
+        if static is not None:
+            return static
+        # متن‌های بلند (پاراگراف‌های یکتای AI) تکرار نمی‌شوند و فقط جای cache را می‌گیرند
+        if len(text) > getattr(settings, 'PERSIAN_SHAPING_CACHE_MAX_CHARS', 400):
+            return _shape_uncached(text, bidi)
+        return cls._cache()(text, bidi)
+
+    @classmethod
+    def reshape(cls, text) -> str:
+        """فقط اتصال حروف (بدون bidi)، برای خروجی‌هایی که خودشان RTL را مدیریت می‌کنند"""
+        return cls.shape(text, bidi=False)
+
+    @classmethod
+    def warm(cls, strings: Iterable[str]) -> int:
+        """شکل‌دهی پیشاپیش رشته‌های ثابت (هر دو حالت bidi، با و بدون نیم‌فاصله)"""
+        if not SHAPING_AVAILABLE:
+            return 0
+        static = dict(cls._static)
+        for text in strings:
+            for variant in {text, text.replace('\u200c', '')}:
+                for bidi in (True, False):
+                    static.setdefault((variant, bidi), _shape_uncached(variant, bidi))
+        cls._static = static
+        return len(static)
+
+    @classmethod
+    def warm_from_file(cls, path: Optional[str] = None) -> int:
+        """رشته‌های ثابت داخلی به‌علاوه فهرست JSON اختیاری PERSIAN_SHAPING_WARM_FILE"""
+        strings = list(STATIC_STRINGS)
+        path = path if path is not None else getattr(settings, 'PERSIAN_SHAPING_WARM_FILE', '')
+        if path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    strings.extend(s for s in json.load(f) if isinstance(s, str))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Persian shaping warm file {path} skipped: {e}")
+        return cls.warm(strings)
+
+    @classmethod
+    def cache_info(cls) -> Dict[str, int]:
+        info = cls._cache().cache_info()
+        return {
+            'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+            'maxsize': info.maxsize, 'static': len(cls._static),
+        }
+
+    @classmethod
+    def clear(cls, static: bool = False) -> None:
+        if cls._cached is not None:
+            cls._cached.cache_clear()
+        if static:
+            cls._static = {}
+
+
+shape_persian = PersianShaper.shape
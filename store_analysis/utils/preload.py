@@ -0,0 +1,77 @@
+"""
+بارگذاری پیشاپیش ساختارهای فقط‌خواندنی مشترک در master gunicorn (preload_app)
+
+کاتالوگ‌های ترجمه، قالب‌های کامپایل‌شده، فونت‌های PDF و متن‌های فارسی ثابت شکل‌دهی‌شده
+پیش از fork ساخته می‌شوند تا همه workerها آن‌ها را copy-on-write به اشتراک بگذارند؛ در پایان gc.freeze اشیای موجود
+را از چرخه GC خارج می‌کند تا GC در workerها صفحات مشترک را لمس (و کپی) نکند.
+"""
+
+import gc
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def preload_translations() -> int:
+    from django.utils import translation
+
+    languages = [code for code, _ in getattr(settings, 'LANGUAGES', [])] or [settings.LANGUAGE_CODE]
+    for code in languages:
+        with translation.override(code):
+            translation.gettext('')
+    return len(languages)
+
+
+def preload_templates(limit: int) -> int:
+    """کامپایل قالب‌های .html پوشه‌های قالب تا حداکثر limit عدد (با cached loader)"""
+    from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+    loaded = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if loaded >= limit:
+                        return loaded
+                    if not filename.endswith('.html'):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name)
+                        loaded += 1
+                    except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError) as e:
+                        logger.debug(f"Template preload skipped {name}: {e}")
+    return loaded
+
+
+def preload_shared_resources(freeze: bool = True) -> Dict[str, Any]:
+    """اجرای همه preloadها؛ هر بخش مستقل است و خطای آن مانع بقیه نمی‌شود"""
+    from .pdf_fonts import preload_persian_font
+    from .persian_shaping import PersianShaper
+
+    stats: Dict[str, Any] = {}
+    start = time.perf_counter()
+    steps = (
+        ('translations', preload_translations),
+        ('templates', lambda: preload_templates(getattr(settings, 'PRELOAD_TEMPLATES_LIMIT', 300))),
+        ('pdf_font', preload_persian_font),
+        ('persian_shaping', PersianShaper.warm_from_file),
+    )
+    for name, step in steps:
+        try:
+            stats[name] = step()
+        except Exception as e:
+            logger.warning(f"⚠️ Preload {name} failed: {e}")
+            stats[name] = None
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+        stats['frozen_objects'] = gc.get_freeze_count()
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
@@ -0,0 +1,306 @@
+"""
+گذرگاه رویدادهای پیشرفت تحلیل
+
+مراحل pipeline تحلیل رویدادهای تایپ‌شده منتشر می‌کنند. هر رویداد:
+- به گروه analysis_<id> در channel layer (مشترک بین پروسس‌ها) ارسال می‌شود تا
+  AnalysisConsumer آن را به مرورگر push کند؛
+- به‌عنوان آخرین وضعیت در cache ذخیره می‌شود تا endpointهای polling بدون کوئری
+  دیتابیس و با پشتیبانی از ETag پاسخ دهند.
+
+endpoint وضعیت async (ASGI) با ?wait=N (long-poll) تا N ثانیه منتظر تغییر ETag می‌ماند و
+تغییرات را با بررسی دوره‌ای cache/دیتابیس (ANALYSIS_STATUS_POLL_INTERVAL) می‌بیند. viewهای
+sync پارامتر wait را نادیده می‌گیرند تا هر تب باز thread یک worker WSGI را اشغال نکند.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STARTED = 'started'
+STAGE_STARTED = 'stage_started'
+STAGE_COMPLETED = 'stage_completed'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+TERMINAL_STATUSES = ('completed', 'preliminary_completed', 'failed', 'cancelled')
+
+# درصد پیشرفت پیش‌فرض هر وضعیت مدل (همان نگاشت StoreAnalysis.get_progress)
+STATUS_PROGRESS = {
+    'pending': 25,
+    'processing': 50,
+    'completed': 100,
+    'preliminary_completed': 100,
+}
+
+STATUS_MESSAGES = {
+    'pending': 'در انتظار',
+    'processing': 'در حال پردازش',
+    'completed': 'تحلیل تکمیل شده',
+    'preliminary_completed': 'تحلیل تکمیل شده',
+    'failed': 'تحلیل ناموفق بود',
+    'cancelled': 'تحلیل لغو شد',
+}
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """رویداد پیشرفت یک تحلیل؛ کلیدهای message/progress/timestamp با فرمت قبلی cache سازگارند"""
+    analysis_id: int
+    event: str
+    status: str = 'processing'
+    stage: str = ''
+    current: int = 0
+    total: int = 0
+    progress: int = 0
+    message: str = ''
+    user_id: Optional[int] = None
+    # تخمین ثانیه‌های باقی‌مانده از سرعت مراحل تمام‌شده (None: نامعلوم)
+    eta_seconds: Optional[int] = None
+    created_at: str = ''
+    timestamp: str = field(default_factory=lambda: timezone.now().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ProgressBus:
+    """انتشار رویدادهای پیشرفت و خواندن آخرین وضعیت هر تحلیل"""
+
+    STATUS_CACHE_KEY = 'analysis_status_{}'
+    OWNER_CACHE_KEY = 'analysis_owner_{}'
+    CHECKED_CACHE_KEY = 'analysis_status_checked_{}'
+    # فاصله بررسی مجدد وضعیت cache‌شده با دیتابیس (ثانیه)
+    REVALIDATE_SECONDS = 5
+
+    @classmethod
+    def _ttl(cls) -> int:
+        return getattr(settings, 'ANALYSIS_PROGRESS_TTL', 3600)
+
+    @classmethod
+    def latest(cls, analysis_id) -> Optional[Dict[str, Any]]:
+        """آخرین وضعیت منتشرشده برای تحلیل (بدون کوئری دیتابیس)"""
+        try:
+            return cache.get(cls.STATUS_CACHE_KEY.format(analysis_id))
+        except Exception:
+            return None
+
+    @classmethod
+    def remember(cls, state: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        try:
+            cache.set(cls.STATUS_CACHE_KEY.format(state['analysis_id']), state, ttl or cls._ttl())
+        except Exception as e:
+            logger.warning(f"Could not cache progress for analysis {state.get('analysis_id')}: {e}")
+
+    @classmethod
+    def _carry_forward(cls, event: ProgressEvent) -> ProgressEvent:
+        """created_at رکورد قبلی روی رویدادهای بعدی حفظ می‌شود"""
+        if event.created_at:
+            return event
+        previous = cls.latest(event.analysis_id) or {}
+        return replace(event, created_at=previous.get('created_at') or '')
+
+    @classmethod
+    def _messages(cls, event: ProgressEvent):
+        data = event.to_dict()
+        messages = [(f'analysis_{event.analysis_id}', {'type': 'analysis.status_update', 'data': data})]
+        if event.event == COMPLETED and event.user_id:
+            messages.append((f'user_{event.user_id}', {
+                'type': 'analysis.completion_notification',
+                'data': {
+                    'analysis_id': event.analysis_id,
+                    'user_id': event.user_id,
+                    'message': 'تحلیل فروشگاه شما تکمیل شد!',
+                    'timestamp': event.timestamp,
+                },
+            }))
+        return messages
+
+    @classmethod
+    def publish(cls, event: ProgressEvent) -> None:
+        """انتشار رویداد از کد همگام (thread پس‌زمینه، Celery، signal)"""
+        event = cls._carry_forward(event)
+        cls.remember(event.to_dict())
+        try:
+            from channels.layers import get_channel_layer
+            layer = get_channel_layer()
+            if layer is None:
+                return
+            for group, message in cls._messages(event):
+                async_to_sync(layer.group_send)(group, message)
+        except Exception as e:
+            # نرسیدن رویداد به WebSocket نباید تحلیل را متوقف کند؛ polling همچنان کار می‌کند
+            logger.warning(f"Could not publish progress event for analysis {event.analysis_id}: {e}")
+
+    @classmethod
+    async def apublish(cls, event: ProgressEvent) -> None:
+        """نسخه async برای consumerها و RealTimeAnalyzer"""
+        event = cls._carry_forward(event)
+        cls.remember(event.to_dict())
+        try:
+            from channels.layers import get_channel_layer
+            layer = get_channel_layer()
+            if layer is None:
+                return
+            for group, message in cls._messages(event):
+                await layer.group_send(group, message)
+        except Exception as e:
+            logger.warning(f"Could not publish progress event for analysis {event.analysis_id}: {e}")
+
+    @classmethod
+    def publish_status(cls, analysis_id, status: str, user_id: Optional[int] = None) -> None:
+        """
+        انتشار تغییر وضعیت مدل؛ اگر وضعیت ثبت‌شده تغییری نکرده باشد چیزی منتشر نمی‌شود (پیشرفت
+        جزئی‌تر مراحل بازنویسی نمی‌شود و save بعدی تحلیل تمام‌شده اعلان تکمیل تکراری نمی‌فرستد)
+        """
+        current = cls.latest(analysis_id)
+        if current and current.get('status') == status:
+            return
+        if status in ('completed', 'preliminary_completed'):
+            event_type = COMPLETED
+        elif status in ('failed', 'cancelled'):
+            event_type = FAILED
+        else:
+            event_type = STARTED
+        cls.publish(ProgressEvent(
+            analysis_id=analysis_id,
+            event=event_type,
+            status=status,
+            progress=STATUS_PROGRESS.get(status, 0),
+            message=STATUS_MESSAGES.get(status, status),
+            user_id=user_id,
+            eta_seconds=0 if status in TERMINAL_STATUSES else None,
+        ))
+
+    @classmethod
+    def stage_callbacks(cls, analysis_id, user_id: Optional[int] = None, labels: Optional[Dict[str, str]] = None):
+        """callbackهای on_stage_start/on_stage_complete برای StagePipeline"""
+        labels = labels or {}
+        started = time.monotonic()
+
+        def eta(done, total):
+            # مراحل هم‌زمان اجرا می‌شوند؛ تخمین خطی از میانگین زمان مراحل تمام‌شده تا این لحظه
+            if not done or not total:
+                return None
+            return int((time.monotonic() - started) * (total - done) / done)
+
+        def on_stage_start(name, done, total):
+            cls.publish(ProgressEvent(
+                analysis_id=analysis_id,
+                event=STAGE_STARTED,
+                stage=name,
+                current=done,
+                total=total,
+                progress=int(done * 100 / total) if total else 0,
+                message=f"در حال {labels.get(name, name)}...",
+                user_id=user_id,
+                eta_seconds=eta(done, total),
+            ))
+
+        def on_stage_complete(name, done, total):
+            # ۱۰۰٪ فقط پس از ذخیره نتیجه نهایی (رویداد completed) اعلام می‌شود
+            cls.publish(ProgressEvent(
+                analysis_id=analysis_id,
+                event=STAGE_COMPLETED,
+                stage=name,
+                current=done,
+                total=total,
+                progress=min(int(done * 100 / total), 99) if total else 0,
+                message=f"{labels.get(name, name)} انجام شد",
+                user_id=user_id,
+                eta_seconds=eta(done, total),
+            ))
+
+        return on_stage_start, on_stage_complete
+
+    @classmethod
+    def current(cls, analysis_id):
+        """
+        (owner_id, state) برای endpointهای polling.
+        در حالت عادی فقط از cache خوانده می‌شود. cache محلی هر پروسس است و وضعیت ممکن است
+        در پروسس دیگری تغییر کند، پس هر REVALIDATE_SECONDS ثانیه یک کوئری سبک روی ستون‌های
+        وضعیت (بدون بارگذاری ستون‌های JSON و بدون بررسی schema در StoreAnalysisManager)
+        اجرا و در صورت اختلاف جایگزین می‌شود.
+        """
+        from ..models import StoreAnalysis
+
+        owner_key = cls.OWNER_CACHE_KEY.format(analysis_id)
+        status_key = cls.STATUS_CACHE_KEY.format(analysis_id)
+        cached = cache.get_many([owner_key, status_key])
+        owner_id = cached.get(owner_key)
+        state = cached.get(status_key)
+        if owner_id is not None and state is not None and not cache.add(
+            cls.CHECKED_CACHE_KEY.format(analysis_id), True, cls.REVALIDATE_SECONDS
+        ):
+            return owner_id, state
+
+        row = StoreAnalysis._base_manager.filter(pk=analysis_id).values(
+            'user_id', 'status', 'created_at', 'updated_at'
+        ).first()
+        if row is None:
+            return None, None
+
+        owner_id = row['user_id']
+        cache.set(owner_key, owner_id, 86400)
+        status = row['status']
+        created_at = row['created_at'].isoformat() if row['created_at'] else ''
+        if state is None or state.get('status') != status:
+            state = ProgressEvent(
+                analysis_id=int(analysis_id),
+                event=COMPLETED if status in ('completed', 'preliminary_completed') else STARTED,
+                status=status,
+                progress=STATUS_PROGRESS.get(status, 0),
+                message=STATUS_MESSAGES.get(status, status),
+                user_id=owner_id,
+                eta_seconds=0 if status in TERMINAL_STATUSES else None,
+                created_at=created_at,
+                timestamp=(row['updated_at'] or row['created_at']).isoformat(),
+            ).to_dict()
+            cls.remember(state)
+        return owner_id, state
+
+    # ---- long-poll ----
+
+    @staticmethod
+    def wait_seconds(value) -> float:
+        """مقدار پارامتر ?wait= محدود به ANALYSIS_STATUS_LONG_POLL_MAX"""
+        try:
+            seconds = float(value or 0)
+        except (TypeError, ValueError):
+            return 0.0
+        return max(0.0, min(seconds, float(getattr(settings, 'ANALYSIS_STATUS_LONG_POLL_MAX', 25))))
+
+    @staticmethod
+    def _interval() -> float:
+        return float(getattr(settings, 'ANALYSIS_STATUS_POLL_INTERVAL', 0.5))
+
+    @classmethod
+    async def apoll(cls, build: Callable[[], Awaitable[Tuple[Any, str]]], if_none_match: str = '', wait: float = 0.0):
+        """
+        build() -> (payload, etag). اگر ETag فعلی همان If-None-Match باشد تا wait ثانیه منتظر
+        تغییر می‌ماند (بدون اشغال thread)؛ (payload, etag) آخرین وضعیت برگردانده می‌شود.
+        """
+        payload, etag = await build()
+        deadline = time.monotonic() + wait
+        while etag and etag in (if_none_match or ''):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, cls._interval()))
+            payload, etag = await build()
+        return payload, etag
+
+    @staticmethod
+    def etag(state: Dict[str, Any]) -> str:
+        """ETag پایدار برای یک وضعیت؛ با هر رویداد جدید تغییر می‌کند"""
+        basis = f"{state.get('analysis_id')}:{state.get('status')}:{state.get('progress')}:{state.get('timestamp')}"
+        return hashlib.md5(basis.encode('utf-8')).hexdigest()
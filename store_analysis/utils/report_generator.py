@@ -8,9 +8,8 @@
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from ..models import StoreAnalysis
+from .pdf_fonts import register_persian_font
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +24,7 @@ def _setup_fonts(self):
         """تنظیم فونت‌های فارسی"""
         try:
             # تلاش برای بارگذاری فونت فارسی
-            font_path = os.path.join(settings.BASE_DIR, 'static', 'fonts', 'Vazir.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('Vazir', font_path))
+            if register_persian_font():
                 self.farsi_style = ParagraphStyle(
                     'Farsi',
                     parent=self.styles['Normal'],
@@ -0,0 +1,255 @@
+"""
+اجرای مرحله‌ای تحلیل با چک‌پوینت و قابلیت ادامه از آخرین مرحله موفق
+
+هر مرحله خروجی خود را با کلید (run_key, stage, input_hash) در دیتابیس ذخیره می‌کند.
+input_hash از داده ورودی pipeline و hash خروجی مراحل پیش‌نیاز ساخته می‌شود؛ بنابراین
+در retry مراحلی که ورودی‌شان تغییر نکرده از چک‌پوینت خوانده می‌شوند و فقط مراحل
+باقی‌مانده اجرا می‌شوند. مراحل مستقل به‌صورت هم‌زمان در ThreadPool اجرا می‌شوند.
+
+مراحلی که provider دارند (مثلاً 'openai') علاوه بر سقف workerهای pipeline زیر سقف
+هم‌زمانی همان provider در کل پروسس (AI_PROVIDER_CONCURRENCY) اجرا می‌شوند تا چند تحلیل
+هم‌زمان با هم از سقف درخواست‌های موازی سرویس AI بیشتر نشوند.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """یک مرحله از pipeline؛ func خروجی مراحل پیش‌نیاز را به‌صورت dict دریافت می‌کند"""
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    depends_on: Tuple[str, ...] = ()
+    provider: str = ''
+
+
+class ProviderLimiter:
+    """سقف درخواست هم‌زمان به هر provider در سطح پروسس (مشترک بین همه pipelineها)"""
+
+    _semaphores: Dict[str, Tuple[int, threading.BoundedSemaphore]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def limit(cls, provider: str) -> int:
+        return int(getattr(settings, 'AI_PROVIDER_CONCURRENCY', {}).get(provider, 0) or 0)
+
+    @classmethod
+    def _semaphore(cls, provider: str) -> Optional[threading.BoundedSemaphore]:
+        limit = cls.limit(provider)
+        if limit <= 0:
+            return None
+        with cls._lock:
+            current = cls._semaphores.get(provider)
+            # تغییر سقف (override_settings در تست/benchmark) semaphore تازه می‌سازد
+            if current is None or current[0] != limit:
+                current = cls._semaphores[provider] = (limit, threading.BoundedSemaphore(limit))
+            return current[1]
+
+    @classmethod
+    @contextmanager
+    def slot(cls, provider: str):
+        semaphore = cls._semaphore(provider) if provider else None
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
+def stable_hash(value: Any) -> str:
+    """hash پایدار برای داده‌های JSON‌پذیر (ترتیب کلیدها اثری ندارد)"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_failed_output(output: Any) -> bool:
+    """خروجی‌های خطادار ({'error': ...}) چک‌پوینت نمی‌شوند تا در retry دوباره اجرا شوند"""
+    return isinstance(output, dict) and bool(output.get('error'))
+
+
+class StagePipeline:
+    """اجراکننده گراف مراحل با چک‌پوینت، اجرای هم‌زمان و ثبت زمان هر مرحله"""
+
+    def __init__(
+        self,
+        run_key: str,
+        stages: Sequence[Stage],
+        input_data: Any = None,
+        max_workers: Optional[int] = None,
+        on_stage_start: Optional[Callable[[str, int, int], None]] = None,
+        on_stage_complete: Optional[Callable[[str, int, int], None]] = None,
+    ):
+        self.run_key = str(run_key)
+        self.stages = list(stages)
+        self.input_hash = stable_hash(input_data)
+        self.max_workers = max_workers or getattr(settings, 'ANALYSIS_PIPELINE_MAX_WORKERS', 4)
+        self.on_stage_start = on_stage_start
+        self.on_stage_complete = on_stage_complete
+        self.outputs: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self._validate()
+
+    def _validate(self) -> None:
+        names = [stage.name for stage in self.stages]
+        if len(names) != len(set(names)):
+            raise ValueError('نام مراحل pipeline باید یکتا باشد')
+        known = set(names)
+        for stage in self.stages:
+            missing = set(stage.depends_on) - known
+            if missing:
+                raise ValueError(f"مرحله {stage.name} به مراحل ناموجود وابسته است: {sorted(missing)}")
+
+        # تشخیص وابستگی حلقوی
+        resolved = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [s for s in remaining if set(s.depends_on) <= resolved]
+            if not ready:
+                raise ValueError(f"وابستگی حلقوی بین مراحل: {[s.name for s in remaining]}")
+            resolved.update(s.name for s in ready)
+            remaining = [s for s in remaining if s.name not in resolved]
+
+    # --- Checkpoint storage ---
+
+    def _load_checkpoints(self) -> Dict[Tuple[str, str], Any]:
+        from ..models import AnalysisStageCheckpoint
+        try:
+            rows = AnalysisStageCheckpoint.objects.filter(
+                run_key=self.run_key
+            ).values_list('stage', 'input_hash', 'output')
+            return {(stage, input_hash): output for stage, input_hash, output in rows}
+        except DatabaseError as e:
+            logger.warning(f"Could not load stage checkpoints for {self.run_key}: {e}")
+            return {}
+
+    def _save_checkpoint(self, stage: str, input_hash: str, output: Any, seconds: float) -> None:
+        from ..models import AnalysisStageCheckpoint
+        try:
+            AnalysisStageCheckpoint.objects.update_or_create(
+                run_key=self.run_key,
+                stage=stage,
+                input_hash=input_hash,
+                defaults={'output': output, 'duration_seconds': seconds},
+            )
+        except (DatabaseError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save checkpoint {self.run_key}/{stage}: {e}")
+
+    def clear(self) -> None:
+        """حذف چک‌پوینت‌های این اجرا (پس از ذخیره موفق نتیجه نهایی)"""
+        from ..models import AnalysisStageCheckpoint
+        try:
+            AnalysisStageCheckpoint.objects.filter(run_key=self.run_key).delete()
+        except DatabaseError as e:
+            logger.warning(f"Could not clear checkpoints for {self.run_key}: {e}")
+
+    # --- Execution ---
+
+    @staticmethod
+    def _run_stage(stage: Stage, inputs: Dict[str, Any]) -> Tuple[Any, float]:
+        try:
+            with ProviderLimiter.slot(stage.provider):
+                # زمان انتظار برای سهمیه provider جزو زمان مرحله حساب نمی‌شود
+                start = time.perf_counter()
+                return stage.func(inputs), time.perf_counter() - start
+        finally:
+            # اتصال‌های دیتابیس thread-local هستند؛ اتصال threadهای کمکی بسته شود
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    def _notify(self, callback, name: str) -> None:
+        if callback:
+            try:
+                callback(name, len(self.outputs), len(self.stages))
+            except Exception as e:
+                logger.warning(f"Stage progress callback failed: {e}")
+
+    def _record(self, name: str, output: Any, seconds: float, from_checkpoint: bool) -> None:
+        self.outputs[name] = output
+        self.timings[name] = {
+            'seconds': round(seconds, 3),
+            'from_checkpoint': from_checkpoint,
+        }
+        self._notify(self.on_stage_complete, name)
+
+    def run(self) -> Dict[str, Any]:
+        """اجرای همه مراحل و برگرداندن خروجی هر مرحله به تفکیک نام"""
+        checkpoints = self._load_checkpoints()
+        pending = {stage.name: stage for stage in self.stages}
+        output_hashes: Dict[str, str] = {}
+        running = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                # زمان‌بندی مراحلی که پیش‌نیازهایشان آماده است
+                progressed = True
+                while progressed and error is None:
+                    progressed = False
+                    for name, stage in list(pending.items()):
+                        if not all(dep in self.outputs for dep in stage.depends_on):
+                            continue
+                        del pending[name]
+                        stage_hash = stable_hash({
+                            'input': self.input_hash,
+                            'deps': {dep: output_hashes[dep] for dep in stage.depends_on},
+                        })
+                        key = (name, stage_hash)
+                        if key in checkpoints:
+                            output = checkpoints[key]
+                            output_hashes[name] = stable_hash(output)
+                            self._record(name, output, 0.0, from_checkpoint=True)
+                            logger.info(f"Stage {self.run_key}/{name} restored from checkpoint")
+                            progressed = True
+                            continue
+                        inputs = {dep: self.outputs[dep] for dep in stage.depends_on}
+                        self._notify(self.on_stage_start, name)
+                        future = pool.submit(self._run_stage, stage, inputs)
+                        running[future] = (name, stage_hash)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, stage_hash = running.pop(future)
+                    try:
+                        output, seconds = future.result()
+                    except Exception as e:
+                        # مراحل در حال اجرا تمام شوند تا خروجی موفقشان چک‌پوینت شود
+                        logger.error(f"Stage {self.run_key}/{name} failed: {e}")
+                        if error is None:
+                            error = e
+                        continue
+                    if not is_failed_output(output):
+                        self._save_checkpoint(name, stage_hash, output, seconds)
+                    output_hashes[name] = stable_hash(output)
+                    self._record(name, output, seconds, from_checkpoint=False)
+                    logger.info(f"Stage {self.run_key}/{name} finished in {seconds:.2f}s")
+
+        if error is not None:
+            raise error
+        return dict(self.outputs)
+
+
+def purge_stale_checkpoints(max_age_days: Optional[int] = None) -> int:
+    """حذف چک‌پوینت‌های اجراهایی که هیچ‌وقت تکمیل نشده‌اند"""
+    from ..models import AnalysisStageCheckpoint
+    max_age_days = max_age_days or getattr(settings, 'ANALYSIS_CHECKPOINT_MAX_AGE_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    deleted, _ = AnalysisStageCheckpoint.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,188 @@
+"""
+آپلود multipart جریانی با حافظه محدود و اعتبارسنجی تدریجی
+
+MemoryFileUploadHandler هر فایل تا FILE_UPLOAD_MAX_MEMORY_SIZE را کامل در حافظه نگه
+می‌داشت و SecurityService/FileSecurityValidator بعداً فایل را دوباره می‌خواندند.
+StreamingUploadHandler هر بخش را chunk به chunk مستقیم در FILE_UPLOAD_TEMP_DIR می‌نویسد
+و در همان حین:
+    - پسوند و نوع فایل را پیش از دریافت اولین بایت بررسی می‌کند
+    - magic bytes ابتدای فایل را با نوع اعلام‌شده تطبیق می‌دهد
+    - سقف حجم هر نوع و سقف کل درخواست را می‌شمارد
+    - SHA-256 محتوا را محاسبه می‌کند تا file_storage آن را دوباره hash نکند
+فایل نامعتبر با SkipFile کنار گذاشته می‌شود (باقی بخش‌ها ادامه می‌یابند) و دلیل آن در
+request.upload_errors ثبت می‌شود؛ عبور از سقف کل درخواست آپلود را با StopUpload قطع می‌کند.
+حافظه هر درخواست به یک chunk (UPLOAD_CHUNK_SIZE) و چند بایت ابتدای فایل محدود است.
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+
+# تعداد بایت ابتدای فایل که برای تشخیص نوع نگه داشته می‌شود
+HEAD_BYTES = 1024
+MB = 1024 * 1024
+
+# پسوند -> نوع
+UPLOAD_KINDS: Dict[str, str] = {
+    **dict.fromkeys(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif'), 'image'),
+    **dict.fromkeys(('.mp4', '.mov', '.avi', '.wmv', '.webm', '.mkv', '.m4v'), 'video'),
+    **dict.fromkeys(('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.csv', '.txt', '.dwg', '.dxf'), 'document'),
+}
+
+_OLE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+_ZIP = b'PK\x03\x04'
+_ISO_BOX_TYPES = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip')
+
+DEFAULT_MAX_FILE_MB = {'image': 20, 'video': 200, 'document': 25}
+
+
+def _riff(head: bytes, form: bytes) -> bool:
+    return head[:4] == b'RIFF' and head[8:12] == form
+
+
+def _iso_media(head: bytes) -> bool:
+    return head[4:8] in _ISO_BOX_TYPES
+
+
+def _text(head: bytes) -> bool:
+    return b'\x00' not in head and b'<script' not in head.lower()
+
+
+# پسوند -> بررسی ابتدای فایل
+SIGNATURES = {
+    '.jpg': lambda h: h[:3] == b'\xff\xd8\xff',
+    '.jpeg': lambda h: h[:3] == b'\xff\xd8\xff',
+    '.png': lambda h: h[:8] == b'\x89PNG\r\n\x1a\n',
+    '.gif': lambda h: h[:6] in (b'GIF87a', b'GIF89a'),
+    '.bmp': lambda h: h[:2] == b'BM',
+    '.webp': lambda h: _riff(h, b'WEBP'),
+    '.heic': lambda h: h[4:8] == b'ftyp',
+    '.heif': lambda h: h[4:8] == b'ftyp',
+    '.mp4': _iso_media,
+    '.m4v': _iso_media,
+    '.mov': _iso_media,
+    '.avi': lambda h: _riff(h, b'AVI '),
+    '.wmv': lambda h: h[:4] == b'\x30\x26\xb2\x75',
+    '.webm': lambda h: h[:4] == b'\x1a\x45\xdf\xa3',
+    '.mkv': lambda h: h[:4] == b'\x1a\x45\xdf\xa3',
+    '.pdf': lambda h: h[:5] == b'%PDF-',
+    '.doc': lambda h: h[:8] == _OLE,
+    '.xls': lambda h: h[:8] == _OLE,
+    '.docx': lambda h: h[:4] == _ZIP,
+    '.xlsx': lambda h: h[:4] == _ZIP,
+    '.dwg': lambda h: h[:4] == b'AC10',
+    '.csv': _text,
+    '.txt': _text,
+    '.dxf': _text,
+}
+
+
+def max_file_size(kind: str) -> int:
+    limits = {**DEFAULT_MAX_FILE_MB, **getattr(settings, 'UPLOAD_MAX_FILE_MB', {})}
+    return int(limits.get(kind, 0) * MB)
+
+
+def classify(file_name: str) -> Tuple[str, Optional[str]]:
+    """(پسوند، نوع) یک نام فایل؛ نوع None یعنی پسوند مجاز نیست"""
+    ext = os.path.splitext(file_name or '')[1].lower()
+    return ext, UPLOAD_KINDS.get(ext)
+
+
+def rejected_uploads(request) -> Dict[str, str]:
+    """فایل‌هایی که هنگام دریافت رد شدند: {نام فیلد: دلیل}"""
+    return dict(getattr(request, 'upload_errors', None) or {})
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """نوشتن مستقیم هر فایل روی دیسک با اعتبارسنجی نوع، محتوا و حجم در حین دریافت"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = getattr(settings, 'UPLOAD_CHUNK_SIZE', 64 * 1024)
+        self.request_limit = int(getattr(settings, 'UPLOAD_MAX_REQUEST_MB', 300) * MB)
+        self.request_received = 0
+        self.too_large = False
+
+    def _record(self, reason: str) -> None:
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_errors'):
+                self.request.upload_errors = {}
+            self.request.upload_errors[self.field_name] = reason
+        if hasattr(self, 'file'):
+            # بستن TemporaryUploadedFile فایل موقت را حذف می‌کند
+            self.file.close()
+            del self.file
+
+    def _reject(self, reason: str, stop: bool = False):
+        self._record(reason)
+        if stop:
+            # بقیه بدنه خوانده نمی‌شود؛ فایل‌های کامل‌شده قبلی حفظ می‌شوند
+            raise StopUpload(connection_reset=True)
+        raise SkipFile(reason)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.too_large = bool(content_length and content_length > self.request_limit)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if self.too_large:
+            self._reject(f"حجم کل درخواست بیش از {self.request_limit // MB} مگابایت است", stop=True)
+        self.ext, self.kind = classify(file_name)
+        if self.kind is None:
+            self._reject(f"نوع فایل {self.ext or 'بدون پسوند'} مجاز نیست")
+        self.limit = max_file_size(self.kind)
+        if content_length and content_length > self.limit:
+            self._reject(f"حجم فایل بیش از {self.limit // MB} مگابایت است")
+        self.head = b''
+        self.head_checked = False
+        self.digest = hashlib.sha256()
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def _head_error(self) -> Optional[str]:
+        self.head_checked = True
+        if not SIGNATURES[self.ext](self.head):
+            return f"محتوای فایل با پسوند {self.ext} مطابقت ندارد"
+        return None
+
+    def receive_data_chunk(self, raw_data, start):
+        end = start + len(raw_data)
+        self.request_received += len(raw_data)
+        if self.request_received > self.request_limit:
+            self._reject(f"حجم کل درخواست بیش از {self.request_limit // MB} مگابایت است", stop=True)
+        if end > self.limit:
+            self._reject(f"حجم فایل بیش از {self.limit // MB} مگابایت است")
+        if not self.head_checked:
+            self.head += raw_data[:HEAD_BYTES - len(self.head)]
+            if len(self.head) >= HEAD_BYTES:
+                error = self._head_error()
+                if error:
+                    self._reject(error)
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        # file_complete بیرون از بلوک SkipFile پارسر اجرا می‌شود؛ فایل کوتاه نامعتبر فقط کنار گذاشته می‌شود
+        error = self._head_error() if not self.head_checked else None
+        if error:
+            self._record(error)
+            return None
+        file = self.file
+        del self.file
+        file.seek(0)
+        file.size = file_size
+        file.sha256 = self.digest.hexdigest()
+        file.upload_kind = self.kind
+        return file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            temp_location = self.file.temporary_file_path()
+            try:
+                self.file.close()
+                os.remove(temp_location)
+            except FileNotFoundError:
+                pass
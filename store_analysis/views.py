@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.http import Http404
@@ -22,8 +22,7 @@
 from django.contrib.auth.models import User
 # Admin views moved to chidmano.admin_dashboard
 # Import های لازم برای AI services
-from .ai_services.advanced_ai_manager import AdvancedAIManager
-from .ai_services.liara_ai_service import LiaraAIService
+from .ai_services.registry import ServiceRegistry
 # from .services.faq_service import FAQService
 # Admin views moved to chidmano.admin_dashboard
 # from .forms import StoreAnalysisForm, ProfessionalStoreAnalysisForm
@@ -41,9 +40,12 @@
 from io import BytesIO
 from .utils import generate_initial_ai_analysis, color_name_to_hex
 from decimal import Decimal
-from .ai_analysis_service_simple import SimpleAIAnalysisService
 from django.views.decorators.http import require_http_methods
 from .models import FreeUsageTracking
+from .utils.config_store import ConfigStore
+from .utils.inflight import InflightTracker
+from .utils.pdf_fonts import register_persian_font
+from .utils.persian_shaping import shape_persian
 import hashlib
 
 def calculate_analysis_scores(analysis):
@@ -672,8 +674,8 @@ class StoreAnalysisAI:
     """Wrapper class برای سازگاری با کد قدیمی - استفاده از LiaraAIService"""
     
     def __init__(self):
-        self.liara_service = LiaraAIService()
-        self.advanced_manager = AdvancedAIManager()
+        self.liara_service = ServiceRegistry.get('liara')
+        self.advanced_manager = ServiceRegistry.get('advanced_ai')
     
     def generate_detailed_analysis(self, analysis_data):
         """تولید تحلیل تفصیلی"""
@@ -921,7 +923,7 @@ def ensure_basic_analysis_results(analysis: StoreAnalysis) -> None:
             analysis.status
         )
 
-        service = SimpleAIAnalysisService()
+        service = ServiceRegistry.get('simple_ai')
         base_data = analysis.analysis_data.copy() if isinstance(analysis.analysis_data, dict) else {}
 
         base_data.setdefault('store_name', analysis.store_name or 'فروشگاه شما')
@@ -1377,6 +1379,9 @@ def analysis_list(request):
         analyses = StoreAnalysis.objects.all().order_by('-created_at')
     else:
         analyses = StoreAnalysis.objects.filter(user=request.user).order_by('-created_at')
+    # وجود نتیجه با annotate بررسی می‌شود تا ستون results برای هر ردیف بارگذاری نشود؛
+    # نام کاربر هر ردیف در قالب نمایش داده می‌شود
+    analyses = analyses.select_related('user').with_result_flags()
     
     # اضافه کردن اطلاعات اضافی برای نمایش
     for analysis in analyses:
@@ -1391,7 +1396,7 @@ def analysis_list(request):
             analysis.progress = 0
         
         # بررسی وجود پیش‌تحلیل (به صورت متغیر موقت)
-        analysis.has_preliminary_temp = bool(analysis.results or analysis.preliminary_analysis)
+        analysis.has_preliminary_temp = analysis.has_results or bool(analysis.preliminary_analysis)
     
     paginator = Paginator(analyses, 10)
     page = request.GET.get('page')
@@ -1400,7 +1405,7 @@ def analysis_list(request):
     # گروه‌بندی بر اساس پلن و پرداخت
     def is_paid(a):
         try:
-            return a.package_type in ['professional', 'enterprise'] and a.status in ['paid', 'completed'] and bool(a.results)
+            return a.package_type in ['professional', 'enterprise'] and a.status in ['paid', 'completed'] and a.has_results
         except Exception:
             return False
 
@@ -2430,14 +2435,10 @@ def download_analysis_report(request, pk):
                 
                 if premium_results and isinstance(premium_results, dict) and len(premium_results) > 0:
                     logger.info(f"✅ Premium report found with {len(premium_results)} sections: {list(premium_results.keys())}")
-                    pdf_bytes = generate_premium_pdf_from_premium_report(analysis, premium_results)
-                    if pdf_bytes and len(pdf_bytes) > 1000:
-                        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-                        response['Content-Disposition'] = f'attachment; filename="premium_report_{analysis.id}.pdf"'
-                        logger.info(f"✅ Premium PDF generated successfully, size: {len(pdf_bytes)} bytes")
+                    response = _pooled_pdf_response(request, analysis, 'premium', f"premium_report_{analysis.id}.pdf", as_attachment=True)
+                    if response is not None:
                         return response
-                    else:
-                        logger.warning(f"⚠️ Premium PDF generation returned empty or too small ({len(pdf_bytes) if pdf_bytes else 0} bytes)")
+                    logger.warning(f"⚠️ Premium PDF generation failed for analysis {analysis.id}")
                 else:
                     logger.warning(f"⚠️ Premium report is empty or invalid for analysis {analysis.id}, trying to generate...")
                     # اگر گزارش پولی وجود ندارد، سعی کن آن را تولید کن
@@ -2452,10 +2453,8 @@ def download_analysis_report(request, pk):
                             analysis.results['premium_report'] = premium_results
                             analysis.save(update_fields=['results'])
                             logger.info(f"✅ Premium report generated and saved, generating PDF...")
-                            pdf_bytes = generate_premium_pdf_from_premium_report(analysis, premium_results)
-                            if pdf_bytes and len(pdf_bytes) > 1000:
-                                response = HttpResponse(pdf_bytes, content_type='application/pdf')
-                                response['Content-Disposition'] = f'attachment; filename="premium_report_{analysis.id}.pdf"'
+                            response = _pooled_pdf_response(request, analysis, 'premium', f"premium_report_{analysis.id}.pdf", as_attachment=True)
+                            if response is not None:
                                 return response
             except Exception as e:
                 logger.error(f"Premium PDF generation failed: {e}", exc_info=True)
@@ -2469,20 +2468,13 @@ def download_analysis_report(request, pk):
             
             pdf_content = None
             
-            try:
-                # تلاش برای تولید PDF کامل
-                logger.info("Attempting to call generate_professional_persian_pdf_report...")
-                pdf_content = generate_professional_persian_pdf_report(analysis)
-                logger.info(f"PDF generated. Size: {len(pdf_content) if pdf_content else 0} bytes")
-            except Exception as e:
-                logger.error(f"Error in generate_professional_persian_pdf_report: {e}", exc_info=True)
-                # تلاش با نسخه Fixed
-                try:
-                    logger.info("Trying generate_professional_persian_pdf_report_fixed...")
-                    pdf_content = generate_professional_persian_pdf_report_fixed(analysis)
-                    logger.info(f"Fixed PDF generated. Size: {len(pdf_content) if pdf_content else 0} bytes")
-                except Exception as e2:
-                    logger.error(f"Error in generate_professional_persian_pdf_report_fixed: {e2}", exc_info=True)
+            # تلاش برای تولید PDF کامل (و در صورت خطا نسخه Fixed) در process pool
+            response = _pooled_pdf_response(
+                request, analysis, 'professional',
+                f"گزارش_تحلیل_{analysis.store_name}_{analysis.id}.pdf", as_attachment=False
+            )
+            if response is not None:
+                return response
             
             # اگر PDF تولید نشد، یک PDF ساده با اطلاعات تولید می‌کنیم
             if not pdf_content or len(pdf_content) < 100:
@@ -2561,10 +2553,66 @@ def download_analysis_report(request, pk):
         return redirect('store_analysis:analysis_results', pk=analysis.pk)
 
 
+def _pooled_pdf_response(request, analysis, kind, filename, as_attachment):
+    """
+    تولید PDF در PdfRenderPool و stream فایل آماده با FileResponse. اگر ساخت در
+    PDF_SYNC_WAIT_SECONDS تمام نشود، پاسخ 202 (JSON یا صفحه با refresh خودکار) برمی‌گردد؛
+    None یعنی job شکست خورده و view از fallback استفاده می‌کند.
+    """
+    from .services.pdf_renderer import PdfRenderPool
+
+    job = PdfRenderPool.render(kind, analysis)
+    if job.ready:
+        return FileResponse(open(job.path, 'rb'), content_type='application/pdf',
+                            as_attachment=as_attachment, filename=filename)
+    if job.status == 'failed':
+        logger.error(f"PDF job {job.key} failed: {job.error}")
+        return None
+    return _pdf_pending_response(request, analysis, job)
+
+
+def _pdf_pending_response(request, analysis, job):
+    status_url = reverse('store_analysis:pdf_report_status', args=[analysis.pk])
+    retry_after = getattr(settings, 'PDF_STATUS_POLL_SECONDS', 3)
+    if 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'status': job.status, 'status_url': status_url}, status=202)
+    else:
+        response = HttpResponse(
+            f'<html><head><meta charset="utf-8"><meta http-equiv="refresh" content="{retry_after}"></head>'
+            f'<body dir="rtl" style="font-family:Vazir,Tahoma;text-align:center;padding:3em">'
+            f'گزارش PDF در حال آماده‌سازی است؛ این صفحه به‌صورت خودکار بارگذاری مجدد می‌شود.</body></html>',
+            status=202, content_type='text/html; charset=utf-8'
+        )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+@login_required
+def pdf_report_status(request, pk):
+    """وضعیت job تولید PDF گزارش (ready / queued / running / failed / missing)"""
+    from .services.pdf_renderer import PdfRenderPool
+
+    if request.user.is_staff or request.user.is_superuser:
+        analysis = get_object_or_404(StoreAnalysis.objects.only('id', 'results'), pk=pk)
+    else:
+        analysis = get_object_or_404(StoreAnalysis.objects.only('id', 'results'), pk=pk, user=request.user)
+
+    premium = (analysis.results or {}).get('premium_report')
+    kind = 'premium' if isinstance(premium, dict) and premium else 'professional'
+    job = PdfRenderPool.status(PdfRenderPool.artifact_key(kind, analysis))
+    return JsonResponse({
+        'status': job.status,
+        'kind': kind,
+        'error': job.error,
+        'download_url': f"{reverse('store_analysis:download_analysis', args=[analysis.pk])}?type=pdf",
+    })
+
+
 # --- Premium PDF Generator (compact, with header/footer & basic TOC) ---
-def generate_premium_pdf_from_premium_report(analysis, premium_report):
+def generate_premium_pdf_from_premium_report(analysis, premium_report, output=None):
     """Generate a professional multi-page PDF from premium_report dict using ReportLab.
-    Keeps it robust and dependency-free."""
+    Keeps it robust and dependency-free. With a file object as output the PDF is written
+    there directly and the number of bytes written is returned instead of the content."""
     try:
         # بررسی اینکه آیا premium_report داده دارد
         if not premium_report or (isinstance(premium_report, dict) and len(premium_report) == 0):
@@ -2590,18 +2638,14 @@ def generate_premium_pdf_from_premium_report(analysis, premium_report):
         import os
         import datetime
         from django.conf import settings
-        import arabic_reshaper
-        from bidi.algorithm import get_display
 
         from reportlab.lib.pagesizes import A4
         from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
         from reportlab.lib.enums import TA_RIGHT
         from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle, Image
         from reportlab.lib import colors
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
 
-        buffer = BytesIO()
+        buffer = output if output is not None else BytesIO()
 
         # Document
         doc = SimpleDocTemplate(
@@ -2613,28 +2657,7 @@ def generate_premium_pdf_from_premium_report(analysis, premium_report):
         # --- Persian font registration ---
         font_name = 'Helvetica'
         try:
-            font_paths = [
-                os.path.join(getattr(settings, 'STATIC_ROOT', ''), 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(getattr(settings, 'STATIC_ROOT', ''), 'fonts', 'Vazir.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir.ttf'),
-                '/usr/src/app/staticfiles/fonts/Vazir-Bold.ttf',
-                '/usr/src/app/staticfiles/fonts/Vazir.ttf',
-                'static/fonts/Vazir-Bold.ttf',
-                'static/fonts/Vazir.ttf',
-            ]
-            for font_path in font_paths:
-                if font_path and os.path.exists(font_path):
-                    try:
-                        font = TTFont('Vazir', font_path)
-                        font.face.subset = 0
-                        font.face.embedding = 1
-                        pdfmetrics.registerFont(font)
-                        font_name = 'Vazir'
-                        logger.info(f"Using Vazir font for premium PDF: {font_path}")
-                        break
-                    except Exception as font_err:
-                        logger.warning(f"Failed to register font {font_path}: {font_err}")
+            font_name = register_persian_font() or font_name
         except Exception as font_exc:
             logger.error(f"Font registration error (premium PDF): {font_exc}")
 
@@ -2686,8 +2709,7 @@ def fix_persian_text(text):
             persian_chars = 'اآبپتثجچحخدذرزژسشصضطظعغفقکگلمنوهی'
             if any(ch in persian_chars for ch in text):
                 try:
-                    reshaped = arabic_reshaper.reshape(text)
-                    text = get_display(reshaped)
+                    text = shape_persian(text)
                 except Exception as exc:
                     logger.debug(f"Persian shaping fallback: {exc}")
             return text
@@ -3017,6 +3039,9 @@ def on_page(canvas, doc):
             story.append(Paragraph(fix_persian_text("گزارش در حال تولید است. لطفاً بعداً دوباره تلاش کنید."), styles['RTL']))
         
         doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+        if output is not None:
+            logger.info(f"✅ PDF written for analysis {analysis.id}, size: {output.tell()} bytes")
+            return output.tell()
         pdf_value = buffer.getvalue()
         buffer.close()
         
@@ -4173,18 +4198,19 @@ def generate_image_report(request, analysis):
     text_color = (0, 0, 0)
     
     y_position = 50
+    fa = shape_persian
     
     # عنوان اصلی
-    draw.text((width//2, y_position), "گزارش مدیریتی تحلیل فروشگاه", fill=primary_color, font=title_font, anchor="mm")
+    draw.text((width//2, y_position), fa("گزارش مدیریتی تحلیل فروشگاه"), fill=primary_color, font=title_font, anchor="mm")
     y_position += 80
     
     # اطلاعات مدیر
     manager_name = analysis.analysis_data.get('manager_name', 'مدیر محترم') if analysis.analysis_data else 'مدیر محترم'
-    draw.text((width//2, y_position), f"جناب {manager_name}", fill=secondary_color, font=subtitle_font, anchor="mm")
+    draw.text((width//2, y_position), fa(f"جناب {manager_name}"), fill=secondary_color, font=subtitle_font, anchor="mm")
     y_position += 60
     
     # اطلاعات فروشگاه
-    draw.text((100, y_position), "اطلاعات فروشگاه:", fill=primary_color, font=subtitle_font)
+    draw.text((100, y_position), fa("اطلاعات فروشگاه:"), fill=primary_color, font=subtitle_font)
     y_position += 50
     
     store_info = [
@@ -4196,14 +4222,14 @@ def generate_image_report(request, analysis):
     ]
     
     for info in store_info:
-        draw.text((120, y_position), info, fill=text_color, font=normal_font)
+        draw.text((120, y_position), fa(info), fill=text_color, font=normal_font)
         y_position += 40
     
     y_position += 30
     
     # امتیازات
     if hasattr(analysis, 'results') and analysis.results:
-        draw.text((100, y_position), "امتیازات کلی:", fill=primary_color, font=subtitle_font)
+        draw.text((100, y_position), fa("امتیازات کلی:"), fill=primary_color, font=subtitle_font)
         y_position += 50
         
         scores = [
@@ -4216,14 +4242,14 @@ def generate_image_report(request, analysis):
         
         for i, (label, score) in enumerate(scores):
             x = 120 + (i * 200)
-            draw.text((x, y_position), label, fill=text_color, font=normal_font)
+            draw.text((x, y_position), fa(label), fill=text_color, font=normal_font)
             draw.text((x, y_position + 30), score, fill=secondary_color, font=subtitle_font)
         
         y_position += 80
     
     # پیش‌تحلیل
     if analysis.preliminary_analysis:
-        draw.text((100, y_position), "پیش‌تحلیل اولیه:", fill=primary_color, font=subtitle_font)
+        draw.text((100, y_position), fa("پیش‌تحلیل اولیه:"), fill=primary_color, font=subtitle_font)
         y_position += 50
         
         # تقسیم متن به خطوط
@@ -4243,12 +4269,12 @@ def generate_image_report(request, analysis):
             lines.append(current_line)
         
         for line in lines[:10]:  # حداکثر 10 خط
-            draw.text((120, y_position), line, fill=text_color, font=normal_font)
+            draw.text((120, y_position), fa(line), fill=text_color, font=normal_font)
             y_position += 35
     
     # تاریخ تولید
     y_position = height - 100
-    draw.text((width//2, y_position), f"تاریخ تولید: {datetime.now().strftime('%Y/%m/%d %H:%M')}", 
+    draw.text((width//2, y_position), fa(f"تاریخ تولید: {datetime.now().strftime('%Y/%m/%d %H:%M')}"), 
               fill=text_color, font=normal_font, anchor="mm")
     
     # ذخیره تصویر
@@ -4377,16 +4403,17 @@ def user_dashboard(request):
                 else:
                     # برای سایر دیتابیس‌ها، فیلدهای پایه را فرض می‌کنیم
                     available_columns = {'id', 'store_name', 'status', 'created_at', 'updated_at', 
-                                       'analysis_type', 'results', 'analysis_data', 'user_id'}
+                                       'analysis_type', 'analysis_data', 'user_id'}
         except Exception as schema_error:
             logger.warning(f"Error checking schema: {schema_error}, using fallback fields")
             available_columns = {'id', 'store_name', 'status', 'created_at', 'updated_at', 
-                               'analysis_type', 'results', 'analysis_data', 'user_id'}
+                               'analysis_type', 'analysis_data', 'user_id'}
         
         # ساخت SELECT statement با فقط فیلدهای موجود
+        # results (خروجی کامل LLM) در داشبورد استفاده نمی‌شود و خوانده نمی‌شود
         base_fields = ['id', 'store_name', 'status', 'created_at', 'updated_at', 
-                      'analysis_type', 'results', 'analysis_data', 'user_id']
-        optional_fields = ['package_type', 'store_address', 'store_type', 'store_size']
+                      'analysis_type', 'analysis_data', 'user_id']
+        optional_fields = ['package_type', 'store_address', 'store_type', 'store_size', 'order_id']
         
         select_fields = [f for f in base_fields if f in available_columns]
         for field in optional_fields:
@@ -4475,35 +4502,29 @@ def user_dashboard(request):
                     else:
                         obj.results = {}
                     
-                    # اضافه کردن order از طریق raw SQL query
+                    obj.order = None
+                    recent_analyses.append(obj)
+                
+                # سفارش‌های همه تحلیل‌ها با یک کوئری (به‌جای یک کوئری برای هر تحلیل)
+                order_ids = {getattr(obj, 'order_id', None) for obj in recent_analyses} - {None}
+                if order_ids:
                     try:
-                        if hasattr(obj, 'id'):
-                            with connection.cursor() as order_cursor:
-                                order_cursor.execute("""
-                                    SELECT id, order_number, status, final_amount
-                                    FROM store_analysis_order
-                                    WHERE id IN (
-                                        SELECT order_id FROM store_analysis_storeanalysis WHERE id = %s
-                                    )
-                                    LIMIT 1
-                                """, [obj.id])
-                                order_row = order_cursor.fetchone()
-                                if order_row:
-                                    from types import SimpleNamespace
-                                    order_obj = SimpleNamespace()
-                                    order_obj.id = order_row[0]
-                                    order_obj.pk = order_row[0]  # pk همان id است
-                                    order_obj.order_number = order_row[1]
-                                    order_obj.status = order_row[2]
-                                    order_obj.final_amount = order_row[3]
-                                    obj.order = order_obj
-                                else:
-                                    obj.order = None
+                        with connection.cursor() as order_cursor:
+                            order_cursor.execute(
+                                f"SELECT id, order_number, status, final_amount FROM store_analysis_order "
+                                f"WHERE id IN ({', '.join(['%s'] * len(order_ids))})",
+                                list(order_ids)
+                            )
+                            orders = {}
+                            for order_row in order_cursor.fetchall():
+                                orders[order_row[0]] = SimpleNamespace(
+                                    id=order_row[0], pk=order_row[0], order_number=order_row[1],
+                                    status=order_row[2], final_amount=order_row[3]
+                                )
+                        for obj in recent_analyses:
+                            obj.order = orders.get(getattr(obj, 'order_id', None))
                     except Exception as order_error:
-                        logger.warning(f"Error loading order for analysis {obj.id}: {order_error}")
-                        obj.order = None
-                    
-                    recent_analyses.append(obj)
+                        logger.warning(f"Error loading orders for recent analyses: {order_error}")
             
             logger.info(f"✅ Loaded {len(recent_analyses)} analyses using raw SQL (safe mode)")
         except Exception as sql_error:
@@ -4720,10 +4741,8 @@ def download_detailed_pdf(request, pk):
         # تنظیم فونت فارسی
         try:
             # اولویت با فونت وزیر
-            font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('Vazir', font_path))
-                font_name = 'Vazir'
+            font_name = register_persian_font()
+            if font_name:
                 print("Using Vazir font for PDF")
             else:
                 # استفاده از فونت Tahoma که از فارسی پشتیبانی می‌کند
@@ -4882,19 +4901,9 @@ def convert_numbers_to_persian(text):
                         text = text.replace(digit, persian_digits[i])
                     return text
                 
-                # مرحله 2: Character Shaping با arabic_reshaper
-                import arabic_reshaper
-                reshaped_text = arabic_reshaper.reshape(convert_numbers_to_persian(text))
+                # مرحله 2 و 3: Character Shaping و RTL Processing (cache‌شده)
+                return shape_persian(convert_numbers_to_persian(text))
                 
-                # مرحله 3: RTL Processing با bidi
-                from bidi.algorithm import get_display
-                rtl_text = get_display(reshaped_text)
-                
-                return rtl_text
-                
-            except ImportError:
-                # اگر کتابخانه‌ها نصب نیستند، متن را بدون تغییر برگردان
-                return text
             except Exception as e:
                 # در صورت هر خطای دیگر، متن اصلی را برگردان
                 logger.warning(f"Error in fix_persian_text: {e}")
@@ -5098,11 +5107,8 @@ def view_analysis_pdf_inline(request, pk):
 
         # فونت فارسی
         try:
-            font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir.ttf')
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('Vazir', font_path))
-                font_name = 'Vazir'
-            else:
+            font_name = register_persian_font()
+            if font_name is None:
                 tahoma_path = "C:/Windows/Fonts/tahoma.ttf"
                 if os.path.exists(tahoma_path):
                     pdfmetrics.registerFont(TTFont('Tahoma', tahoma_path))
@@ -5152,10 +5158,7 @@ def fix_persian_text(text):
             if not text:
                 return text
             text = text.replace('📊', '').replace('🏪', '').replace('✅', '').replace('⚠️', '').replace('🚀', '').replace('⚡', '').replace('👥', '').replace('💰', '').replace('💎', '').replace('🎯', '').replace('📅', '').replace('📈', '')
-            if arabic_reshaper and get_display:
-                reshaped_text = arabic_reshaper.reshape(text)
-                return get_display(reshaped_text)
-            return text
+            return shape_persian(text)
 
         # سربرگ سه‌ردیفی حرفه‌ای
         header_row1_data = [['CHIDEMANO', '', fix_persian_text(get_persian_date())]]
@@ -5641,7 +5644,7 @@ def payping_payment(request, order_id):
             client_ref_id=f"ORD_{order.order_number}"  # شناسه یکتا
         )
         
-        logger.info(f"💳 PayPing payment request result: {payment_request}")
+        logger.info("💳 PayPing payment request result: %s", payment_request)
         
         if payment_request.get('status') == 'success':
             # ذخیره اطلاعات پرداخت (با fallback برای missing columns)
@@ -5794,9 +5797,7 @@ def test_zarinpal(request):
 def test_liara_ai(request):
     """تست Liara AI"""
     try:
-        from .ai_services.liara_ai_service import LiaraAIService
-        
-        ai_service = LiaraAIService()
+        ai_service = ServiceRegistry.get('liara')
         
         # تست ساده
         test_data = {
@@ -6008,6 +6009,21 @@ def payping_callback(request, order_id):
             # حالا کاربر لاگین است، به dashboard redirect کن
             return redirect('store_analysis:user_dashboard')
 
+        # callback تکراری (refresh کاربر یا retry درگاه) بدون verify مجدد پاسخ داده می‌شود
+        from .services.payment_callback import PaymentCallbackProcessor
+        recorded = PaymentCallbackProcessor.replay(
+            PaymentCallbackProcessor.idempotency_key('payping', order.order_number, 'completed')
+        )
+        if recorded is not None:
+            logger.info("🔁 Duplicate PayPing callback for order %s - skipping verification", order.order_number)
+            if not request.user.is_authenticated and order.user:
+                from django.contrib.auth import login
+                login(request, order.user, backend='django.contrib.auth.backends.ModelBackend')
+            messages.success(request, '✅ پرداخت با موفقیت انجام شد! لطفاً فرم تحلیل را تکمیل کنید.')
+            if recorded.get('analysis_id'):
+                return redirect('store_analysis:forms', analysis_id=recorded['analysis_id'])
+            return redirect('store_analysis:user_dashboard')
+
         from .payment_gateways import PaymentGatewayManager
         
         gateway_manager = PaymentGatewayManager()
@@ -6096,6 +6112,12 @@ def payping_callback(request, order_id):
                 order.payment_method = 'payping'
                 order.save(update_fields=['status', 'payment', 'transaction_id', 'payment_method'])
                 logger.info(f"✅ سفارش {order.order_number} به وضعیت paid تغییر کرد (حتی با verify fail) - از refund خودکار جلوگیری شد")
+                PaymentCallbackProcessor.record(
+                    'payping', order.order_number, 'completed',
+                    {'status': 'success', 'analysis_id': store_analysis.id if store_analysis else None,
+                     'verification_failed': True},
+                    payment=payment,
+                )
 
                 # ایجاد تیکت برای بررسی دستی
                 try:
@@ -6194,6 +6216,11 @@ def payping_callback(request, order_id):
             order.transaction_id = refid
             order.save(update_fields=['status', 'payment_method', 'payment', 'transaction_id'])
             logger.info(f"✅ سفارش {order.order_number} به وضعیت paid تغییر کرد - از بازگشت پول جلوگیری می‌شود")
+            PaymentCallbackProcessor.record(
+                'payping', order.order_number, 'completed',
+                {'status': 'success', 'analysis_id': store_analysis.id if store_analysis else None},
+                payment=payment,
+            )
 
             if store_analysis and store_analysis.status not in ['completed']:
                 store_analysis.status = 'processing'  # تغییر به processing برای شروع تحلیل
@@ -6280,8 +6307,7 @@ def start_real_analysis():
                                 logger.info(f"📊 فایل‌های استخراج شده: {len(images)} تصویر، {len(videos)} ویدیو، {'فایل فروش موجود' if sales_data_file else 'بدون فایل فروش'}")
                             
                             # استفاده از LiaraAIService برای تحلیل جامع
-                            from .ai_services.liara_ai_service import LiaraAIService
-                            liara_service = LiaraAIService()
+                            liara_service = ServiceRegistry.get('liara')
                             
                             # بررسی مجدد API key در سرویس
                             if not liara_service.api_key:
@@ -6297,7 +6323,8 @@ def start_real_analysis():
                                 store_data=store_data,
                                 images=images if images else None,
                                 videos=videos if videos else None,
-                                sales_data_file=sales_data_file
+                                sales_data_file=sales_data_file,
+                                run_id=store_analysis.id
                             )
                             
                             # بررسی وجود خطا در تحلیل
@@ -6318,8 +6345,7 @@ def start_real_analysis():
                                     # خطای 403 - استفاده از fallback
                                     logger.warning(f"⚠️ خطای 403 دریافت شد - استفاده از fallback analysis برای تحلیل {store_analysis.id}")
                                     try:
-                                        from .ai_analysis_service_simple import SimpleAIAnalysisService
-                                        simple_service = SimpleAIAnalysisService()
+                                        simple_service = ServiceRegistry.get('simple_ai')
                                         fallback_analysis = simple_service.analyze_store(store_data)
                                         
                                         if fallback_analysis and not fallback_analysis.get('error'):
@@ -6356,8 +6382,7 @@ def start_real_analysis():
                                     if '403' in error_message or 'access denied' in error_message.lower():
                                         logger.warning(f"⚠️ خطای 403 در all_analyses_failed - استفاده از fallback analysis برای تحلیل {store_analysis.id}")
                                         try:
-                                            from .ai_analysis_service_simple import SimpleAIAnalysisService
-                                            simple_service = SimpleAIAnalysisService()
+                                            simple_service = ServiceRegistry.get('simple_ai')
                                             fallback_analysis = simple_service.analyze_store(store_data)
                                             
                                             if fallback_analysis and not fallback_analysis.get('error'):
@@ -6871,7 +6896,7 @@ def wallet_dashboard(request):
             amount=int(payment.amount)
         )
         
-        logger.info(f"✅ Wallet verification result: {verification_result}")
+        logger.info("✅ Wallet verification result: %s", verification_result)
         
         if verification_result.get('status') == 'success':
             # ✅ پرداخت موفق - واریز به کیف پول
@@ -7017,8 +7042,7 @@ def order_analysis_results(request, order_id):
 
                 if action == 'reprocess_liara':
                     # Kick off advanced analysis in background
-                    from .ai_services.advanced_ai_manager import AdvancedAIManager
-                    ai_manager = AdvancedAIManager()
+                    ai_manager = ServiceRegistry.get('advanced_ai')
 
                     def run_liara_bg():
                         try:
@@ -7032,7 +7056,7 @@ def run_liara_bg():
                             store_analysis.save()
 
                     import threading
-                    threading.Thread(target=run_liara_bg, daemon=True).start()
+                    threading.Thread(target=InflightTracker.track(run_liara_bg), daemon=True).start()
                     store_analysis.status = 'processing'
                     store_analysis.save(update_fields=['status'])
                     return JsonResponse({'success': True, 'message': 'تحلیل پیشرفته شروع شد', 'status': 'processing'})
@@ -7062,7 +7086,7 @@ def run_ollama_bg():
                             store_analysis.save()
 
                     import threading
-                    threading.Thread(target=run_ollama_bg, daemon=True).start()
+                    threading.Thread(target=InflightTracker.track(run_ollama_bg), daemon=True).start()
                     store_analysis.status = 'processing'
                     store_analysis.save(update_fields=['status'])
                     return JsonResponse({'success': True, 'message': 'تحلیل ساده شروع شد', 'status': 'processing'})
@@ -7134,7 +7158,7 @@ def process_analysis_background():
                         store_analysis.save()
                 
                 # شروع پردازش در background
-                thread = threading.Thread(target=process_analysis_background)
+                thread = threading.Thread(target=InflightTracker.track(process_analysis_background))
                 thread.daemon = True
                 thread.start()
                 
@@ -7243,21 +7267,40 @@ def process_analysis_background():
 @login_required
 def check_analysis_status(request, order_id):
     """بررسی وضعیت تحلیل (AJAX)"""
+    from django.db.models import BooleanField, ExpressionWrapper, Q
+    from .utils.progress_bus import ProgressBus
+    
     try:
-        # هر کاربر فقط Order های خودش را بررسی کند
-        order = get_object_or_404(Order, order_number=order_id, user=request.user)
-        store_analysis = StoreAnalysis.objects.filter(order=order).first()
-        
-        if not store_analysis:
+        # هر کاربر فقط Order های خودش را بررسی کند؛ ستون‌های JSON بارگذاری نمی‌شوند
+        row = StoreAnalysis.objects.filter(
+            order__order_number=order_id, order__user=request.user
+        ).annotate(
+            has_preliminary=ExpressionWrapper(~Q(preliminary_analysis=''), output_field=BooleanField()),
+            has_results=ExpressionWrapper(
+                Q(results__isnull=False) & ~Q(results={}), output_field=BooleanField()
+            ),
+        ).values('id', 'has_preliminary', 'has_results').first()
+        
+        if not row:
             return JsonResponse({'error': 'تحلیل یافت نشد'}, status=404)
         
-        return JsonResponse({
-            'status': store_analysis.status,
-            'progress': store_analysis.get_progress(),
-            'has_preliminary': bool(store_analysis.preliminary_analysis),
-            'has_results': store_analysis.has_results,
-            'estimated_completion': store_analysis.estimated_duration,
-        })
+        def build():
+            _, state = ProgressBus.current(row['id'])
+            payload = {
+                'status': state['status'],
+                'progress': state['progress'],
+                'stage': state.get('stage', ''),
+                'message': state.get('message', ''),
+                'eta_seconds': state.get('eta_seconds'),
+                'has_preliminary': bool(row['has_preliminary']),
+                'has_results': bool(row['has_results']),
+            }
+            etag = f"{ProgressBus.etag(state)}-{int(payload['has_preliminary'])}{int(payload['has_results'])}"
+            return payload, etag
+        
+        # long-poll (?wait=) فقط در view async؛ اینجا انتظار thread یک worker را اشغال می‌کند
+        payload, etag = build()
+        return _conditional_status_response(request, payload, etag)
     
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -7474,10 +7517,14 @@ def generate_ai_report(request, pk):
             'message': f'خطا در تولید تحلیل: {str(e)}'
         })
 def processing_status(request, pk):
-    """نمایش صفحه وضعیت پردازش"""
-    analysis = get_object_or_404(StoreAnalysis, pk=pk, user=request.user)
+    """نمایش صفحه وضعیت پردازش (فقط رکورد پیشرفت؛ ردیف تحلیل بارگذاری نمی‌شود)"""
+    from .utils.progress_bus import ProgressBus
+    
+    owner_id, status = ProgressBus.current(pk)
+    if owner_id is None or owner_id != request.user.id:
+        raise Http404
     return render(request, 'store_analysis/processing_status.html', {
-        'analysis': analysis,
+        'status': status,
         'analysis_id': pk
     })
 
@@ -7541,7 +7588,7 @@ def process_analysis():
                 analysis.save()
         
         # شروع پردازش در thread جداگانه
-        thread = threading.Thread(target=process_analysis)
+        thread = threading.Thread(target=InflightTracker.track(process_analysis))
         thread.daemon = True
         thread.start()
         
@@ -7571,7 +7618,7 @@ def start_advanced_ai_processing(request, pk):
         def process_advanced_analysis():
             try:
                 # استفاده از Advanced AI Manager
-                ai_manager = AdvancedAIManager()
+                ai_manager = ServiceRegistry.get('advanced_ai')
                 advanced_analysis = ai_manager.start_advanced_analysis(analysis_data)
                 
                 # به‌روزرسانی نتایج
@@ -7605,7 +7652,7 @@ def process_advanced_analysis():
                 analysis.save()
         
         # شروع پردازش در thread جداگانه
-        thread = threading.Thread(target=process_advanced_analysis)
+        thread = threading.Thread(target=InflightTracker.track(process_advanced_analysis))
         thread.daemon = True
         thread.start()
         
@@ -7971,14 +8018,20 @@ def suggest_faqs_api(request):
 
 @login_required
 def check_processing_status(request, pk):
-    """بررسی وضعیت پردازش"""
-    analysis = get_object_or_404(StoreAnalysis, pk=pk, user=request.user)
+    """بررسی وضعیت پردازش از رکورد پیشرفت"""
+    from .utils.progress_bus import ProgressBus
     
+    owner_id, state = ProgressBus.current(pk)
+    if owner_id is None or owner_id != request.user.id:
+        raise Http404
+    status = state['status']
     return JsonResponse({
-        'status': analysis.status,
-        'completed': analysis.status == 'completed',
-        'failed': analysis.status == 'failed',
-        'processing': analysis.status == 'processing'
+        'status': status,
+        'progress': state.get('progress', 0),
+        'eta_seconds': state.get('eta_seconds'),
+        'completed': status == 'completed',
+        'failed': status == 'failed',
+        'processing': status == 'processing'
     })
 def _convert_ollama_results_to_text(results):
     """تبدیل نتایج تحلیل به متن قابل خواندن برای PDF"""
@@ -8479,7 +8532,10 @@ def store_analysis_form(request, analysis_id=None):
                           'store_map', 'window_display_photos', 'entrance_photos', 
                           'checkout_photos', 'surveillance_footage', 'sales_file', 'product_catalog']
             
-            upload_errors = []
+            from store_analysis.utils.streaming_upload import rejected_uploads
+            upload_errors = [
+                f'فایل {field} آپلود نشد: {reason}' for field, reason in rejected_uploads(request).items()
+            ]
             upload_success_count = 0
             
             for field in file_fields:
@@ -8725,7 +8781,7 @@ def start_free_analysis():
                                 logger.error(f"❌ خطا در fallback برای تحلیل {analysis.id}: {fallback_error}", exc_info=True)
                     
                     # شروع تحلیل در background
-                    analysis_thread = threading.Thread(target=start_free_analysis, daemon=True)
+                    analysis_thread = threading.Thread(target=InflightTracker.track(start_free_analysis), daemon=True)
                     analysis_thread.start()
                     logger.info(f"🧵 Thread تحلیل رایگان برای {analysis.id} شروع شد")
                     
@@ -8869,9 +8925,8 @@ def analysis_progress(request, pk):
     analysis = get_object_or_404(StoreAnalysis, pk=pk, user=request.user)
     
     # بررسی وضعیت تحلیل
-    from .services.real_time_analyzer import RealTimeAnalyzer
-    analyzer = RealTimeAnalyzer()
-    status = analyzer.get_analysis_status(pk)
+    from .utils.progress_bus import ProgressBus
+    status = ProgressBus.latest(pk)
     
     context = {
         'analysis': analysis,
@@ -8952,44 +9007,34 @@ def start_analysis(request, pk):
         'message': 'درخواست نامعتبر'
     })
 
+def _conditional_status_response(request, payload, etag):
+    """پاسخ JSON وضعیت با ETag؛ اگر If-None-Match برابر باشد 304 برمی‌گرداند"""
+    from django.utils.cache import get_conditional_response
+    from django.utils.http import quote_etag
+    
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag) or JsonResponse(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def get_analysis_status(request, pk):
-    """دریافت وضعیت تحلیل"""
-    analysis = get_object_or_404(StoreAnalysis, pk=pk, user=request.user)
+    """دریافت وضعیت تحلیل از گذرگاه پیشرفت (بدون بارگذاری ردیف تحلیل، با پشتیبانی از 304؛ long-poll در async_views)"""
+    from django.core.cache import cache
+    from .utils.progress_bus import ProgressBus
     
-    from .services.real_time_analyzer import RealTimeAnalyzer
-    analyzer = RealTimeAnalyzer()
-    status = analyzer.get_analysis_status(pk)
-    results = analyzer.get_analysis_results(pk)
-    
-    # اگر status در cache نیست، از مدل استفاده کن
-    if not status:
-        if analysis.status == 'completed' or analysis.status == 'preliminary_completed':
-            status = {
-                'analysis_id': pk,
-                'message': 'تحلیل تکمیل شده',
-                'progress': 100,
-                'timestamp': analysis.updated_at.isoformat()
-            }
-        elif analysis.status == 'processing':
-            status = {
-                'analysis_id': pk,
-                'message': 'در حال پردازش',
-                'progress': 50,
-                'timestamp': analysis.updated_at.isoformat()
-            }
-        else:
-            status = {
-                'analysis_id': pk,
-                'message': 'در انتظار',
-                'progress': 0,
-                'timestamp': analysis.created_at.isoformat()
-            }
+    def build():
+        owner_id, status = ProgressBus.current(pk)
+        if owner_id != request.user.id:
+            raise Http404
+        results = cache.get(f'analysis_results_{pk}')
+        etag = f"{ProgressBus.etag(status)}-{int(bool(results))}"
+        return {'status': status, 'results': results}, etag
     
-    return JsonResponse({
-        'status': status,
-        'results': results
-    })
+    payload, etag = build()
+    return _conditional_status_response(request, payload, etag)
 
 
 @login_required
@@ -9381,16 +9426,23 @@ def admin_dashboard(request):
         # آمار پرداخت‌ها
         try:
             from .models import Payment
-            total_payments = Payment.objects.count()
-            completed_payments = Payment.objects.filter(status='completed').count()
-            pending_payments = Payment.objects.filter(status='pending').count()
-            processing_payments = Payment.objects.filter(status='processing').count()
-            recent_payments = Payment.objects.filter(created_at__gte=week_ago).count()
+            # همه شمارش‌ها و درآمد با یک کوئری
+            payment_stats = Payment.objects.aggregate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(status='completed')),
+                pending=Count('id', filter=Q(status='pending')),
+                processing=Count('id', filter=Q(status='processing')),
+                recent=Count('id', filter=Q(created_at__gte=week_ago)),
+                revenue=Sum('amount', filter=Q(status='completed')),
+            )
+            total_payments = payment_stats['total']
+            completed_payments = payment_stats['completed']
+            pending_payments = payment_stats['pending']
+            processing_payments = payment_stats['processing']
+            recent_payments = payment_stats['recent']
             
             # آمار فروش و درآمد
-            total_revenue = Payment.objects.filter(status='completed').aggregate(
-                total=Sum('amount')
-            )['total'] or 0
+            total_revenue = payment_stats['revenue'] or 0
         except Exception as e:
             print(f"⚠️ Payment stats error: {e}")
             total_payments = 0
@@ -9403,8 +9455,11 @@ def admin_dashboard(request):
         # آمار بسته‌های خدمات
         try:
             from .models import ServicePackage
-            total_packages = ServicePackage.objects.count()
-            active_packages = ServicePackage.objects.filter(is_active=True).count()
+            package_stats = ServicePackage.objects.aggregate(
+                total=Count('id'), active=Count('id', filter=Q(is_active=True))
+            )
+            total_packages = package_stats['total']
+            active_packages = package_stats['active']
         except Exception as e:
             print(f"⚠️ ServicePackage not available: {e}")
             total_packages = 0
@@ -9413,8 +9468,11 @@ def admin_dashboard(request):
         # آمار اشتراک‌ها
         try:
             from .models import UserSubscription
-            total_subscriptions = UserSubscription.objects.count()
-            active_subscriptions = UserSubscription.objects.filter(is_active=True).count()
+            subscription_stats = UserSubscription.objects.aggregate(
+                total=Count('id'), active=Count('id', filter=Q(is_active=True))
+            )
+            total_subscriptions = subscription_stats['total']
+            active_subscriptions = subscription_stats['active']
         except Exception as e:
             print(f"⚠️ UserSubscription not available: {e}")
             total_subscriptions = 0
@@ -9468,18 +9526,25 @@ def admin_dashboard(request):
         chart_data = []
         chart_labels = []
         try:
+            # یک کوئری برای هر مدل در کل بازه و تقسیم به روزها در Python (به‌جای ۱۴ شمارش)
+            now = timezone.now()
+            first_day = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+            day_users = [0] * 7
+            day_payments = [0] * 7
+            for joined in User.objects.filter(date_joined__gte=first_day).values_list('date_joined', flat=True):
+                if (joined - first_day).days < 7:
+                    day_users[(joined - first_day).days] += 1
+            if 'Payment' in locals():
+                for created in Payment.objects.filter(created_at__gte=first_day).values_list('created_at', flat=True):
+                    if (created - first_day).days < 7:
+                        day_payments[(created - first_day).days] += 1
+            
             for i in range(7):
-                date = timezone.now() - timedelta(days=6-i)
-                day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_start + timedelta(days=1)
-                
-                day_users = User.objects.filter(date_joined__gte=day_start, date_joined__lt=day_end).count()
-                day_payments = Payment.objects.filter(created_at__gte=day_start, created_at__lt=day_end).count() if 'Payment' in locals() else 0
-                
+                date = now - timedelta(days=6-i)
                 chart_data.append({
                     'date': date.strftime('%Y-%m-%d'),
-                    'users': day_users,
-                    'payments': day_payments
+                    'users': day_users[i],
+                    'payments': day_payments[i]
                 })
                 chart_labels.append(date.strftime('%m/%d'))
         except Exception as e:
@@ -10017,7 +10082,7 @@ def admin_settings(request):
         messages.error(request, 'دسترسی غیرمجاز')
         return redirect('home')
     
-    from django.core.cache import cache
+    from .models import SystemSettings
     
     # مقادیر پیش‌فرض
     default_settings = {
@@ -10059,27 +10124,29 @@ def admin_settings(request):
                 'max_payment_amount': request.POST.get('max_payment_amount', default_settings['max_payment_amount'])
             }
             
-            # ذخیره در cache (بدون محدودیت زمانی)
+            # ذخیره در SystemSettings تا بین همه workerها مشترک و ماندگار باشد
             try:
-                cache.set('admin_settings', current_settings, timeout=None)
-                logger.info(f"✅ Admin settings saved to cache by {request.user.username}")
+                SystemSettings.set_setting(
+                    ConfigStore.ADMIN_SETTINGS_KEY,
+                    json.dumps(current_settings, ensure_ascii=False),
+                    'تنظیمات صفحه مدیریت'
+                )
+                logger.info(f"✅ Admin settings saved by {request.user.username}")
                 logger.info(f"📋 Settings: {current_settings}")
                 messages.success(request, 'تنظیمات با موفقیت ذخیره شد')
             except Exception as e:
-                logger.error(f"❌ Error saving settings to cache: {e}")
+                logger.error(f"❌ Error saving admin settings: {e}")
                 messages.error(request, f'خطا در ذخیره تنظیمات: {str(e)}')
             
             return redirect('store_analysis:admin_settings')
         
-        # خواندن تنظیمات فعلی از cache
-        current_settings = cache.get('admin_settings', default_settings.copy())
+        # خواندن تنظیمات فعلی از ConfigStore
+        saved_settings = ConfigStore.get_admin_settings()
+        current_settings = default_settings.copy()
+        current_settings.update(saved_settings)
         
-        # اگر تنظیمات در cache نبود، از مقادیر پیش‌فرض استفاده می‌کنیم
-        if current_settings is None:
-            current_settings = default_settings.copy()
-            logger.info("⚠️ No settings in cache, using defaults")
-        else:
-            logger.info(f"✅ Settings loaded from cache: {current_settings}")
+        if not saved_settings:
+            logger.info("⚠️ No saved admin settings, using defaults")
         
         context = {
             'title': 'تنظیمات سیستم',
@@ -10236,6 +10303,17 @@ def admin_reports(request):
             'title': 'گزارش درآمد'
         }
     
+    elif report_type == 'queries':
+        # گزارش کوئری‌های هر view/task (پنجره غلتان QueryInstrumentationMiddleware و taskها)
+        from .services.query_budget import QueryReport
+        
+        context = {
+            'report_type': 'queries',
+            'data': QueryReport.summary(),
+            'window': QueryReport.window(),
+            'title': 'گزارش کوئری‌ها'
+        }
+    
     else:
         # گزارش کلی
         context = {
@@ -11128,6 +11206,9 @@ def forms_submit(request):
                                 except Exception as e:
                                     logger.error(f"Error saving file {field_name}: {e}")
                                     uploaded_files[field_name] = {'error': str(e)}
+                        from store_analysis.utils.streaming_upload import rejected_uploads
+                        for field_name, reason in rejected_uploads(request).items():
+                            uploaded_files.setdefault(field_name, {'error': reason})
                         
                         # به‌روزرسانی analysis_data
                         current_data = store_analysis.analysis_data or {}
@@ -11228,7 +11309,7 @@ def start_free_analysis():
                                         save_analysis_error(store_analysis, str(e))
                                 
                                 # شروع تحلیل در background thread
-                                analysis_thread = threading.Thread(target=start_free_analysis, daemon=True)
+                                analysis_thread = threading.Thread(target=InflightTracker.track(start_free_analysis), daemon=True)
                                 analysis_thread.start()
                                 logger.info(f"🚀 Thread تحلیل رایگان برای تحلیل {store_analysis.id} شروع شد")
                                 
@@ -11274,6 +11355,10 @@ def start_free_analysis():
                         uploaded_files[field_name] = {'error': str(e)}
             else:
                 logger.warning(f"⚠️ No files in request.FILES")
+            from store_analysis.utils.streaming_upload import rejected_uploads
+            for field_name, reason in rejected_uploads(request).items():
+                logger.warning(f"⚠️ Upload rejected: {field_name} ({reason})")
+                uploaded_files.setdefault(field_name, {'error': reason})
             
             # اگر تحلیل موجود است، آن را update کن
             if store_analysis:
@@ -11371,7 +11456,7 @@ def start_free_analysis():
                                     except Exception as e:
                                         logger.error(f"❌ خطا در شروع تحلیل رایگان: {e}", exc_info=True)
                                 
-                                analysis_thread = threading.Thread(target=start_free_analysis, daemon=True)
+                                analysis_thread = threading.Thread(target=InflightTracker.track(start_free_analysis), daemon=True)
                                 analysis_thread.start()
                                 logger.info(f"🚀 Thread تحلیل رایگان برای تحلیل {store_analysis.id} شروع شد")
                             except Exception as e:
@@ -11473,8 +11558,7 @@ def start_paid_analysis():
                                                         videos.append(file_info['path'])
                                             
                                             # استفاده از LiaraAIService برای تحلیل جامع
-                                            from .ai_services.liara_ai_service import LiaraAIService
-                                            liara_service = LiaraAIService()
+                                            liara_service = ServiceRegistry.get('liara')
                                             
                                             if not liara_service.api_key:
                                                 error_msg = "⚠️ LIARA_AI_API_KEY در سرویس موجود نیست."
@@ -11491,7 +11575,8 @@ def start_paid_analysis():
                                             logger.info(f"🔄 در حال فراخوانی analyze_store_comprehensive برای تحلیل {analysis.id}")
                                             comprehensive_analysis = liara_service.analyze_store_comprehensive(
                                                 store_data=store_data,
-                                                images=all_media if all_media else None
+                                                images=all_media if all_media else None,
+                                                run_id=analysis.id
                                             )
                                             logger.info(f"📥 نتیجه analyze_store_comprehensive دریافت شد: has_error={comprehensive_analysis.get('error') if comprehensive_analysis else 'None'}")
                                             
@@ -11572,7 +11657,7 @@ def start_paid_analysis():
                                                 pass
                                     
                                     try:
-                                        analysis_thread = threading.Thread(target=start_paid_analysis, daemon=True)
+                                        analysis_thread = threading.Thread(target=InflightTracker.track(start_paid_analysis), daemon=True)
                                         analysis_thread.start()
                                         logger.info(f"🚀 Thread تحلیل پولی برای تحلیل {store_analysis.id} شروع شد")
                                     except Exception as e:
@@ -11754,8 +11839,7 @@ def start_existing_analysis():
                                                         videos.append(file_info['path'])
                                             
                                             # استفاده از LiaraAIService
-                                            from .ai_services.liara_ai_service import LiaraAIService
-                                            liara_service = LiaraAIService()
+                                            liara_service = ServiceRegistry.get('liara')
                                             
                                             if not liara_service.api_key:
                                                 error_msg = "⚠️ LIARA_AI_API_KEY در سرویس موجود نیست."
@@ -11769,7 +11853,8 @@ def start_existing_analysis():
                                             comprehensive_analysis = liara_service.analyze_store_comprehensive(
                                                 store_data=store_data,
                                                 images=images if images else None,
-                                                videos=videos if videos else None
+                                                videos=videos if videos else None,
+                                                run_id=store_analysis.id
                                             )
                                             
                                             if comprehensive_analysis and comprehensive_analysis.get('success'):
@@ -11811,7 +11896,7 @@ def start_existing_analysis():
                                             except:
                                                 pass
                                     
-                                    analysis_thread = threading.Thread(target=start_existing_analysis, daemon=True)
+                                    analysis_thread = threading.Thread(target=InflightTracker.track(start_existing_analysis), daemon=True)
                                     analysis_thread.start()
                                     logger.info(f"🚀 Thread تحلیل برای تحلیل موجود {store_analysis.id} شروع شد")
                                 except Exception as e:
@@ -11982,8 +12067,7 @@ def start_paid_analysis_new():
                                         videos.append(file_info['path'])
                             
                             # استفاده از LiaraAIService
-                            from .ai_services.liara_ai_service import LiaraAIService
-                            liara_service = LiaraAIService()
+                            liara_service = ServiceRegistry.get('liara')
                             
                             if not liara_service.api_key:
                                 error_msg = "⚠️ LIARA_AI_API_KEY در سرویس موجود نیست."
@@ -11997,7 +12081,8 @@ def start_paid_analysis_new():
                             comprehensive_analysis = liara_service.analyze_store_comprehensive(
                                 store_data=store_data,
                                 images=images if images else None,
-                                videos=videos if videos else None
+                                videos=videos if videos else None,
+                                run_id=store_analysis.id
                             )
                             
                             if comprehensive_analysis and comprehensive_analysis.get('success'):
@@ -12039,7 +12124,7 @@ def start_paid_analysis_new():
                             except:
                                 pass
                     
-                    analysis_thread = threading.Thread(target=start_paid_analysis_new, daemon=True)
+                    analysis_thread = threading.Thread(target=InflightTracker.track(start_paid_analysis_new), daemon=True)
                     analysis_thread.start()
                     logger.info(f"🚀 Thread تحلیل پولی جدید برای تحلیل {store_analysis.id} شروع شد")
                 except Exception as e:
@@ -12093,8 +12178,7 @@ def products_page(request):
     products = []
     try:
         from store_analysis.models import ServicePackage
-        from django.core.cache import cache
-        admin_settings = cache.get('admin_settings', {}) or {}
+        admin_settings = ConfigStore.get_admin_settings()
         # سیستم تخفیف افتتاحیه: ۹۰% برای ۵ روز اول، سپس ۶۰%
         from datetime import datetime, timezone
         launch_date = datetime(2025, 12, 5, tzinfo=timezone.utc)  # تاریخ شروع تخفیف افتتاحیه
@@ -12343,9 +12427,8 @@ def buy_complete(request):
                 code=discount_code_str,
                 is_active=True
             )
-            if discount_code_obj.is_valid():
+            if discount_code_obj.use_discount():
                 discount_percentage = discount_code_obj.discount_percentage
-                discount_code_obj.use_discount()
                 # علامت‌گذاری یادآوری به عنوان استفاده شده
                 from .models import ReviewReminder
                 ReviewReminder.objects.filter(
@@ -12379,9 +12462,8 @@ def buy_complete(request):
                         code=discount_code_str,
                         is_active=True
                     )
-                    if discount_code_obj.is_valid():
+                    if discount_code_obj.use_discount():
                         discount_percentage = discount_code_obj.discount_percentage
-                        discount_code_obj.use_discount()
                     else:
                         discount_code_obj = None
                 except DiscountCode.DoesNotExist:
@@ -12980,8 +13062,8 @@ def check_processing_status(request, order_id):
         logger.error(f"Error checking processing status: {e}")
         return JsonResponse({'status': 'error', 'message': str(e)})
 
-def generate_professional_persian_pdf_report(analysis):
-    """تولید گزارش PDF فارسی با ترجمه روان و حرفه‌ای"""
+def generate_professional_persian_pdf_report(analysis, output=None):
+    """تولید گزارش PDF فارسی با ترجمه روان و حرفه‌ای (با output: نوشتن مستقیم در فایل و برگرداندن حجم)"""
     
     logger.info(f"📄 Starting PDF generation for analysis {analysis.id}")
     try:
@@ -13000,53 +13082,21 @@ def generate_professional_persian_pdf_report(analysis):
         import os
         import datetime
         import jdatetime
-        import arabic_reshaper
-        from bidi.algorithm import get_display
         from django.conf import settings
         import re
         
         # ایجاد buffer برای PDF
-        buffer = BytesIO()
+        buffer = output if output is not None else BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
         
         # تنظیم فونت فارسی با fallback بهتر
         font_name = 'Helvetica'  # فونت پیش‌فرض
         
         try:
-            # اولویت 1: فونت Vazir از staticfiles
-            from django.conf import settings
-            import os
-            
-            # جستجو در مسیرهای مختلف برای فونت Vazir
-            font_paths = [
-                os.path.join(settings.STATIC_ROOT, 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(settings.STATIC_ROOT, 'fonts', 'Vazir.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir.ttf'),
-                '/usr/src/app/staticfiles/fonts/Vazir-Bold.ttf',
-                '/usr/src/app/staticfiles/fonts/Vazir.ttf',
-                'static/fonts/Vazir-Bold.ttf',
-                'static/fonts/Vazir.ttf',
-            ]
-            
-            font_registered = False
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        # ثبت فونت بدون subset برای پشتیبانی کامل از فارسی
-                        font = TTFont('Vazir', font_path)
-                        font.face.subset = 0  # عدم subset کردن فونت
-                        font.face.embedding = 1  # embed کامل فونت
-                        pdfmetrics.registerFont(font)
-                        font_name = 'Vazir'
-                        logger.info(f"Using Vazir font (no subset): {font_path}")
-                        font_registered = True
-                        break
-                    except Exception as font_error:
-                        logger.warning(f"Failed to register font {font_path}: {font_error}")
-                        continue
-            
-            if not font_registered:
+            # فونت Vazir بدون subset برای پشتیبانی کامل از فارسی (utils.pdf_fonts)
+            if register_persian_font():
+                font_name = 'Vazir'
+            else:
                 logger.warning("No suitable Persian font found, using Helvetica")
                 font_name = 'Helvetica'
                 
@@ -13140,9 +13190,6 @@ def fix_persian_text(text):
                 
             # روش استاندارد جهانی برای PDF فارسی
             try:
-                import arabic_reshaper
-                from bidi.algorithm import get_display
-                
                 # مرحله 1: تبدیل اعداد به فارسی (بهترین روش)
                 def convert_numbers_to_persian(input_text):
                     persian_digits = '۰۱۲۳۴۵۶۷۸۹'
@@ -13153,23 +13200,9 @@ def convert_numbers_to_persian(input_text):
                 # مرحله 2: متن با اعداد فارسی
                 text_with_persian_numbers = convert_numbers_to_persian(text)
                 
-                # مرحله 3: Character Shaping (تغییر شکل حروف برای فارسی)
-                reshaped_text = arabic_reshaper.reshape(text_with_persian_numbers)
-                
-                # مرحله 4: RTL Processing (راست به چپ)
-                rtl_text = get_display(reshaped_text)
+                # مرحله 3 و 4: Character Shaping و RTL Processing (cache‌شده؛ بدون کتابخانه‌ها فقط اعداد فارسی می‌شوند)
+                return shape_persian(text_with_persian_numbers)
                 
-                return rtl_text
-                
-            except ImportError:
-                logger.warning("arabic_reshaper or bidi not installed, using simple text")
-                # بدون کتابخانه‌ها، فقط اعداد را فارسی کنیم
-                def convert_numbers_simple(input_text):
-                    persian_digits = '۰۱۲۳۴۵۶۷۸۹'
-                    english_digits = '0123456789'
-                    digit_map = str.maketrans(english_digits, persian_digits)
-                    return input_text.translate(digit_map)
-                return convert_numbers_simple(text)
             except Exception as e:
                 logger.error(f"Error in fix_persian_text: {e}")
                 # در صورت خطا، متن اصلی را برگردان
@@ -13734,6 +13767,9 @@ def convert_numbers_simple(text):
         # ساخت PDF
         logger.info(f"Building PDF document for analysis {analysis.id}...")
         doc.build(story)
+        if output is not None:
+            logger.info(f"✅ PDF written for analysis {analysis.id}. Content length: {output.tell()}")
+            return output.tell()
         
         # آماده‌سازی برای بازگشت
         buffer.seek(0)
@@ -13747,8 +13783,8 @@ def convert_numbers_simple(text):
         logger.error(f"❌ خطا در تولید PDF فارسی برای analysis {analysis.id}: {str(e)}")
         logger.error(f"PDF generation error details: {type(e).__name__}: {e}", exc_info=True)
         return None
-def generate_professional_persian_pdf_report_fixed(analysis):
-    """تولید گزارش PDF فارسی با ترجمه روان و حرفه‌ای"""
+def generate_professional_persian_pdf_report_fixed(analysis, output=None):
+    """تولید گزارش PDF فارسی با ترجمه روان و حرفه‌ای (با output: نوشتن مستقیم در فایل و برگرداندن حجم)"""
     
     try:
         from reportlab.lib.pagesizes import A4
@@ -13777,40 +13813,10 @@ def get_persian_date():
         font_name = 'Helvetica'  # فونت پیش‌فرض
         
         try:
-            # اولویت 1: فونت Vazir از staticfiles
-            from django.conf import settings
-            import os
-            
-            # جستجو در مسیرهای مختلف برای فونت Vazir
-            font_paths = [
-                os.path.join(settings.STATIC_ROOT, 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(settings.STATIC_ROOT, 'fonts', 'Vazir.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir-Bold.ttf'),
-                os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'Vazir.ttf'),
-                '/usr/src/app/staticfiles/fonts/Vazir-Bold.ttf',
-                '/usr/src/app/staticfiles/fonts/Vazir.ttf',
-                'static/fonts/Vazir-Bold.ttf',
-                'static/fonts/Vazir.ttf',
-            ]
-            
-            font_registered = False
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        # ثبت فونت بدون subset برای پشتیبانی کامل از فارسی
-                        font = TTFont('Vazir', font_path)
-                        font.face.subset = 0  # عدم subset کردن فونت
-                        font.face.embedding = 1  # embed کامل فونت
-                        pdfmetrics.registerFont(font)
-                        font_name = 'Vazir'
-                        logger.info(f"Using Vazir font (no subset): {font_path}")
-                        font_registered = True
-                        break
-                    except Exception as font_error:
-                        logger.warning(f"Failed to register font {font_path}: {font_error}")
-                        continue
-            
-            if not font_registered:
+            # فونت Vazir بدون subset برای پشتیبانی کامل از فارسی (utils.pdf_fonts)
+            if register_persian_font():
+                font_name = 'Vazir'
+            else:
                 logger.warning("No suitable Persian font found, using Helvetica")
                 font_name = 'Helvetica'
         except Exception as e:
@@ -13840,7 +13846,7 @@ def get_persian_date():
                 pass
         
         # ایجاد PDF در حافظه
-        buffer = BytesIO()
+        buffer = output if output is not None else BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
         
         # استایل‌ها
@@ -14397,6 +14403,8 @@ def get_persian_date():
         
         # ساخت PDF
         doc.build(story)
+        if output is not None:
+            return output.tell()
         
         # آماده‌سازی برای بازگشت
         buffer.seek(0)
@@ -14521,8 +14529,7 @@ def start_mock_analysis():
                                         videos.append(file_info['path'])
                             
                             # استفاده از LiaraAIService
-                            from .ai_services.liara_ai_service import LiaraAIService
-                            liara_service = LiaraAIService()
+                            liara_service = ServiceRegistry.get('liara')
                             
                             if not liara_service.api_key:
                                 error_msg = "⚠️ LIARA_AI_API_KEY در سرویس موجود نیست."
@@ -14538,7 +14545,8 @@ def start_mock_analysis():
                             # تحلیل جامع با Liara AI
                             comprehensive_analysis = liara_service.analyze_store_comprehensive(
                                 store_data=store_data,
-                                images=all_media if all_media else None
+                                images=all_media if all_media else None,
+                                run_id=store_analysis.id
                             )
                             
                             # بررسی نتیجه تحلیل